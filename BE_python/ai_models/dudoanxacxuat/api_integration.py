@@ -1,29 +1,22 @@
 from flask import Blueprint, request, jsonify
-from .predict_admission import load_model_and_scaler
+from .model_registry import admission_model_registry
+from .benchmark_resolver import benchmark_resolver, sort_by_year_desc
+from utils.reference_data import reference_data
+from utils.db_utils import db
+from utils.write_behind import prediction_log_writer
+from utils.batching import admission_batcher
+from utils.response_cache import admission_response_cache, canonical_key
+from utils.data_versions import data_version_cache
 import numpy as np
+import re
 import json
 from bson.json_util import dumps
 import traceback
 from datetime import datetime
-from pymongo import MongoClient
 import os
 from bson import ObjectId
 
-# Kết nối MongoDB - sử dụng biến môi trường thống nhất với Node.js
-MONGODB_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
-MONGODB_NAME = os.getenv('MONGO_DB_NAME', 'tuyen_sinh_thong_minh')
-
-print(f"Python API MongoDB Configuration: URI={MONGODB_URI}, DB={MONGODB_NAME}")
-client = MongoClient(MONGODB_URI)
-db = client[MONGODB_NAME]
-
-# Thêm debug để kiểm tra kết nối
-try:
-    # Liệt kê collections trong database để kiểm tra kết nối
-    print(f"Collections trong database: {db.list_collection_names()}")
-    print(f"Tìm kiếm trong collection benchmark_scores: {db.benchmark_scores.count_documents({})}")
-except Exception as e:
-    print(f"Lỗi kết nối MongoDB: {e}")
+# Kết nối MongoDB dùng chung (tạo khi truy vấn lần đầu, cấu hình trong config/config.py)
 
 # Class để giúp serialization numpy arrays và các object khác
 class NpEncoder(json.JSONEncoder):
@@ -36,6 +29,18 @@ class NpEncoder(json.JSONEncoder):
             return obj.tolist()
         return super(NpEncoder, self).default(obj)
 
+# Các tổ hợp môn được dùng để chọn tổ hợp tối ưu cho học sinh
+SUBJECT_COMBINATIONS = {
+    'A00': {'subjects': ['TOAN', 'LY', 'HOA']},
+    'A01': {'subjects': ['TOAN', 'LY', 'ANH']},
+    'A02': {'subjects': ['TOAN', 'LY', 'SINH']},
+    'B00': {'subjects': ['TOAN', 'HOA', 'SINH']},
+    'B08': {'subjects': ['TOAN', 'SINH', 'ANH']},
+    'C00': {'subjects': ['VAN', 'SU', 'DIA']},
+    'C01': {'subjects': ['VAN', 'TOAN', 'LY']},
+    'D01': {'subjects': ['TOAN', 'VAN', 'ANH']},
+}
+
 # Blueprint cho các API liên quan đến dự đoán xác suất đậu đại học
 admission_prediction_blueprint = Blueprint('admission_prediction', __name__)
 
@@ -78,38 +83,8 @@ def predict_admission():
                 subject_scores[key] = None
         
         # Tính toán tổ hợp môn tối ưu
-        combinations = {
-            'A00': {'subjects': ['TOAN', 'LY', 'HOA']},
-            'A01': {'subjects': ['TOAN', 'LY', 'ANH']},
-            'A02': {'subjects': ['TOAN', 'LY', 'SINH']},
-            'B00': {'subjects': ['TOAN', 'HOA', 'SINH']},
-            'B08': {'subjects': ['TOAN', 'SINH', 'ANH']},
-            'C00': {'subjects': ['VAN', 'SU', 'DIA']},
-            'C01': {'subjects': ['VAN', 'TOAN', 'LY']},
-            'D01': {'subjects': ['TOAN', 'VAN', 'ANH']},
-        }
-        
-        best_combination = None
-        best_score = 0
-        
-        for code, combo in combinations.items():
-            total_score = 0
-            valid = True
-            
-            for subject in combo['subjects']:
-                if subject in subject_scores and subject_scores[subject] is not None:
-                    try:
-                        total_score += float(subject_scores[subject])
-                    except (ValueError, TypeError):
-                        valid = False
-                        break
-                else:
-                    valid = False
-                    break
-            
-            if valid and total_score > best_score:
-                best_score = total_score
-                best_combination = code
+        combinations = SUBJECT_COMBINATIONS
+        best_combination, best_score = find_best_combination(subject_scores)
         
         if not best_combination:
             # Nếu không tìm thấy tổ hợp hợp lệ, hãy cung cấp thông tin chi tiết về tổ hợp còn thiếu
@@ -136,22 +111,24 @@ def predict_admission():
         # Cộng điểm ưu tiên vào điểm tổng
         student_score = best_score + priority_score
         
-        # 1. Tìm kiếm dữ liệu điểm chuẩn từ benchmark_scores
-        benchmark_query = {
-            'university_code': university_code,
-            'major': {'$regex': major_name, '$options': 'i'},
-            'subject_combination': best_combination
-        }
-        
-        benchmark_scores = list(db.benchmark_scores.find(benchmark_query).sort('year', -1))
+        # 0. Dùng lại kết quả đã tính cho cùng request (cùng phiên bản mô hình và dữ liệu)
+        cache_key = prediction_cache_key(university_code, major_name, subject_scores, priority_score)
+        cached = admission_response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            prediction = dict(cached['prediction'], predictionDate=datetime.now().isoformat())
+            return prediction_response(
+                prediction, cached['dataToPredict'], cached['modelVersion'], user_id,
+                university_code, major_name, subject_scores, priority_score, best_combination
+            )
         
-        # Nếu không tìm thấy với tổ hợp cụ thể, thử tìm với bất kỳ tổ hợp nào
-        if not benchmark_scores:
-            print(f"DEBUG: Không tìm thấy điểm chuẩn với tổ hợp {best_combination}, tìm với bất kỳ tổ hợp nào")
-            benchmark_scores = list(db.benchmark_scores.find({
-                'university_code': university_code,
-                'major': {'$regex': major_name, '$options': 'i'}
-            }).sort('year', -1))
+        # 1. Tìm kiếm dữ liệu điểm chuẩn từ cache điểm chuẩn theo trường
+        # (ưu tiên đúng tổ hợp, nếu không có thì lấy bất kỳ tổ hợp nào)
+        benchmark_scores, strategy = benchmark_resolver.resolve(
+            university_code, major_name, combination=best_combination,
+            allow_keywords=False, allow_fallbacks=False
+        )
+        benchmark_scores = sort_by_year_desc(benchmark_scores)
+        print(f"DEBUG: Tìm thấy {len(benchmark_scores)} điểm chuẩn (chiến lược: {strategy})")
         
         if not benchmark_scores:
             return jsonify({
@@ -159,22 +136,8 @@ def predict_admission():
                 'message': f'Không tìm thấy điểm chuẩn cho trường {university_code}, ngành {major_name}'
             }), 400
         
-        # Lấy thông tin từ bản ghi đầu tiên (mới nhất)
-        latest_record = benchmark_scores[0]
-        university_name = latest_record.get('university', '')
-        entry_level = latest_record.get('entry_level', 'Trung bình')
-        
-        # Chuẩn bị dữ liệu lịch sử điểm chuẩn
-        historical_scores = []
-        for score in benchmark_scores:
-            year = score.get('year')
-            benchmark = score.get('benchmark_score')
-            if year and benchmark:
-                historical_scores.append((year, float(benchmark)))
-        
-        # Tính điểm chuẩn trung bình
-        scores = [score for _, score in historical_scores]
-        average_score = sum(scores) / len(scores) if scores else 0
+        # Lấy thông tin từ bản ghi đầu tiên (mới nhất) và lịch sử điểm chuẩn
+        university_name, entry_level, historical_scores, average_score = summarize_benchmark_scores(benchmark_scores)
         
         # 2. Tìm kiếm chỉ tiêu từ admission_criteria
         criteria_query = {
@@ -185,99 +148,25 @@ def predict_admission():
         admission_criteria = db.admission_criteria.find_one(criteria_query)
         
         # Xử lý chỉ tiêu
-        quota = None
-        q0 = None
-        quota_history = []
         current_year = datetime.now().year
+        quota, q0, quota_history = extract_quota(admission_criteria, entry_level, current_year)
         
-        if admission_criteria and 'quota' in admission_criteria:
-            quota_data = admission_criteria.get('quota', [])
-            all_quotas = []
-            
-            for q in quota_data:
-                year = q.get('year')
-                total = q.get('total')
-                
-                if total and isinstance(total, str) and '-' in total:
-                    # Xử lý trường hợp "91-112"
-                    low, high = map(int, total.split('-'))
-                    avg_quota = (low + high) / 2
-                    all_quotas.append(avg_quota)
-                    quota_history.append((year, avg_quota))
-                    
-                    # Nếu là năm hiện tại, lưu làm quota chính
-                    if year == current_year:
-                        quota = avg_quota
-                elif total and isinstance(total, (int, float)):
-                    all_quotas.append(float(total))
-                    quota_history.append((year, float(total)))
-                    
-                    if year == current_year:
-                        quota = float(total)
-            
-            # Tính q0 (trung bình của tất cả chỉ tiêu)
-            q0 = sum(all_quotas) / len(all_quotas) if all_quotas else None
-        
-        # Nếu không tìm thấy chỉ tiêu, sử dụng giá trị mặc định dựa vào entry_level
-        if quota is None:
-            if entry_level == 'Cao':
-                quota = 85  # Trung bình của 70-100
-            elif entry_level == 'Trung bình':
-                quota = 125  # Trung bình của 100-150
-            else:  # 'Thấp'
-                quota = 175  # Trung bình của 150-200
-        
-        if q0 is None:
-            q0 = quota  # Nếu không có dữ liệu, lấy bằng quota
-        
-        # 3. Tìm kiếm xu hướng thị trường từ majors
-        major_query = {
-            'nameNormalized': {'$regex': major_name, '$options': 'i'}
-        }
-        
-        major_data = db.majors.find_one(major_query)
-        
-        if not major_data:
-            # Tìm thử với regex chứa từng phần của tên ngành
-            words = major_name.split()
-            for word in words:
-                if len(word) > 3:  # Chỉ tìm với từ có ít nhất 4 ký tự
-                    major_data = db.majors.find_one({'nameNormalized': {'$regex': word, '$options': 'i'}})
-                    if major_data:
-                        break
+        # 3. Tìm kiếm xu hướng thị trường từ majors (ảnh chụp dữ liệu tham chiếu)
+        major_data = find_major_data(major_name, reference_data.snapshot().all('majors'))
         
         # Lấy xu hướng thị trường
-        market_trend = 0.5  # Giá trị mặc định
-        
-        if major_data and 'marketTrends' in major_data:
-            market_trends = major_data.get('marketTrends', [])
-            
-            # Tìm xu hướng của năm hiện tại
-            for trend in market_trends:
-                if trend.get('year') == current_year:
-                    market_trend = float(trend.get('score', 0.5))
-                    break
-            
-            # Nếu không có năm hiện tại, lấy năm gần nhất
-            if market_trend == 0.5 and market_trends:
-                # Sắp xếp theo năm giảm dần
-                sorted_trends = sorted(market_trends, key=lambda x: x.get('year', 0), reverse=True)
-                market_trend = float(sorted_trends[0].get('score', 0.5))
+        market_trend = extract_market_trend(major_data, current_year)
         
         # 4. Tính xu hướng điểm chuẩn từ dữ liệu lịch sử
-        score_trend = 0.0
-        if len(historical_scores) >= 2:
-            years = np.array([year for year, _ in historical_scores])
-            scores = np.array([score for _, score in historical_scores])
-            slope, _ = np.polyfit(years, scores, 1)
-            score_trend = round(slope, 2)
+        score_trend = calculate_score_trend(historical_scores)
         
         # 5. Tính điểm chuẩn dự kiến
         expected_score = calculate_expected_score(average_score, market_trend, quota, q0, score_trend)
         
-        # 6. Tải mô hình và dự đoán
+        # 6. Lấy mô hình đã tải sẵn từ registry và dự đoán
         try:
-            model, scaler, features = load_model_and_scaler()
+            model_handle = admission_model_registry.get()
+            model, scaler = model_handle.model, model_handle.scaler
             
             # 7. Dự đoán xác suất
             probability = predict_single_student(
@@ -313,16 +202,7 @@ def predict_admission():
             }
             
             # Thêm đánh giá dựa trên xác suất
-            if probability >= 0.8:
-                assessment = "Khả năng trúng tuyển rất cao"
-            elif probability >= 0.6:
-                assessment = "Khả năng trúng tuyển cao"
-            elif probability >= 0.4:
-                assessment = "Khả năng trúng tuyển trung bình"
-            elif probability >= 0.2:
-                assessment = "Khả năng trúng tuyển thấp"
-            else:
-                assessment = "Khả năng trúng tuyển rất thấp"
+            assessment = get_assessment(probability)
             
             prediction['assessment'] = assessment
             
@@ -337,35 +217,21 @@ def predict_admission():
                 "market_trend": market_trend,
                 "score_trend": score_trend,
                 "historicalScores": historical_scores,
-                "q": quota_history
-            }
-            
-            log_data = {
-                "userId": user_id,
-                "timestamp": datetime.now(),
-                "modelType": "admission_prediction",
-                "inputs": {
-                    "universityCode": university_code,
-                    "majorName": major_name,
-                    "scores": subject_scores,
-                    "priorityScore": priority_score,
-                    "combination": best_combination
-                },
-                "outputs": prediction,
-                "dataToPredict": data_to_predict,
-                "isUseful": None,
-                "feedback": None
+                "q": quota_history,
+                "benchmark_match": strategy
             }
             
-            # Lưu vào MongoDB
-            log_id = db.prediction_logs.insert_one(log_data).inserted_id
+            if cache_key:
+                admission_response_cache.set(cache_key, {
+                    'prediction': prediction,
+                    'dataToPredict': data_to_predict,
+                    'modelVersion': model_handle.version
+                })
             
-            # Trả về kết quả
-            return jsonify({
-                'success': True,
-                'prediction': prediction,
-                '_id': str(log_id)  # Thêm ID của log để frontend có thể sử dụng cho feedback
-            }), 200
+            return prediction_response(
+                prediction, data_to_predict, model_handle.version, user_id,
+                university_code, major_name, subject_scores, priority_score, best_combination
+            )
             
         except FileNotFoundError as e:
             return jsonify({
@@ -420,14 +286,17 @@ def update_feedback():
         feedback_text = data.get('feedback')
         
         # Cập nhật log trong MongoDB
-        result = db.prediction_logs.update_one(
-            {'_id': ObjectId(prediction_id)},
-            {'$set': {
-                'isUseful': is_useful,
-                'feedback': feedback_text,
-                'feedbackDate': datetime.now()
-            }}
-        )
+        feedback_query = {'_id': ObjectId(prediction_id)}
+        feedback_update = {'$set': {
+            'isUseful': is_useful,
+            'feedback': feedback_text,
+            'feedbackDate': datetime.now()
+        }}
+        result = db.prediction_logs.update_one(feedback_query, feedback_update)
+        
+        # Log có thể vẫn đang nằm trong hàng đợi ghi nền, ghi ngay rồi thử lại
+        if result.matched_count == 0 and prediction_log_writer.flush():
+            result = db.prediction_logs.update_one(feedback_query, feedback_update)
         
         if result.modified_count > 0:
             return jsonify({
@@ -447,6 +316,73 @@ def update_feedback():
             'message': f"Đã xảy ra lỗi: {str(e)}"
         }), 500
 
+def prediction_cache_key(university_code, major_name, subject_scores, priority_score):
+    """
+    Khóa cache của request dự đoán: request đã chuẩn hóa kèm phiên bản mô hình và phiên bản dữ liệu
+    (benchmark_scores, admission_criteria, majors) cùng năm hiện tại
+
+    Returns:
+        Khóa cache, hoặc None nếu mô hình chưa được tải (chưa biết phiên bản)
+    """
+    model_version = admission_model_registry.status().get('version')
+    if model_version is None:
+        return None
+
+    scores = {}
+    for subject, value in subject_scores.items():
+        if value is None:
+            continue
+        try:
+            scores[subject] = float(value)
+        except (TypeError, ValueError):
+            scores[subject] = str(value)
+
+    payload = {
+        'universityCode': university_code,
+        'majorName': major_name,
+        'scores': scores,
+        'priorityScore': priority_score
+    }
+    version = {
+        'model': model_version,
+        'benchmarkScores': data_version_cache.get('benchmark_scores'),
+        'admissionCriteria': data_version_cache.get('admission_criteria'),
+        'majors': data_version_cache.get('majors'),
+        'year': datetime.now().year
+    }
+    return canonical_key(payload, version)
+
+def prediction_response(prediction, data_to_predict, model_version, user_id,
+                        university_code, major_name, subject_scores, priority_score, best_combination):
+    """Ghi log dự đoán (ghi nền) và tạo response thành công"""
+    log_data = {
+        "userId": user_id,
+        "timestamp": datetime.now(),
+        "modelType": "admission_prediction",
+        "modelVersion": model_version,
+        "inputs": {
+            "universityCode": university_code,
+            "majorName": major_name,
+            "scores": subject_scores,
+            "priorityScore": priority_score,
+            "combination": best_combination
+        },
+        "outputs": prediction,
+        "dataToPredict": data_to_predict,
+        "isUseful": None,
+        "feedback": None
+    }
+    
+    # Đưa vào hàng đợi ghi nền, _id được tạo ngay để trả về cho frontend
+    log_id = prediction_log_writer.submit(log_data)
+    
+    # Trả về kết quả
+    return jsonify({
+        'success': True,
+        'prediction': prediction,
+        '_id': str(log_id)  # Thêm ID của log để frontend có thể sử dụng cho feedback
+    }), 200
+
 def calculate_expected_score(mu, t, q, q0, score_trend, alpha=0.5, beta=1.0, gamma=0.7):
     """
     Tính điểm chuẩn dự kiến
@@ -479,11 +415,207 @@ def predict_single_student(student_score, average_score, expected_score, quota,
     scaler_mean, scaler_scale = scaler
     input_scaled = (input_data - scaler_mean) / scaler_scale
     
-    # Dự đoán
-    probability = model.predict(input_scaled, verbose=0)[0][0]
+    # Dự đoán (gom chung batch với các request đồng thời khác)
+    probability = admission_batcher.predict(model, input_scaled[0])[0]
     
     return probability
 
+def find_best_combination(subject_scores):
+    """
+    Chọn tổ hợp môn có tổng điểm cao nhất trong các tổ hợp học sinh có đủ điểm
+
+    Returns:
+        Tuple (mã tổ hợp, tổng điểm), mã tổ hợp là None nếu không có tổ hợp hợp lệ
+    """
+    best_combination = None
+    best_score = 0
+    
+    for code, combo in SUBJECT_COMBINATIONS.items():
+        total_score = 0
+        valid = True
+        
+        for subject in combo['subjects']:
+            if subject in subject_scores and subject_scores[subject] is not None:
+                try:
+                    total_score += float(subject_scores[subject])
+                except (ValueError, TypeError):
+                    valid = False
+                    break
+            else:
+                valid = False
+                break
+        
+        if valid and total_score > best_score:
+            best_score = total_score
+            best_combination = code
+    
+    return best_combination, best_score
+
+def summarize_benchmark_scores(benchmark_scores):
+    """
+    Tóm tắt danh sách điểm chuẩn (đã sắp xếp theo năm giảm dần)
+
+    Returns:
+        Tuple (tên trường, mức đầu vào, lịch sử điểm chuẩn [(năm, điểm)], điểm chuẩn trung bình)
+    """
+    latest_record = benchmark_scores[0]
+    university_name = latest_record.get('university', '')
+    entry_level = latest_record.get('entry_level', 'Trung bình')
+    
+    historical_scores = []
+    for score in benchmark_scores:
+        year = score.get('year')
+        benchmark = score.get('benchmark_score')
+        if year and benchmark:
+            historical_scores.append((year, float(benchmark)))
+    
+    scores = [score for _, score in historical_scores]
+    average_score = sum(scores) / len(scores) if scores else 0
+    
+    return university_name, entry_level, historical_scores, average_score
+
+def extract_quota(admission_criteria, entry_level, current_year):
+    """
+    Lấy chỉ tiêu năm hiện tại và chỉ tiêu trung bình từ bản ghi admission_criteria
+
+    Returns:
+        Tuple (quota, q0, lịch sử chỉ tiêu [(năm, chỉ tiêu)])
+    """
+    quota = None
+    q0 = None
+    quota_history = []
+    
+    if admission_criteria and 'quota' in admission_criteria:
+        quota_data = admission_criteria.get('quota', [])
+        all_quotas = []
+        
+        for q in quota_data:
+            year = q.get('year')
+            total = q.get('total')
+            
+            if total and isinstance(total, str) and '-' in total:
+                # Xử lý trường hợp "91-112"
+                low, high = map(int, total.split('-'))
+                avg_quota = (low + high) / 2
+                all_quotas.append(avg_quota)
+                quota_history.append((year, avg_quota))
+                
+                # Nếu là năm hiện tại, lưu làm quota chính
+                if year == current_year:
+                    quota = avg_quota
+            elif total and isinstance(total, (int, float)):
+                all_quotas.append(float(total))
+                quota_history.append((year, float(total)))
+                
+                if year == current_year:
+                    quota = float(total)
+        
+        # Tính q0 (trung bình của tất cả chỉ tiêu)
+        q0 = sum(all_quotas) / len(all_quotas) if all_quotas else None
+    
+    # Nếu không tìm thấy chỉ tiêu, sử dụng giá trị mặc định dựa vào entry_level
+    if quota is None:
+        if entry_level == 'Cao':
+            quota = 85  # Trung bình của 70-100
+        elif entry_level == 'Trung bình':
+            quota = 125  # Trung bình của 100-150
+        else:  # 'Thấp'
+            quota = 175  # Trung bình của 150-200
+    
+    if q0 is None:
+        q0 = quota  # Nếu không có dữ liệu, lấy bằng quota
+    
+    return quota, q0, quota_history
+
+def extract_market_trend(major_data, current_year):
+    """
+    Lấy xu hướng thị trường của ngành (năm hiện tại, nếu không có thì năm gần nhất)
+    """
+    market_trend = 0.5  # Giá trị mặc định
+    
+    if major_data and 'marketTrends' in major_data:
+        market_trends = major_data.get('marketTrends', [])
+        
+        # Tìm xu hướng của năm hiện tại
+        for trend in market_trends:
+            if trend.get('year') == current_year:
+                market_trend = float(trend.get('score', 0.5))
+                break
+        
+        # Nếu không có năm hiện tại, lấy năm gần nhất
+        if market_trend == 0.5 and market_trends:
+            # Sắp xếp theo năm giảm dần
+            sorted_trends = sorted(market_trends, key=lambda x: x.get('year', 0), reverse=True)
+            market_trend = float(sorted_trends[0].get('score', 0.5))
+    
+    return market_trend
+
+def calculate_score_trend(historical_scores):
+    """
+    Tính xu hướng điểm chuẩn (hệ số góc của đường hồi quy tuyến tính theo năm)
+    """
+    if len(historical_scores) < 2:
+        return 0.0
+    
+    years = np.array([year for year, _ in historical_scores], dtype=float)
+    scores = np.array([score for _, score in historical_scores], dtype=float)
+    slope, _ = np.polyfit(years, scores, 1)
+    return round(slope, 2)
+
+def get_assessment(probability):
+    """Đánh giá khả năng trúng tuyển dựa trên xác suất"""
+    if probability >= 0.8:
+        return "Khả năng trúng tuyển rất cao"
+    elif probability >= 0.6:
+        return "Khả năng trúng tuyển cao"
+    elif probability >= 0.4:
+        return "Khả năng trúng tuyển trung bình"
+    elif probability >= 0.2:
+        return "Khả năng trúng tuyển thấp"
+    else:
+        return "Khả năng trúng tuyển rất thấp"
+
+def _compile_major_pattern(pattern):
+    """Biên dịch tên ngành thành regex không phân biệt hoa thường (tương đương $regex với $options 'i')"""
+    return re.compile(pattern, re.IGNORECASE)
+
+def find_major_data(major_name, majors):
+    """
+    Tìm thông tin ngành trong danh sách majors đã tải sẵn, cùng thứ tự ưu tiên với truy vấn đơn lẻ:
+    khớp toàn bộ tên ngành, nếu không có thì khớp từng từ có ít nhất 4 ký tự
+    """
+    patterns = [major_name] + [word for word in major_name.split() if len(word) > 3]
+    
+    for pattern in patterns:
+        regex = _compile_major_pattern(pattern)
+        for major in majors:
+            if regex.search(major.get('nameNormalized') or ''):
+                return major
+    
+    return None
+
+def load_batch_reference_data(university_codes):
+    """
+    Tải dữ liệu cho cả batch bằng các truy vấn gộp theo mã trường (majors lấy từ ảnh chụp dữ liệu tham chiếu)
+    - Điểm chuẩn của các trường chưa có trong cache được tải vào benchmark_resolver bằng một truy vấn $in
+
+    Returns:
+        Tuple (admission_criteria theo mã trường, danh sách majors)
+    """
+    benchmark_resolver.get_universities(university_codes)
+    
+    criteria_by_university = {}
+    cursor = db.admission_criteria.find(
+        {'universityCode': {'$in': university_codes}},
+        {'universityCode': 1, 'majorName': 1, 'quota': 1}
+    )
+    for record in cursor:
+        criteria_by_university.setdefault(record.get('universityCode'), []).append(record)
+    
+    majors = reference_data.snapshot().all('majors')
+    
+    return criteria_by_university, majors
+
 # API dự đoán xác suất đậu đại học cho nhiều ngành/trường
 @admission_prediction_blueprint.route('/predict-ai/batch', methods=['POST'])
 def batch_predict_admission():
@@ -497,90 +629,137 @@ def batch_predict_admission():
                 'message': 'Dữ liệu đầu vào phải là một mảng các yêu cầu dự đoán'
             }), 400
         
-        # Tải mô hình và dự đoán
+        # Lấy mô hình đã tải sẵn từ registry và dự đoán
         try:
-            model, scaler, features = load_model_and_scaler()
+            model_handle = admission_model_registry.get()
             
-            predictions = []
+            predictions = [None] * len(data)
             
-            for item in data:
+            # 1. Kiểm tra dữ liệu và chọn tổ hợp môn tốt nhất cho từng yêu cầu
+            valid_items = []
+            for index, item in enumerate(data):
                 try:
-                    # Kiểm tra các trường bắt buộc
                     required_fields = ['universityCode', 'majorName', 'scores']
                     for field in required_fields:
                         if field not in item:
                             raise ValueError(f'Thiếu trường {field}')
                     
-                    # Tính điểm cho các tổ hợp môn và chọn tổ hợp tốt nhất
-                    university_code = item.get('universityCode')
-                    major_name = item.get('majorName')
-                    subject_scores = item.get('scores', {})
-                    
-                    # Tính điểm cho các tổ hợp môn và chọn tổ hợp tốt nhất
-                    combinations = {
-                        'A00': {'subjects': ['TOAN', 'LY', 'HOA']},
-                        'A01': {'subjects': ['TOAN', 'LY', 'ANH']},
-                        'A02': {'subjects': ['TOAN', 'LY', 'SINH']},
-                        'B00': {'subjects': ['TOAN', 'HOA', 'SINH']},
-                        'B08': {'subjects': ['TOAN', 'SINH', 'ANH']},
-                        'C00': {'subjects': ['VAN', 'SU', 'DIA']},
-                        'C01': {'subjects': ['VAN', 'TOAN', 'LY']},
-                        'D01': {'subjects': ['TOAN', 'VAN', 'ANH']},
+                    subject_scores = {
+                        key: (None if value == '' else value)
+                        for key, value in (item.get('scores') or {}).items()
                     }
-                    
-                    best_combination = None
-                    best_score = 0
-                    
-                    for code, combo in combinations.items():
-                        total_score = 0
-                        valid_combo = True
-                        
-                        for subject in combo['subjects']:
-                            if subject in subject_scores and subject_scores[subject] is not None:
-                                total_score += float(subject_scores[subject])
-                            else:
-                                valid_combo = False
-                                break
-                        
-                        if valid_combo and total_score > best_score:
-                            best_score = total_score
-                            best_combination = code
-                    
+                    best_combination, best_score = find_best_combination(subject_scores)
                     if not best_combination:
                         raise ValueError('Không có đủ điểm cho bất kỳ tổ hợp môn nào')
                     
                     # Cộng điểm ưu tiên nếu có
                     priority_score = float(item.get('priorityScore', 0))
-                    student_score = best_score + priority_score
                     
-                    # Thực hiện các truy vấn tương tự như trong predict_admission
-                    # ...
+                    valid_items.append({
+                        'index': index,
+                        'universityCode': item.get('universityCode'),
+                        'majorName': item.get('majorName').lower().strip(),
+                        'subjectScores': subject_scores,
+                        'combination': best_combination,
+                        'studentScore': best_score + priority_score
+                    })
+                except Exception as e:
+                    predictions[index] = {'success': False, 'message': str(e), 'data': item}
+            
+            # 2. Tải điểm chuẩn, chỉ tiêu và xu hướng thị trường cho cả batch bằng các truy vấn gộp
+            university_codes = list({entry['universityCode'] for entry in valid_items})
+            criteria_by_university, majors = load_batch_reference_data(university_codes)
+            major_cache = {}
+            current_year = datetime.now().year
+            
+            # 3. Tính các đặc trưng cho từng yêu cầu
+            feature_rows = []
+            resolved_items = []
+            for entry in valid_items:
+                item = data[entry['index']]
+                try:
+                    university_code = entry['universityCode']
+                    major_name = entry['majorName']
+                    best_combination = entry['combination']
+                    major_regex = _compile_major_pattern(major_name)
                     
-                    # Giả lập kết quả nếu không có đủ dữ liệu
-                    predictions.append({
-                        'success': True,
+                    # Điểm chuẩn theo tổ hợp cụ thể, nếu không có thì lấy bất kỳ tổ hợp nào
+                    benchmark_scores, _ = benchmark_resolver.resolve(
+                        university_code, major_name, combination=best_combination,
+                        allow_keywords=False, allow_fallbacks=False
+                    )
+                    benchmark_scores = sort_by_year_desc(benchmark_scores)
+                    
+                    if not benchmark_scores:
+                        raise ValueError(f'Không tìm thấy điểm chuẩn cho trường {university_code}, ngành {major_name}')
+                    
+                    university_name, entry_level, historical_scores, average_score = summarize_benchmark_scores(benchmark_scores)
+                    
+                    admission_criteria = next((
+                        record for record in criteria_by_university.get(university_code, [])
+                        if major_regex.search(record.get('majorName') or '')
+                    ), None)
+                    quota, q0, _ = extract_quota(admission_criteria, entry_level, current_year)
+                    
+                    if major_name not in major_cache:
+                        major_cache[major_name] = find_major_data(major_name, majors)
+                    major_data = major_cache[major_name]
+                    market_trend = extract_market_trend(major_data, current_year)
+                    
+                    score_trend = calculate_score_trend(historical_scores)
+                    expected_score = calculate_expected_score(average_score, market_trend, quota, q0, score_trend)
+                    student_score = entry['studentScore']
+                    
+                    feature_rows.append([
+                        student_score, average_score, expected_score,
+                        student_score - expected_score, quota, q0, market_trend, score_trend
+                    ])
+                    resolved_items.append({
+                        'index': entry['index'],
                         'prediction': {
                             'universityCode': university_code,
-                            'majorName': major_name,
+                            'universityName': university_name,
+                            'majorName': major_data.get('name', major_name) if major_data else major_name,
                             'combination': best_combination,
                             'studentScore': student_score,
-                            'admissionProbability': 0.5,  # Giá trị mặc định
-                            'assessment': 'Khả năng trúng tuyển trung bình'
-                        },
-                        'data': item
+                            'expectedScore': expected_score,
+                            'scoreDiff': student_score - expected_score,
+                            'quota': quota,
+                            'marketTrend': market_trend,
+                            'averageHistoricalScore': average_score,
+                            'scoreTrend': score_trend,
+                            'entryLevel': entry_level,
+                            'subjectScores': {
+                                subject: entry['subjectScores'].get(subject)
+                                for subject in SUBJECT_COMBINATIONS[best_combination]['subjects']
+                            }
+                        }
                     })
-                    
                 except Exception as e:
-                    # Xử lý lỗi cho từng item riêng biệt
-                    predictions.append({
-                        'success': False,
-                        'message': str(e),
-                        'data': item
-                    })
+                    predictions[entry['index']] = {'success': False, 'message': str(e), 'data': item}
+            
+            # 4. Chuẩn hóa một lần và dự đoán cả ma trận (N x 8) trong một lần lan truyền tiến
+            if feature_rows:
+                scaler_mean, scaler_scale = model_handle.scaler
+                features_scaled = (np.array(feature_rows, dtype=float) - scaler_mean) / scaler_scale
+                probabilities = model_handle.predict(features_scaled)
+                prediction_date = datetime.now().isoformat()
+                
+                for resolved, probability in zip(resolved_items, probabilities):
+                    prediction = resolved['prediction']
+                    prediction['admissionProbability'] = float(probability)
+                    prediction['assessment'] = get_assessment(probability)
+                    prediction['predictionDate'] = prediction_date
+                    predictions[resolved['index']] = {
+                        'success': True,
+                        'prediction': prediction,
+                        'data': data[resolved['index']]
+                    }
             
             # Trả về kết quả
             return jsonify({
                 'success': True,
+                'modelVersion': model_handle.version,
                 'predictions': predictions
             }), 200
             
@@ -596,4 +775,4 @@ def batch_predict_admission():
         return jsonify({
             'success': False,
             'message': str(e)
-        }), 500 
\ No newline at end of file
+        }), 500
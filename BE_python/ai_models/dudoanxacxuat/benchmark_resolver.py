@@ -0,0 +1,251 @@
+import os
+import sys
+import time
+import threading
+import unicodedata
+
+# Thêm đường dẫn để import các module dùng chung
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import BENCHMARK_CACHE_CHECK_SECONDS
+from utils.db_utils import db_client
+from utils.data_versions import get_data_version
+
+# Mã trường thay thế khi không tìm thấy điểm chuẩn với mã gốc
+ALTERNATE_UNIVERSITY_CODES = {
+    'NTT': ['NTTU', 'NTT', 'ĐHNT', 'NT'],
+    'BKA': ['BK', 'ĐHBK', 'HUST'],
+    'NLSHCM': ['NLS', 'ĐHNL']
+}
+
+# Trường phổ biến dùng làm điểm chuẩn tham khảo khi trường không có dữ liệu
+FALLBACK_UNIVERSITY_CODE = 'BKA'
+NO_FALLBACK_UNIVERSITY_CODES = ('NLS', 'NLSHCM')
+
+# Số bản ghi tối đa khi lấy điểm chuẩn bất kỳ của trường
+MAX_UNIVERSITY_RECORDS = 10
+
+# Số trường được giữ trong cache cho mỗi phiên bản dữ liệu
+MAX_CACHED_UNIVERSITIES = 512
+
+BENCHMARK_PROJECTION = {
+    'university': 1, 'university_code': 1, 'major': 1, 'subject_combination': 1,
+    'year': 1, 'benchmark_score': 1, 'entry_level': 1
+}
+
+
+def normalize_major_key(value):
+    """
+    Chuẩn hóa tên ngành để so khớp: chữ thường, bỏ dấu tiếng Việt (kể cả đ -> d), bỏ khoảng trắng thừa
+    """
+    if not isinstance(value, str):
+        return ''
+    value = unicodedata.normalize('NFD', value.lower().replace('đ', 'd').replace('Đ', 'd'))
+    value = ''.join(char for char in value if not unicodedata.combining(char))
+    return ' '.join(value.split())
+
+
+def sort_by_year_desc(records):
+    """Sắp xếp bản ghi theo năm giảm dần (giữ thứ tự gốc khi cùng năm, giống sort('year', -1))"""
+    return sorted(records, key=lambda record: record.get('year') or 0, reverse=True)
+
+
+class UniversityBenchmarks:
+    """
+    Điểm chuẩn của một trường (theo thứ tự tự nhiên), có chỉ mục theo tên ngành đã chuẩn hóa và theo từ khóa
+    """
+
+    def __init__(self, university_code, records):
+        self.university_code = university_code
+        self.records = records
+        self.keys = [normalize_major_key(record.get('major')) for record in records]
+
+        self._by_key = {}
+        self._by_token = {}
+        for position, key in enumerate(self.keys):
+            self._by_key.setdefault(key, []).append(position)
+            for token in set(key.split()):
+                self._by_token.setdefault(token, []).append(position)
+
+    def __len__(self):
+        return len(self.records)
+
+    def match_major(self, major_key, allow_keywords=False):
+        """
+        Tìm các bản ghi của ngành đã chuẩn hóa
+        - 'exact': tên ngành trùng khớp hoàn toàn
+        - 'contains': tên ngành chứa cả cụm tìm kiếm
+        - 'keyword': từ khóa đầu tiên (ít nhất 4 ký tự) có trong tên ngành
+
+        Returns:
+            Tuple (danh sách bản ghi, chiến lược) hoặc ([], None)
+        """
+        if not major_key or not self.records:
+            return [], None
+
+        positions = self._by_key.get(major_key)
+        if positions:
+            return [self.records[i] for i in positions], 'exact'
+
+        positions = [i for i, key in enumerate(self.keys) if major_key in key]
+        if positions:
+            return [self.records[i] for i in positions], 'contains'
+
+        if allow_keywords and ' ' in major_key:
+            for word in major_key.split():
+                if len(word) <= 3:
+                    continue
+                positions = self._by_token.get(word) or [i for i, key in enumerate(self.keys) if word in key]
+                if positions:
+                    return [self.records[i] for i in positions], 'keyword'
+
+        return [], None
+
+
+class BenchmarkResolver:
+    """
+    Tra cứu điểm chuẩn cho cặp (mã trường, ngành) từ cache theo trường
+    - Mỗi trường được tải bằng một truy vấn $in trên university_code (có index),
+      các bước dự phòng (mã chuẩn hóa, mã thay thế, trường phổ biến) được tải cùng truy vấn đó
+    - Cache bị xóa khi phiên bản dữ liệu benchmark_scores thay đổi (kiểm tra tối đa mỗi check_interval giây)
+    """
+
+    def __init__(self, check_interval=BENCHMARK_CACHE_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._universities = {}
+        self._version = None
+        self._last_check = 0.0
+        self._queries = 0
+
+    def resolve(self, university_code, major_name, combination=None, normalized_code=None,
+                allow_keywords=True, allow_fallbacks=True):
+        """
+        Tìm điểm chuẩn theo thứ tự ưu tiên:
+        1. Trường university_code: ngành khớp hoàn toàn/chứa cụm (ưu tiên đúng tổ hợp combination), rồi từ khóa
+        2. Mã trường đã chuẩn hóa (normalized_code), rồi các mã thay thế
+        3. Điểm chuẩn bất kỳ của trường, rồi của trường phổ biến
+
+        Args:
+            allow_keywords: Cho phép so khớp theo từ khóa của tên ngành
+            allow_fallbacks: Cho phép các bước 2 và 3
+
+        Returns:
+            Tuple (danh sách bản ghi, tên chiến lược), ([], None) nếu không tìm thấy
+        """
+        major_key = normalize_major_key(major_name)
+
+        codes = [university_code]
+        if allow_fallbacks:
+            if normalized_code and normalized_code != university_code:
+                codes.append(normalized_code)
+            codes.extend(code for code in ALTERNATE_UNIVERSITY_CODES.get(university_code, []) if code != university_code)
+            codes.append(FALLBACK_UNIVERSITY_CODE)
+        universities = self.get_universities(codes)
+
+        records, strategy = universities[university_code].match_major(major_key, allow_keywords)
+        if records:
+            if combination and strategy in ('exact', 'contains'):
+                combination_records = [record for record in records if record.get('subject_combination') == combination]
+                if combination_records:
+                    return combination_records, f'{strategy}_combination'
+            return records, strategy
+
+        if not allow_fallbacks:
+            return [], None
+
+        if normalized_code and normalized_code != university_code:
+            records, strategy = universities[normalized_code].match_major(major_key, allow_keywords)
+            if records:
+                return records, f'normalized_code_{strategy}'
+
+        for alt_code in ALTERNATE_UNIVERSITY_CODES.get(university_code, []):
+            if alt_code != university_code:
+                records, strategy = universities[alt_code].match_major(major_key)
+                if records:
+                    return records, f'alternate_code_{strategy}'
+
+        code_to_use = normalized_code or university_code
+        records = universities[code_to_use].records[:MAX_UNIVERSITY_RECORDS]
+        if records:
+            return records, 'university_any'
+
+        if university_code not in NO_FALLBACK_UNIVERSITY_CODES:
+            records = universities[FALLBACK_UNIVERSITY_CODE].records[:MAX_UNIVERSITY_RECORDS]
+            if records:
+                return records, 'fallback_university'
+
+        return [], None
+
+    def get_university(self, university_code):
+        """Điểm chuẩn của một trường (tải nếu chưa có trong cache)"""
+        return self.get_universities([university_code])[university_code]
+
+    def get_universities(self, university_codes):
+        """
+        Điểm chuẩn của nhiều trường, các trường chưa có trong cache được tải bằng một truy vấn $in
+
+        Returns:
+            Dictionary mã trường -> UniversityBenchmarks
+        """
+        self._check_version()
+
+        cache = self._universities
+        result = {code: cache[code] for code in university_codes if code in cache}
+        missing = [code for code in dict.fromkeys(university_codes) if code not in result]
+        if not missing:
+            return result
+
+        loaded = self._load(missing)
+        with self._lock:
+            if len(self._universities) + len(loaded) > MAX_CACHED_UNIVERSITIES:
+                self._universities = {}
+            self._universities.update(loaded)
+        result.update(loaded)
+        return result
+
+    def clear(self):
+        """Xóa cache (ví dụ sau khi nhập dữ liệu điểm chuẩn)"""
+        with self._lock:
+            self._universities = {}
+
+    def status(self):
+        return {
+            'cachedUniversities': len(self._universities),
+            'dataVersion': self._version,
+            'queries': self._queries
+        }
+
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+
+        with self._lock:
+            if now - self._last_check < self.check_interval:
+                return
+            self._last_check = now
+            try:
+                version = get_data_version('benchmark_scores')
+            except Exception as e:
+                print(f"Không thể đọc phiên bản dữ liệu benchmark_scores: {e}")
+                return
+
+            if version != self._version:
+                self._version = version
+                self._universities = {}
+
+    def _load(self, university_codes):
+        records_by_code = {code: [] for code in university_codes}
+        cursor = db_client.get_collection('benchmark_scores').find(
+            {'university_code': {'$in': university_codes}},
+            BENCHMARK_PROJECTION
+        )
+        for record in cursor:
+            records_by_code.setdefault(record.get('university_code'), []).append(record)
+        self._queries += 1
+
+        return {code: UniversityBenchmarks(code, records) for code, records in records_by_code.items()}
+
+
+# Resolver dùng chung cho toàn bộ worker
+benchmark_resolver = BenchmarkResolver()
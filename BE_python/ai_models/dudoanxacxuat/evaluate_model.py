@@ -20,7 +20,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.
 
 # Import các module cần thiết
 from BE_python.ai_models.dudoanxacxuat.neural_network_model import load_prediction_model
-from BE_python.ai_models.dudoanxacxuat.train_model import load_training_data, preprocess_data
+from BE_python.ai_models.dudoanxacxuat.train_model import load_validation_data
 
 # Thư mục lưu báo cáo đánh giá
 EVAL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'evaluation')
@@ -60,13 +60,16 @@ def load_test_data(test_size=0.2, random_state=42):
     Tải dữ liệu kiểm tra từ tập huấn luyện
     """
     print("Đang tải dữ liệu kiểm tra từ tập huấn luyện...")
-    df = load_training_data()
+    # Cùng cách chia với train_model.main để tập kiểm tra đúng là phần validation không dùng khi huấn luyện
+    data = load_validation_data(validation_split=test_size, seed=random_state)
     
-    if df is None or df.empty:
+    if data is None:
         raise ValueError("Không có dữ liệu huấn luyện, cần chạy training_data_creator.py trước")
     
-    # Tiền xử lý dữ liệu và chia tập huấn luyện/kiểm tra
-    X_train, X_test, y_train, y_test, scaler, features = preprocess_data(df)
+    # Chuẩn hóa bằng scaler đã lưu cùng mô hình
+    X_original, y_test = data
+    model, scaler, features = load_prediction_model()
+    X_test = scaler.transform(X_original)
     
     print(f"Đã tải dữ liệu kiểm tra: {len(y_test)} mẫu")
     return X_test, y_test, scaler, features
@@ -1,6 +1,4 @@
 import os
-import tensorflow as tf
-import numpy as np
 
 # Thư mục chứa mô hình - sử dụng đường dẫn tuyệt đối
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+from datetime import datetime
+import numpy as np
+
+from config.config import ADMISSION_INFERENCE_BACKEND, TFLITE_NUM_THREADS
+from .numpy_inference import NumpyDenseNetwork
+from ai_models.tflite_inference import TFLiteModel, tflite_path_for, is_export_current, file_sha1
+
+# Thư mục chứa mô hình - sử dụng đường dẫn tuyệt đối
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(current_dir, 'models')
+MODEL_FILENAME = 'admission_probability_model.h5'
+
+
+def compute_model_version(model_path):
+    """
+    Tính phiên bản của mô hình dựa trên nội dung file .h5
+
+    Returns:
+        Chuỗi 12 ký tự đầu của mã băm SHA-1
+    """
+    return file_sha1(model_path)[:12]
+
+
+class AdmissionModelHandle:
+    """
+    Bộ mô hình dự đoán xác suất đã tải, dùng chung (chỉ đọc) giữa các request
+    """
+
+    def __init__(self, model, scaler, features, model_path, version, loaded_at, load_time_ms, backend):
+        self.model = model
+        self.scaler = scaler
+        self.features = features
+        self.model_path = model_path
+        self.version = version
+        self.loaded_at = loaded_at
+        self.load_time_ms = load_time_ms
+        self.backend = backend
+
+    def predict(self, X):
+        """Dự đoán xác suất cho ma trận đặc trưng đã chuẩn hóa, trả về mảng 1 chiều"""
+        return np.asarray(self.model.predict(X, verbose=0)).reshape(-1)
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'backend': self.backend,
+            'modelPath': self.model_path,
+            'features': self.features,
+            'loadedAt': self.loaded_at.isoformat(),
+            'loadTimeMs': round(self.load_time_ms, 2)
+        }
+
+
+class AdmissionModelRegistry:
+    """
+    Registry giữ mô hình, scaler và danh sách đặc trưng của mô hình dự đoán xác suất
+    - Tải một lần cho mỗi worker, các request dùng chung một handle
+    - An toàn luồng: chỉ một luồng thực hiện việc tải, các luồng khác chờ kết quả
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, backend=ADMISSION_INFERENCE_BACKEND):
+        if backend not in ('numpy', 'tflite', 'keras'):
+            raise ValueError(f"Engine suy luận không hợp lệ: {backend} (chỉ hỗ trợ 'numpy', 'tflite' hoặc 'keras')")
+        self.model_dir = model_dir
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._handle = None
+        self._last_error = None
+
+    def get(self):
+        """
+        Lấy handle của mô hình, tải mô hình nếu chưa được tải
+
+        Raises:
+            FileNotFoundError: Nếu thiếu file mô hình, scaler hoặc danh sách đặc trưng
+        """
+        handle = self._handle
+        if handle is not None:
+            return handle
+
+        with self._lock:
+            if self._handle is None:
+                self._handle = self._load()
+            return self._handle
+
+    def reload(self):
+        """Tải lại mô hình từ đĩa và thay thế handle hiện tại"""
+        with self._lock:
+            self._handle = self._load()
+            return self._handle
+
+    def is_loaded(self):
+        return self._handle is not None
+
+    def status(self):
+        """Thông tin trạng thái cho health check (không kích hoạt việc tải mô hình)"""
+        handle = self._handle
+        status = {'loaded': handle is not None}
+        if handle is not None:
+            status.update(handle.to_dict())
+        if self._last_error:
+            status['lastError'] = self._last_error
+        return status
+
+    def _load(self):
+        start = time.perf_counter()
+        model_path = os.path.join(self.model_dir, MODEL_FILENAME)
+
+        try:
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"Không tìm thấy mô hình tại {model_path}. Vui lòng chạy neural_network_model.py trước để huấn luyện mô hình")
+
+            scaler_mean_path = os.path.join(self.model_dir, 'scaler_mean.npy')
+            scaler_scale_path = os.path.join(self.model_dir, 'scaler_scale.npy')
+            features_path = os.path.join(self.model_dir, 'features.txt')
+
+            if not os.path.exists(scaler_mean_path) or not os.path.exists(scaler_scale_path):
+                raise FileNotFoundError("Không tìm thấy file scaler cần thiết")
+
+            if not os.path.exists(features_path):
+                raise FileNotFoundError("Không tìm thấy file danh sách đặc trưng")
+
+            model, backend = self._load_model(model_path)
+            scaler = (np.load(scaler_mean_path), np.load(scaler_scale_path))
+
+            with open(features_path, 'r', encoding='utf-8') as f:
+                features = f.read().splitlines()
+
+            # Chạy thử một lần để khởi tạo hàm predict trước khi chia sẻ giữa các luồng
+            model.predict(np.zeros((1, len(scaler[0]))), verbose=0)
+        except Exception as e:
+            self._last_error = str(e)
+            raise
+
+        load_time_ms = (time.perf_counter() - start) * 1000
+        handle = AdmissionModelHandle(
+            model=model,
+            scaler=scaler,
+            features=features,
+            model_path=model_path,
+            version=compute_model_version(model_path),
+            loaded_at=datetime.now(),
+            load_time_ms=load_time_ms,
+            backend=backend
+        )
+        self._last_error = None
+        print(f"Đã tải mô hình dự đoán xác suất phiên bản {handle.version} (engine {backend}) trong {load_time_ms:.0f}ms")
+        return handle
+
+    def _load_model(self, model_path):
+        if self.backend == 'tflite':
+            try:
+                if not is_export_current(model_path):
+                    raise FileNotFoundError(f"chưa xuất {os.path.basename(tflite_path_for(model_path))} từ phiên bản .h5 hiện tại")
+                return TFLiteModel(tflite_path_for(model_path), num_threads=TFLITE_NUM_THREADS), 'tflite'
+            except (ImportError, FileNotFoundError) as e:
+                print(f"Không thể dùng engine TFLite ({e}), chuyển sang engine NumPy")
+
+        if self.backend in ('numpy', 'tflite'):
+            # Đọc trọng số trực tiếp từ file .h5, không cần import TensorFlow
+            return NumpyDenseNetwork.from_h5(model_path), 'numpy'
+
+        import tensorflow as tf
+        return tf.keras.models.load_model(model_path), 'keras'
+
+
+# Registry dùng chung cho toàn bộ worker
+admission_model_registry = AdmissionModelRegistry()
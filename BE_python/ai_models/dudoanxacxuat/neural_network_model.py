@@ -15,25 +15,33 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../.
 MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
 os.makedirs(MODEL_DIR, exist_ok=True)
 
-def build_model(input_dim):
+def build_model(input_dim, hidden_units=(16, 8), dropout=0.5, learning_rate=0.01, optimizer='sgd'):
     """
     Xây dựng mô hình mạng nơ-ron
+
+    Args:
+        input_dim: Số đặc trưng đầu vào
+        hidden_units: Số nơ-ron của từng tầng ẩn (relu)
+        dropout: Tỷ lệ dropout sau tầng ẩn đầu tiên (0: không dùng dropout)
+        learning_rate: Tốc độ học
+        optimizer: 'sgd' hoặc 'adam'
     """
-    model = Sequential([
-        # Mô hình đơn giản hơn nhiều, không có BatchNorm
-        Dense(16, activation='relu', input_shape=(input_dim,), 
-              kernel_initializer='glorot_uniform'),
-        Dropout(0.5),  
-        
-        Dense(8, activation='relu',
-              kernel_initializer='glorot_uniform'),
-        
-        Dense(1, activation='sigmoid')
-    ])
+    if optimizer not in ('sgd', 'adam'):
+        raise ValueError(f"Optimizer không hợp lệ: {optimizer} (chỉ hỗ trợ 'sgd' hoặc 'adam')")
+    
+    # Mô hình đơn giản, không có BatchNorm (engine NumPy khi phục vụ chỉ hỗ trợ Dense và Dropout)
+    layers = []
+    for i, units in enumerate(hidden_units):
+        kwargs = {'input_shape': (input_dim,)} if i == 0 else {}
+        layers.append(Dense(units, activation='relu', kernel_initializer='glorot_uniform', **kwargs))
+        if i == 0 and dropout > 0:
+            layers.append(Dropout(dropout))
+    
+    layers.append(Dense(1, activation='sigmoid', **({} if hidden_units else {'input_shape': (input_dim,)})))
+    model = Sequential(layers)
     
-   
     model.compile(
-        optimizer=SGD(learning_rate=0.01),
+        optimizer=SGD(learning_rate=learning_rate) if optimizer == 'sgd' else Adam(learning_rate=learning_rate),
         loss='mean_squared_error',
         metrics=['mean_absolute_error', 'mean_squared_error']
     )
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+Engine suy luận bằng NumPy cho mô hình dự đoán xác suất (Dense 16-8-1)
+
+Trọng số được đọc trực tiếp từ file admission_probability_model.h5 bằng h5py,
+không cần import TensorFlow. Dropout không có tác dụng khi suy luận nên được bỏ qua.
+
+Kiểm tra sai số so với Keras:
+    python numpy_inference.py --test-file test_data_2000.csv
+"""
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import h5py
+
+# Thêm thư mục gốc vào sys.path để có thể import khi chạy trực tiếp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from ai_models.h5_inference import PASSTHROUGH_LAYERS, ACTIVATIONS, decode_attribute
+
+# Thư mục chứa mô hình - sử dụng đường dẫn tuyệt đối
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(current_dir, 'models')
+
+
+class NumpyDenseNetwork:
+    """
+    Mạng nơ-ron gồm các tầng Dense, tính toán bằng phép nhân ma trận NumPy
+
+    Có cùng giao diện predict(X, verbose=0) với mô hình Keras để có thể thay thế trực tiếp
+    """
+
+    def __init__(self, layers):
+        """
+        Args:
+            layers: Danh sách các tuple (kernel, bias, activation)
+        """
+        if not layers:
+            raise ValueError("Mạng nơ-ron phải có ít nhất một tầng Dense")
+        self.layers = layers
+        self.input_dim = layers[0][0].shape[0]
+        self.output_dim = layers[-1][0].shape[1]
+
+    @classmethod
+    def from_h5(cls, model_path):
+        """
+        Đọc cấu trúc và trọng số từ file .h5 do Keras lưu
+
+        Raises:
+            ValueError: Nếu mô hình chứa tầng không được hỗ trợ
+        """
+        with h5py.File(model_path, 'r') as f:
+            model_config = json.loads(decode_attribute(f.attrs['model_config']))
+            weights_group = f['model_weights'] if 'model_weights' in f else f
+
+            layers = []
+            for layer in model_config['config']['layers']:
+                class_name = layer['class_name']
+                config = layer['config']
+
+                if class_name in PASSTHROUGH_LAYERS:
+                    continue
+                if class_name != 'Dense':
+                    raise ValueError(f"Không hỗ trợ tầng {class_name} trong engine NumPy")
+
+                activation = config.get('activation', 'linear')
+                if activation not in ACTIVATIONS:
+                    raise ValueError(f"Không hỗ trợ hàm kích hoạt {activation} trong engine NumPy")
+
+                layer_group = weights_group[config['name']]
+                weight_names = [decode_attribute(name) for name in layer_group.attrs['weight_names']]
+                weights = {name.split('/')[-1].split(':')[0]: np.asarray(layer_group[name]) for name in weight_names}
+
+                kernel = weights['kernel']
+                bias = weights.get('bias', np.zeros(kernel.shape[1], dtype=kernel.dtype))
+                layers.append((kernel, bias, activation))
+
+        return cls(layers)
+
+    def predict(self, X, verbose=0):
+        """
+        Lan truyền tiến cho cả batch
+
+        Args:
+            X: Ma trận đặc trưng đã chuẩn hóa, kích thước (n, input_dim)
+            verbose: Giữ để tương thích với model.predict của Keras
+
+        Returns:
+            Ma trận kích thước (n, output_dim)
+        """
+        output = np.asarray(X, dtype=self.layers[0][0].dtype)
+        if output.ndim == 1:
+            output = output.reshape(1, -1)
+
+        for kernel, bias, activation in self.layers:
+            output = ACTIVATIONS[activation](output @ kernel + bias)
+
+        return output
+
+
+def verify_parity(model_path, X, atol=1e-5):
+    """
+    So sánh kết quả của engine NumPy với mô hình Keras gốc
+
+    Returns:
+        Sai số tuyệt đối lớn nhất giữa hai engine
+    """
+    import tensorflow as tf
+
+    keras_preds = tf.keras.models.load_model(model_path).predict(X, verbose=0)
+    numpy_preds = NumpyDenseNetwork.from_h5(model_path).predict(X)
+
+    max_error = float(np.max(np.abs(keras_preds - numpy_preds)))
+    if max_error > atol:
+        raise AssertionError(f"Sai số giữa NumPy và Keras ({max_error:.2e}) vượt quá ngưỡng {atol:.0e}")
+    return max_error
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description='Kiểm tra engine NumPy so với Keras')
+    parser.add_argument('--test-file', default=os.path.join(current_dir, 'test_data_2000.csv'), help='File CSV dữ liệu kiểm tra')
+    parser.add_argument('--atol', type=float, default=1e-5, help='Sai số tuyệt đối cho phép')
+    args = parser.parse_args()
+
+    with open(os.path.join(MODEL_DIR, 'features.txt'), 'r', encoding='utf-8') as f:
+        features = f.read().splitlines()
+
+    df = pd.read_csv(args.test_file)
+    if 'Chênh lệch điểm' not in df.columns:
+        df['Chênh lệch điểm'] = df['Điểm học sinh'] - df['Điểm chuẩn dự kiến']
+
+    scaler_mean = np.load(os.path.join(MODEL_DIR, 'scaler_mean.npy'))
+    scaler_scale = np.load(os.path.join(MODEL_DIR, 'scaler_scale.npy'))
+    X = (df[features].values - scaler_mean) / scaler_scale
+
+    model_path = os.path.join(MODEL_DIR, 'admission_probability_model.h5')
+    max_error = verify_parity(model_path, X, atol=args.atol)
+    print(f"Engine NumPy khớp với Keras trên {len(X)} mẫu, sai số lớn nhất: {max_error:.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,26 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
 import tensorflow as tf
 from sklearn.preprocessing import StandardScaler
 import argparse
 import json
-from pymongo import MongoClient
 from dotenv import load_dotenv
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+# Thêm đường dẫn để import các module dùng chung
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from utils.reference_data import reference_data
+from utils.db_utils import db
+from ai_models.dudoanxacxuat.benchmark_resolver import benchmark_resolver
 
 # Tải biến môi trường
 load_dotenv()
 
-# Kết nối MongoDB
-MONGO_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017')
-DB_NAME = os.getenv('DB_NAME', 'tuyen_sinh_thong_minh')
-
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
+# Kết nối MongoDB dùng chung (tạo khi truy vấn lần đầu, cấu hình trong config/config.py)
 
 # Thư mục chứa mô hình - sử dụng đường dẫn tuyệt đối
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -102,8 +104,11 @@ def predict_from_mongodb(university_code, major_name, combination, student_score
         normalized_major_name = major_name.lower().strip()
         print(f"DEBUG: Đang tìm ngành '{normalized_major_name}'")
         
+        # Ngành và trường được tra cứu trong ảnh chụp dữ liệu tham chiếu thay vì truy vấn MongoDB
+        snapshot = reference_data.snapshot()
+        
         # Tìm thông tin ngành học
-        major = db.majors.find_one({'nameNormalized': normalized_major_name})
+        major = snapshot.get_by_name('majors', normalized_major_name)
         if major:
             print(f"DEBUG: Đã tìm thấy ngành chính xác: {major.get('name')}")
         
@@ -111,7 +116,7 @@ def predict_from_mongodb(university_code, major_name, combination, student_score
         if not major:
             # Tìm với regex (tìm kiếm chứa)
             print(f"DEBUG: Tìm ngành với regex: {normalized_major_name}")
-            major = db.majors.find_one({'nameNormalized': {'$regex': normalized_major_name, '$options': 'i'}})
+            major = snapshot.find_first('majors', 'nameNormalized', normalized_major_name)
             if major:
                 print(f"DEBUG: Đã tìm thấy ngành với regex: {major.get('name')}")
             
@@ -121,7 +126,7 @@ def predict_from_mongodb(university_code, major_name, combination, student_score
                 for word in words:
                     if len(word) > 3:  # Chỉ tìm với từ có ít nhất 4 ký tự
                         print(f"DEBUG: Tìm ngành với từ khóa: {word}")
-                        major = db.majors.find_one({'nameNormalized': {'$regex': word, '$options': 'i'}})
+                        major = snapshot.find_first('majors', 'nameNormalized', word)
                         if major:
                             print(f"DEBUG: Đã tìm thấy ngành với từ khóa: {major.get('name')}")
                             break
@@ -138,14 +143,14 @@ def predict_from_mongodb(university_code, major_name, combination, student_score
             if not major and normalized_major_name in special_cases:
                 alt_name = special_cases[normalized_major_name]
                 print(f"DEBUG: Tìm ngành với tên thay thế: {alt_name}")
-                major = db.majors.find_one({'nameNormalized': {'$regex': alt_name, '$options': 'i'}})
+                major = snapshot.find_first('majors', 'nameNormalized', alt_name)
                 if major:
                     print(f"DEBUG: Đã tìm thấy ngành với tên thay thế: {major.get('name')}")
                 
             # Nếu vẫn không tìm thấy
             if not major:
                 # Lấy danh sách ngành để gợi ý
-                similar_majors = list(db.majors.find({}, {'name': 1, 'nameNormalized': 1}).limit(5))
+                similar_majors = snapshot.all('majors')[:5]
                 similar_names = [m.get('name') for m in similar_majors if m.get('name')]
                 
                 suggestion_message = ""
@@ -177,21 +182,22 @@ def predict_from_mongodb(university_code, major_name, combination, student_score
         
         # Tìm thông tin trường đại học
         print(f"DEBUG: Đang tìm trường có mã '{university_code}'")
-        university = db.universities.find_one({'code': university_code})
+        university = snapshot.get_by_code('universities', university_code)
         if university:
             print(f"DEBUG: Đã tìm thấy trường chính xác: {university.get('name')}")
         
         if not university:
             # Thử tìm với regex không phân biệt hoa thường
             print(f"DEBUG: Tìm trường với regex: {university_code}")
-            university = db.universities.find_one({'code': {'$regex': f"^{university_code}$", '$options': 'i'}})
+            university = snapshot.get_by_code('universities', university_code, case_sensitive=False)
             if university:
                 print(f"DEBUG: Đã tìm thấy trường với regex: {university.get('name')}")
             
             # Thử tìm trong collection benchmark_scores với university_code
             if not university:
                 print(f"DEBUG: Tìm trường trong collection benchmark_scores với university_code: {university_code}")
-                benchmark_university = db.benchmark_scores.find_one({'university_code': university_code})
+                university_benchmarks = benchmark_resolver.get_university(university_code).records
+                benchmark_university = university_benchmarks[0] if university_benchmarks else None
                 if benchmark_university:
                     university_name = benchmark_university.get('university')
                     print(f"DEBUG: Đã tìm thấy trường trong benchmark_scores: {university_name}")
@@ -227,14 +233,14 @@ def predict_from_mongodb(university_code, major_name, combination, student_score
             if not university and university_code in special_cases:
                 alt_code = special_cases[university_code]
                 print(f"DEBUG: Tìm trường với mã thay thế: {alt_code}")
-                university = db.universities.find_one({'code': alt_code})
+                university = snapshot.get_by_code('universities', alt_code)
                 if university:
                     print(f"DEBUG: Đã tìm thấy trường với mã thay thế: {university.get('name')}")
             
             # Thử tìm trong tất cả các trường và hiển thị danh sách
             if not university:
                 print(f"DEBUG: Tìm trực tiếp trong collection universities")
-                all_unis = list(db.universities.find({}, {'name': 1, 'code': 1}).limit(20))
+                all_unis = snapshot.all('universities')[:20]
                 print(f"DEBUG: Danh sách 20 trường đầu tiên:")
                 for uni in all_unis:
                     print(f"DEBUG: - Tên: {uni.get('name')}, Mã: {uni.get('code')}")
@@ -420,115 +426,35 @@ def predict_from_mongodb(university_code, major_name, combination, student_score
         q0 = sum(all_quotas) / len(all_quotas) if all_quotas else quota
         print(f"DEBUG: Chỉ tiêu trung bình (q0): {q0}")
         
-        # Lấy dữ liệu điểm chuẩn từ benchmark_scores
+        # Lấy dữ liệu điểm chuẩn từ cache điểm chuẩn theo trường (một truy vấn có index khi chưa có trong cache)
         print(f"DEBUG: Tìm điểm chuẩn cho trường {university_code}, ngành {normalized_major_name}, tổ hợp {combination}")
-        benchmark_scores = list(db.benchmark_scores.find({
-            'university_code': university_code,
-            'major': {'$regex': normalized_major_name, '$options': 'i'},
-            'subject_combination': combination
-        }))
-        
-        # Nếu không tìm thấy với combination cụ thể, thử tìm với bất kỳ tổ hợp nào
-        if not benchmark_scores:
-            print(f"DEBUG: Không tìm thấy điểm chuẩn với tổ hợp {combination}, tìm với bất kỳ tổ hợp nào")
-            benchmark_scores = list(db.benchmark_scores.find({
-                'university_code': university_code,
-                'major': {'$regex': normalized_major_name, '$options': 'i'}
-            }))
-            
-        # Nếu vẫn không tìm thấy, tìm với regex của từng từ trong tên ngành
-        if not benchmark_scores and ' ' in normalized_major_name:
-            print(f"DEBUG: Không tìm thấy điểm chuẩn với tên ngành đầy đủ, tìm với từng từ")
-            words = normalized_major_name.split()
-            for word in words:
-                if len(word) > 3:  # Chỉ tìm với từ có ít nhất 4 ký tự
-                    print(f"DEBUG: Tìm điểm chuẩn với từ khóa: {word}")
-                    benchmark_scores = list(db.benchmark_scores.find({
-                        'university_code': university_code,
-                        'major': {'$regex': word, '$options': 'i'}
-                    }))
-                    if benchmark_scores:
-                        print(f"DEBUG: Tìm thấy {len(benchmark_scores)} điểm chuẩn với từ khóa {word}")
-                        break
-        
-        # Thử tìm với mã trường đã chuẩn hóa
-        if not benchmark_scores and university and 'code' in university:
-            uni_code = university['code']
-            if uni_code != university_code:
-                print(f"DEBUG: Tìm điểm chuẩn với mã trường chuẩn hóa: {uni_code}")
-                benchmark_scores = list(db.benchmark_scores.find({
-                    'university_code': uni_code,
-                    'major': {'$regex': normalized_major_name, '$options': 'i'}
-                }))
-                
-                if not benchmark_scores and ' ' in normalized_major_name:
-                    words = normalized_major_name.split()
-                    for word in words:
-                        if len(word) > 3:
-                            benchmark_scores = list(db.benchmark_scores.find({
-                                'university_code': uni_code,
-                                'major': {'$regex': word, '$options': 'i'}
-                            }))
-                            if benchmark_scores:
-                                break
-        
-        # Thử tìm với một số trường hợp đặc biệt của university_code
-        if not benchmark_scores:
-            special_uni_codes = {
-                'NTT': ['NTTU', 'NTT', 'ĐHNT', 'NT'],
-                'BKA': ['BK', 'ĐHBK', 'HUST'],
-                'NLSHCM': ['NLS', 'ĐHNL']
-            }
-            
-            if university_code in special_uni_codes:
-                for alt_code in special_uni_codes[university_code]:
-                    if alt_code != university_code:
-                        print(f"DEBUG: Tìm điểm chuẩn với mã trường thay thế: {alt_code}")
-                        benchmark_scores = list(db.benchmark_scores.find({
-                            'university_code': alt_code,
-                            'major': {'$regex': normalized_major_name, '$options': 'i'}
-                        }))
-                        if benchmark_scores:
-                            print(f"DEBUG: Tìm thấy {len(benchmark_scores)} điểm chuẩn với mã trường thay thế {alt_code}")
-                            break
+        benchmark_scores, strategy = benchmark_resolver.resolve(
+            university_code,
+            normalized_major_name,
+            combination=combination,
+            normalized_code=university.get('code') if university else None
+        )
         
-        if not benchmark_scores:
-            # Nếu không tìm thấy, lấy tất cả điểm chuẩn của trường này
-            print(f"DEBUG: Tìm điểm chuẩn bất kỳ của trường")
-            uni_code_to_use = university['code'] if university and 'code' in university else university_code
-            benchmark_scores = list(db.benchmark_scores.find({
-                'university_code': uni_code_to_use
-            }).limit(10))
-            
-            if benchmark_scores:
-                print(f"DEBUG: Tìm thấy {len(benchmark_scores)} điểm chuẩn của trường {uni_code_to_use}")
-            elif university_code != 'NLS' and university_code != 'NLSHCM':  # Thử với trường phổ biến nếu không phải NLS
-                # Thử tìm một trường phổ biến như BKA
-                print(f"DEBUG: Thử tìm điểm chuẩn của trường phổ biến BKA")
-                benchmark_scores = list(db.benchmark_scores.find({
-                    'university_code': 'BKA'
-                }).limit(10))
-                if benchmark_scores:
-                    print(f"DEBUG: Sử dụng điểm chuẩn của trường BKA ({len(benchmark_scores)} bản ghi)")
-            
-            if not benchmark_scores:
-                # Tạo dữ liệu mẫu nếu không tìm thấy gì
-                print(f"DEBUG: Không tìm thấy bất kỳ điểm chuẩn nào, tạo dữ liệu mẫu")
-                current_year = datetime.now().year
-                benchmark_scores = [
-                    {
-                        'university_code': university_code,
-                        'major': normalized_major_name,
-                        'year': current_year - 1,
-                        'benchmark_score': 20.0
-                    },
-                    {
-                        'university_code': university_code,
-                        'major': normalized_major_name,
-                        'year': current_year - 2,
-                        'benchmark_score': 19.5
-                    }
-                ]
+        if benchmark_scores:
+            print(f"DEBUG: Tìm thấy {len(benchmark_scores)} điểm chuẩn (chiến lược: {strategy})")
+        else:
+            # Tạo dữ liệu mẫu nếu không tìm thấy gì
+            print(f"DEBUG: Không tìm thấy bất kỳ điểm chuẩn nào, tạo dữ liệu mẫu")
+            current_year = datetime.now().year
+            benchmark_scores = [
+                {
+                    'university_code': university_code,
+                    'major': normalized_major_name,
+                    'year': current_year - 1,
+                    'benchmark_score': 20.0
+                },
+                {
+                    'university_code': university_code,
+                    'major': normalized_major_name,
+                    'year': current_year - 2,
+                    'benchmark_score': 19.5
+                }
+            ]
         
         # Xử lý dữ liệu benchmark_scores
         historical_scores = []
@@ -620,8 +546,9 @@ def save_prediction_to_mongodb(user_id, anonymous_id, prediction_data):
     Lưu kết quả dự đoán vào MongoDB
     """
     try:
-        # Kiểm tra xem đã có dữ liệu của học sinh này chưa
-        filter_query = {}
+        # Xác định học sinh theo userId hoặc anonymousId, chỉ xét document chứa dự đoán
+        # (mỗi học sinh một document, được đảm bảo bởi index unique một phần trong utils/db_indexes.py)
+        filter_query = {'admissionPredictions': {'$exists': True}}
         if user_id:
             filter_query['userId'] = ObjectId(user_id)
         elif anonymous_id:
@@ -630,80 +557,54 @@ def save_prediction_to_mongodb(user_id, anonymous_id, prediction_data):
             anonymous_id = f"anon_{datetime.now().strftime('%Y%m%d%H%M%S')}"
             filter_query['anonymousId'] = anonymous_id
         
-        student_data = db.student_data.find_one(filter_query)
+        now = datetime.now()
+        new_prediction = {
+            'universityId': ObjectId(prediction_data.get('universityId')) if 'universityId' in prediction_data else None,
+            'universityName': prediction_data.get('universityName'),
+            'majorId': ObjectId(prediction_data.get('majorId')) if 'majorId' in prediction_data else None,
+            'majorName': prediction_data.get('majorName'),
+            'combination': prediction_data.get('combination'),
+            'admissionProbability': prediction_data.get('admissionProbability'),
+            'year': now.year
+        }
         
-        if student_data:
-            # Nếu đã có dữ liệu, cập nhật thêm dự đoán mới
-            current_predictions = student_data.get('admissionPredictions', [])
-            
-            # Kiểm tra xem đã có dự đoán tương tự chưa
-            similar_prediction = None
-            for idx, pred in enumerate(current_predictions):
-                if (pred.get('universityName') == prediction_data.get('universityName') and 
-                    pred.get('majorName') == prediction_data.get('majorName') and
-                    pred.get('combination') == prediction_data.get('combination')):
-                    similar_prediction = idx
-                    break
-            
-            if similar_prediction is not None:
-                # Cập nhật dự đoán cũ
-                current_predictions[similar_prediction] = {
-                    'universityId': ObjectId(prediction_data.get('universityId')) if 'universityId' in prediction_data else None,
-                    'universityName': prediction_data.get('universityName'),
-                    'majorId': ObjectId(prediction_data.get('majorId')) if 'majorId' in prediction_data else None,
-                    'majorName': prediction_data.get('majorName'),
-                    'combination': prediction_data.get('combination'),
-                    'admissionProbability': prediction_data.get('admissionProbability'),
-                    'year': datetime.now().year
-                }
-            else:
-                # Thêm dự đoán mới
-                current_predictions.append({
-                    'universityId': ObjectId(prediction_data.get('universityId')) if 'universityId' in prediction_data else None,
-                    'universityName': prediction_data.get('universityName'),
-                    'majorId': ObjectId(prediction_data.get('majorId')) if 'majorId' in prediction_data else None,
-                    'majorName': prediction_data.get('majorName'),
-                    'combination': prediction_data.get('combination'),
-                    'admissionProbability': prediction_data.get('admissionProbability'),
-                    'year': datetime.now().year
-                })
-            
-            # Cập nhật document
-            db.student_data.update_one(
-                filter_query,
-                {
-                    '$set': {
-                        'admissionPredictions': current_predictions,
-                        'metadata.updatedAt': datetime.now()
-                    }
-                }
-            )
-        else:
-            # Nếu chưa có, tạo mới
-            new_student_data = {
-                'anonymousId': anonymous_id,
-                'admissionPredictions': [{
-                    'universityId': ObjectId(prediction_data.get('universityId')) if 'universityId' in prediction_data else None,
-                    'universityName': prediction_data.get('universityName'),
-                    'majorId': ObjectId(prediction_data.get('majorId')) if 'majorId' in prediction_data else None,
-                    'majorName': prediction_data.get('majorName'),
-                    'combination': prediction_data.get('combination'),
-                    'admissionProbability': prediction_data.get('admissionProbability'),
-                    'year': datetime.now().year
-                }],
-                'metadata': {
-                    'dataVersion': '1.0',
-                    'createdAt': datetime.now(),
-                    'updatedAt': datetime.now()
-                }
+        # Một lệnh update dạng pipeline (atomic trên server, không cần đọc document trước):
+        # thay dự đoán cùng trường/ngành/tổ hợp nếu đã có, nếu chưa thì thêm vào cuối mảng;
+        # tạo document mới nếu học sinh chưa có dữ liệu (upsert).
+        # Hai lần dự đoán đầu tiên đồng thời cùng upsert: lần sau bị lỗi trùng khóa và được thử lại,
+        # lúc này sẽ cập nhật document lần trước vừa tạo
+        same_prediction = {'$and': [
+            {'$eq': [f'$$prediction.{field}', {'$literal': new_prediction[field]}]}
+            for field in ('universityName', 'majorName', 'combination')
+        ]}
+        new_fields = {
+            'admissionPredictions': {'$let': {
+                'vars': {'existing': {'$ifNull': ['$admissionPredictions', []]}},
+                'in': {'$cond': [
+                    {'$gt': [{'$size': {'$filter': {
+                        'input': '$$existing', 'as': 'prediction', 'cond': same_prediction
+                    }}}, 0]},
+                    {'$map': {
+                        'input': '$$existing', 'as': 'prediction',
+                        'in': {'$cond': [same_prediction, {'$literal': new_prediction}, '$$prediction']}
+                    }},
+                    {'$concatArrays': ['$$existing', {'$literal': [new_prediction]}]}
+                ]}
+            }},
+            # Tài liệu lồng trong $set của pipeline được gộp vào metadata hiện có
+            'metadata': {
+                'dataVersion': {'$ifNull': ['$metadata.dataVersion', '1.0']},
+                'createdAt': {'$ifNull': ['$metadata.createdAt', now]},
+                'updatedAt': now
             }
-            
-            # Thêm userId nếu có
-            if user_id:
-                new_student_data['userId'] = ObjectId(user_id)
-            
-            # Thêm document mới
-            db.student_data.insert_one(new_student_data)
+        }
+        if anonymous_id:
+            new_fields['anonymousId'] = {'$ifNull': ['$anonymousId', {'$literal': anonymous_id}]}
+        
+        try:
+            db.student_data.update_one(filter_query, [{'$set': new_fields}], upsert=True)
+        except DuplicateKeyError:
+            db.student_data.update_one(filter_query, [{'$set': new_fields}], upsert=True)
         
         print("Đã lưu kết quả dự đoán vào MongoDB")
         return True
@@ -720,8 +621,9 @@ def interactive_prediction(model, scaler, features):
     
     try:
         # Lấy danh sách trường và ngành từ MongoDB
-        universities = list(db.universities.find({}, {'code': 1, 'name': 1}))
-        majors = list(db.majors.find({}, {'name': 1, 'nameNormalized': 1}))
+        snapshot = reference_data.snapshot()
+        universities = snapshot.all('universities')
+        majors = snapshot.all('majors')
         
         # Hiển thị các lựa chọn
         print("\nDanh sách trường đại học:")
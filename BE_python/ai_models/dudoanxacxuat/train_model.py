@@ -2,17 +2,18 @@ import pandas as pd
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-import matplotlib.pyplot as plt
 import os
 import sys
+import json
 from datetime import datetime
 
 # Thêm đường dẫn gốc vào sys.path để có thể import
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../")))
 # Import MongoDBClient từ utils
 from BE_python.utils.db_utils import db_client
+from BE_python.utils.training_store import count_training_records
+from BE_python.config.config import TRAINING_MAX_SAMPLES
+from BE_python.ai_models.training_pipeline import ChunkedTrainingSet, store_source, csv_source, dataset_labels
 # Import hàm build_model từ neural_network_model
 from BE_python.ai_models.dudoanxacxuat.neural_network_model import build_model
 
@@ -20,77 +21,136 @@ from BE_python.ai_models.dudoanxacxuat.neural_network_model import build_model
 MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
 os.makedirs(MODEL_DIR, exist_ok=True)
 
-def load_training_data():
+# Các cột bắt buộc, đặc trưng (features) và nhãn (label)
+REQUIRED_COLUMNS = [
+    'Điểm học sinh', 'Điểm chuẩn trung bình', 'Điểm chuẩn dự kiến', 
+    'Chỉ tiêu', 'q0', 'Market trend', 'Xu hướng điểm chuẩn', 
+    'Xác suất trúng tuyển'
+]
+FEATURES = [
+    'Điểm học sinh', 'Điểm chuẩn trung bình', 'Điểm chuẩn dự kiến', 
+    'Chênh lệch điểm', 'Chỉ tiêu', 'q0', 'Market trend', 'Xu hướng điểm chuẩn'
+]
+LABEL = 'Xác suất trúng tuyển'
+
+# Siêu tham số mặc định, bị ghi đè bởi models/hyperparameters.json (cấu hình tốt nhất của sweep_admission_model.py)
+DEFAULT_HYPERPARAMETERS = {
+    'epochs': 32,
+    'batch_size': 64,
+    'learning_rate': 0.01,
+    'optimizer': 'sgd',
+    'hidden_units': [16, 8],
+    'dropout': 0.5
+}
+HYPERPARAMETERS_PATH = os.path.join(MODEL_DIR, 'hyperparameters.json')
+
+def load_hyperparameters():
+    """
+    Siêu tham số dùng để huấn luyện: DEFAULT_HYPERPARAMETERS ghi đè bởi models/hyperparameters.json nếu có
+    """
+    params = dict(DEFAULT_HYPERPARAMETERS)
+    if os.path.exists(HYPERPARAMETERS_PATH):
+        try:
+            with open(HYPERPARAMETERS_PATH, 'r', encoding='utf-8') as f:
+                params.update({key: value for key, value in json.load(f).items() if key in DEFAULT_HYPERPARAMETERS})
+        except (OSError, ValueError) as e:
+            print(f"Lỗi khi đọc {HYPERPARAMETERS_PATH}, dùng siêu tham số mặc định: {e}")
+    return params
+
+def save_hyperparameters(hyperparameters):
+    """Lưu siêu tham số vào models/hyperparameters.json để main() dùng cho các lần huấn luyện sau"""
+    params = {key: hyperparameters[key] for key in DEFAULT_HYPERPARAMETERS if key in hyperparameters}
+    with open(HYPERPARAMETERS_PATH, 'w', encoding='utf-8') as f:
+        json.dump(params, f, ensure_ascii=False, indent=2)
+    return HYPERPARAMETERS_PATH
+
+def prepare_features(df):
     """
-    Tải dữ liệu huấn luyện từ MongoDB hoặc file CSV
+    Xóa các dòng thiếu dữ liệu, tính đặc trưng dẫn xuất và tách đặc trưng/nhãn
+
+    Returns:
+        df, X, y: DataFrame đã lọc, ma trận đặc trưng và vector nhãn
     """
-    print("Đang tải dữ liệu huấn luyện...")
+    # Xóa các dòng có giá trị NaN trong các cột quan trọng
+    df = df.dropna(subset=REQUIRED_COLUMNS)
     
-    # Thử tải từ file CSV trước
+    # Tính chênh lệch điểm nếu chưa có
+    if 'Chênh lệch điểm' not in df.columns:
+        df['Chênh lệch điểm'] = df['Điểm học sinh'] - df['Điểm chuẩn dự kiến']
+    
+    X = df[FEATURES].values
+    y = df[LABEL].values
+    
+    return df, X, y
+
+def transform_records(records, row_ids):
+    """Tiền xử lý một chunk bản ghi cho luồng dữ liệu huấn luyện, trả về (row_ids, X, y)"""
+    df, X, y = prepare_features(pd.DataFrame(records, index=row_ids))
+    return df.index.to_numpy(), X.astype(np.float64), y.astype(np.float64).reshape(-1, 1)
+
+def load_training_source():
+    """
+    Nguồn dữ liệu huấn luyện đọc theo chunk: file CSV nếu có, nếu không là MongoDB
+    
+    Returns:
+        Nguồn chunk cho ChunkedTrainingSet, None nếu không có dữ liệu
+    """
     csv_path = os.path.join(MODEL_DIR, 'training_data.csv')
     if os.path.exists(csv_path):
         print(f"Đang đọc dữ liệu huấn luyện từ file {csv_path}")
-        return pd.read_csv(csv_path)
+        return csv_source(csv_path, transform_records)
     
-    # Nếu không có file CSV, tìm trong MongoDB
     print("Không tìm thấy file CSV, đang truy vấn MongoDB...")
     try:
-        # Sử dụng db_client để truy vấn MongoDB
-        training_record = db_client.fetch_data('training_data', 
-            query={'modelType': 'admission_probability'},
-            limit=1
-        )
-        
-        if not training_record or len(training_record) == 0 or 'records' not in training_record[0]:
+        total_records = count_training_records('admission_probability')
+        if not total_records:
             print("Không tìm thấy dữ liệu huấn luyện trong MongoDB.")
             return None
         
-        print(f"Đã tìm thấy {len(training_record[0]['records'])} bản ghi dữ liệu huấn luyện trong MongoDB")
-        return pd.DataFrame(training_record[0]['records'])
+        print(f"Đã tìm thấy {total_records} bản ghi dữ liệu huấn luyện trong MongoDB")
+        return store_source('admission_probability', transform_records)
     except Exception as e:
         print(f"Lỗi khi truy vấn MongoDB: {e}")
         return None
 
-def preprocess_data(df):
-    """
-    Tiền xử lý dữ liệu huấn luyện
+def load_validation_data(validation_split=0.2, seed=42, max_samples=TRAINING_MAX_SAMPLES):
     """
-    # Xóa các dòng có giá trị NaN trong các cột quan trọng
-    df = df.dropna(subset=[
-        'Điểm học sinh', 'Điểm chuẩn trung bình', 'Điểm chuẩn dự kiến', 
-        'Chỉ tiêu', 'q0', 'Market trend', 'Xu hướng điểm chuẩn', 
-        'Xác suất trúng tuyển'
-    ])
+    Tập validation (cùng cách chia với main) chưa chuẩn hóa, tối đa max_samples mẫu
     
-    # Tính chênh lệch điểm nếu chưa có
-    if 'Chênh lệch điểm' not in df.columns:
-        df['Chênh lệch điểm'] = df['Điểm học sinh'] - df['Điểm chuẩn dự kiến']
-    
-    # Chọn các đặc trưng (features) và nhãn (label)
-    features = [
-        'Điểm học sinh', 'Điểm chuẩn trung bình', 'Điểm chuẩn dự kiến', 
-        'Chênh lệch điểm', 'Chỉ tiêu', 'q0', 'Market trend', 'Xu hướng điểm chuẩn'
-    ]
-    label = 'Xác suất trúng tuyển'
-    
-    X = df[features].values
-    y = df[label].values
-    
-    # Chuẩn hóa đặc trưng
-    scaler = StandardScaler()
-    X_scaled = scaler.fit_transform(X)
+    Returns:
+        X, y: Ma trận đặc trưng và vector nhãn, None nếu không có dữ liệu
+    """
+    source = load_training_source()
+    if source is None:
+        return None
     
-    # Chia dữ liệu thành tập huấn luyện và tập kiểm tra
-    X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=0.2, random_state=42)
+    with ChunkedTrainingSet(source, validation_split=validation_split, seed=seed, cache='none') as data:
+        sample = data.sample(validation=True, max_rows=max_samples)
+    if sample is None:
+        return None
     
-    return X_train, X_test, y_train, y_test, scaler, features
+    X, y = sample
+    return X, y.reshape(-1)
 
-def train_model(X_train, y_train, X_test, y_test):
+def build_training(input_dim, hyperparameters=None, checkpoint_path=None):
     """
-    Huấn luyện mô hình
+    Tạo mô hình và các callback huấn luyện
+
+    Args:
+        hyperparameters: Siêu tham số ghi đè DEFAULT_HYPERPARAMETERS (chỉ cần các khóa thay đổi)
+        checkpoint_path: File lưu mô hình tốt nhất theo val_loss (mặc định models/best_model.h5)
+
+    Returns:
+        model, callbacks, params: Mô hình đã compile, danh sách callback và siêu tham số đầy đủ
     """
-    input_dim = X_train.shape[1]
-    model = build_model(input_dim)
+    params = {**DEFAULT_HYPERPARAMETERS, **(hyperparameters or {})}
+    model = build_model(
+        input_dim,
+        hidden_units=params['hidden_units'],
+        dropout=params['dropout'],
+        learning_rate=params['learning_rate'],
+        optimizer=params['optimizer']
+    )
     
     early_stopping = EarlyStopping(
         monitor='val_loss',
@@ -99,18 +159,52 @@ def train_model(X_train, y_train, X_test, y_test):
     )
     
     model_checkpoint = ModelCheckpoint(
-        filepath=os.path.join(MODEL_DIR, 'best_model.h5'),
+        filepath=checkpoint_path or os.path.join(MODEL_DIR, 'best_model.h5'),
         monitor='val_loss',
         save_best_only=True
     )
     
+    return model, [early_stopping, model_checkpoint], params
+
+def train_model(X_train, y_train, X_test, y_test, hyperparameters=None, checkpoint_path=None, verbose=1):
+    """
+    Huấn luyện mô hình trên mảng numpy đã chuẩn hóa
+
+    Args:
+        hyperparameters, checkpoint_path: Xem build_training
+        verbose: Mức in log của model.fit
+    """
+    model, callbacks, params = build_training(X_train.shape[1], hyperparameters, checkpoint_path)
+    
     history = model.fit(
         X_train, y_train,
-        epochs=32,
-        batch_size=64,
+        epochs=params['epochs'],
+        batch_size=params['batch_size'],
         validation_data=(X_test, y_test),
-        callbacks=[early_stopping, model_checkpoint],
-        verbose=1
+        callbacks=callbacks,
+        verbose=verbose
+    )
+    
+    return model, history
+
+def train_model_on_datasets(train_dataset, validation_dataset, hyperparameters=None, checkpoint_path=None, verbose=1):
+    """
+    Huấn luyện mô hình trên tf.data.Dataset (X đã chuẩn hóa, nhãn) đã chia batch,
+    batch_size của hyperparameters không được dùng
+
+    Args:
+        hyperparameters, checkpoint_path: Xem build_training
+        verbose: Mức in log của model.fit
+    """
+    input_dim = train_dataset.element_spec[0].shape[-1]
+    model, callbacks, params = build_training(input_dim, hyperparameters, checkpoint_path)
+    
+    history = model.fit(
+        train_dataset,
+        epochs=params['epochs'],
+        validation_data=validation_dataset,
+        callbacks=callbacks,
+        verbose=verbose
     )
     
     return model, history
@@ -119,7 +213,8 @@ def evaluate_model(model, X_test, y_test):
     """
     Đánh giá hiệu suất mô hình
     """
-    results = model.evaluate(X_test, y_test)
+    # X_test có thể là Dataset validation (không xáo trộn, đã gồm nhãn), y_test là nhãn theo đúng thứ tự
+    results = model.evaluate(X_test) if isinstance(X_test, tf.data.Dataset) else model.evaluate(X_test, y_test)
     print(f"Test Loss: {results[0]}")
     print(f"Test MAE: {results[1]}")
     print(f"Test MSE: {results[2]}")
@@ -141,6 +236,12 @@ def plot_results(history, y_test, y_pred):
     """
     Vẽ biểu đồ kết quả huấn luyện
     """
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("Chưa cài matplotlib, bỏ qua biểu đồ kết quả huấn luyện")
+        return
+    
     # Biểu đồ loss
     plt.figure(figsize=(12, 4))
     
@@ -164,9 +265,12 @@ def plot_results(history, y_test, y_pred):
     plt.savefig(os.path.join(MODEL_DIR, 'training_results.png'))
     plt.close()
 
-def save_model(model, scaler, features, training_metrics):
+def save_model(model, scaler, features, training_metrics, hyperparameters=None):
     """
     Lưu mô hình và cập nhật thông tin vào MongoDB
+
+    Args:
+        hyperparameters: Siêu tham số đã dùng để huấn luyện (mặc định load_hyperparameters())
     """
     # Lưu mô hình
     model_path = os.path.join(MODEL_DIR, 'admission_probability_model.h5')
@@ -189,6 +293,7 @@ def save_model(model, scaler, features, training_metrics):
             'output_dim': model.layers[-1].output_shape[1],
             'training_samples': training_metrics.get('training_samples', 0),
             'validation_mae': float(training_metrics.get('mae', 0)),
+            'hyperparameters': hyperparameters or load_hyperparameters(),
             'training_date': datetime.now().isoformat()
         },
         'featureMapping': {
@@ -223,29 +328,30 @@ def main():
     """
     Hàm chính thực hiện toàn bộ quy trình huấn luyện mô hình
     """
-    # Tải dữ liệu huấn luyện
-    df = load_training_data()
+    # Nguồn dữ liệu huấn luyện đọc theo chunk, không tải toàn bộ dữ liệu vào bộ nhớ
+    source = load_training_source()
     
-    if df is None or df.empty:
+    if source is None:
         print("Lỗi: Không có dữ liệu huấn luyện, cần chạy training_data_creator.py trước")
         return
     
-    # THÊM ĐOẠN NÀY: Lấy mẫu ngẫu nhiên từ DataFrame
-    sample_size = 10000  # Số mẫu bạn muốn sử dụng
-    if len(df) > sample_size:
-        df = df.sample(n=sample_size, random_state=42)
-        print(f"Đã giảm số mẫu xuống: {len(df)} mẫu")
-    
-    print(f"Đã tải dữ liệu huấn luyện: {len(df)} mẫu")
-    
-    # Tiền xử lý dữ liệu
-    X_train, X_test, y_train, y_test, scaler, features = preprocess_data(df)
-    
-    # Huấn luyện mô hình
-    model, history = train_model(X_train, y_train, X_test, y_test)
+    hyperparameters = load_hyperparameters()
+    print(f"Siêu tham số: {hyperparameters}")
     
-    # Đánh giá mô hình
-    y_pred = evaluate_model(model, X_test, y_test)
+    with ChunkedTrainingSet(source, validation_split=0.2, seed=42) as data:
+        # Tiền xử lý dữ liệu: scaler tính trên tập huấn luyện trong một lượt đọc
+        stats = data.scan()
+        print(f"Đã tải dữ liệu huấn luyện: {stats['train_rows']} mẫu huấn luyện, {stats['validation_rows']} mẫu kiểm tra")
+        
+        train_dataset = data.dataset(batch_size=hyperparameters['batch_size'])
+        validation_dataset = data.dataset(validation=True, batch_size=hyperparameters['batch_size'])
+        
+        # Huấn luyện mô hình
+        model, history = train_model_on_datasets(train_dataset, validation_dataset, hyperparameters)
+        
+        # Đánh giá mô hình
+        y_test = dataset_labels(validation_dataset).reshape(-1)
+        y_pred = evaluate_model(model, validation_dataset, y_test)
     
     # Tính MAE cho báo cáo
     mae = np.mean(np.abs(y_test - y_pred.flatten()))
@@ -255,10 +361,10 @@ def main():
     
     # Lưu mô hình và cập nhật thông tin
     training_metrics = {
-        'training_samples': len(df),
+        'training_samples': stats['train_rows'] + stats['validation_rows'],
         'mae': mae
     }
-    save_model(model, scaler, features, training_metrics)
+    save_model(model, data.scaler, FEATURES, training_metrics, hyperparameters)
     
     print("Hoàn thành huấn luyện và đánh giá mô hình!")
 
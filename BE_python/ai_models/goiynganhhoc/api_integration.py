@@ -3,28 +3,13 @@ from .predict_major import load_model_and_scaler, preprocess_student_data, predi
 import numpy as np
 import json
 import traceback
-from pymongo import MongoClient
+from utils.db_utils import db
+from utils.write_behind import prediction_log_writer
 import os
 from datetime import datetime
 from bson import ObjectId
 
-# Kết nối MongoDB - sử dụng biến môi trường thống nhất với Node.js
-# Thứ tự ưu tiên: MONGODB_URI -> MONGO_URI -> fallback tới giá trị mặc định
-MONGODB_URI = os.getenv('MONGO_URI') 
-MONGODB_NAME = os.getenv('MONGO_DB_NAME') 
-
-print(f"Major Recommendation API MongoDB Configuration: URI={MONGODB_URI}, DB={MONGODB_NAME}")
-client = MongoClient(MONGODB_URI)
-db = client[MONGODB_NAME]
-
-# Thêm debug để kiểm tra kết nối
-try:
-    # Liệt kê collections trong database để kiểm tra kết nối
-    print(f"Collections trong database: {db.list_collection_names()}")
-    print(f"Kiểm tra collection interests: {db.interests.count_documents({})}")
-    print(f"Kiểm tra collection majors: {db.majors.count_documents({})}")
-except Exception as e:
-    print(f"Lỗi kết nối MongoDB: {e}")
+# Kết nối MongoDB dùng chung (tạo khi truy vấn lần đầu, cấu hình trong config/config.py)
 
 # Class để hỗ trợ serialization numpy arrays
 class NpEncoder(json.JSONEncoder):
@@ -160,8 +145,8 @@ def recommend_majors():
                 "feedback": None   # Sẽ được cập nhật khi có feedback
             }
             
-            # Lưu vào MongoDB và lấy id của bản ghi
-            log_id = db.prediction_logs.insert_one(log_data).inserted_id
+            # Đưa vào hàng đợi ghi nền, _id được tạo ngay để trả về cho frontend
+            log_id = prediction_log_writer.submit(log_data)
             
             # Trả về kết quả
             return jsonify({
@@ -212,14 +197,17 @@ def update_feedback():
         feedback_text = data.get('feedback')
         
         # Cập nhật log trong MongoDB
-        result = db.prediction_logs.update_one(
-            {'_id': ObjectId(prediction_id)},
-            {'$set': {
-                'isUseful': is_useful,
-                'feedback': feedback_text,
-                'feedbackDate': datetime.now()
-            }}
-        )
+        feedback_query = {'_id': ObjectId(prediction_id)}
+        feedback_update = {'$set': {
+            'isUseful': is_useful,
+            'feedback': feedback_text,
+            'feedbackDate': datetime.now()
+        }}
+        result = db.prediction_logs.update_one(feedback_query, feedback_update)
+        
+        # Log có thể vẫn đang nằm trong hàng đợi ghi nền, ghi ngay rồi thử lại
+        if result.matched_count == 0 and prediction_log_writer.flush():
+            result = db.prediction_logs.update_one(feedback_query, feedback_update)
         
         if result.modified_count > 0:
             return jsonify({
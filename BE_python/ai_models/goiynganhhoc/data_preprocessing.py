@@ -1,27 +1,49 @@
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
 import os
 import sys
 import datetime
+from itertools import repeat
 from bson import ObjectId
 
 # Thêm thư mục cha vào sys.path để import các module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from utils.db_utils import db_client
+from utils.reference_data import reference_data
+from utils.training_store import get_training_manifest, iter_training_batches, sample_batches
+from config.config import TRAINING_CHUNK_SIZE
+
+def _isinstance(values, cls):
+    """Mảng bool: phần tử nào của mảng object là instance của cls"""
+    return np.fromiter(map(isinstance, values, repeat(cls)), dtype=bool, count=len(values))
+
+def _map_unique(values, func, default):
+    """
+    Áp dụng func cho từng giá trị khác nhau của mảng object (thay vì từng phần tử) rồi trải lại theo vị trí,
+    giá trị NaN/None nhận default
+    """
+    import pandas as pd
+    
+    codes, uniques = pd.factorize(values)
+    mapped = [func(value) for value in uniques] + [default]
+    if isinstance(default, int):
+        mapped = np.array(mapped, dtype=np.int64)
+    else:
+        mapped = pd.Series(mapped, dtype=object).to_numpy()
+    return mapped[codes]
 
 class DataPreprocessor:
-    def __init__(self):
+    def __init__(self, snapshot=None):
         """
         Khởi tạo DataPreprocessor sử dụng MongoDB thay vì file CSV
+
+        Args:
+            snapshot: Ảnh chụp dữ liệu tham chiếu (mặc định lấy từ reference_data)
         """
-        # Lấy dữ liệu từ MongoDB
-        self.interests = db_client.fetch_data('interests')
-        self.subject_combinations = db_client.fetch_data('subject_combinations')
-        self.majors = db_client.fetch_data('majors')
+        # Lấy dữ liệu từ ảnh chụp dữ liệu tham chiếu (được tải một lần từ MongoDB)
+        snapshot = snapshot or reference_data.snapshot()
+        self.interests = snapshot.all('interests')
+        self.subject_combinations = snapshot.all('subject_combinations')
+        self.majors = snapshot.all('majors')
         
         # Tạo mapping để dễ sử dụng
         self.interest_to_id = {interest['name']: i for i, interest in enumerate(self.interests)}
@@ -30,6 +52,7 @@ class DataPreprocessor:
         # Tạo mapping tên ngành đơn giản
         self.major_to_id = {}
         self.id_to_major = {}
+        self.major_info_by_name = {}
         
         for i, major in enumerate(self.majors):
             name = major['name']
@@ -38,6 +61,7 @@ class DataPreprocessor:
             # Lưu cả tên gốc và tên lowercase vào mapping
             self.major_to_id[name_lower] = i
             self.id_to_major[i] = name
+            self.major_info_by_name.setdefault(name_lower, major)
         
         # In ra thông tin mapping
         print(f"Đã tạo mapping cho {len(self.id_to_major)} ngành học")
@@ -99,122 +123,32 @@ class DataPreprocessor:
         
         return features
     
-    def preprocess_training_data(self):
+    def preprocess_training_data(self, max_samples=None):
         """
-        Tiền xử lý dữ liệu huấn luyện lấy từ MongoDB
+        Tiền xử lý dữ liệu huấn luyện lấy từ MongoDB, đọc và xử lý lần lượt từng chunk
+        
+        Args:
+            max_samples: Số mẫu tối đa, lấy mẫu ngẫu nhiên đều trong khi đọc để bộ nhớ
+                         không phụ thuộc kích thước bộ dữ liệu (None: lấy tất cả)
         
         Returns:
             X, y: Mảng numpy của đặc trưng đầu vào và nhãn đầu ra
         """
-        # Lấy dữ liệu huấn luyện từ MongoDB
-        training_data = db_client.fetch_data(
-            'training_data', 
-            query={'modelType': 'major_recommendation'}
-        )
-        
         # Kiểm tra xem có dữ liệu không
-        if not training_data or len(training_data) == 0:
+        manifest = get_training_manifest('major_recommendation')
+        if manifest is None:
             raise ValueError("Không tìm thấy dữ liệu huấn luyện trong MongoDB")
-            
-        # Lấy bản ghi đầu tiên (giả sử chỉ có một document)
-        records = training_data[0]['records']
-        
-        # Khởi tạo mảng
-        X = []
-        y = []
         
         # Debug: Kiểm tra số lượng sở thích
         print(f"DEBUG: Số lượng sở thích trong mô hình: {len(self.interest_to_id)}")
         print(f"DEBUG: Một số sở thích đầu tiên: {list(self.interest_to_id.keys())[:5]}")
         
-        for record in records:
-            # Xử lý điểm số
-            scores = np.zeros(9)
-            for i, subject in enumerate(self.subjects):
-                if subject in record and record[subject] != "":
-                    scores[i] = float(record[subject]) / 10.0  # Chuẩn hóa về [0,1]
-            
-            # Xử lý khối thi (TN hoặc XH)
-            tohopthi = np.zeros(2)  # TN, XH
-            if 'Tohopthi' in record:
-                if record['Tohopthi'] == 'TN':
-                    tohopthi[0] = 1.0
-                elif record['Tohopthi'] == 'XH':
-                    tohopthi[1] = 1.0
-            
-            # Xử lý sở thích - CẢI TIẾN: Kiểm tra nhiều định dạng có thể có
-            interests = np.zeros(len(self.interest_to_id))
-            if 'Interests' in record:
-                if isinstance(record['Interests'], str):
-                    # Xử lý trường hợp Interests là chuỗi
-                    student_interests = record['Interests'].split(',')
-                    for interest in student_interests:
-                        interest = interest.strip()
-                        if interest in self.interest_to_id:
-                            interests[self.interest_to_id[interest]] = 1.0
-                        else:
-                            print(f"DEBUG: Không tìm thấy sở thích '{interest}' trong mapping")
-                elif isinstance(record['Interests'], list):
-                    # Xử lý trường hợp Interests là danh sách
-                    for interest in record['Interests']:
-                        if isinstance(interest, str) and interest in self.interest_to_id:
-                            interests[self.interest_to_id[interest]] = 1.0
-                        elif isinstance(interest, dict) and 'name' in interest and interest['name'] in self.interest_to_id:
-                            interests[self.interest_to_id[interest['name']]] = 1.0
-            
-            # DEBUG: Kiểm tra nếu vector sở thích toàn 0
-            if np.sum(interests) == 0:
-                print(f"DEBUG: Record có vector sở thích toàn 0: {record.get('Interests', 'Không có')}")
-                # Nếu không có sở thích, thử áp dụng các sở thích từ ngành đã chọn
-                if 'Major_1' in record and record['Major_1']:
-                    major_name = record['Major_1'].lower().strip()
-                    # Tìm các sở thích liên quan đến ngành này từ dữ liệu majors
-                    for major in self.majors:
-                        if major['name'].lower() == major_name and 'interests' in major:
-                            for interest_obj in major['interests']:
-                                if 'name' in interest_obj and interest_obj['name'] in self.interest_to_id:
-                                    interests[self.interest_to_id[interest_obj['name']]] = 1.0
-            
-            # Xử lý tổ hợp môn
-            subject_groups = np.zeros(len(self.subject_comb_to_id))
-            
-            # Xử lý tổ hợp môn từ định dạng mới
-            for i in range(1, 4):  # Kiểm tra tất cả 3 lựa chọn ngành tiềm năng
-                subject_group_col = f'Subject_Group_{i}'
-                if subject_group_col in record and record[subject_group_col] != "":
-                    group = record[subject_group_col]
-                    if group in self.subject_comb_to_id:
-                        subject_groups[self.subject_comb_to_id[group]] = 1.0
-            
-            # Gộp đặc trưng
-            features = np.concatenate([
-                scores,
-                tohopthi,
-                interests,
-                subject_groups
-            ])
-            
-            X.append(features)
-            
-            # Xử lý mục tiêu - ngành học ưu tiên và điểm số
-            major_scores = np.zeros(len(self.major_to_id))
-            
-            # Xử lý từ định dạng mới (Major_1, Score_1, Major_2, Score_2, Major_3, Score_3)
-            for i in range(1, 4):
-                major_col = f'Major_{i}'
-                score_col = f'Score_{i}'
-                if major_col in record and score_col in record and record[major_col] and record[score_col]:
-                    major = record[major_col].lower().strip()
-                    if major in self.major_to_id:
-                        major_scores[self.major_to_id[major]] = float(record[score_col])
-                    else:
-                        print(f"DEBUG: Không tìm thấy ngành '{major}' trong mapping")
-            
-            y.append(major_scores)
+        print(f"DEBUG: Số bản ghi trong bộ dữ liệu: {manifest.get('metadata', {}).get('totalRecords')}, lấy tối đa: {max_samples}")
+        X_array, y_array = sample_batches(
+            self.iter_training_batches(TRAINING_CHUNK_SIZE, manifest=manifest), max_samples, seed=42
+        ) or self.preprocess_records([])
         
         # DEBUG: Kiểm tra số lượng mẫu và phân phối đặc trưng
-        X_array = np.array(X)
-        y_array = np.array(y)
         print(f"DEBUG: Số lượng mẫu huấn luyện: {len(X_array)}")
         print(f"DEBUG: Số lượng features: {X_array.shape[1]}")
         print(f"DEBUG: Số lượng ngành: {y_array.shape[1]}")
@@ -224,6 +158,151 @@ class DataPreprocessor:
         
         return X_array, y_array
     
+    def iter_training_batches(self, batch_size, shuffle=False, seed=None, manifest=None):
+        """
+        Luồng batch (X, y) đã tiền xử lý từ bộ dữ liệu huấn luyện trong MongoDB,
+        mỗi lúc chỉ giữ một chunk bản ghi trong bộ nhớ
+        """
+        return iter_training_batches(
+            'major_recommendation', lambda records, row_ids: self.preprocess_records(records), batch_size,
+            shuffle=shuffle, seed=seed, manifest=manifest
+        )
+    
+    def preprocess_records(self, records):
+        """
+        Tiền xử lý danh sách bản ghi huấn luyện theo cột bằng pandas/NumPy
+        
+        Kết quả giống hệt từng byte với phiên bản duyệt từng bản ghi trước đây (giữ trong
+        scripts/benchmark_preprocessing.py để kiểm tra), các thông báo DEBUG cho từng bản ghi được gộp thành số lượng
+        
+        Args:
+            records: Danh sách dict (mỗi dict là một dòng của file dữ liệu huấn luyện)
+            
+        Returns:
+            X, y: Mảng numpy của đặc trưng đầu vào và nhãn đầu ra
+        """
+        # Chỉ import pandas khi huấn luyện, không làm chậm khởi động API
+        import pandas as pd
+        
+        n_records = len(records)
+        interest_offset = len(self.subjects) + 2
+        group_offset = interest_offset + len(self.interest_to_id)
+        
+        X = np.zeros((n_records, group_offset + len(self.subject_comb_to_id)))
+        y = np.zeros((n_records, len(self.major_to_id)))
+        
+        choice_columns = [f'{name}_{i}' for i in range(1, 4) for name in ('Major', 'Score', 'Subject_Group')]
+        frame = pd.DataFrame(records, columns=self.subjects + ['Tohopthi', 'Interests'] + choice_columns, dtype=object)
+        
+        def column(key):
+            return frame[key].to_numpy()
+        
+        def absent(key, values):
+            # pandas điền NaN cho khóa không có trong bản ghi, giống giá trị NaN thật (ô trống của CSV),
+            # nên kiểm tra lại các ô NaN (chỉ cần với cột điểm: khóa không có -> 0, NaN -> NaN)
+            missing = np.zeros(n_records, dtype=bool)
+            nan_rows = np.flatnonzero(pd.isna(values))
+            missing[nan_rows] = [key not in records[row] for row in nan_rows.tolist()]
+            return missing
+        
+        def truthy(values):
+            # bool(value) của từng phần tử, NaN được coi là có giá trị như trong Python
+            return values.astype(bool)
+        
+        def major_ids(values, mapping, default):
+            # Tra tên ngành đã lower().strip() trong mapping
+            return _map_unique(values, lambda name: mapping.get(name.lower().strip(), default) if isinstance(name, str) else default, default)
+        
+        # Xử lý điểm số (9 môn cùng lúc): chuẩn hóa về [0,1], bỏ qua ô rỗng
+        scores = frame[self.subjects].to_numpy()
+        present = scores != ""
+        for i, subject in enumerate(self.subjects):
+            present[:, i] &= ~absent(subject, scores[:, i])
+        X[:, :len(self.subjects)][present] = scores[present].astype(np.float64) / 10.0
+        
+        # Xử lý khối thi (TN hoặc XH)
+        tohopthi = column('Tohopthi')
+        X[:, len(self.subjects)] = tohopthi == 'TN'
+        X[:, len(self.subjects) + 1] = tohopthi == 'XH'
+        
+        # Xử lý sở thích dạng chuỗi: nối tất cả chuỗi rồi tách theo dấu phẩy một lần,
+        # số sở thích của mỗi bản ghi = số dấu phẩy + 1
+        interests = column('Interests')
+        is_string = _isinstance(interests, str)
+        string_rows = np.flatnonzero(is_string)
+        strings = interests[string_rows].tolist()
+        token_counts = np.fromiter(map(str.count, strings, repeat(',')), dtype=np.int64, count=len(strings)) + 1
+        token_rows = np.repeat(string_rows, token_counts)
+        tokens = np.array(','.join(strings).split(','), dtype=object) if strings else np.empty(0, dtype=object)
+        interest_ids = _map_unique(tokens, lambda token: self.interest_to_id.get(token.strip(), -1), -1)
+        known = interest_ids >= 0
+        X[token_rows[known], interest_offset + interest_ids[known]] = 1.0
+        if not known.all():
+            unknown = pd.unique(np.array([token.strip() for token in tokens[~known]], dtype=object))
+            print(f"DEBUG: {np.count_nonzero(~known)} sở thích không tìm thấy trong mapping, ví dụ: {list(unknown[:5])}")
+        
+        # Xử lý sở thích dạng danh sách (tên hoặc dict có 'name')
+        other_rows = np.flatnonzero(~is_string & ~pd.isna(interests))
+        list_rows = other_rows[_isinstance(interests[other_rows], list)]
+        if len(list_rows):
+            items = pd.Series(interests[list_rows], index=list_rows, dtype=object).explode()
+            names = np.array(
+                [item if isinstance(item, str) else item.get('name') if isinstance(item, dict) else None for item in items],
+                dtype=object
+            )
+            interest_ids = _map_unique(names, lambda name: self.interest_to_id.get(name, -1), -1)
+            known = interest_ids >= 0
+            X[items.index[known], interest_offset + interest_ids[known]] = 1.0
+        
+        # Bản ghi không có sở thích nào: dùng sở thích của ngành Major_1 (tra theo tên ngành)
+        empty_rows = np.flatnonzero(~X[:, interest_offset:group_offset].any(axis=1))
+        if len(empty_rows):
+            print(f"DEBUG: {len(empty_rows)} bản ghi có vector sở thích toàn 0, dùng sở thích của ngành Major_1")
+            first_majors = column('Major_1')
+            rows = empty_rows[~pd.isna(first_majors[empty_rows]) & truthy(first_majors[empty_rows])]
+            fallback_ids = pd.Series(
+                major_ids(first_majors[rows], self._major_interest_ids(), []), index=rows, dtype=object
+            ).explode().dropna()
+            X[fallback_ids.index, interest_offset + fallback_ids.to_numpy(dtype=np.int64)] = 1.0
+        
+        # Xử lý tổ hợp môn (Subject_Group_1..3)
+        for i in range(1, 4):
+            values = column(f'Subject_Group_{i}')
+            group_ids = _map_unique(values, lambda group: self.subject_comb_to_id.get(group, -1) if group != "" else -1, -1)
+            rows = np.flatnonzero(group_ids >= 0)
+            X[rows, group_offset + group_ids[rows]] = 1.0
+        
+        # Xử lý mục tiêu (Major_1..3, Score_1..3), lựa chọn sau ghi đè lựa chọn trước nếu trùng ngành
+        n_unknown_majors = 0
+        unknown_majors = set()
+        for i in range(1, 4):
+            majors = column(f'Major_{i}')
+            major_scores = column(f'Score_{i}')
+            rows = np.flatnonzero(
+                ~pd.isna(majors) & truthy(majors) & ~absent(f'Score_{i}', major_scores) & truthy(major_scores)
+            )
+            ids = major_ids(majors[rows], self.major_to_id, -1)
+            known = ids >= 0
+            y[rows[known], ids[known]] = major_scores[rows[known]].astype(np.float64)
+            n_unknown_majors += np.count_nonzero(~known)
+            unknown_majors.update(pd.unique(majors[rows[~known]]))
+        
+        if n_unknown_majors:
+            print(f"DEBUG: {n_unknown_majors} ngành không tìm thấy trong mapping, ví dụ: {list(unknown_majors)[:5]}")
+        
+        return X, y
+    
+    def _major_interest_ids(self):
+        """Mapping từ tên ngành (lowercase) đến danh sách ID sở thích của các ngành cùng tên"""
+        major_interest_ids = {}
+        for major in self.majors:
+            if 'interests' in major:
+                ids = major_interest_ids.setdefault(major['name'].lower(), set())
+                for interest_obj in major['interests']:
+                    if 'name' in interest_obj and interest_obj['name'] in self.interest_to_id:
+                        ids.add(self.interest_to_id[interest_obj['name']])
+        return {name: sorted(ids) for name, ids in major_interest_ids.items()}
+    
     def get_market_trend_weights(self):
         """
         Lấy trọng số xu hướng thị trường cho mỗi ngành
@@ -276,13 +355,7 @@ class DataPreprocessor:
     
     def get_major_info(self, major_name):
         """Lấy thông tin ngành"""
-        major_info = None
-        for major in self.majors:
-            if major['name'].lower() == major_name.lower():
-                major_info = major
-                break
-                
-        return major_info or {}
+        return self.major_info_by_name.get(major_name.lower()) or {}
 
     @staticmethod
     def preprocess_with_mappings(student_data, mappings):
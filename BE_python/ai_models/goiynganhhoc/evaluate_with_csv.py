@@ -5,7 +5,6 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import datetime
 import json
-from sklearn.metrics import precision_score, recall_score, f1_score
 from pymongo import MongoClient
 
 # Thêm thư mục cha vào sys.path để import các module
@@ -14,6 +13,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
 from ai_models.goiynganhhoc.simple_predict import load_model_and_scaler
 from utils.db_utils import db_client
+from config.config import TRAINING_CHUNK_SIZE
 
 def get_active_model_mappings():
     """
@@ -40,19 +40,18 @@ def get_active_model_mappings():
         print(f"Lỗi khi lấy model mapping: {e}")
         return None
 
-def load_test_data_from_csv(csv_file, preprocessor=None, mappings=None):
+def iter_test_data_from_csv(csv_file, preprocessor=None, mappings=None, chunk_size=TRAINING_CHUNK_SIZE):
     """
-    Đọc và xử lý dữ liệu test từ file CSV
+    Đọc và xử lý dữ liệu test từ file CSV theo từng chunk, không giữ toàn bộ file trong bộ nhớ
     
     Args:
         csv_file: Đường dẫn đến file CSV chứa dữ liệu test
         preprocessor: DataPreprocessor đã được khởi tạo, nếu None sẽ tạo mới
         mappings: Dictionary chứa mapping từ model_mappings collection
+        chunk_size: Số dòng CSV mỗi chunk
         
-    Returns:
-        X_test: Ma trận đặc trưng đầu vào
-        y_test: Ma trận nhãn đầu ra
-        preprocessor: DataPreprocessor đã sử dụng
+    Yields:
+        X, y: Ma trận đặc trưng đầu vào và ma trận nhãn đầu ra của một chunk
     """
     print(f"Đang đọc dữ liệu test từ file: {csv_file}")
     
@@ -60,14 +59,6 @@ def load_test_data_from_csv(csv_file, preprocessor=None, mappings=None):
     if preprocessor is None:
         preprocessor = DataPreprocessor()
     
-    # Đọc file CSV
-    df = pd.read_csv(csv_file)
-    print(f"Đã đọc {len(df)} mẫu từ file CSV")
-    
-    # Khởi tạo mảng
-    X = []
-    y = []
-    
     # Sử dụng mapping nếu có, nếu không sử dụng từ preprocessor
     interest_to_id = mappings.get('interest_to_id', {}) if mappings else preprocessor.interest_to_id
     subject_comb_to_id = mappings.get('subject_comb_to_id', {}) if mappings else preprocessor.subject_comb_to_id
@@ -87,87 +78,118 @@ def load_test_data_from_csv(csv_file, preprocessor=None, mappings=None):
     # Danh sách môn học
     subjects = mappings.get('scores_order', preprocessor.subjects) if mappings else preprocessor.subjects
     
-    # Xử lý từng dòng trong DataFrame
-    for _, row in df.iterrows():
-        # Xử lý điểm số
-        scores = np.zeros(len(subjects))
-        for i, subject in enumerate(subjects):
-            if subject in row and pd.notna(row[subject]):
-                scores[i] = float(row[subject]) / 10.0  # Chuẩn hóa về [0,1]
+    # In ra một số thông tin mapping để debug
+    print(f"Số lượng ngành học trong mapping: {len(id_to_major)}")
+    print(f"Số lượng sở thích trong mapping: {len(interest_to_id)}")
+    print(f"Số lượng tổ hợp môn trong mapping: {len(subject_comb_to_id)}")
+    
+    # Đọc file CSV theo từng chunk
+    n_rows = 0
+    for df in pd.read_csv(csv_file, chunksize=chunk_size):
+        n_rows += len(df)
+        
+        # Khởi tạo mảng
+        X = []
+        y = []
+        
+        # Xử lý từng dòng trong DataFrame
+        for _, row in df.iterrows():
+            # Xử lý điểm số
+            scores = np.zeros(len(subjects))
+            for i, subject in enumerate(subjects):
+                if subject in row and pd.notna(row[subject]):
+                    scores[i] = float(row[subject]) / 10.0  # Chuẩn hóa về [0,1]
         
-        # Xử lý khối thi (TN hoặc XH)
-        tohopthi = np.zeros(2)  # TN, XH
-        if 'Tohopthi' in row and pd.notna(row['Tohopthi']):
-            if row['Tohopthi'] == 'TN':
-                tohopthi[0] = 1.0
-            elif row['Tohopthi'] == 'XH':
-                tohopthi[1] = 1.0
+            # Xử lý khối thi (TN hoặc XH)
+            tohopthi = np.zeros(2)  # TN, XH
+            if 'Tohopthi' in row and pd.notna(row['Tohopthi']):
+                if row['Tohopthi'] == 'TN':
+                    tohopthi[0] = 1.0
+                elif row['Tohopthi'] == 'XH':
+                    tohopthi[1] = 1.0
         
-        # Xử lý sở thích
-        interests = np.zeros(len(interest_to_id))
-        if 'Interests' in row and pd.notna(row['Interests']):
-            if isinstance(row['Interests'], str):
-                # Xử lý trường hợp Interests là chuỗi
-                student_interests = row['Interests'].split(',')
-                for interest in student_interests:
-                    interest = interest.strip()
-                    if interest in interest_to_id:
-                        interests[interest_to_id[interest]] = 1.0
+            # Xử lý sở thích
+            interests = np.zeros(len(interest_to_id))
+            if 'Interests' in row and pd.notna(row['Interests']):
+                if isinstance(row['Interests'], str):
+                    # Xử lý trường hợp Interests là chuỗi
+                    student_interests = row['Interests'].split(',')
+                    for interest in student_interests:
+                        interest = interest.strip()
+                        if interest in interest_to_id:
+                            interests[interest_to_id[interest]] = 1.0
         
-        # Xử lý tổ hợp môn
-        subject_groups = np.zeros(len(subject_comb_to_id))
-        for i in range(1, 4):  # Kiểm tra tất cả 3 lựa chọn ngành tiềm năng
-            subject_group_col = f'Subject_Group_{i}'
-            if subject_group_col in row and pd.notna(row[subject_group_col]):
-                group = row[subject_group_col]
-                if group in subject_comb_to_id:
-                    subject_groups[subject_comb_to_id[group]] = 1.0
+            # Xử lý tổ hợp môn
+            subject_groups = np.zeros(len(subject_comb_to_id))
+            for i in range(1, 4):  # Kiểm tra tất cả 3 lựa chọn ngành tiềm năng
+                subject_group_col = f'Subject_Group_{i}'
+                if subject_group_col in row and pd.notna(row[subject_group_col]):
+                    group = row[subject_group_col]
+                    if group in subject_comb_to_id:
+                        subject_groups[subject_comb_to_id[group]] = 1.0
         
-        # Gộp đặc trưng
-        features = np.concatenate([
-            scores,
-            tohopthi,
-            interests,
-            subject_groups
-        ])
+            # Gộp đặc trưng
+            features = np.concatenate([
+                scores,
+                tohopthi,
+                interests,
+                subject_groups
+            ])
         
-        X.append(features)
+            X.append(features)
         
-        # Xử lý mục tiêu - ngành học ưu tiên và điểm số
-        num_majors = len(id_to_major)
-        major_scores = np.zeros(num_majors)
+            # Xử lý mục tiêu - ngành học ưu tiên và điểm số
+            num_majors = len(id_to_major)
+            major_scores = np.zeros(num_majors)
         
-        # Xử lý từ định dạng mới (Major_1, Score_1, Major_2, Score_2, Major_3, Score_3)
-        for i in range(1, 4):
-            major_col = f'Major_{i}'
-            score_col = f'Score_{i}'
-            if major_col in row and score_col in row and pd.notna(row[major_col]) and pd.notna(row[score_col]):
-                major = str(row[major_col]).lower().strip()
-                if major in major_to_id:
-                    major_id = major_to_id[major]
-                    major_scores[major_id] = float(row[score_col])
-                else:
-                    # Thử tìm kiếm khớp gần đúng
-                    found = False
-                    for key in major_to_id.keys():
-                        if major in key or key in major:
-                            major_scores[major_to_id[key]] = float(row[score_col])
-                            found = True
-                            break
+            # Xử lý từ định dạng mới (Major_1, Score_1, Major_2, Score_2, Major_3, Score_3)
+            for i in range(1, 4):
+                major_col = f'Major_{i}'
+                score_col = f'Score_{i}'
+                if major_col in row and score_col in row and pd.notna(row[major_col]) and pd.notna(row[score_col]):
+                    major = str(row[major_col]).lower().strip()
+                    if major in major_to_id:
+                        major_id = major_to_id[major]
+                        major_scores[major_id] = float(row[score_col])
+                    else:
+                        # Thử tìm kiếm khớp gần đúng
+                        found = False
+                        for key in major_to_id.keys():
+                            if major in key or key in major:
+                                major_scores[major_to_id[key]] = float(row[score_col])
+                                found = True
+                                break
                     
-                    if not found:
-                        print(f"Không tìm thấy ngành '{major}' trong mapping")
+                        if not found:
+                            print(f"Không tìm thấy ngành '{major}' trong mapping")
         
-        y.append(major_scores)
+            y.append(major_scores)
+        
+        yield np.array(X), np.array(y)
     
-    # In ra một số thông tin mapping để debug
-    print(f"Số lượng ngành học trong mapping: {len(id_to_major)}")
-    print(f"Số lượng sở thích trong mapping: {len(interest_to_id)}")
-    print(f"Số lượng tổ hợp môn trong mapping: {len(subject_comb_to_id)}")
+    print(f"Đã đọc {n_rows} mẫu từ file CSV")
+
+def load_test_data_from_csv(csv_file, preprocessor=None, mappings=None):
+    """
+    Đọc và xử lý toàn bộ dữ liệu test từ file CSV
     
-    # Chuyển sang numpy array
-    X_array = np.array(X)
-    y_array = np.array(y)
+    Args:
+        csv_file: Đường dẫn đến file CSV chứa dữ liệu test
+        preprocessor: DataPreprocessor đã được khởi tạo, nếu None sẽ tạo mới
+        mappings: Dictionary chứa mapping từ model_mappings collection
+        
+    Returns:
+        X_test: Ma trận đặc trưng đầu vào
+        y_test: Ma trận nhãn đầu ra
+        preprocessor: DataPreprocessor đã sử dụng
+    """
+    # Tạo preprocessor nếu chưa có
+    if preprocessor is None:
+        preprocessor = DataPreprocessor()
+    
+    chunks = list(iter_test_data_from_csv(csv_file, preprocessor, mappings))
+    X_array = np.concatenate([X for X, _ in chunks])
+    y_array = np.concatenate([y for _, y in chunks])
     
     print(f"Đã tạo {len(X_array)} mẫu dữ liệu test")
     print(f"Số chiều đặc trưng: {X_array.shape[1]}")
@@ -175,6 +197,26 @@ def load_test_data_from_csv(csv_file, preprocessor=None, mappings=None):
     
     return X_array, y_array, preprocessor
 
+def weighted_scores_from_confusion(confusion):
+    """
+    Precision, Recall, F1 trung bình có trọng số theo số mẫu thực tế của từng nhãn
+    từ ma trận nhầm lẫn (hàng: nhãn thực tế, cột: nhãn dự đoán), nhãn không có dự đoán
+    hoặc không có mẫu nhận giá trị 0 (giống zero_division=0 của sklearn)
+    """
+    true_positive = np.diag(confusion).astype(np.float64)
+    support = confusion.sum(axis=1)
+    predicted = confusion.sum(axis=0)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(predicted > 0, true_positive / predicted, 0.0)
+        recall = np.where(support > 0, true_positive / support, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    
+    total_support = support.sum()
+    if total_support == 0:
+        return 0.0, 0.0, 0.0
+    return tuple(float(np.dot(values, support) / total_support) for values in (precision, recall, f1))
+
 def evaluate_with_csv(csv_file=None, output_file=None):
     """
     Đánh giá mô hình sử dụng dữ liệu test từ file CSV
@@ -201,109 +243,78 @@ def evaluate_with_csv(csv_file=None, output_file=None):
     # Đọc dữ liệu test từ CSV, sử dụng mapping nếu có
     if mappings:
         print("Sử dụng mapping từ model_mappings collection để xử lý dữ liệu test")
-        X_test, y_test, preprocessor = load_test_data_from_csv(csv_file, preprocessor, mappings)
     else:
         print("Sử dụng preprocessor mặc định để xử lý dữ liệu test")
-        X_test, y_test, preprocessor = load_test_data_from_csv(csv_file, preprocessor)
-    
-    # Chuẩn hóa dữ liệu nếu cần
-    if scaler is not None:
-        print("Áp dụng chuẩn hóa dữ liệu...")
-        scaler_mean, scaler_scale = scaler
-        X_test = (X_test - scaler_mean) / scaler_scale
     
     # Thư mục cho biểu đồ
     plots_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plots')
     if not os.path.exists(plots_dir):
         os.makedirs(plots_dir)
     
-    # Dự đoán
-    print("Đang dự đoán...")
-    if hasattr(model, 'predict_combined'):
-        y_pred = model.predict_combined(X_test)
-    else:
-        y_pred = model.predict(X_test)
-    
-    # Tính Top-K accuracy
-    print("Đang tính độ chính xác Top-K...")
+    # Dự đoán và cộng dồn các chỉ số theo từng chunk, không giữ toàn bộ tập test trong bộ nhớ
+    print("Đang dự đoán và tính độ chính xác Top-K, Precision, Recall, F1 Score...")
     top_k_values = [1, 3, 5, 10]
-    top_k_accuracies = []
-    overlap_top3_accuracies = []
-    
-    # Tính Precision, Recall, F1 Score cho Top-1
-    print("Đang tính Precision, Recall, F1 Score...")
-    precision_values = []
-    recall_values = []
-    f1_values = []
-    
-    for k in top_k_values:
-        correct = 0
-        overlap_correct = 0
-        total = len(y_test)
+    correct = np.zeros(len(top_k_values))
+    overlap_correct = np.zeros(len(top_k_values))
+    confusion = None
+    total = 0
+    
+    for X_test, y_test in iter_test_data_from_csv(csv_file, preprocessor, mappings):
+        # Chuẩn hóa dữ liệu nếu cần
+        if scaler is not None:
+            scaler_mean, scaler_scale = scaler
+            X_test = (X_test - scaler_mean) / scaler_scale
         
-        # Chuẩn bị mảng y_true và y_pred cho tính Precision, Recall, F1 nếu k=1
-        if k == 1:
-            # Chuyển đổi thành dạng binary classification cho từng ngành
-            y_true_binary = np.zeros((total, y_test.shape[1]), dtype=int)
-            y_pred_binary = np.zeros((total, y_test.shape[1]), dtype=int)
-            
-            for i in range(total):
-                # Ngành thực tế Top-1
-                actual_top = np.argmax(y_test[i])
-                y_true_binary[i, actual_top] = 1
-                
-                # Ngành dự đoán Top-1
-                pred_top = np.argmax(y_pred[i])
-                y_pred_binary[i, pred_top] = 1
-            
-            # Tính các chỉ số cho từng nhãn và lấy trung bình (weighted)
-            precision = precision_score(y_true_binary, y_pred_binary, average='weighted', zero_division=0)
-            recall = recall_score(y_true_binary, y_pred_binary, average='weighted', zero_division=0)
-            f1 = f1_score(y_true_binary, y_pred_binary, average='weighted', zero_division=0)
-            
-            precision_values.append(precision * 100)  # Đổi sang phần trăm
-            recall_values.append(recall * 100)
-            f1_values.append(f1 * 100)
+        if hasattr(model, 'predict_combined'):
+            y_pred = model.predict_combined(X_test)
+        else:
+            y_pred = model.predict(X_test)
         
-        for i in range(total):
-            # Lấy top-k ngành thực tế có điểm cao nhất
-            actual_topk = np.argsort(y_test[i])[::-1][:k]
-                
-            # Lấy top-k ngành dự đoán
-            predicted_topk = np.argsort(y_pred[i])[::-1][:k]
+        total += len(y_test)
+        
+        # Thứ tự ngành giảm dần theo điểm thực tế và điểm dự đoán của từng mẫu
+        actual_order = np.argsort(y_test, axis=1)[:, ::-1]
+        predicted_order = np.argsort(y_pred, axis=1)[:, ::-1]
+        actual_top3 = actual_order[:, :3]
+        
+        for j, k in enumerate(top_k_values):
+            actual_topk = actual_order[:, :k]
+            predicted_topk = predicted_order[:, :k]
             
             if k == 1:
                 # Kiểm tra xem ngành thực tế top-1 có trùng với ngành dự đoán top-1 không
-                if actual_topk[0] == predicted_topk[0]:
-                    correct += 1
+                correct[j] += np.count_nonzero(actual_topk[:, 0] == predicted_topk[:, 0])
             else:
-                # Đếm số ngành thực tế nằm trong top-k dự đoán
-                overlap_count = sum(1 for major in actual_topk if major in predicted_topk)
-                
-                # Tính tỉ lệ overlap
-                overlap_percent = overlap_count / len(actual_topk) * 100
-                correct += overlap_count / len(actual_topk)  # Tính theo tỉ lệ phần trăm
-                
-                # Thêm giá trị giả lập cho các chỉ số với k > 1
-                if k in [3, 5, 10]:
-                    precision_values.append(None)
-                    recall_values.append(None)
-                    f1_values.append(None)
+                # Tỉ lệ các ngành thực tế top-k nằm trong top-k dự đoán
+                overlap_count = (actual_topk[:, :, None] == predicted_topk[:, None, :]).any(axis=2).sum(axis=1)
+                correct[j] += np.sum(overlap_count / actual_topk.shape[1])
             
             # Tính overlap cho top-3 thực tế
-            actual_top3 = np.argsort(y_test[i])[::-1][:3]
-            overlap_count = sum(1 for major in actual_top3 if major in predicted_topk)
-            if len(actual_top3) > 0:
-                overlap_percent = overlap_count / len(actual_top3) * 100
-                overlap_correct += overlap_percent
-        
-        # Tính độ chính xác
-        accuracy = (correct / total) * 100
-        top_k_accuracies.append(accuracy)
+            if actual_top3.shape[1] > 0:
+                overlap_count = (actual_top3[:, :, None] == predicted_topk[:, None, :]).any(axis=2).sum(axis=1)
+                overlap_correct[j] += np.sum(overlap_count / actual_top3.shape[1] * 100)
         
-        # Tính trung bình % overlap
-        overlap_accuracy = overlap_correct / total
-        overlap_top3_accuracies.append(overlap_accuracy)
+        # Ma trận nhầm lẫn giữa ngành thực tế Top-1 và ngành dự đoán Top-1
+        num_majors = y_test.shape[1]
+        if confusion is None:
+            confusion = np.zeros((num_majors, num_majors), dtype=np.int64)
+        confusion += np.bincount(
+            np.argmax(y_test, axis=1) * num_majors + np.argmax(y_pred, axis=1), minlength=num_majors * num_majors
+        ).reshape(num_majors, num_majors)
+    
+    if total == 0:
+        raise ValueError(f"Không có mẫu dữ liệu test trong file {csv_file}")
+    
+    # Độ chính xác và trung bình % overlap
+    top_k_accuracies = list(correct / total * 100)
+    overlap_top3_accuracies = list(overlap_correct / total)
+    
+    # Precision, Recall, F1 Score cho Top-1: trung bình có trọng số (theo số mẫu thực tế) của từng ngành,
+    # giống sklearn average='weighted', zero_division=0 trên nhãn nhị phân Top-1
+    precision, recall, f1 = weighted_scores_from_confusion(confusion)
+    precision_values = [precision * 100]  # Đổi sang phần trăm
+    recall_values = [recall * 100]
+    f1_values = [f1 * 100]
     
     # Lấy thông tin về phiên bản mapping
     mapping_version = "default"
@@ -313,7 +324,7 @@ def evaluate_with_csv(csv_file=None, output_file=None):
     # In kết quả
     print("\n==== KẾT QUẢ ĐÁNH GIÁ MÔ HÌNH TRÊN TẬP TEST CSV ====")
     print(f"Tệp test: {csv_file}")
-    print(f"Số lượng mẫu: {len(X_test)}")
+    print(f"Số lượng mẫu: {total}")
     print(f"Phiên bản mapping: {mapping_version}")
     print("\n=== ĐỘ CHÍNH XÁC TOP-K TRUYỀN THỐNG ===")
     for k, acc in zip(top_k_values, top_k_accuracies):
@@ -350,7 +361,7 @@ def evaluate_with_csv(csv_file=None, output_file=None):
         f.write("====== ĐÁNH GIÁ MÔ HÌNH GỢI Ý NGÀNH HỌC TRÊN TẬP CSV ======\n\n")
         f.write(f"Thời gian đánh giá: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         f.write(f"Tệp test: {csv_file}\n")
-        f.write(f"Số lượng mẫu: {len(X_test)}\n")
+        f.write(f"Số lượng mẫu: {total}\n")
         f.write(f"Phiên bản mapping: {mapping_version}\n\n")
         
         # Thông tin Top-K Accuracy truyền thống
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+"""
+Chế độ phục vụ "fused head" cho MajorRecommendationModel đa đầu ra
+
+Mô hình đa đầu ra có một tầng Dense(1) riêng cho mỗi ngành (output_0 ... output_{N-1}).
+Module này gộp kernel của tất cả các đầu ra thành một ma trận (64 x N) và bias thành
+một vector (N,), sau đó tính điểm của tất cả các ngành bằng một phép nhân ma trận duy nhất.
+Các tầng chia sẻ (Dense, BatchNormalization) được tính bằng NumPy, Dropout bị bỏ qua
+khi suy luận, vì vậy không cần import TensorFlow.
+
+Kiểm tra sai số so với mô hình đa đầu ra gốc:
+    python fused_head.py --test-file test_data_2000.csv
+"""
+
+import os
+import re
+import sys
+import json
+import argparse
+import numpy as np
+import h5py
+
+# Thêm thư mục gốc vào sys.path để có thể import khi chạy trực tiếp
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from ai_models.h5_inference import PASSTHROUGH_LAYERS, ACTIVATIONS, decode_attribute
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(current_dir, 'model')
+
+# Tên tầng đầu ra của mô hình đa đầu ra
+OUTPUT_LAYER_PATTERN = re.compile(r'^output_(\d+)$')
+
+
+def _fold_batch_norm(gamma, beta, moving_mean, moving_variance, epsilon):
+    """Chuyển BatchNormalization (chế độ suy luận) thành phép biến đổi affine x * scale + shift"""
+    scale = gamma / np.sqrt(moving_variance + epsilon)
+    shift = beta - moving_mean * scale
+    return scale, shift
+
+
+class FusedMajorModel:
+    """
+    Mô hình gợi ý ngành học với đầu ra đã được gộp thành một ma trận
+
+    Có cùng phương thức predict_combined(X) với MajorRecommendationModel để thay thế trực tiếp
+    """
+
+    def __init__(self, trunk, head_kernel, head_bias, head_activation='sigmoid'):
+        """
+        Args:
+            trunk: Danh sách các bước của phần chia sẻ, mỗi bước là
+                   ('dense', kernel, bias, activation) hoặc ('affine', scale, shift)
+            head_kernel: Ma trận trọng số đầu ra đã gộp, kích thước (hidden_dim, output_dim)
+            head_bias: Vector bias đầu ra đã gộp, kích thước (output_dim,)
+            head_activation: Hàm kích hoạt của đầu ra
+        """
+        self.trunk = trunk
+        self.head_kernel = head_kernel
+        self.head_bias = head_bias
+        self.head_activation = head_activation
+        self.output_dim = head_kernel.shape[1]
+        self.use_multi_output = False
+
+        first_dense = next(step for step in trunk if step[0] == 'dense') if trunk else None
+        self.input_dim = first_dense[1].shape[0] if first_dense else head_kernel.shape[0]
+
+    @classmethod
+    def from_h5(cls, model_path):
+        """
+        Đọc cấu trúc và trọng số từ file .h5 của mô hình đa đầu ra
+
+        Raises:
+            ValueError: Nếu mô hình chứa tầng không được hỗ trợ
+        """
+        with h5py.File(model_path, 'r') as f:
+            model_config = json.loads(decode_attribute(f.attrs['model_config']))
+            weights_group = f['model_weights'] if 'model_weights' in f else f
+
+            def read_weights(layer_name):
+                layer_group = weights_group[layer_name]
+                weight_names = [decode_attribute(name) for name in layer_group.attrs['weight_names']]
+                return {name.split('/')[-1].split(':')[0]: np.asarray(layer_group[name]) for name in weight_names}
+
+            layer_specs = []
+            for layer in model_config['config']['layers']:
+                spec = {'class_name': layer['class_name'], 'config': layer['config']}
+                if layer['class_name'] not in PASSTHROUGH_LAYERS:
+                    spec['weights'] = read_weights(layer['config']['name'])
+                layer_specs.append(spec)
+
+        output_names = [output[0] for output in model_config['config'].get('output_layers', [])]
+        return cls._from_layer_specs(layer_specs, output_names)
+
+    @classmethod
+    def from_keras_model(cls, model):
+        """Gộp đầu ra từ một mô hình Keras đa đầu ra đã tải trong bộ nhớ"""
+        layer_specs = []
+        for layer in model.layers:
+            config = layer.get_config()
+            spec = {'class_name': layer.__class__.__name__, 'config': config}
+            if spec['class_name'] not in PASSTHROUGH_LAYERS:
+                spec['weights'] = {
+                    weight.name.split('/')[-1].split(':')[0]: value
+                    for weight, value in zip(layer.weights, layer.get_weights())
+                }
+            layer_specs.append(spec)
+
+        output_names = [name.split('/')[0] for name in model.output_names]
+        return cls._from_layer_specs(layer_specs, output_names)
+
+    @classmethod
+    def _from_layer_specs(cls, layer_specs, output_names):
+        trunk = []
+        heads = {}
+        head_activation = None
+
+        for spec in layer_specs:
+            class_name = spec['class_name']
+            config = spec['config']
+            name = config['name']
+
+            if class_name in PASSTHROUGH_LAYERS:
+                continue
+
+            weights = spec['weights']
+
+            if class_name == 'Dense':
+                activation = config.get('activation', 'linear')
+                if activation not in ACTIVATIONS:
+                    raise ValueError(f"Không hỗ trợ hàm kích hoạt {activation} trong chế độ fused")
+
+                kernel = weights['kernel']
+                bias = weights.get('bias', np.zeros(kernel.shape[1], dtype=kernel.dtype))
+
+                if OUTPUT_LAYER_PATTERN.match(name) or name == 'fused_output':
+                    if head_activation not in (None, activation):
+                        raise ValueError("Các đầu ra có hàm kích hoạt khác nhau, không thể gộp")
+                    head_activation = activation
+                    heads[name] = (kernel, bias)
+                else:
+                    trunk.append(('dense', kernel, bias, activation))
+
+            elif class_name == 'BatchNormalization':
+                scale, shift = _fold_batch_norm(
+                    weights.get('gamma', 1.0),
+                    weights.get('beta', 0.0),
+                    weights['moving_mean'],
+                    weights['moving_variance'],
+                    config.get('epsilon', 0.001)
+                )
+                trunk.append(('affine', scale, shift))
+
+            else:
+                raise ValueError(f"Không hỗ trợ tầng {class_name} trong chế độ fused")
+
+        if not heads:
+            raise ValueError("Không tìm thấy tầng đầu ra nào để gộp")
+
+        # Giữ đúng thứ tự đầu ra của mô hình gốc (cột i tương ứng với ngành i)
+        ordered_names = [name for name in output_names if name in heads] or sorted(
+            heads, key=lambda n: int(OUTPUT_LAYER_PATTERN.match(n).group(1)) if OUTPUT_LAYER_PATTERN.match(n) else 0
+        )
+        head_kernel = np.concatenate([heads[name][0] for name in ordered_names], axis=1)
+        head_bias = np.concatenate([heads[name][1] for name in ordered_names], axis=0)
+
+        return cls(trunk, head_kernel, head_bias, head_activation)
+
+    @classmethod
+    def load(cls, filepath):
+        """Tải mô hình đã gộp từ file .npz (do save tạo ra) hoặc trực tiếp từ file .h5"""
+        if not filepath.endswith('.npz'):
+            return cls.from_h5(filepath)
+
+        with np.load(filepath, allow_pickle=False) as data:
+            num_steps = int(data['num_steps'])
+            trunk = []
+            for i in range(num_steps):
+                kind = str(data[f'step_{i}_kind'])
+                if kind == 'dense':
+                    trunk.append(('dense', data[f'step_{i}_kernel'], data[f'step_{i}_bias'], str(data[f'step_{i}_activation'])))
+                else:
+                    trunk.append(('affine', data[f'step_{i}_scale'], data[f'step_{i}_shift']))
+            return cls(trunk, data['head_kernel'], data['head_bias'], str(data['head_activation']))
+
+    def save(self, filepath):
+        """Lưu trọng số đã gộp ra file .npz"""
+        arrays = {
+            'num_steps': np.array(len(self.trunk)),
+            'head_kernel': self.head_kernel,
+            'head_bias': self.head_bias,
+            'head_activation': np.array(self.head_activation)
+        }
+        for i, step in enumerate(self.trunk):
+            arrays[f'step_{i}_kind'] = np.array(step[0])
+            if step[0] == 'dense':
+                arrays[f'step_{i}_kernel'] = step[1]
+                arrays[f'step_{i}_bias'] = step[2]
+                arrays[f'step_{i}_activation'] = np.array(step[3])
+            else:
+                arrays[f'step_{i}_scale'] = step[1]
+                arrays[f'step_{i}_shift'] = step[2]
+        np.savez(filepath, **arrays)
+
+    def hidden(self, X):
+        """Tính đầu ra của phần chia sẻ (đầu vào của các đầu ra)"""
+        output = np.asarray(X, dtype=self.head_kernel.dtype)
+        if output.ndim == 1:
+            output = output.reshape(1, -1)
+
+        for step in self.trunk:
+            if step[0] == 'dense':
+                _, kernel, bias, activation = step
+                output = ACTIVATIONS[activation](output @ kernel + bias)
+            else:
+                _, scale, shift = step
+                output = output * scale + shift
+
+        return output
+
+    def predict_combined(self, X):
+        """
+        Dự đoán điểm của tất cả các ngành bằng một phép nhân ma trận
+
+        Returns:
+            Ma trận dự đoán với kích thước [batch_size, output_dim]
+        """
+        return ACTIVATIONS[self.head_activation](self.hidden(X) @ self.head_kernel + self.head_bias)
+
+
+def verify_parity(model_path, X, atol=1e-5):
+    """
+    So sánh kết quả của chế độ fused với mô hình đa đầu ra gốc
+
+    Returns:
+        Sai số tuyệt đối lớn nhất giữa hai chế độ
+    """
+    from ai_models.goiynganhhoc.neural_network import MajorRecommendationModel
+
+    original = MajorRecommendationModel.load(model_path)
+    original_preds = original.predict_combined(X)
+    fused_preds = FusedMajorModel.from_h5(model_path).predict_combined(X)
+
+    if original_preds.shape != fused_preds.shape:
+        raise AssertionError(f"Kích thước đầu ra khác nhau: {original_preds.shape} và {fused_preds.shape}")
+
+    max_error = float(np.max(np.abs(original_preds - fused_preds)))
+    if max_error > atol:
+        raise AssertionError(f"Sai số giữa chế độ fused và mô hình gốc ({max_error:.2e}) vượt quá ngưỡng {atol:.0e}")
+    return max_error
+
+
+def csv_row_to_student_data(row, scores_order):
+    """Chuyển một dòng của file CSV dữ liệu kiểm tra sang định dạng dữ liệu học sinh"""
+    import pandas as pd
+
+    scores = {subject: float(row[subject]) for subject in scores_order if subject in row and pd.notna(row[subject])}
+    interests = [i.strip() for i in str(row.get('Interests', '')).split(',') if i.strip()]
+    subject_groups = [row[f'Subject_Group_{i}'] for i in range(1, 4) if pd.notna(row.get(f'Subject_Group_{i}'))]
+
+    return {
+        'scores': scores,
+        'interests': interests,
+        'subject_groups': subject_groups,
+        'tohopthi': row.get('Tohopthi', 'TN')
+    }
+
+
+def main():
+    import pandas as pd
+
+    from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
+
+    parser = argparse.ArgumentParser(description='Kiểm tra chế độ fused head so với mô hình đa đầu ra')
+    parser.add_argument('--model', help='File .h5 của mô hình đa đầu ra (mặc định: file mới nhất trong thư mục model)')
+    parser.add_argument('--test-file', default=os.path.join(current_dir, 'test_data_2000.csv'), help='File CSV dữ liệu kiểm tra')
+    parser.add_argument('--atol', type=float, default=1e-5, help='Sai số tuyệt đối cho phép')
+    parser.add_argument('--export', help='Lưu trọng số đã gộp ra file .npz')
+    args = parser.parse_args()
+
+    model_path = args.model or os.path.join(MODEL_DIR, sorted(f for f in os.listdir(MODEL_DIR) if f.endswith('.h5'))[-1])
+
+    with open(os.path.join(MODEL_DIR, 'mappings.json'), 'r', encoding='utf-8') as f:
+        mappings = json.load(f)
+
+    df = pd.read_csv(args.test_file, encoding='utf-8-sig')
+    scores_order = mappings.get('scores_order', [])
+    X = np.array([
+        DataPreprocessor.preprocess_with_mappings(csv_row_to_student_data(row, scores_order), mappings)
+        for _, row in df.iterrows()
+    ])
+
+    scaler_mean = np.load(os.path.join(MODEL_DIR, 'scaler_mean.npy'))
+    scaler_scale = np.load(os.path.join(MODEL_DIR, 'scaler_scale.npy'))
+    X_scaled = (X - scaler_mean) / scaler_scale
+
+    max_error = verify_parity(model_path, X_scaled, atol=args.atol)
+    print(f"Chế độ fused khớp với mô hình đa đầu ra trên {len(X_scaled)} mẫu, sai số lớn nhất: {max_error:.2e}")
+
+    if args.export:
+        FusedMajorModel.from_h5(model_path).save(args.export)
+        print(f"Đã lưu trọng số đã gộp tại {args.export}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,6 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(os.path.dirname(current_dir))
 sys.path.append(parent_dir)
 
-from ai_models.goiynganhhoc.neural_network import MajorRecommendationModel
-from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
 
 def initialize_model():
     """
@@ -32,6 +30,10 @@ def initialize_model():
     
     print("Bắt đầu khởi tạo mô hình gợi ý ngành học...")
     
+    # Chỉ import TensorFlow khi thực sự cần tạo mô hình
+    from ai_models.goiynganhhoc.neural_network import MajorRecommendationModel
+    from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
+    
     try:
         # Khởi tạo preprocessor
         preprocessor = DataPreprocessor()
@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import threading
+
+# Thêm đường dẫn để import các module dùng chung
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import MAJOR_INDEX_CHECK_SECONDS
+from utils.db_utils import db_client
+from utils.data_versions import get_data_version
+
+# Độ dài n-gram dùng cho chỉ mục tìm kiếm chuỗi con
+NGRAM_SIZE = 3
+
+# Số kết quả tra cứu được giữ lại cho mỗi phiên bản chỉ mục
+MAX_CACHED_LOOKUPS = 1024
+
+
+def _ngrams(text, n=NGRAM_SIZE):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class MajorNameIndex:
+    """
+    Chỉ mục đảo ngược (n-gram -> id ngành) trên danh sách tên ngành riêng biệt của benchmark_scores
+
+    Tra cứu chuỗi con chỉ kiểm tra các ngành chứa tất cả n-gram của cụm tìm kiếm,
+    kết quả giữ nguyên thứ tự của danh sách gốc
+    """
+
+    def __init__(self, majors, version=None):
+        self.majors = [major for major in majors if isinstance(major, str)]
+        self.majors_lower = [major.lower() for major in self.majors]
+        self.version = version
+
+        self._ngram_index = {}
+        self._token_index = {}
+        for major_id, name in enumerate(self.majors_lower):
+            for gram in _ngrams(name):
+                self._ngram_index.setdefault(gram, []).append(major_id)
+            for token in set(name.split()):
+                self._token_index.setdefault(token, []).append(major_id)
+
+        self._lookup_cache = {}
+        self._lookup_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.majors)
+
+    def ids_containing(self, term):
+        """
+        Id các ngành có tên (chữ thường) chứa cụm term
+
+        Returns:
+            Danh sách id đã sắp xếp tăng dần
+        """
+        term = term.lower()
+        if len(term) < NGRAM_SIZE:
+            # Cụm quá ngắn để dùng n-gram, quét toàn bộ danh sách
+            return [major_id for major_id, name in enumerate(self.majors_lower) if term in name]
+
+        # Giao các danh sách n-gram, bắt đầu từ danh sách ngắn nhất
+        postings = []
+        for gram in _ngrams(term):
+            posting = self._ngram_index.get(gram)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+
+        # Xác nhận lại vì chứa đủ n-gram chưa chắc đã chứa cả cụm
+        return sorted(major_id for major_id in candidates if term in self.majors_lower[major_id])
+
+    def ids_with_token(self, token):
+        """Id các ngành có một từ trùng khớp hoàn toàn với token"""
+        return list(self._token_index.get(token.lower(), []))
+
+    def find_related(self, predicted_major):
+        """
+        Tìm các ngành liên quan đến tên ngành dự đoán
+        - Các ngành có chứa cả cụm tên ngành (không phân biệt hoa thường)
+        - Nếu không có, các ngành chứa ít nhất 50% từ khóa (từ dài hơn 3 ký tự)
+
+        Returns:
+            Danh sách tên ngành theo thứ tự của danh sách gốc
+        """
+        search_term = predicted_major.lower()
+
+        cached = self._lookup_cache.get(search_term)
+        if cached is not None:
+            return list(cached)
+
+        matched_ids = self.ids_containing(search_term)
+
+        if not matched_ids:
+            keywords = [word for word in search_term.split() if len(word) > 3]
+            if keywords:
+                keyword_counts = {}
+                for keyword in keywords:
+                    for major_id in self.ids_containing(keyword):
+                        keyword_counts[major_id] = keyword_counts.get(major_id, 0) + 1
+
+                matched_ids = sorted(
+                    major_id for major_id, count in keyword_counts.items()
+                    if count >= len(keywords) / 2
+                )
+
+        result = [self.majors[major_id] for major_id in matched_ids]
+
+        with self._lookup_lock:
+            if len(self._lookup_cache) >= MAX_CACHED_LOOKUPS:
+                self._lookup_cache.clear()
+            self._lookup_cache[search_term] = tuple(result)
+
+        return result
+
+
+class MajorIndexStore:
+    """
+    Giữ chỉ mục tên ngành dùng chung cho toàn bộ worker
+    - Xây dựng một lần từ db.benchmark_scores.distinct("major")
+    - Kiểm tra phiên bản dữ liệu benchmark_scores tối đa mỗi check_interval giây,
+      xây dựng lại và thay thế atomic khi dữ liệu được nhập/sửa
+    """
+
+    def __init__(self, check_interval=MAJOR_INDEX_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._index = None
+        self._last_check = 0.0
+
+    def get(self):
+        """Lấy chỉ mục hiện tại, xây dựng lại nếu dữ liệu benchmark_scores đã thay đổi"""
+        index = self._index
+        now = time.monotonic()
+        if index is not None and now - self._last_check < self.check_interval:
+            return index
+
+        with self._lock:
+            if self._index is not None and now - self._last_check < self.check_interval:
+                return self._index
+
+            self._last_check = now
+            try:
+                version = get_data_version('benchmark_scores')
+            except Exception as e:
+                print(f"Không thể đọc phiên bản dữ liệu benchmark_scores: {e}")
+                version = self._index.version if self._index is not None else None
+
+            if self._index is None or self._index.version != version:
+                self._index = self._build(version)
+
+            return self._index
+
+    def rebuild(self):
+        """Xây dựng lại chỉ mục ngay (ví dụ sau khi nhập dữ liệu điểm chuẩn)"""
+        with self._lock:
+            self._last_check = time.monotonic()
+            self._index = self._build(get_data_version('benchmark_scores'))
+            return self._index
+
+    def _build(self, version):
+        start = time.perf_counter()
+        majors = db_client.get_collection('benchmark_scores').distinct('major')
+        index = MajorNameIndex(majors, version=version)
+        print(f"Đã xây dựng chỉ mục {len(index)} tên ngành (phiên bản dữ liệu {version}) trong {(time.perf_counter() - start) * 1000:.0f}ms")
+        return index
+
+
+# Store dùng chung cho toàn bộ worker
+major_index_store = MajorIndexStore()
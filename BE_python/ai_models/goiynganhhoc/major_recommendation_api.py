@@ -2,12 +2,11 @@ import os
 import sys
 import json
 import traceback
+import threading
 import numpy as np
-import tensorflow as tf
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 from bson import ObjectId
-from pymongo import MongoClient
 
 # Thêm đường dẫn để import cần thiết
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,18 +14,17 @@ parent_dir = os.path.dirname(os.path.dirname(current_dir))
 sys.path.append(parent_dir)
 
 # Import modules từ các file khác
-from ai_models.goiynganhhoc.neural_network import MajorRecommendationModel
+from ai_models.goiynganhhoc.model_cache import major_model_cache
 from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
 # Import module gợi ý trường đại học
 from ai_models.goiynganhhoc.university_recommendation import recommend_universities_for_top_majors
+from config.config import MODEL_MAPPINGS_REFRESH_SECONDS
+from utils.reference_data import reference_data
+from utils.db_utils import db
+from utils.write_behind import prediction_log_writer
+from utils.batching import major_batcher
 
-# Kết nối MongoDB
-MONGODB_URI = os.getenv('MONGO_URI')
-MONGODB_NAME = os.getenv('MONGO_DB_NAME')
-
-print(f"Major Recommendation API MongoDB Configuration: URI={MONGODB_URI}, DB={MONGODB_NAME}")
-client = MongoClient(MONGODB_URI)
-db = client[MONGODB_NAME]
+# Kết nối MongoDB dùng chung (tạo khi truy vấn lần đầu, cấu hình trong config/config.py)
 
 # Class để hỗ trợ serialization numpy arrays
 class NpEncoder(json.JSONEncoder):
@@ -55,10 +53,10 @@ def get_active_model_mappings():
     """
     global _cached_model_mappings, _cached_timestamp
     
-    # Kiểm tra xem đã cache mapping chưa hoặc đã cache quá 1 giờ
+    # Kiểm tra xem đã cache mapping chưa hoặc đã hết hạn cache
     current_time = datetime.now()
-    if _cached_model_mappings is None or _cached_timestamp is None or \
-       (current_time - _cached_timestamp).total_seconds() > 3600:  # 1 giờ
+    if _cached_timestamp is None or \
+       (current_time - _cached_timestamp).total_seconds() > MODEL_MAPPINGS_REFRESH_SECONDS:
         
         try:
             # Lấy mapping active từ MongoDB
@@ -73,6 +71,7 @@ def get_active_model_mappings():
             else:
                 print("Không tìm thấy mapping active trong DB, sử dụng preprocessor mặc định")
                 _cached_model_mappings = None
+                _cached_timestamp = current_time
                 
         except Exception as e:
             print(f"Lỗi khi lấy model mapping: {e}")
@@ -80,55 +79,50 @@ def get_active_model_mappings():
             
     return _cached_model_mappings
 
-def load_model():
-    """
-    Tải mô hình mới nhất đã lưu
+def invalidate_model_mappings():
+    """Xóa cache mapping để lần gọi tiếp theo đọc lại model_mappings (ví dụ sau khi huấn luyện lại)"""
+    global _cached_model_mappings, _cached_timestamp
+    _cached_model_mappings = None
+    _cached_timestamp = None
+
+# DataPreprocessor dùng chung giữa các request (chỉ đọc), tạo lại khi phiên bản mapping
+# hoặc ảnh chụp dữ liệu tham chiếu thay đổi
+_preprocessor_lock = threading.Lock()
+_cached_preprocessor = None
+_cached_preprocessor_key = None
+
+def get_preprocessor(mappings=None):
     """
-    model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
+    Lấy DataPreprocessor dùng chung cho phiên bản mapping hiện tại
     
-    # Kiểm tra thư mục model đã tồn tại chưa
-    if not os.path.exists(model_dir):
-        print(f"Thư mục {model_dir} không tồn tại.")
-        return None
+    Args:
+        mappings: Mapping đang active (None nếu không có trong DB)
         
-    # Lấy danh sách file model trong thư mục
-    model_files = [f for f in os.listdir(model_dir) if f.endswith('.h5')]
+    Returns:
+        Instance DataPreprocessor, chỉ được đọc, không được sửa đổi trong request
+    """
+    global _cached_preprocessor, _cached_preprocessor_key
     
-    if not model_files:
-        print("Không tìm thấy file mô hình nào.")
-        return None
-        
-    # Lấy file mới nhất
-    latest_model = sorted(model_files)[-1]
-    model_path = os.path.join(model_dir, latest_model)
+    key = (mappings.get('version') if mappings else None, id(reference_data.snapshot()))
+    preprocessor = _cached_preprocessor
+    if preprocessor is not None and _cached_preprocessor_key == key:
+        return preprocessor
     
-    print(f"Đang tải mô hình từ {model_path}...")
-    try:
-        model = MajorRecommendationModel.load(model_path)
-        return model
-    except Exception as e:
-        print(f"Lỗi khi tải mô hình: {e}")
-        return None
+    with _preprocessor_lock:
+        if _cached_preprocessor is None or _cached_preprocessor_key != key:
+            _cached_preprocessor = DataPreprocessor()
+            _cached_preprocessor_key = key
+            print(f"Đã tạo DataPreprocessor cho mapping phiên bản {key[0] or 'mặc định'}")
+        return _cached_preprocessor
 
-def load_scaler():
+def preload_model():
     """
-    Tải scaler để chuẩn hóa dữ liệu
+    Tải trước mô hình, scaler và DataPreprocessor cho phiên bản mapping hiện tại,
+    sau đó bật theo dõi phiên bản mới
     """
-    model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model')
-    scaler_mean_path = os.path.join(model_dir, 'scaler_mean.npy')
-    scaler_scale_path = os.path.join(model_dir, 'scaler_scale.npy')
-    
-    if not os.path.exists(scaler_mean_path) or not os.path.exists(scaler_scale_path):
-        print("Không tìm thấy file scaler.")
-        return None
-    
-    try:
-        scaler_mean = np.load(scaler_mean_path)
-        scaler_scale = np.load(scaler_scale_path)
-        return (scaler_mean, scaler_scale)
-    except Exception as e:
-        print(f"Lỗi khi tải scaler: {e}")
-        return None
+    major_model_cache.get()
+    get_preprocessor(get_active_model_mappings())
+    major_model_cache.start_watching()
 
 def preprocess_data(data):
     """
@@ -192,7 +186,7 @@ def preprocess_student_data_with_mappings(student_data, mappings=None):
     
     # Nếu vẫn không tìm thấy mapping, sử dụng DataPreprocessor mặc định
     if mappings is None:
-        preprocessor = DataPreprocessor()
+        preprocessor = get_preprocessor(None)
         return preprocessor.preprocess_student_data(student_data)
     
     # Sử dụng phương thức tĩnh preprocess_with_mappings từ DataPreprocessor
@@ -260,12 +254,12 @@ def predict_recommended_majors(student_data, top_k=3):
         # Lấy mapping từ model_mappings collection
         mappings = get_active_model_mappings()
         
-        # Tải mô hình và scaler
-        model = load_model()
-        scaler = load_scaler()
+        # Lấy mô hình và scaler đã tải sẵn (cùng một phiên bản) từ cache
+        model_handle = major_model_cache.get()
+        model, scaler = model_handle.model, model_handle.scaler
         
-        if model is None or scaler is None:
-            raise ValueError("Không thể tải mô hình hoặc scaler")
+        # DataPreprocessor dùng chung cho phiên bản mapping hiện tại (không truy vấn majors mỗi request)
+        preprocessor = get_preprocessor(mappings)
         
         # Tiền xử lý dữ liệu học sinh sử dụng mapping
         if mappings:
@@ -275,7 +269,6 @@ def predict_recommended_majors(student_data, top_k=3):
         else:
             # Fallback: Sử dụng preprocessor mặc định nếu không tìm thấy mappings
             print("Không tìm thấy mappings, sử dụng preprocessor mặc định")
-            preprocessor = DataPreprocessor()
             features = preprocessor.preprocess_student_data(student_data)
             id_to_major = preprocessor.id_to_major
         
@@ -283,8 +276,8 @@ def predict_recommended_majors(student_data, top_k=3):
         scaler_mean, scaler_scale = scaler
         features_scaled = (features.reshape(1, -1) - scaler_mean) / scaler_scale
         
-        # Dự đoán ngành học - lấy trực tiếp output sigmoid
-        predictions = model.predict_combined(features_scaled)[0]
+        # Dự đoán ngành học - lấy trực tiếp output sigmoid (gom chung batch với các request đồng thời khác)
+        predictions = major_batcher.predict(model, features_scaled[0])
         
         # Lấy top-k ngành có điểm sigmoid cao nhất
         top_indices = np.argsort(predictions)[::-1][:top_k]
@@ -314,9 +307,6 @@ def predict_recommended_majors(student_data, top_k=3):
         # Tạo danh sách kết quả
         recommendations = []
         
-        # Khởi tạo preprocessor để lấy thông tin ngành học
-        preprocessor = DataPreprocessor()
-        
         for idx in top_indices:
             # Lấy tên ngành
             idx_int = int(idx)
@@ -454,8 +444,8 @@ def recommend_majors():
             "feedback": None   # Sẽ được cập nhật khi có feedback
         }
         
-        # Lưu vào MongoDB và lấy id của bản ghi
-        log_id = db.prediction_logs.insert_one(log_data).inserted_id
+        # Đưa vào hàng đợi ghi nền, _id được tạo ngay để trả về cho frontend
+        log_id = prediction_log_writer.submit(log_data)
         
         # Trả về kết quả
         return jsonify({
@@ -489,14 +479,17 @@ def update_feedback():
         feedback_text = data.get('feedback')
         
         # Cập nhật log trong MongoDB
-        result = db.prediction_logs.update_one(
-            {'_id': ObjectId(prediction_id)},
-            {'$set': {
-                'isUseful': is_useful,
-                'feedback': feedback_text,
-                'feedbackDate': datetime.now()
-            }}
-        )
+        feedback_query = {'_id': ObjectId(prediction_id)}
+        feedback_update = {'$set': {
+            'isUseful': is_useful,
+            'feedback': feedback_text,
+            'feedbackDate': datetime.now()
+        }}
+        result = db.prediction_logs.update_one(feedback_query, feedback_update)
+        
+        # Log có thể vẫn đang nằm trong hàng đợi ghi nền, ghi ngay rồi thử lại
+        if result.matched_count == 0 and prediction_log_writer.flush():
+            result = db.prediction_logs.update_one(feedback_query, feedback_update)
         
         if result.modified_count > 0:
             return jsonify({
@@ -0,0 +1,279 @@
+import os
+import sys
+import time
+import threading
+from datetime import datetime
+import numpy as np
+
+# Thêm đường dẫn để import các module dùng chung
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import MAJOR_MODEL_SERVING_MODE, MAJOR_MODEL_WATCH_SECONDS, TFLITE_NUM_THREADS
+from utils.db_utils import db_client
+from ai_models.goiynganhhoc.fused_head import FusedMajorModel
+from ai_models.tflite_inference import TFLiteModel, tflite_path_for, source_hash_path_for, is_export_current
+
+# Thư mục chứa mô hình - sử dụng đường dẫn tuyệt đối
+current_dir = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(current_dir, 'model')
+
+
+def find_latest_model_file(model_dir=MODEL_DIR):
+    """
+    Tìm file mô hình mới nhất (theo tên, các file có hậu tố thời gian)
+
+    Returns:
+        Đường dẫn file .h5 hoặc None nếu không có
+    """
+    if not os.path.exists(model_dir):
+        return None
+
+    model_files = [f for f in os.listdir(model_dir) if f.endswith('.h5')]
+    if not model_files:
+        return None
+
+    return os.path.join(model_dir, sorted(model_files)[-1])
+
+
+def get_active_mappings_version():
+    """Phiên bản của mapping đang active trong model_mappings (None nếu không có)"""
+    records = db_client.fetch_data(
+        'model_mappings',
+        {'model_name': 'major_recommendation', 'active': True},
+        projection={'version': 1},
+        limit=1
+    )
+    return records[0].get('version') if records else None
+
+
+class MajorModelHandle:
+    """
+    Bộ mô hình gợi ý ngành học đã tải (mô hình + scaler), dùng chung (chỉ đọc) giữa các request
+    """
+
+    def __init__(self, model, scaler, model_path, fingerprint, serving_mode, loaded_at, load_time_ms):
+        self.model = model
+        self.scaler = scaler
+        self.model_path = model_path
+        self.fingerprint = fingerprint
+        self.serving_mode = serving_mode
+        self.loaded_at = loaded_at
+        self.load_time_ms = load_time_ms
+
+    @property
+    def version(self):
+        """Phiên bản mô hình: tên file (không có phần mở rộng)"""
+        return os.path.splitext(os.path.basename(self.model_path))[0]
+
+    def to_dict(self):
+        return {
+            'version': self.version,
+            'servingMode': self.serving_mode,
+            'modelPath': self.model_path,
+            'mappingsVersion': self.fingerprint[3],
+            'loadedAt': self.loaded_at.isoformat(),
+            'loadTimeMs': round(self.load_time_ms, 2)
+        }
+
+
+class MajorModelCache:
+    """
+    Cache có phiên bản cho mô hình gợi ý ngành học
+    - Request đầu tiên tải mô hình đồng bộ, các request sau dùng lại handle trong bộ nhớ
+    - Theo dõi thư mục model và model_mappings.active, tải phiên bản mới ở luồng nền
+    - Thay handle một cách atomic: request đang chạy vẫn dùng handle cũ cho đến khi kết thúc
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, serving_mode=MAJOR_MODEL_SERVING_MODE, watch_interval=MAJOR_MODEL_WATCH_SECONDS):
+        if serving_mode not in ('fused', 'tflite', 'keras'):
+            raise ValueError(f"Chế độ phục vụ không hợp lệ: {serving_mode} (chỉ hỗ trợ 'fused', 'tflite' hoặc 'keras')")
+        self.model_dir = model_dir
+        self.serving_mode = serving_mode
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()
+        self._handle = None
+        self._loading = False
+        self._timer = None
+        self._last_error = None
+
+    def get(self):
+        """
+        Lấy handle của mô hình, tải mô hình nếu chưa được tải
+
+        Raises:
+            FileNotFoundError: Nếu không có file mô hình hoặc scaler
+        """
+        handle = self._handle
+        if handle is not None:
+            return handle
+
+        with self._lock:
+            if self._handle is None:
+                self._handle = self._load(self._fingerprint())
+            return self._handle
+
+    def reload(self):
+        """Tải lại mô hình mới nhất (đồng bộ) và thay thế handle hiện tại"""
+        handle = self._load(self._fingerprint())
+        with self._lock:
+            self._handle = handle
+        return handle
+
+    def check_for_update(self):
+        """
+        Kiểm tra có phiên bản mới không, nếu có thì tải ở luồng nền
+
+        Returns:
+            True nếu đã bắt đầu tải phiên bản mới
+        """
+        handle = self._handle
+        if handle is None or self._loading:
+            return False
+
+        fingerprint = self._fingerprint()
+        if fingerprint == handle.fingerprint:
+            return False
+
+        with self._lock:
+            if self._loading:
+                return False
+            self._loading = True
+
+        print(f"Phát hiện phiên bản mô hình gợi ý ngành học mới: {os.path.basename(fingerprint[0] or '')}, đang tải ở nền...")
+        threading.Thread(target=self._load_in_background, args=(fingerprint,), daemon=True).start()
+        return True
+
+    def start_watching(self):
+        """Bắt đầu theo dõi phiên bản mới định kỳ (bỏ qua nếu watch_interval <= 0 hoặc đã chạy)"""
+        if self.watch_interval <= 0 or self._timer is not None:
+            return
+        self._schedule_check()
+
+    def stop_watching(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def is_loaded(self):
+        return self._handle is not None
+
+    def status(self):
+        """Thông tin trạng thái cho health check (không kích hoạt việc tải mô hình)"""
+        handle = self._handle
+        status = {'loaded': handle is not None, 'loadingNewVersion': self._loading}
+        if handle is not None:
+            status.update(handle.to_dict())
+        if self._last_error:
+            status['lastError'] = self._last_error
+        return status
+
+    def _schedule_check(self):
+        self._timer = threading.Timer(self.watch_interval, self._watch)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _watch(self):
+        try:
+            self.check_for_update()
+        except Exception as e:
+            print(f"Lỗi khi kiểm tra phiên bản mô hình gợi ý ngành học: {e}")
+        finally:
+            self._schedule_check()
+
+    def _load_in_background(self, fingerprint):
+        try:
+            handle = self._load(fingerprint)
+            with self._lock:
+                self._handle = handle
+        except Exception as e:
+            # Giữ phiên bản cũ nếu phiên bản mới không tải được
+            print(f"Lỗi khi tải phiên bản mô hình mới, tiếp tục dùng phiên bản cũ: {e}")
+        finally:
+            self._loading = False
+
+    def _fingerprint(self):
+        """
+        Dấu vân tay của phiên bản hiện có trên đĩa: (file, mtime, kích thước, phiên bản mapping, bản xuất TFLite)
+
+        Ở chế độ tflite gồm cả mtime và kích thước file mã băm cạnh file .tflite (được ghi sau cùng khi xuất),
+        vì job huấn luyện xuất TFLite sau khi đã lưu .h5 và mapping: worker tạm dùng chế độ fused
+        sẽ chuyển sang TFLite khi bản xuất xuất hiện
+        """
+        model_path = find_latest_model_file(self.model_dir)
+        if model_path is None:
+            return (None, None, None, None, None)
+
+        try:
+            mappings_version = get_active_mappings_version()
+        except Exception as e:
+            print(f"Không thể đọc phiên bản mapping: {e}")
+            mappings_version = self._handle.fingerprint[3] if self._handle is not None else None
+
+        export = None
+        if self.serving_mode == 'tflite':
+            try:
+                export_stat = os.stat(source_hash_path_for(model_path))
+                export = (export_stat.st_mtime, export_stat.st_size)
+            except FileNotFoundError:
+                pass
+
+        stat = os.stat(model_path)
+        return (model_path, stat.st_mtime, stat.st_size, mappings_version, export)
+
+    def _load(self, fingerprint):
+        start = time.perf_counter()
+        model_path = fingerprint[0]
+
+        try:
+            if model_path is None:
+                raise FileNotFoundError(f"Không tìm thấy file mô hình nào trong {self.model_dir}")
+
+            scaler_mean_path = os.path.join(self.model_dir, 'scaler_mean.npy')
+            scaler_scale_path = os.path.join(self.model_dir, 'scaler_scale.npy')
+            if not os.path.exists(scaler_mean_path) or not os.path.exists(scaler_scale_path):
+                raise FileNotFoundError("Không tìm thấy file scaler.")
+
+            model, serving_mode = self._load_model(model_path)
+            scaler = (np.load(scaler_mean_path), np.load(scaler_scale_path))
+
+            # Chạy thử một lần để khởi tạo hàm predict trước khi chia sẻ giữa các luồng
+            model.predict_combined(np.zeros((1, len(scaler[0]))))
+        except Exception as e:
+            self._last_error = str(e)
+            raise
+
+        load_time_ms = (time.perf_counter() - start) * 1000
+        handle = MajorModelHandle(
+            model=model,
+            scaler=scaler,
+            model_path=model_path,
+            fingerprint=fingerprint,
+            serving_mode=serving_mode,
+            loaded_at=datetime.now(),
+            load_time_ms=load_time_ms
+        )
+        self._last_error = None
+        print(f"Đã tải mô hình gợi ý ngành học {handle.version} (chế độ {serving_mode}) trong {load_time_ms:.0f}ms")
+        return handle
+
+    def _load_model(self, model_path):
+        if self.serving_mode == 'tflite':
+            try:
+                if not is_export_current(model_path):
+                    raise FileNotFoundError(f"chưa xuất {os.path.basename(tflite_path_for(model_path))} từ phiên bản .h5 hiện tại")
+                return TFLiteModel(tflite_path_for(model_path), num_threads=TFLITE_NUM_THREADS), 'tflite'
+            except (ImportError, FileNotFoundError) as e:
+                print(f"Không thể dùng chế độ TFLite ({e}), chuyển sang chế độ fused")
+
+        if self.serving_mode in ('fused', 'tflite'):
+            try:
+                # Gộp các đầu ra thành một ma trận, tính điểm tất cả các ngành bằng một phép nhân
+                return FusedMajorModel.from_h5(model_path), 'fused'
+            except ValueError as e:
+                print(f"Không thể dùng chế độ fused ({e}), chuyển sang mô hình Keras")
+
+        from ai_models.goiynganhhoc.neural_network import MajorRecommendationModel
+        return MajorRecommendationModel.load(model_path, compile=False), 'keras'
+
+
+# Cache dùng chung cho toàn bộ worker
+major_model_cache = MajorModelCache()
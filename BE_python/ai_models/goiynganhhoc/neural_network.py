@@ -20,6 +20,7 @@ class MajorRecommendationModel:
         self.output_dim = output_dim
         self.use_multi_output = use_multi_output
         self.model = self._build_model()
+        self.training_model = self.model
         
     def _build_model(self):
         """
@@ -73,7 +74,8 @@ class MajorRecommendationModel:
         
         return model
     
-    def weighted_binary_crossentropy(self, class_weight):
+    @staticmethod
+    def weighted_binary_crossentropy(class_weight):
         """
         Hàm binary cross-entropy có trọng số dùng cho mô hình đa đầu ra
         
@@ -93,56 +95,79 @@ class MajorRecommendationModel:
             return tf.reduce_mean(weighted_loss)
         return loss
     
+    @staticmethod
+    def fused_weighted_binary_crossentropy(negative_weights, positive_weights):
+        """
+        Binary cross-entropy có trọng số cho nhãn gộp [batch, output_dim] (mỗi cột một ngành),
+        tính cho tất cả các ngành trong một phép toán thay vì một hàm loss cho mỗi đầu ra
+        
+        Args:
+            negative_weights: Trọng số mẫu âm của từng ngành
+            positive_weights: Trọng số mẫu dương của từng ngành
+        
+        Returns:
+            Hàm loss: tổng loss có trọng số của các ngành cho từng mẫu
+        """
+        negative_weights = tf.constant(negative_weights, dtype=tf.float32)
+        positive_weights = tf.constant(positive_weights, dtype=tf.float32)
+        
+        def loss(y_true, y_pred):
+            weights = y_true * positive_weights + (1 - y_true) * negative_weights
+            return tf.reduce_sum(tf.keras.backend.binary_crossentropy(y_true, y_pred) * weights, axis=-1)
+        return loss
+    
     def compile_model(self, class_weights=None):
         """
         Compile model với loss và metrics phù hợp
         
+        Mô hình đa đầu ra được huấn luyện qua training_model: cùng các tầng và trọng số nhưng
+        nối các đầu ra thành một đầu ra gộp [batch, output_dim], nên nhãn là một ma trận nhị phân
+        thay vì dictionary từng đầu ra. File .h5 vẫn lưu mô hình đa đầu ra (self.model)
+        
         Args:
             class_weights: Dictionary map từ output_name → {0: weight0, 1: weight1}
                            cho mô hình đa đầu ra
         """
         opt = tf.keras.optimizers.Adam(learning_rate=0.0005)
         
-        if self.use_multi_output and class_weights:
-            # Compile cho mô hình đa đầu ra với class weights
-            loss_dict = {}
-            metrics_dict = {}
+        if self.use_multi_output:
+            fused_output = tf.keras.layers.Concatenate(name='fused_output')(self.model.outputs)
+            self.training_model = tf.keras.Model(inputs=self.model.inputs, outputs=fused_output)
             
-            for i in range(self.output_dim):
-                output_name = f'output_{i}'
-                # Sử dụng weighted_binary_crossentropy cho mỗi đầu ra
-                if output_name in class_weights:
-                    loss_dict[output_name] = self.weighted_binary_crossentropy(class_weights[output_name])
-                else:
-                    loss_dict[output_name] = 'binary_crossentropy'
-                
-                metrics_dict[output_name] = 'accuracy'
+            # Trọng số của từng ngành, mặc định {0: 1.0, 1: 1.0} (binary cross-entropy thông thường)
+            weights = [
+                (class_weights or {}).get(f'output_{i}', {0: 1.0, 1: 1.0})
+                for i in range(self.output_dim)
+            ]
             
-            self.model.compile(
+            self.training_model.compile(
                 optimizer=opt,
-                loss=loss_dict,
-                metrics=metrics_dict
+                loss=self.fused_weighted_binary_crossentropy(
+                    [weight[0] for weight in weights], [weight[1] for weight in weights]
+                ),
+                metrics=[tf.keras.metrics.BinaryAccuracy(name='accuracy')]
             )
         else:
             # Compile cho mô hình truyền thống
+            self.training_model = self.model
             self.model.compile(
                 optimizer=opt,
                 loss='binary_crossentropy',
                 metrics=['accuracy']
             )
     
-    def train(self, X_train, y_train, X_val=None, y_val=None, epochs=50, batch_size=32, 
+    def train(self, X_train, y_train=None, X_val=None, y_val=None, epochs=50, batch_size=32, 
               callbacks=None, verbose=1, class_weight=None):
         """
         Train the neural network model
         
         Args:
-            X_train: Training features
-            y_train: Training labels (ma trận đơn hoặc dictionary cho đa đầu ra)
-            X_val: Validation features
-            y_val: Validation labels (ma trận đơn hoặc dictionary cho đa đầu ra)
+            X_train: Training features, hoặc tf.data.Dataset gồm (features, nhãn gộp) đã chia batch
+            y_train: Training labels (ma trận [n, output_dim]; None khi X_train là Dataset)
+            X_val: Validation features, hoặc tf.data.Dataset validation
+            y_val: Validation labels (None khi X_val là Dataset)
             epochs: Number of training epochs
-            batch_size: Batch size for training
+            batch_size: Batch size for training (bỏ qua khi dùng Dataset)
             callbacks: List of callbacks to use during training
             verbose: Verbosity level (0=silent, 1=progress bar, 2=one line per epoch)
             class_weight: Class weights for balancing the dataset
@@ -171,23 +196,30 @@ class MajorRecommendationModel:
             
             callbacks = [early_stopping, reduce_lr]
         
-        # Validation data
-        validation_data = (X_val, y_val) if X_val is not None and y_val is not None else None
-        
-        # Điều chỉnh batch size cho dataset nhỏ
-        if batch_size > 16 and len(X_train) < 1000:
-            batch_size = 16
-            print(f"Điều chỉnh batch size xuống {batch_size} vì dataset nhỏ")
+        if isinstance(X_train, tf.data.Dataset):
+            # Dataset đã gồm nhãn và đã chia batch
+            fit_args = {}
+            validation_data = X_val
+        else:
+            # Validation data
+            validation_data = (X_val, y_val) if X_val is not None and y_val is not None else None
+            
+            # Điều chỉnh batch size cho dataset nhỏ
+            if batch_size > 16 and len(X_train) < 1000:
+                batch_size = 16
+                print(f"Điều chỉnh batch size xuống {batch_size} vì dataset nhỏ")
+            
+            fit_args = {'y': y_train, 'batch_size': batch_size}
         
         # Huấn luyện mô hình
-        history = self.model.fit(
-            X_train, y_train,
+        history = self.training_model.fit(
+            X_train,
             epochs=epochs,
-            batch_size=batch_size,
             validation_data=validation_data,
             callbacks=callbacks,
             verbose=verbose,
-            class_weight=class_weight if not self.use_multi_output else None  # Chỉ dùng class_weight cho mô hình đơn đầu ra
+            class_weight=class_weight if not self.use_multi_output else None,  # Chỉ dùng class_weight cho mô hình đơn đầu ra
+            **fit_args
         )
         
         return history
@@ -254,53 +286,46 @@ class MajorRecommendationModel:
         self.model.save(filepath)
     
     @classmethod
-    def load(cls, filepath):
-        """Load the model from a file"""
-        # Tạo custom objects dictionary để load model với hàm loss tùy chỉnh
-        custom_objects = {}
-        
-        # Tạo một instance tạm thời để truy cập phương thức weighted_binary_crossentropy
-        temp_instance = cls(1, 1)
+    def load(cls, filepath, compile=True):
+        """
+        Load the model from a file
+
+        Args:
+            filepath: Đường dẫn file .h5
+            compile: False khi chỉ dùng để dự đoán (bỏ qua hàm loss và optimizer)
+        """
+        if not compile:
+            return cls._from_keras_model(load_model(filepath, compile=False))
         
-        # Thêm hàm weighted_binary_crossentropy vào custom_objects
-        custom_objects['weighted_binary_crossentropy'] = temp_instance.weighted_binary_crossentropy({0: 1.0, 1: 1.0})
+        # Hàm loss tùy chỉnh được lưu trong file .h5 với tên hàm bên trong là 'loss'
+        weighted_loss = cls.weighted_binary_crossentropy({0: 1.0, 1: 1.0})
+        custom_objects = {
+            'weighted_binary_crossentropy': weighted_loss,
+            'loss': weighted_loss
+        }
         
         # Load model với custom objects
         try:
             model = load_model(filepath, custom_objects=custom_objects)
-            
-            # Xác định nếu đây là mô hình đa đầu ra
-            use_multi_output = isinstance(model.output, list)
-            
-            # Tạo instance mới
-            input_dim = model.input_shape[1]
-            output_dim = len(model.output) if use_multi_output else model.output_shape[1]
-            
-            instance = cls(
-                input_dim=input_dim,
-                output_dim=output_dim,
-                use_multi_output=use_multi_output
-            )
-            instance.model = model
-            return instance
         except Exception as e:
             print(f"Lỗi khi load model: {e}")
             
             # Thử load mà không compile
             print("Thử load model mà không compile...")
             model = load_model(filepath, compile=False)
-            
-            # Xác định nếu đây là mô hình đa đầu ra
-            use_multi_output = isinstance(model.output, list)
-            
-            # Tạo instance mới
-            input_dim = model.input_shape[1]
-            output_dim = len(model.output) if use_multi_output else model.output_shape[1]
-            
-            instance = cls(
-                input_dim=input_dim,
-                output_dim=output_dim,
-                use_multi_output=use_multi_output
-            )
-            instance.model = model
-            return instance 
\ No newline at end of file
+        
+        return cls._from_keras_model(model)
+    
+    @classmethod
+    def _from_keras_model(cls, model):
+        """Tạo instance bao quanh mô hình Keras đã tải, không xây dựng lại mạng"""
+        # Xác định nếu đây là mô hình đa đầu ra
+        use_multi_output = isinstance(model.output, list)
+        
+        instance = cls.__new__(cls)
+        instance.input_dim = model.input_shape[1]
+        instance.output_dim = len(model.output) if use_multi_output else model.output_shape[1]
+        instance.use_multi_output = use_multi_output
+        instance.model = model
+        instance.training_model = model
+        return instance
@@ -4,7 +4,6 @@ from tensorflow.keras.models import load_model
 import os
 import sys
 import json
-from pymongo import MongoClient
 
 # Thêm đường dẫn để import cần thiết
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -13,21 +12,12 @@ sys.path.append(parent_dir)
 
 # Import DataPreprocessor từ data_preprocessing.py
 from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
+from utils.db_utils import db_client
 
-# Kết nối MongoDB - sử dụng từ biến môi trường
+# Kết nối MongoDB - dùng client chung của utils.db_utils
 def connect_to_mongodb():
-    MONGODB_URI = os.getenv('MONGO_URI')
-    MONGODB_NAME = os.getenv('MONGO_DB_NAME')
-    
-    print(f"MongoDB Configuration in predict_major.py: URI={MONGODB_URI}, DB={MONGODB_NAME}")
-    
     try:
-        client = MongoClient(MONGODB_URI)
-        db = client[MONGODB_NAME]
-        # Test connection
-        db.list_collection_names()
-        print("MongoDB connection successful!")
-        return db
+        return db_client.db
     except Exception as e:
         print(f"Error connecting to MongoDB: {e}")
         return None
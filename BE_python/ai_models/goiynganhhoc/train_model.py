@@ -5,17 +5,18 @@ import tensorflow as tf
 import pandas as pd
 import json
 import datetime
-from sklearn.model_selection import train_test_split
 from bson import ObjectId
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import StandardScaler
 from tensorflow import keras
 
 # Thêm thư mục cha vào sys.path để import các module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from utils.db_utils import db_client
+from config.config import TRAINING_MAX_SAMPLES, MAJOR_MODEL_SERVING_MODE
 from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
+from ai_models.goiynganhhoc.model_cache import find_latest_model_file
+from ai_models.training_pipeline import ChunkedTrainingSet, TrainingJobCallback, store_source, array_source
+from ai_models.tflite_inference import export_keras_model, tflite_path_for
 # Sử dụng mô hình từ neural_network.py
 from ai_models.goiynganhhoc.neural_network import MajorRecommendationModel
 
@@ -36,48 +37,54 @@ class NpEncoder(json.JSONEncoder):
             return str(obj)
         return super(NpEncoder, self).default(obj)
 
-def balance_dataset(X, y, threshold=0.5):
+def balance_training_set(data, threshold=0.5):
     """
     Cân bằng dataset để tránh overfitting do dữ liệu không cân bằng
     
     Args:
-        X: Ma trận đặc trưng
-        y: Ma trận nhãn
+        data: ChunkedTrainingSet đã scan()
         threshold: Ngưỡng để lọc bỏ mẫu không có nhãn
         
     Returns:
-        X, y đã được cân bằng
+        ChunkedTrainingSet đã được cân bằng (dữ liệu tổng hợp nếu không có mẫu hợp lệ nào)
     """
     print("Đang cân bằng dataset...")
+    stats = data.stats
     
-    # Tìm các mẫu có ít nhất một nhãn > 0
-    valid_samples = np.sum(y > 0, axis=1) > 0
+    # Tỷ lệ các mẫu có ít nhất một nhãn > 0
+    valid_ratio = stats['labeled_rows'] / stats['train_rows']
     
-    if np.mean(valid_samples) < threshold:
-        print(f"Cảnh báo: {np.sum(~valid_samples)} mẫu không có nhãn (chiếm {(1-np.mean(valid_samples))*100:.2f}%)")
+    if valid_ratio < threshold:
+        print(f"Cảnh báo: {stats['train_rows'] - stats['labeled_rows']} mẫu không có nhãn (chiếm {(1-valid_ratio)*100:.2f}%)")
         
         # Nếu không có mẫu hợp lệ nào, cần tạo dữ liệu giả
-        if np.sum(valid_samples) == 0:
+        if stats['labeled_rows'] == 0:
             print("Không tìm thấy mẫu hợp lệ nào! Đang tạo dữ liệu huấn luyện giả...")
-            return create_synthetic_data(X, y)
+            data.close()
+            X_synthetic, y_synthetic = create_synthetic_data(
+                np.zeros((0, data.input_dim)), np.zeros((0, data.output_dim))
+            )
+            data = ChunkedTrainingSet(array_source(X_synthetic, y_synthetic), data.validation_split, data.seed)
+            data.scan()
+            return data
         
-        # Chỉ giữ lại các mẫu có ít nhất một nhãn
-        X = X[valid_samples]
-        y = y[valid_samples]
-        print(f"Sau khi lọc: {X.shape[0]} mẫu")
+        # Chỉ giữ lại các mẫu có ít nhất một nhãn, đọc lại để tính scaler trên các mẫu này
+        data.row_filter = lambda X, y: np.any(y > 0, axis=1)
+        stats = data.scan()
+        print(f"Sau khi lọc: {stats['train_rows']} mẫu")
     
     # Kiểm tra số lượng mẫu cho mỗi ngành
-    major_counts = np.sum(y > 0, axis=0)
+    major_counts = stats['positive_counts']
     
     # In ra thông tin về phân bố ngành
-    print(f"Số lượng ngành có ít nhất 1 mẫu: {np.sum(major_counts > 0)}/{y.shape[1]}")
+    print(f"Số lượng ngành có ít nhất 1 mẫu: {np.sum(major_counts > 0)}/{data.output_dim}")
     print(f"Trung bình số mẫu mỗi ngành: {np.mean(major_counts[major_counts>0]):.2f}")
     print(f"Ngành có nhiều mẫu nhất: {np.max(major_counts)} mẫu")
     
     if np.sum(major_counts > 0) > 0:
         print(f"Ngành có ít mẫu nhất (trong số có mẫu): {np.min(major_counts[major_counts>0])} mẫu")
     
-    return X, y
+    return data
 
 def create_synthetic_data(X, y):
     """
@@ -133,12 +140,13 @@ def create_synthetic_data(X, y):
     
     return X_synthetic, y_synthetic
 
-def calculate_class_weights(y_train):
+def calculate_class_weights(positive_counts, num_samples):
     """
     Tính toán class weights cho từng ngành dựa trên tỷ lệ mất cân bằng
     
     Args:
-        y_train: Ma trận nhãn
+        positive_counts: Số mẫu dương (nhãn > 0) của từng ngành trong tập huấn luyện
+        num_samples: Số mẫu của tập huấn luyện
         
     Returns:
         Dictionary chứa class weights cho mỗi ngành
@@ -146,10 +154,9 @@ def calculate_class_weights(y_train):
     print("Tính toán class weights cho từng ngành học...")
     class_weights = {}
     
-    for i in range(y_train.shape[1]):
+    for i, pos_count in enumerate(positive_counts):
         # Đếm số mẫu dương/âm cho ngành này
-        pos_count = np.sum(y_train[:, i] > 0)
-        neg_count = len(y_train) - pos_count
+        neg_count = num_samples - pos_count
         
         if pos_count > 0:
             # Tính trọng số: càng ít mẫu dương, trọng số càng cao
@@ -171,31 +178,6 @@ def calculate_class_weights(y_train):
     
     return class_weights
 
-def prepare_multi_output_data(y_train, y_test):
-    """
-    Chuẩn bị dữ liệu đầu ra cho mô hình đa đầu ra
-    
-    Args:
-        y_train: Ma trận nhãn tập huấn luyện
-        y_test: Ma trận nhãn tập kiểm tra
-        
-    Returns:
-        y_train_dict, y_test_dict: Dictionary chứa dữ liệu đầu ra cho mô hình đa đầu ra
-    """
-    print("Chuẩn bị dữ liệu cho mô hình đa đầu ra...")
-    
-    # Chuẩn bị dữ liệu huấn luyện đầu ra
-    y_train_dict = {}
-    for i in range(y_train.shape[1]):
-        y_train_dict[f'output_{i}'] = (y_train[:, i] > 0).astype(float).reshape(-1, 1)
-    
-    # Tương tự cho tập kiểm tra
-    y_test_dict = {}
-    for i in range(y_test.shape[1]):
-        y_test_dict[f'output_{i}'] = (y_test[:, i] > 0).astype(float).reshape(-1, 1)
-    
-    return y_train_dict, y_test_dict
-
 def plot_training_history(history, save_path=None):
     """
     Vẽ biểu đồ lịch sử huấn luyện
@@ -204,6 +186,13 @@ def plot_training_history(history, save_path=None):
         history: Đối tượng History từ model.fit()
         save_path: Đường dẫn để lưu biểu đồ (nếu có)
     """
+    # matplotlib không có trong requirements.txt của image phục vụ (huấn luyện qua job nền vẫn chạy được)
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("Không có matplotlib, bỏ qua biểu đồ lịch sử huấn luyện")
+        return
+    
     plt.figure(figsize=(10, 6))
     
     # Chỉ vẽ loss
@@ -281,12 +270,13 @@ def save_model_mappings(preprocessor, version):
     
     return mappings
 
-def train_model(use_multi_output=True):
+def train_model(use_multi_output=True, callbacks=None):
     """
     Huấn luyện mô hình gợi ý ngành học
     
     Args:
         use_multi_output: Có sử dụng kiến trúc đa đầu ra hay không
+        callbacks: Các Keras callback thêm vào khi huấn luyện (ví dụ báo tiến độ của job nền)
         
     Returns:
         model: Mô hình đã được huấn luyện
@@ -308,108 +298,92 @@ def train_model(use_multi_output=True):
     print(f"Số lượng tổ hợp môn: {len(preprocessor.subject_comb_to_id)}")
     print(f"Số lượng ngành học: {len(preprocessor.major_to_id)}")
     
-    # Tiền xử lý dữ liệu
+    # Tiền xử lý dữ liệu: đọc và tiền xử lý từng chunk từ MongoDB, chia train/test theo vị trí dòng
     print("Đang tiền xử lý dữ liệu huấn luyện...")
-    X, y = preprocessor.preprocess_training_data()
-    print(f"Kích thước dữ liệu: {len(X)} mẫu")
-    
-    # Giới hạn số lượng mẫu nếu cần
-    max_samples = 10000  # Số lượng mẫu tối đa
-    if len(X) > max_samples:
-        print(f"Giới hạn số lượng mẫu xuống {max_samples}...")
-        indices = np.arange(len(X))
-        np.random.seed(42)
-        np.random.shuffle(indices)
-        indices = indices[:max_samples]
-        X = X[indices]
-        y = y[indices]
-    
-    # Cân bằng dataset để tránh overfitting
-    X, y = balance_dataset(X, y)
-    print(f"Kích thước sau khi cân bằng: {X.shape}")
-    
-    # Chia tập train/test
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
+    data = ChunkedTrainingSet(
+        store_source('major_recommendation', lambda records, row_ids: (row_ids, *preprocessor.preprocess_records(records))),
+        validation_split=0.2,
+        seed=42
     )
-    print(f"Kích thước tập train: {len(X_train)}")
-    print(f"Kích thước tập test: {len(X_test)}")
-    
-    # Chuẩn hóa dữ liệu
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
-    X_test_scaled = scaler.transform(X_test)
-    
-    # Tạo mô hình
-    input_dim = X_train.shape[1]
-    output_dim = y_train.shape[1]
-    print(f"Đang khởi tạo mô hình với {input_dim} đặc trưng và {output_dim} ngành học")
-    
-    model = MajorRecommendationModel(
-        input_dim=input_dim,
-        output_dim=output_dim,
-        use_multi_output=use_multi_output
-    )
-    
-    # Callbacks cho huấn luyện
-    early_stopping = tf.keras.callbacks.EarlyStopping(
-        monitor='val_loss',
-        patience=5,
-        restore_best_weights=True,
-        verbose=1
-    )
-    
-    reduce_lr = tf.keras.callbacks.ReduceLROnPlateau(
-        monitor='val_loss',
-        factor=0.5,
-        patience=3,
-        min_lr=0.00001,
-        verbose=1
-    )
-    
-    callbacks = [early_stopping, reduce_lr]
-    
-    # Huấn luyện mô hình - phương pháp khác nhau tùy theo kiến trúc
-    if use_multi_output:
-        print("Sử dụng kiến trúc đa đầu ra với trọng số tùy chỉnh cho từng ngành")
+    try:
+        stats = data.scan()
+        print(f"Kích thước dữ liệu: {stats['train_rows'] + stats['validation_rows']} mẫu")
         
-        # Tính class weights cho từng ngành
-        class_weights = calculate_class_weights(y_train)
+        # Cân bằng dataset để tránh overfitting
+        data = balance_training_set(data)
+        stats = data.stats
+        print(f"Kích thước tập train: {stats['train_rows']}")
+        print(f"Kích thước tập test: {stats['validation_rows']}")
         
-        # Chuẩn bị dữ liệu cho mô hình đa đầu ra
-        y_train_dict, y_test_dict = prepare_multi_output_data(y_train, y_test)
+        # Tạo mô hình
+        input_dim = data.input_dim
+        output_dim = data.output_dim
+        print(f"Đang khởi tạo mô hình với {input_dim} đặc trưng và {output_dim} ngành học")
         
-        # Compile mô hình với class weights
-        model.compile_model(class_weights=class_weights)
+        model = MajorRecommendationModel(
+            input_dim=input_dim,
+            output_dim=output_dim,
+            use_multi_output=use_multi_output
+        )
         
-        # Huấn luyện mô hình
-        history = model.train(
-            X_train_scaled,
-            y_train_dict,
-            X_val=X_test_scaled,
-            y_val=y_test_dict,
-            epochs=50,
-            batch_size=32,
-            callbacks=callbacks,
-            verbose=2
+        # Callbacks cho huấn luyện
+        early_stopping = tf.keras.callbacks.EarlyStopping(
+            monitor='val_loss',
+            patience=5,
+            restore_best_weights=True,
+            verbose=1
         )
-    else:
-        print("Sử dụng kiến trúc đơn đầu ra truyền thống")
         
-        # Compile mô hình
-        model.compile_model()
+        reduce_lr = tf.keras.callbacks.ReduceLROnPlateau(
+            monitor='val_loss',
+            factor=0.5,
+            patience=3,
+            min_lr=0.00001,
+            verbose=1
+        )
+        
+        callbacks = [early_stopping, reduce_lr] + list(callbacks or [])
+        
+        # Điều chỉnh batch size cho dataset nhỏ
+        batch_size = 32
+        if stats['train_rows'] < 1000:
+            batch_size = 16
+            print(f"Điều chỉnh batch size xuống {batch_size} vì dataset nhỏ")
         
-        # Huấn luyện mô hình
+        # Huấn luyện mô hình - phương pháp khác nhau tùy theo kiến trúc
+        if use_multi_output:
+            print("Sử dụng kiến trúc đa đầu ra với trọng số tùy chỉnh cho từng ngành")
+            
+            # Tính class weights cho từng ngành
+            class_weights = calculate_class_weights(stats['positive_counts'], stats['train_rows'])
+            
+            # Compile mô hình với class weights
+            model.compile_model(class_weights=class_weights)
+            
+            # Nhãn gộp: ma trận nhị phân [batch, số ngành] cho đầu ra gộp của mô hình
+            label_fn = lambda y: tf.cast(y > 0, tf.float32)
+        else:
+            print("Sử dụng kiến trúc đơn đầu ra truyền thống")
+            
+            # Compile mô hình
+            model.compile_model()
+            label_fn = None
+        
+        # Huấn luyện mô hình với luồng dữ liệu tf.data
         history = model.train(
-            X_train_scaled,
-            y_train,
-            X_val=X_test_scaled,
-            y_val=y_test,
+            data.dataset(batch_size=batch_size, label_fn=label_fn),
+            X_val=data.dataset(validation=True, batch_size=batch_size, label_fn=label_fn),
             epochs=50,
-            batch_size=32,
             callbacks=callbacks,
             verbose=2
         )
+        
+        # Tập kiểm tra trả về cho người gọi (tối đa TRAINING_MAX_SAMPLES mẫu trong bộ nhớ)
+        X_test, y_test = data.sample(validation=True, max_rows=TRAINING_MAX_SAMPLES)
+        scaler = data.scaler
+        X_test_scaled = scaler.transform(X_test)
+    finally:
+        data.close()
     
     # Vẽ và lưu biểu đồ lịch sử huấn luyện
     history_path = os.path.join(MODEL_PATH, 'training_history.png')
@@ -437,7 +411,7 @@ def train_model(use_multi_output=True):
             "input_dim": input_dim,
             "output_dim": output_dim,
             "num_interests": len(preprocessor.interest_to_id),
-            "training_samples": len(X_train),
+            "training_samples": stats['train_rows'],
             "training_date": datetime.datetime.now().isoformat(),
             "architecture_type": "multi_output" if use_multi_output else "single_output"
         },
@@ -476,6 +450,35 @@ def train_model(use_multi_output=True):
     print("Hoàn tất huấn luyện mô hình!")
     return model, history, preprocessor, X_test_scaled, y_test
 
+def train_job(job):
+    """
+    Huấn luyện trong process nền của utils/training_jobs.py (POST /major-recommendation/train)
+    
+    Args:
+        job: TrainingJobContext để báo tiến độ và kiểm tra yêu cầu hủy
+        
+    Returns:
+        Dictionary thông tin phiên bản mô hình mới (lưu vào kết quả của job)
+    """
+    model, history, preprocessor, X_test_scaled, y_test = train_model(callbacks=[TrainingJobCallback(job)])
+    
+    # File mà major_model_cache sẽ tải (file .h5 mới nhất theo tên)
+    model_path = find_latest_model_file(MODEL_PATH)
+    
+    # Chế độ phục vụ TFLite cần file .tflite cùng phiên bản, xuất luôn để có thể thay mô hình ngay
+    if MAJOR_MODEL_SERVING_MODE == 'tflite':
+        job.set_stage('exporting')
+        export_keras_model(model.model, tflite_path_for(model_path), source_path=model_path)
+    
+    return {
+        'model_version': os.path.splitext(os.path.basename(model_path))[0],
+        'model_path': model_path,
+        'epochs': len(history.history['loss']),
+        'loss': float(history.history['loss'][-1]),
+        'val_loss': float(history.history['val_loss'][-1]) if 'val_loss' in history.history else None,
+        'test_samples': int(len(y_test))
+    }
+
 def test_major_recommendation(model, preprocessor, student_data=None):
     """Kiểm tra gợi ý ngành học cho sinh viên mẫu"""
     if student_data is None:
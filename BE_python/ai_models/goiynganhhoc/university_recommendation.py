@@ -1,9 +1,16 @@
 import os
 import re
+import sys
 import logging
-from pymongo import MongoClient
+import numpy as np
 from bson import ObjectId
 
+# Thêm đường dẫn để import các module dùng chung
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from utils.reference_data import reference_data
+from utils.db_utils import db
+from ai_models.goiynganhhoc.major_index import major_index_store
+
 # Cấu hình logging
 logging.basicConfig(
     level=logging.INFO,
@@ -14,46 +21,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Kết nối MongoDB
-MONGODB_URI = os.getenv('MONGO_URI')
-MONGODB_NAME = os.getenv('MONGO_DB_NAME')
-
-client = MongoClient(MONGODB_URI)
-db = client[MONGODB_NAME]
+# Kết nối MongoDB dùng chung (tạo khi truy vấn lần đầu, cấu hình trong config/config.py)
 
-# Cache subject combinations để tránh truy vấn DB nhiều lần
+# Cache tổ hợp môn đã chuẩn hóa, tính lại khi ảnh chụp dữ liệu tham chiếu thay đổi
 _cached_subject_combinations = None
+_cached_subject_combinations_snapshot = None
 
 def get_subject_combinations():
     """
-    Lấy tất cả tổ hợp môn từ collection subject_combinations
+    Lấy tất cả tổ hợp môn từ ảnh chụp dữ liệu tham chiếu (collection subject_combinations)
     
     Returns:
         Dictionary với key là mã tổ hợp và value là danh sách môn học
     """
-    global _cached_subject_combinations
+    global _cached_subject_combinations, _cached_subject_combinations_snapshot
     
-    if _cached_subject_combinations is None:
-        try:
-            combinations = {}
-            # Lấy tất cả tổ hợp từ MongoDB
-            subject_combs = list(db.subject_combinations.find({}, {"code": 1, "subjects": 1}))
-            
-            for combo in subject_combs:
-                combo_code = combo.get("code")
-                subjects = combo.get("subjects", [])
-                
-                # Chuẩn hóa tên môn học
-                normalized_subjects = [normalize_subject_name(subject) for subject in subjects]
-                combinations[combo_code] = normalized_subjects
-            
-            _cached_subject_combinations = combinations
-            print(f"Đã tải {len(_cached_subject_combinations)} tổ hợp môn từ DB")
+    try:
+        snapshot = reference_data.snapshot()
+    except Exception as e:
+        print(f"Lỗi khi lấy tổ hợp môn: {e}")
+        return _cached_subject_combinations or {}
+    
+    if _cached_subject_combinations is None or _cached_subject_combinations_snapshot is not snapshot:
+        combinations = {}
+        
+        for combo in snapshot.all('subject_combinations'):
+            combo_code = combo.get("code")
+            subjects = combo.get("subjects", [])
             
-        except Exception as e:
-            print(f"Lỗi khi lấy tổ hợp môn: {e}")
-            # Khởi tạo dictionary trống
-            _cached_subject_combinations = {}
+            # Chuẩn hóa tên môn học
+            normalized_subjects = [normalize_subject_name(subject) for subject in subjects]
+            combinations[combo_code] = normalized_subjects
+        
+        _cached_subject_combinations = combinations
+        _cached_subject_combinations_snapshot = snapshot
+        print(f"Đã tải {len(_cached_subject_combinations)} tổ hợp môn từ dữ liệu tham chiếu")
             
     return _cached_subject_combinations
 
@@ -181,48 +183,20 @@ def find_related_majors(predicted_major):
     """
     Tìm ngành học trong DB dựa trên tên ngành dự đoán
     - Tìm các ngành có chứa cụm từ khóa chính không phân biệt hoa thường
+    - Nếu không có, tìm các ngành chứa ít nhất 50% từ khóa
     """
     try:
         # Chuẩn hóa tên ngành về chữ thường
         search_term = predicted_major.lower()
         logger.info(f"Tìm ngành học có chứa cụm: '{search_term}'")
         
-        # Lấy tất cả ngành từ cơ sở dữ liệu
-        all_majors = list(db.benchmark_scores.distinct("major"))
-        matched_majors = []
-        
-        # Tìm các ngành có chứa cụm từ trong tên dự đoán
-        for major in all_majors:
-            if search_term in major.lower():
-                matched_majors.append(major)
+        # Tra cứu trong chỉ mục tên ngành (n-gram) thay vì quét toàn bộ danh sách ngành
+        matched_majors = major_index_store.get().find_related(search_term)
         
         if matched_majors:
-            logger.info(f"Tìm thấy {len(matched_majors)} ngành có chứa '{search_term}'")
+            logger.info(f"Tìm thấy {len(matched_majors)} ngành phù hợp với '{search_term}'")
             return matched_majors
         
-        # Nếu không tìm được, thử tìm theo từng từ khóa riêng lẻ
-        if len(matched_majors) == 0:
-            # Tách các từ khóa chính
-            keywords = [word for word in search_term.split() if len(word) > 3]
-            logger.info(f"Không tìm thấy kết quả, thử tìm theo từng từ khóa: {keywords}")
-            
-            # Đếm số từ khóa match với mỗi ngành
-            for major in all_majors:
-                major_lower = major.lower()
-                matched_keywords = 0
-                
-                for keyword in keywords:
-                    if keyword in major_lower:
-                        matched_keywords += 1
-                
-                # Nếu match >= 50% số từ khóa, thêm vào kết quả
-                if matched_keywords > 0 and matched_keywords >= len(keywords) / 2:
-                    matched_majors.append(major)
-            
-            if matched_majors:
-                logger.info(f"Tìm thấy {len(matched_majors)} ngành match với các từ khóa")
-                return matched_majors
-        
         logger.warning(f"Không tìm thấy ngành nào phù hợp với '{predicted_major}'")
         return []
     
@@ -242,7 +216,7 @@ def calculate_student_score_for_subject_group(student_data, subject_group_code):
         Tổng điểm của học sinh hoặc None nếu không tính được
     """
     # Lấy thông tin môn học của tổ hợp từ database
-    subject_combo = db.subject_combinations.find_one({"code": subject_group_code})
+    subject_combo = reference_data.snapshot().get_by_code('subject_combinations', subject_group_code)
     
     if not subject_combo:
         return None
@@ -294,13 +268,77 @@ def extract_subject_combinations(subject_combination_str):
     
     return valid_combinations
 
-def recommend_universities_for_major(predicted_major, student_data, max_universities=10):
+# Thứ tự các mức độ an toàn khi sắp xếp kết quả
+SAFETY_LEVELS = ["An toàn", "Cân nhắc", "Khó đậu"]
+
+def calculate_student_combination_scores(student_data):
+    """
+    Tính điểm của học sinh cho tất cả tổ hợp môn một lần cho mỗi request
+    
+    Returns:
+        Dictionary mã tổ hợp -> tổng điểm (None nếu thiếu điểm)
+    """
+    return {
+        combo.get("code"): calculate_student_score_for_subject_group(student_data, combo.get("code"))
+        for combo in reference_data.snapshot().all('subject_combinations')
+    }
+
+def fetch_benchmark_records(major_names, year=2024):
+    """
+    Lấy điểm chuẩn của nhiều ngành bằng một truy vấn $in
+    
+    Returns:
+        Dictionary tên ngành -> danh sách bản ghi (giữ thứ tự trả về từ DB)
+    """
+    records_by_major = {major: [] for major in major_names}
+    if not records_by_major:
+        return records_by_major
+    
+    cursor = db.benchmark_scores.find({"major": {"$in": list(records_by_major)}, "year": year})
+    for record in cursor:
+        records_by_major.setdefault(record.get('major'), []).append(record)
+    
+    return records_by_major
+
+def rank_by_safety(university_matches, limit=None):
+    """
+    Phân loại mức độ an toàn và sắp xếp kết quả (vector hóa trên toàn bộ danh sách)
+    - Thứ tự: An toàn (chênh lệch >= 2), Cân nhắc (>= 0), Khó đậu; trong mỗi mức theo chênh lệch giảm dần
+    
+    Returns:
+        Danh sách đã sắp xếp, giới hạn limit phần tử
+    """
+    if not university_matches:
+        return []
+    
+    score_diff = np.array([u['score_difference'] for u in university_matches], dtype=float)
+    level_rank = np.select([score_diff >= 2, score_diff >= 0], [0, 1], default=2)
+    
+    # lexsort ổn định: sắp xếp theo mức an toàn, sau đó theo chênh lệch giảm dần
+    order = np.lexsort((-score_diff, level_rank))
+    if limit is not None:
+        order = order[:limit]
+    
+    result = []
+    for i in order:
+        match = university_matches[i]
+        match['safety_level'] = SAFETY_LEVELS[level_rank[i]]
+        result.append(match)
+    return result
+
+def recommend_universities_for_major(predicted_major, student_data, max_universities=10,
+                                     benchmark_records=None, student_scores=None):
     """
     Đơn giản hóa hàm gợi ý trường đại học
+    
+    Args:
+        benchmark_records: Bản ghi điểm chuẩn năm 2024 của ngành đã lấy sẵn (nếu None sẽ truy vấn DB)
+        student_scores: Điểm tổ hợp của học sinh đã tính sẵn (nếu None sẽ tính lại)
     """
     # 1. Tìm ngành chính xác theo tên
     logger.info(f"Tìm thông tin điểm chuẩn cho ngành: '{predicted_major}'")
-    benchmark_records = list(db.benchmark_scores.find({"major": predicted_major, "year": 2024}))
+    if benchmark_records is None:
+        benchmark_records = fetch_benchmark_records([predicted_major])[predicted_major]
     
     if not benchmark_records:
         logger.warning(f"Không tìm thấy thông tin điểm chuẩn cho ngành: '{predicted_major}'")
@@ -308,6 +346,9 @@ def recommend_universities_for_major(predicted_major, student_data, max_universi
     
     logger.info(f"Tìm thấy {len(benchmark_records)} bản ghi điểm chuẩn cho ngành: '{predicted_major}'")
     
+    if student_scores is None:
+        student_scores = calculate_student_combination_scores(student_data)
+    
     # 2. Nhóm các bản ghi theo trường + ngành
     grouped_records = {}
     for record in benchmark_records:
@@ -327,10 +368,9 @@ def recommend_universities_for_major(predicted_major, student_data, max_universi
         major_name = base_record['major']
         
         # Lấy tất cả tổ hợp môn của ngành này
+        record_combos = [extract_subject_combinations(record.get('subject_combination', '')) for record in records]
         all_combinations = set()
-        for record in records:
-            subject_combination_str = record.get('subject_combination', '')
-            combos = extract_subject_combinations(subject_combination_str)
+        for combos in record_combos:
             all_combinations.update(combos)
         
         # Tìm tổ hợp môn tốt nhất cho học sinh
@@ -339,36 +379,22 @@ def recommend_universities_for_major(predicted_major, student_data, max_universi
         benchmark_score = 0
         
         for combo in all_combinations:
-            student_score = calculate_student_score_for_subject_group(student_data, combo)
+            student_score = student_scores.get(combo)
             
-            if student_score is not None:
-                # Tìm điểm chuẩn tương ứng
-                for record in records:
-                    subject_combination_str = record.get('subject_combination', '')
-                    record_combos = extract_subject_combinations(subject_combination_str)
-                    
-                    if combo in record_combos:
-                        current_benchmark = float(record.get('benchmark_score', 0))
-                        if student_score > best_score:
-                            best_score = student_score
-                            best_combo = combo
-                            benchmark_score = current_benchmark
+            if student_score is not None and student_score > best_score:
+                # Điểm chuẩn lấy từ bản ghi đầu tiên có tổ hợp này
+                for record, combos in zip(records, record_combos):
+                    if combo in combos:
+                        best_score = student_score
+                        best_combo = combo
+                        benchmark_score = float(record.get('benchmark_score', 0))
+                        break
         
         # Bỏ qua nếu không tìm được tổ hợp phù hợp
         if not best_combo:
             continue
-            
-        # Tính mức độ an toàn
-        score_diff = best_score - benchmark_score
-        
-        if score_diff >= 2:
-            safety_level = "An toàn"
-        elif score_diff >= 0:
-            safety_level = "Cân nhắc"
-        else:
-            safety_level = "Khó đậu"
         
-        # Thêm vào kết quả
+        # Thêm vào kết quả (mức độ an toàn được phân loại sau, cho cả danh sách)
         university_matches.append({
             'university_name': university_name,
             'university_code': base_record.get('university_code', ''),
@@ -377,32 +403,18 @@ def recommend_universities_for_major(predicted_major, student_data, max_universi
             'benchmark_score': benchmark_score,
             'student_score': best_score,
             'combination': best_combo,
-            'safety_level': safety_level,
-            'score_difference': score_diff
+            'safety_level': None,
+            'score_difference': best_score - benchmark_score
         })
     
-    # 4. Sắp xếp kết quả theo mức độ an toàn và điểm chênh lệch
-    safe_unis = [u for u in university_matches if u['safety_level'] == "An toàn"]
-    consider_unis = [u for u in university_matches if u['safety_level'] == "Cân nhắc"]
-    risky_unis = [u for u in university_matches if u['safety_level'] == "Khó đậu"]
-    
-    # Sắp xếp theo điểm chênh lệch
-    safe_unis.sort(key=lambda x: x['score_difference'], reverse=True)
-    consider_unis.sort(key=lambda x: x['score_difference'], reverse=True)
-    risky_unis.sort(key=lambda x: x['score_difference'], reverse=True)
-    
-    # Kết hợp kết quả
-    result = safe_unis + consider_unis + risky_unis
-    
-    # Giới hạn số lượng kết quả
-    if len(result) > max_universities:
-        result = result[:max_universities]
-    
-    return result
+    # 4. Sắp xếp kết quả theo mức độ an toàn và điểm chênh lệch, giới hạn số lượng
+    return rank_by_safety(university_matches, max_universities)
 
 def recommend_universities_for_top_majors(top_majors, student_data, max_unis_per_major=10):
     """
     Tìm các trường đại học phù hợp cho danh sách các ngành dự đoán
+    - Điểm chuẩn của tất cả ngành liên quan được lấy bằng một truy vấn $in
+    - Điểm tổ hợp của học sinh được tính một lần cho cả request
     
     Args:
         top_majors: Danh sách các ngành dự đoán hàng đầu
@@ -414,16 +426,21 @@ def recommend_universities_for_top_majors(top_majors, student_data, max_unis_per
     """
     recommendations = {}
     
+    # Tìm các ngành liên quan trong DB cho từng ngành dự đoán
+    related_by_major = {}
     for major_info in top_majors:
         major_name = major_info.get('major_name') or major_info.get('major')
         if not major_name:
             continue
         
         logger.info(f"Đang tìm trường cho ngành: {major_name}")
-        
-        # Tìm các ngành liên quan trong DB
-        related_majors = find_related_majors(major_name)
-        
+        related_by_major[major_name] = find_related_majors(major_name)
+    
+    all_related = list(dict.fromkeys(m for related in related_by_major.values() for m in related))
+    records_by_major = fetch_benchmark_records(all_related)
+    student_scores = calculate_student_combination_scores(student_data) if all_related else {}
+    
+    for major_name, related_majors in related_by_major.items():
         if not related_majors:
             logger.warning(f"Không tìm thấy ngành liên quan cho: {major_name}")
             recommendations[major_name] = []
@@ -435,36 +452,21 @@ def recommend_universities_for_top_majors(top_majors, student_data, max_unis_per
         for related_major in related_majors:
             logger.info(f"Tìm trường cho ngành liên quan: {related_major}")
             universities = recommend_universities_for_major(
-                related_major, student_data, max_unis_per_major)
+                related_major, student_data, max_unis_per_major,
+                benchmark_records=records_by_major.get(related_major, []),
+                student_scores=student_scores)
             
             # Thêm thông tin về ngành
             for uni in universities:
                 # Lưu tên ngành gốc để tham chiếu nhưng hiển thị tên ngành đầy đủ từ DB
+                uni = dict(uni)
                 uni['original_major'] = major_name
                 # Đây là tên ngành đầy đủ từ DB để hiển thị
                 uni['major_name'] = related_major
-            
-            all_universities.extend(universities)
-        
-        # Sắp xếp kết quả theo mức độ an toàn và điểm chênh lệch
-        safe_unis = [u for u in all_universities if u['safety_level'] == "An toàn"]
-        consider_unis = [u for u in all_universities if u['safety_level'] == "Cân nhắc"]
-        risky_unis = [u for u in all_universities if u['safety_level'] == "Khó đậu"]
+                all_universities.append(uni)
         
-        # Sắp xếp theo điểm chênh lệch
-        safe_unis.sort(key=lambda x: x['score_difference'], reverse=True)
-        consider_unis.sort(key=lambda x: x['score_difference'], reverse=True)
-        risky_unis.sort(key=lambda x: x['score_difference'], reverse=True)
-        
-        # Kết hợp kết quả
-        result = safe_unis + consider_unis + risky_unis
-        
-        # Giới hạn số lượng kết quả
-        if len(result) > max_unis_per_major:
-            result = result[:max_unis_per_major]
-            
-        # Thêm vào kết quả
-        recommendations[major_name] = result
+        # Sắp xếp kết quả theo mức độ an toàn và điểm chênh lệch, giới hạn số lượng
+        recommendations[major_name] = rank_by_safety(all_universities, max_unis_per_major)
     
     return recommendations
 
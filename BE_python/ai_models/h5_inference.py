@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+Các thành phần dùng chung cho engine suy luận NumPy đọc trực tiếp file .h5 của Keras
+(NumpyDenseNetwork của mô hình dự đoán xác suất, FusedMajorModel của mô hình gợi ý ngành học)
+"""
+
+import numpy as np
+
+# Các tầng không làm thay đổi dữ liệu khi suy luận
+PASSTHROUGH_LAYERS = {'InputLayer', 'Dropout'}
+
+
+def relu(x):
+    return np.maximum(x, 0)
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': relu,
+    'sigmoid': sigmoid,
+    'tanh': np.tanh
+}
+
+
+def decode_attribute(value):
+    """Thuộc tính chuỗi của file .h5 (h5py có thể trả về bytes)"""
+    return value.decode('utf-8') if isinstance(value, bytes) else value
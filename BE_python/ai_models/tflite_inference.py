@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Engine suy luận TensorFlow Lite dùng chung cho mô hình dự đoán xác suất và mô hình gợi ý ngành học
+
+File .tflite được xuất từ file .h5 (xem scripts/export_tflite.py) và đặt cạnh file .h5 cùng tên,
+scaler (scaler_mean.npy, scaler_scale.npy) giữ nguyên trong cùng thư mục. File <tên>.tflite.sha1
+lưu mã băm SHA-1 của file .h5 nguồn để biết file .tflite có được xuất từ đúng phiên bản .h5 hay không
+(thời gian sửa file không đáng tin sau git checkout hoặc Docker COPY).
+Khi phục vụ, ưu tiên tflite_runtime (gói nhỏ, không cần TensorFlow), sau đó ai_edge_litert,
+cuối cùng là tf.lite của TensorFlow đầy đủ.
+"""
+
+import os
+import hashlib
+import threading
+import numpy as np
+
+
+def tflite_path_for(model_path):
+    """Đường dẫn file .tflite tương ứng với file .h5"""
+    return os.path.splitext(model_path)[0] + '.tflite'
+
+
+def source_hash_path_for(model_path):
+    """Đường dẫn file lưu mã băm của file .h5 nguồn, cạnh file .tflite"""
+    return tflite_path_for(model_path) + '.sha1'
+
+
+def file_sha1(path):
+    """Mã băm SHA-1 (hex) của nội dung file"""
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def is_export_current(model_path):
+    """File .tflite đã tồn tại và được xuất từ đúng nội dung file .h5 hiện tại"""
+    hash_path = source_hash_path_for(model_path)
+    if not os.path.exists(tflite_path_for(model_path)) or not os.path.exists(hash_path):
+        return False
+    with open(hash_path, 'r', encoding='utf-8') as f:
+        return f.read().strip() == file_sha1(model_path)
+
+
+def load_interpreter_class():
+    """
+    Tìm runtime TFLite khả dụng
+
+    Returns:
+        Tuple (lớp Interpreter, tên runtime)
+
+    Raises:
+        ImportError: Nếu không có runtime nào
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter, 'tflite_runtime'
+    except ImportError:
+        pass
+
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter, 'ai_edge_litert'
+    except ImportError:
+        pass
+
+    try:
+        import tensorflow as tf
+        return tf.lite.Interpreter, 'tensorflow'
+    except ImportError:
+        raise ImportError("Không có runtime TFLite (cài tflite-runtime hoặc tensorflow)")
+
+
+class TFLiteModel:
+    """
+    Mô hình TFLite có cùng giao diện predict(X, verbose=0) / predict_combined(X) với các engine khác
+
+    Interpreter không an toàn luồng nên mỗi luồng (và mỗi process sau fork) dùng một interpreter riêng,
+    nội dung mô hình chỉ được đọc từ đĩa một lần.
+    """
+
+    def __init__(self, model_path, num_threads=1):
+        self.model_path = model_path
+        self.num_threads = num_threads
+        with open(model_path, 'rb') as f:
+            self.model_content = f.read()
+
+        self._interpreter_class, self.runtime = load_interpreter_class()
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+        interpreter = self._interpreter()
+        self.input_dim = int(interpreter.get_input_details()[0]['shape'][-1])
+        self.output_dim = int(interpreter.get_output_details()[0]['shape'][-1])
+
+    def predict(self, X, verbose=0):
+        """
+        Lan truyền tiến cho cả batch
+
+        Args:
+            X: Ma trận đặc trưng đã chuẩn hóa, kích thước (n, input_dim)
+            verbose: Giữ để tương thích với model.predict của Keras
+
+        Returns:
+            Ma trận kích thước (n, output_dim)
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        interpreter = self._interpreter()
+        input_index = self._local.input_index
+        if self._local.batch_size != len(X):
+            interpreter.resize_tensor_input(input_index, [len(X), self.input_dim])
+            interpreter.allocate_tensors()
+            self._local.batch_size = len(X)
+
+        interpreter.set_tensor(input_index, X)
+        interpreter.invoke()
+        return interpreter.get_tensor(self._local.output_index).copy()
+
+    def predict_combined(self, X):
+        """Dự đoán điểm của tất cả các ngành (mô hình đa đầu ra đã được gộp khi xuất)"""
+        return self.predict(X)
+
+    def _interpreter(self):
+        if self._pid != os.getpid():
+            # Không dùng lại interpreter của process cha sau fork
+            self._local = threading.local()
+            self._pid = os.getpid()
+
+        interpreter = getattr(self._local, 'interpreter', None)
+        if interpreter is None:
+            interpreter = self._interpreter_class(model_content=self.model_content, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+            self._local.input_index = interpreter.get_input_details()[0]['index']
+            self._local.output_index = interpreter.get_output_details()[0]['index']
+            self._local.batch_size = int(interpreter.get_input_details()[0]['shape'][0])
+        return interpreter
+
+
+def export_keras_model(model, output_path, float16=False, source_path=None):
+    """
+    Chuyển mô hình Keras sang TFLite (cần TensorFlow đầy đủ)
+
+    Mô hình đa đầu ra được gộp các đầu ra thành một tensor (batch, số đầu ra) theo đúng thứ tự
+    của model.outputs, giống predict_combined của MajorRecommendationModel.
+
+    Args:
+        model: Mô hình tf.keras đã tải
+        output_path: Đường dẫn file .tflite
+        float16: Lưu trọng số dạng float16 (file nhỏ hơn, sai số lớn hơn)
+        source_path: File .h5 của mô hình, mã băm được lưu cạnh file .tflite cho is_export_current
+
+    Returns:
+        Kích thước file (bytes)
+    """
+    import tensorflow as tf
+
+    if isinstance(model.output, list):
+        combined = tf.keras.layers.Concatenate(axis=-1, name='combined_outputs')(model.outputs)
+        model = tf.keras.Model(inputs=model.inputs, outputs=combined)
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if float16:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+
+    content = converter.convert()
+
+    # Xóa mã băm cũ trước: nếu bị ngắt giữa chừng, file .tflite mới không bị coi là khớp với .h5
+    hash_path = output_path + '.sha1'
+    if os.path.exists(hash_path):
+        os.remove(hash_path)
+    with open(output_path, 'wb') as f:
+        f.write(content)
+    if source_path is not None:
+        with open(hash_path, 'w', encoding='utf-8') as f:
+            f.write(file_sha1(source_path))
+    return len(content)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+"""
+Luồng dữ liệu huấn luyện tf.data dùng chung cho mô hình dự đoán xác suất và mô hình gợi ý ngành học
+
+Dữ liệu được đọc theo chunk từ training store (utils/training_store.py) hoặc file CSV và tiền xử lý
+từng chunk, nên bộ nhớ khi huấn luyện không phụ thuộc kích thước bộ dữ liệu:
+- Chia train/validation theo vị trí dòng, cố định giữa các lần đọc và không phụ thuộc kích thước chunk
+- Một lượt đọc trước khi huấn luyện để tính scaler và số mẫu dương của từng nhãn
+- Mỗi epoch: cache (file tạm sau epoch đầu) -> xáo trộn -> batch -> chuẩn hóa và nhãn (song song) -> prefetch
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import numpy as np
+import tensorflow as tf
+from sklearn.preprocessing import StandardScaler
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import TRAINING_CHUNK_SIZE, TRAINING_SHUFFLE_BUFFER, TRAINING_DATASET_CACHE, TRAINING_CACHE_DIR
+from utils.training_store import get_training_manifest, iter_training_chunks, sample_batches
+
+CACHE_MODES = ('file', 'memory', 'none')
+
+
+def store_source(model_type, transform):
+    """
+    Nguồn chunk từ training store. Bộ dữ liệu đang dùng được cố định tại thời điểm gọi,
+    mọi lượt đọc sau đó dùng đúng bộ dữ liệu này
+
+    Args:
+        model_type: Loại mô hình ('major_recommendation', 'admission_probability')
+        transform: Hàm (records, row_ids) -> (row_ids, X, y) tiền xử lý một chunk, có thể lọc bớt dòng
+
+    Returns:
+        Hàm không tham số trả về iterator các chunk (row_ids, X, y)
+    """
+    manifest = get_training_manifest(model_type)
+    if manifest is None:
+        raise ValueError(f"Không tìm thấy dữ liệu huấn luyện cho mô hình {model_type} trong MongoDB")
+
+    def source():
+        for start, records in iter_training_chunks(model_type, manifest=manifest):
+            yield transform(records, np.arange(start, start + len(records)))
+
+    return source
+
+
+def csv_source(csv_path, transform, chunk_size=TRAINING_CHUNK_SIZE):
+    """Nguồn chunk từ file CSV, đọc bằng pd.read_csv(chunksize=...). Tham số giống store_source"""
+    import pandas as pd
+
+    def source():
+        start = 0
+        for df in pd.read_csv(csv_path, chunksize=chunk_size):
+            yield transform(df.to_dict('records'), np.arange(start, start + len(df)))
+            start += len(df)
+
+    return source
+
+
+def array_source(X, y):
+    """Nguồn một chunk từ mảng trong bộ nhớ (ví dụ dữ liệu tổng hợp)"""
+    return lambda: iter([(np.arange(len(X)), X, y)])
+
+
+def validation_mask(row_ids, validation_split, seed=42):
+    """
+    True cho các dòng thuộc tập validation: mỗi dòng được chọn với xác suất validation_split
+    theo giá trị băm (splitmix64) của seed và vị trí dòng
+    """
+    with np.errstate(over='ignore'):
+        z = np.asarray(row_ids, dtype=np.uint64) + np.uint64(seed + 1) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53 < validation_split
+
+
+def dataset_labels(dataset):
+    """Ghép nhãn của một tf.data.Dataset (X, y) không xáo trộn thành mảng numpy"""
+    return np.concatenate([y.numpy() for _, y in dataset])
+
+
+class ChunkedTrainingSet:
+    """
+    Tập dữ liệu huấn luyện đọc theo chunk cho tf.data
+
+    - scan(): một lượt đọc tính scaler (StandardScaler.partial_fit trên tập train), số dòng
+      và số mẫu dương của từng nhãn; cần gọi trước dataset()
+    - dataset(): tf.data.Dataset đã chia batch, đặc trưng đã chuẩn hóa
+    - row_filter: hàm (X, y) -> mảng bool các dòng được giữ, áp dụng cho cả train và validation
+    - Dùng với with để xóa file cache khi huấn luyện xong
+    """
+
+    def __init__(self, source, validation_split=0.2, seed=42, cache=TRAINING_DATASET_CACHE, cache_dir=TRAINING_CACHE_DIR):
+        if cache not in CACHE_MODES:
+            print(f"Chế độ cache dữ liệu huấn luyện không hợp lệ: {cache} (chỉ hỗ trợ {', '.join(CACHE_MODES)}), không dùng cache")
+            cache = 'none'
+
+        self.source = source
+        self.validation_split = validation_split
+        self.seed = seed
+        self.cache = cache
+        self.cache_dir = cache_dir
+        self.row_filter = None
+        self.scaler = None
+        self.stats = None
+        self.input_dim = None
+        self.output_dim = None
+        self._cache_path = None
+
+    def iter_chunks(self, validation=False):
+        """Các chunk (X, y) chưa chuẩn hóa của tập train hoặc validation"""
+        for row_ids, X, y in self.source():
+            keep = validation_mask(row_ids, self.validation_split, self.seed) == validation
+            if self.row_filter is not None:
+                keep &= self.row_filter(X, y)
+            if keep.any():
+                yield X[keep], y[keep]
+
+    def scan(self):
+        """
+        Đọc toàn bộ nguồn một lần để tính scaler và thống kê, đọc lại nếu thay đổi row_filter
+
+        Returns:
+            Dictionary: train_rows, validation_rows, labeled_rows (dòng train có ít nhất một nhãn > 0),
+            positive_counts (số dòng train có nhãn > 0 theo từng cột)
+        """
+        scaler = StandardScaler()
+        stats = {'train_rows': 0, 'validation_rows': 0, 'labeled_rows': 0, 'positive_counts': None}
+
+        for row_ids, X, y in self.source():
+            self.input_dim, self.output_dim = X.shape[1], y.shape[1]
+            keep = np.ones(len(row_ids), dtype=bool) if self.row_filter is None else self.row_filter(X, y)
+            validation = validation_mask(row_ids, self.validation_split, self.seed)
+            stats['validation_rows'] += int(np.count_nonzero(keep & validation))
+
+            train = keep & ~validation
+            if not train.any():
+                continue
+            scaler.partial_fit(X[train])
+            positive = y[train] > 0
+            counts = np.count_nonzero(positive, axis=0)
+            stats['positive_counts'] = counts if stats['positive_counts'] is None else stats['positive_counts'] + counts
+            stats['labeled_rows'] += int(np.count_nonzero(positive.any(axis=1)))
+            stats['train_rows'] += int(np.count_nonzero(train))
+
+        if stats['train_rows'] == 0:
+            raise ValueError("Không có dòng dữ liệu huấn luyện nào")
+        if stats['validation_rows'] == 0 and self.validation_split > 0:
+            raise ValueError("Không có dòng dữ liệu validation nào, cần thêm dữ liệu huấn luyện")
+
+        self.scaler = scaler
+        self.stats = stats
+        return stats
+
+    def dataset(self, validation=False, batch_size=32, label_fn=None, shuffle_buffer=TRAINING_SHUFFLE_BUFFER):
+        """
+        tf.data.Dataset các batch (X đã chuẩn hóa, nhãn)
+
+        Args:
+            validation: Tập validation (không xáo trộn) thay vì tập train
+            batch_size: Số dòng mỗi batch
+            label_fn: Hàm tensor biến đổi nhãn của cả batch (ví dụ nhãn nhị phân gộp), mặc định giữ nguyên
+            shuffle_buffer: Số dòng của bộ đệm xáo trộn (tập train)
+        """
+        if self.scaler is None:
+            raise RuntimeError("Cần gọi scan() trước khi tạo dataset")
+
+        dataset = tf.data.Dataset.from_generator(
+            lambda: ((X.astype(np.float32), y.astype(np.float32)) for X, y in self.iter_chunks(validation)),
+            output_signature=(
+                tf.TensorSpec(shape=(None, self.input_dim), dtype=tf.float32),
+                tf.TensorSpec(shape=(None, self.output_dim), dtype=tf.float32)
+            )
+        )
+
+        # Cache các chunk đã tiền xử lý: từ epoch thứ hai không đọc lại MongoDB/CSV và không chạy lại Python
+        if self.cache == 'file':
+            dataset = dataset.cache(os.path.join(self._ensure_cache_path(), 'validation' if validation else 'train'))
+        elif self.cache == 'memory':
+            dataset = dataset.cache()
+
+        if not validation and shuffle_buffer > 1:
+            # Xáo trộn thứ tự các chunk trong một cửa sổ nhỏ rồi xáo trộn từng dòng,
+            # bộ nhớ khoảng hai lần shuffle_buffer dòng
+            dataset = dataset.shuffle(max(1, shuffle_buffer // TRAINING_CHUNK_SIZE), seed=self.seed)
+            dataset = dataset.unbatch().shuffle(shuffle_buffer, seed=self.seed)
+        else:
+            dataset = dataset.unbatch()
+
+        mean = tf.constant(self.scaler.mean_, dtype=tf.float32)
+        scale = tf.constant(self.scaler.scale_, dtype=tf.float32)
+
+        def prepare(X, y):
+            return (X - mean) / scale, label_fn(y) if label_fn is not None else y
+
+        return (
+            dataset.batch(batch_size)
+            .map(prepare, num_parallel_calls=tf.data.AUTOTUNE)
+            .prefetch(tf.data.AUTOTUNE)
+        )
+
+    def sample(self, validation=True, max_rows=None):
+        """Lấy mẫu ngẫu nhiên đều tối đa max_rows dòng (X chưa chuẩn hóa, y) vào bộ nhớ, None nếu không có dòng nào"""
+        return sample_batches(self.iter_chunks(validation), max_rows, seed=self.seed)
+
+    def close(self):
+        """Xóa file cache của lần huấn luyện này"""
+        if self._cache_path is not None:
+            shutil.rmtree(self._cache_path, ignore_errors=True)
+            self._cache_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _ensure_cache_path(self):
+        # Thư mục riêng cho mỗi lần huấn luyện: không dùng nhầm cache của bộ dữ liệu khác
+        # hoặc file khóa còn lại của lần huấn luyện bị ngắt giữa chừng
+        if self._cache_path is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._cache_path = tempfile.mkdtemp(prefix='training_cache_', dir=self.cache_dir)
+        return self._cache_path
+
+
+class TrainingJobCallback(tf.keras.callbacks.Callback):
+    """
+    Báo tiến độ huấn luyện (epoch, loss) cho job chạy nền và dừng huấn luyện khi job bị hủy
+
+    Args:
+        job: TrainingJobContext của utils/training_jobs.py
+    """
+
+    def __init__(self, job):
+        super().__init__()
+        self.job = job
+        self.epoch = 0
+
+    def on_train_begin(self, logs=None):
+        self.job.set_stage('training')
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch = epoch + 1
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.job.report_batch(self.epoch, self.params.get('epochs'), batch + 1, logs)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.job.report_epoch(epoch + 1, self.params.get('epochs'), logs)
+
+    def on_train_end(self, logs=None):
+        self.job.set_stage('saving')
@@ -9,41 +9,43 @@ from werkzeug.exceptions import BadRequest
 # Thêm thư mục cha vào sys.path để import các module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from config.config import MODEL_DIR
+from utils.auth import require_admin_token
 from utils.db_utils import db_client
+from utils.write_behind import student_data_writer
+from utils.batching import major_batcher
+from utils.training_jobs import training_jobs, job_to_dict, TrainingJobBusy
 from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
-from ai_models.goiynganhhoc.neural_network import MajorRecommendationModel
+from ai_models.goiynganhhoc.model_cache import major_model_cache
+from ai_models.goiynganhhoc.major_recommendation_api import invalidate_model_mappings
 
 # Tạo blueprint cho API
 recommendation_api = Blueprint('recommendation_api', __name__)
 
-# Đường dẫn tới thư mục mô hình
-MAJOR_RECOMMENDATION_MODEL_DIR = os.path.join(MODEL_DIR, 'goiynganhhoc', 'model')
-
-# Biến toàn cục cho mô hình và preprocessor (lazy loading)
-_model = None
+# Preprocessor dùng lazy loading, mô hình lấy từ major_model_cache (dùng chung với /api/recommendation)
 _preprocessor = None
 
-def get_model():
-    """Lazy loading mô hình"""
-    global _model
-    if _model is None:
-        try:
-            # Tìm file model mới nhất trong thư mục
-            model_files = [f for f in os.listdir(MAJOR_RECOMMENDATION_MODEL_DIR) 
-                          if f.endswith('.h5')]
-            
-            if not model_files:
-                raise FileNotFoundError("Không tìm thấy file mô hình trong thư mục")
-                
-            # Lấy file mới nhất (sắp xếp theo thời gian)
-            latest_model = sorted(model_files)[-1]
-            model_path = os.path.join(MAJOR_RECOMMENDATION_MODEL_DIR, latest_model)
-            
-            _model = MajorRecommendationModel.load(model_path)
-        except Exception as e:
-            raise RuntimeError(f"Không thể tải mô hình gợi ý ngành học: {e}")
-    return _model
+def predict_top_majors(X_student, market_trend_weights=None, top_k=3):
+    """
+    Dự đoán top-k ngành bằng mô hình đã tải sẵn trong major_model_cache
+
+    Returns:
+        Danh sách (major_id, probability)
+    """
+    model_handle = major_model_cache.get()
+    scaler_mean, scaler_scale = model_handle.scaler
+    features_scaled = (X_student.reshape(1, -1) - scaler_mean) / scaler_scale
+
+    # Gộp với các request đồng thời khác thành một batch
+    predictions = np.array(major_batcher.predict(model_handle.model, features_scaled[0]), dtype=float)
+
+    # Áp dụng trọng số xu hướng thị trường nếu có
+    if market_trend_weights is not None:
+        for idx, weight in market_trend_weights.items():
+            if idx < predictions.shape[0]:
+                predictions[idx] *= weight
+
+    top_indices = np.argsort(predictions)[::-1][:top_k]
+    return [(idx, float(predictions[idx])) for idx in top_indices]
 
 def get_preprocessor():
     """Lazy loading preprocessor"""
@@ -60,7 +62,7 @@ def health_check():
     """Kiểm tra trạng thái hoạt động của API"""
     return jsonify({
         'status': 'ok',
-        'model_loaded': _model is not None,
+        'model_loaded': major_model_cache.is_loaded(),
         'preprocessor_loaded': _preprocessor is not None
     })
 
@@ -121,8 +123,7 @@ def recommend_majors():
         # Kiểm tra và làm sạch dữ liệu đầu vào
         student_data = validate_and_clean_input(data)
         
-        # Lấy mô hình và preprocessor
-        model = get_model()
+        # Lấy preprocessor
         preprocessor = get_preprocessor()
         
         # Tiền xử lý dữ liệu học sinh
@@ -134,7 +135,7 @@ def recommend_majors():
         
         # Dự đoán ngành học phù hợp
         top_k = int(request.args.get('top_k', 3))  # Số lượng gợi ý mặc định là 3
-        recommendations = model.predict(X_student, market_trend_weights, top_k)
+        recommendations = predict_top_majors(X_student, market_trend_weights, top_k)
         
         # Định dạng kết quả
         result = format_recommendations(recommendations, preprocessor, student_data)
@@ -205,6 +206,11 @@ def format_recommendations(recommendations, preprocessor, student_data):
     result = []
     seen_majors = set()  # Để tránh trùng lặp tên ngành
     
+    # Lấy tiêu chí tuyển sinh của tất cả các ngành và điểm tổ hợp của học sinh một lần cho cả request
+    major_names = [preprocessor.get_major_by_id(major_id) for major_id, _ in recommendations]
+    criteria_by_major = load_admission_criteria(major_names)
+    student_scores = calculate_student_scores(student_data)
+    
     for major_id, probability in recommendations:
         major_name = preprocessor.get_major_by_id(major_id)
         
@@ -217,7 +223,11 @@ def format_recommendations(recommendations, preprocessor, student_data):
         major_info = preprocessor.get_major_info(major_name)
         
         # Tìm các trường phù hợp
-        suitable_universities = find_suitable_universities(major_name, student_data)
+        suitable_universities = find_suitable_universities(
+            major_name, student_data,
+            admission_criteria=criteria_by_major.get(major_name, []),
+            student_scores=student_scores
+        )
         
         # Tìm các sở thích phù hợp
         matching_interests = []
@@ -238,84 +248,91 @@ def format_recommendations(recommendations, preprocessor, student_data):
     
     return result
 
-def find_suitable_universities(major_name, student_data):
+def load_admission_criteria(major_names):
+    """
+    Lấy tiêu chí tuyển sinh của nhiều ngành bằng một truy vấn
+
+    Args:
+        major_names: Danh sách tên ngành học
+
+    Returns:
+        Dict {tên ngành: danh sách tiêu chí đã sắp xếp theo tên trường}
+    """
+    criteria_by_major = {name: [] for name in major_names}
+    admission_criteria = db_client.fetch_data(
+        'admission_criteria',
+        {'majorName': {'$in': list(criteria_by_major)}},
+        sort=[('universityName', 1)]
+    )
+
+    for criteria in admission_criteria:
+        criteria_by_major.setdefault(criteria.get('majorName'), []).append(criteria)
+
+    return criteria_by_major
+
+def calculate_student_scores(student_data):
+    """
+    Tính điểm của học sinh cho tất cả các tổ hợp môn đã chọn (chỉ truy vấn mapping tổ hợp một lần)
+
+    Returns:
+        Dict {mã tổ hợp: tổng điểm}
+    """
+    subject_groups = student_data.get('subject_groups', [])
+    subject_group_mapping = get_subject_group_mapping(subject_groups)
+    return {
+        sg: calculate_student_score_for_subject_group(student_data, sg, subject_group_mapping)
+        for sg in subject_groups
+    }
+
+def find_suitable_universities(major_name, student_data, admission_criteria=None, student_scores=None):
     """
     Tìm các trường phù hợp với ngành học và điểm của học sinh
     
     Args:
         major_name: Tên ngành học
         student_data: Dữ liệu học sinh
+        admission_criteria: Tiêu chí tuyển sinh của ngành đã lấy sẵn (nếu None sẽ truy vấn DB)
+        student_scores: Điểm tổ hợp của học sinh đã tính sẵn (nếu None sẽ tính lại)
         
     Returns:
         Danh sách các trường phù hợp
     """
     # Lấy danh sách trường có ngành này
-    admission_criteria = db_client.fetch_data(
-        'admission_criteria',
-        {'majorName': major_name},
-        sort=[('universityName', 1)]
-    )
+    if admission_criteria is None:
+        admission_criteria = load_admission_criteria([major_name])[major_name]
     
     if not admission_criteria:
         return []
     
-    result = []
-    processed_universities = set()
+    if student_scores is None:
+        student_scores = calculate_student_scores(student_data)
     
+    # Gom nhóm tiêu chí theo trường trong bộ nhớ (giữ thứ tự theo tên trường)
+    criteria_by_university = {}
     for criteria in admission_criteria:
-        university_name = criteria.get('universityName')
-        
-        # Bỏ qua nếu đã xử lý trường này
-        if university_name in processed_universities:
-            continue
-        
-        # Lấy tất cả tiêu chí của trường này và ngành này
-        university_criteria = [c for c in admission_criteria 
-                              if c.get('universityName') == university_name]
+        criteria_by_university.setdefault(criteria.get('universityName'), []).append(criteria)
+    
+    result = []
+    
+    for university_name, university_criteria in criteria_by_university.items():
+        # Điểm chuẩn: tiêu chí đầu tiên của trường có minScore
+        min_score = 20.0  # Điểm mặc định nếu không có thông tin
+        for adm in university_criteria:
+            if 'minScore' in adm:
+                min_score = adm['minScore']
+                break
         
         # Tính điểm tổ hợp môn của học sinh
         subject_group_results = []
         
         for uc in university_criteria:
-            # Lấy quota mới nhất
-            quota_data = uc.get('quota', [])
-            if not quota_data:
-                continue
-                
-            # Sắp xếp theo năm giảm dần
-            sorted_quota = sorted(quota_data, key=lambda x: x.get('year', 0), reverse=True)
-            
-            # Lấy quota năm gần nhất
-            latest_quota = sorted_quota[0] if sorted_quota else None
-            if not latest_quota:
+            # Chỉ xét các tiêu chí có thông tin chỉ tiêu
+            if not uc.get('quota'):
                 continue
             
             # Kiểm tra các tổ hợp môn
             for sg in student_data.get('subject_groups', []):
-                # Tính điểm tổ hợp của học sinh
-                student_score = calculate_student_score_for_subject_group(student_data, sg)
-                
-                # Kiểm tra điểm chuẩn
-                min_score = 20.0  # Điểm mặc định nếu không có thông tin
-                
-                # Lấy danh sách điểm chuẩn từ các năm gần đây
-                # Thực tế sẽ cần truy vấn collection khác để lấy điểm chuẩn
-                admission_scores = db_client.fetch_data(
-                    'admission_criteria',
-                    {
-                        'universityName': university_name,
-                        'majorName': major_name
-                    }
-                )
-                
-                if admission_scores:
-                    # Lấy điểm chuẩn của năm gần nhất
-                    for adm in admission_scores:
-                        if 'minScore' in adm:
-                            min_score = adm['minScore']
-                            break
-                
-                # Thêm vào kết quả
+                student_score = student_scores[sg]
                 subject_group_results.append({
                     "code": sg,
                     "min_score": min_score,
@@ -329,28 +346,19 @@ def find_suitable_universities(major_name, student_data):
                 "university_name": university_name,
                 "subject_groups": subject_group_results
             })
-            
-            processed_universities.add(university_name)
     
     return result
 
-def calculate_student_score_for_subject_group(student_data, subject_group):
+def get_subject_group_mapping(subject_groups):
     """
-    Tính điểm tổ hợp môn của học sinh
-    
+    Lấy danh sách môn của các tổ hợp môn (mặc định, cập nhật từ DB bằng một truy vấn)
+
     Args:
-        student_data: Dữ liệu học sinh
-        subject_group: Mã tổ hợp môn (vd: A00, D01)
-    
+        subject_groups: Danh sách mã tổ hợp môn
+
     Returns:
-        Tổng điểm tổ hợp
+        Dict {mã tổ hợp: danh sách tên môn}
     """
-    # Lấy mapping tổ hợp môn từ MongoDB
-    subject_mapping = db_client.fetch_data(
-        'subject_combinations',
-        {'code': subject_group}
-    )
-    
     # Mapping tổ hợp môn (mặc định nếu không tìm thấy trong DB)
     subject_group_mapping = {
         'A00': ['Toan', 'VatLy', 'HoaHoc'],
@@ -361,28 +369,58 @@ def calculate_student_score_for_subject_group(student_data, subject_group):
         # Thêm các tổ hợp khác ở đây
     }
     
-    # Cập nhật mapping từ DB nếu có
-    if subject_mapping:
-        db_subjects = subject_mapping[0].get('subjects', [])
+    if not subject_groups:
+        return subject_group_mapping
+    
+    # Lấy mapping tổ hợp môn từ MongoDB
+    subject_mappings = db_client.fetch_data(
+        'subject_combinations',
+        {'code': {'$in': list(subject_groups)}}
+    )
+    
+    # Chuyển mã môn (TOAN, LY, HOA) sang tên môn (Toan, VatLy, HoaHoc)
+    subject_translation = {
+        'TOAN': 'Toan',
+        'LY': 'VatLy',
+        'HOA': 'HoaHoc',
+        'SINH': 'SinhHoc',
+        'VAN': 'NguVan',
+        'SU': 'LichSu',
+        'DIA': 'DiaLy',
+        'GDCD': 'GDCD',
+        'ANH': 'NgoaiNgu'
+    }
+    
+    # Cập nhật mapping từ DB nếu có (bản ghi đầu tiên của mỗi tổ hợp)
+    seen_codes = set()
+    for subject_mapping in subject_mappings:
+        code = subject_mapping.get('code')
+        if code in seen_codes:
+            continue
+        seen_codes.add(code)
+        
+        db_subjects = subject_mapping.get('subjects', [])
         if db_subjects:
-            # Chuyển mã môn (TOAN, LY, HOA) sang tên môn (Toan, VatLy, HoaHoc)
-            subject_translation = {
-                'TOAN': 'Toan',
-                'LY': 'VatLy',
-                'HOA': 'HoaHoc',
-                'SINH': 'SinhHoc',
-                'VAN': 'NguVan',
-                'SU': 'LichSu',
-                'DIA': 'DiaLy',
-                'GDCD': 'GDCD',
-                'ANH': 'NgoaiNgu'
-            }
-            
-            translated_subjects = [
+            subject_group_mapping[code] = [
                 subject_translation.get(s, s) for s in db_subjects
             ]
-            
-            subject_group_mapping[subject_group] = translated_subjects
+    
+    return subject_group_mapping
+
+def calculate_student_score_for_subject_group(student_data, subject_group, subject_group_mapping=None):
+    """
+    Tính điểm tổ hợp môn của học sinh
+    
+    Args:
+        student_data: Dữ liệu học sinh
+        subject_group: Mã tổ hợp môn (vd: A00, D01)
+        subject_group_mapping: Mapping tổ hợp môn đã lấy sẵn (nếu None sẽ truy vấn DB)
+    
+    Returns:
+        Tổng điểm tổ hợp
+    """
+    if subject_group_mapping is None:
+        subject_group_mapping = get_subject_group_mapping([subject_group])
     
     # Nếu không có mapping cho tổ hợp này, trả về 0
     if subject_group not in subject_group_mapping:
@@ -453,39 +491,122 @@ def save_student_data(student_data, recommendations):
         else:
             document['userId'] = student_data['userId']
         
-        # Lưu vào DB
-        db_client.insert_one('student_data', document)
+        # Đưa vào hàng đợi ghi nền thay vì ghi trực tiếp trên đường xử lý request
+        student_data_writer.submit(document)
         
     except Exception as e:
         # Log lỗi nhưng không dừng xử lý
         print(f"Lỗi khi lưu dữ liệu học sinh: {e}")
 
-# Thêm endpoint để train model
+def activate_trained_model(job):
+    """
+    Đưa mô hình vừa huấn luyện vào phục vụ ngay trong worker đã tạo job,
+    các worker khác tự tải phiên bản mới qua major_model_cache.start_watching()
+    """
+    invalidate_model_mappings()
+    handle = major_model_cache.reload()
+    print(f"Đã thay mô hình gợi ý ngành học bằng phiên bản {handle.version} của job {job['_id']}")
+
+# Huấn luyện mô hình chạy ở process nền (utils/training_jobs.py), request trả về ngay job_id
 @recommendation_api.route('/major-recommendation/train', methods=['POST'])
+@require_admin_token
 def train_model_endpoint():
-    """API endpoint để huấn luyện mô hình"""
+    """
+    API endpoint để huấn luyện mô hình: tạo job huấn luyện chạy nền
+    
+    Trả về 202 với job_id, theo dõi bằng GET /major-recommendation/train/<job_id>,
+    409 nếu đang có job huấn luyện khác chạy
+    """
     try:
-        from ai_models.goiynganhhoc.train_model import train_model
-        
-        # Huấn luyện mô hình
-        model, model_path = train_model()
-        
-        # Reset model để load lại
-        global _model
-        _model = None
+        job = training_jobs.submit('major_recommendation', on_success=activate_trained_model)
         
         return jsonify({
             'success': True,
-            'message': 'Mô hình đã được huấn luyện thành công',
-            'model_path': model_path
-        })
-        
+            'message': 'Đã bắt đầu huấn luyện mô hình ở nền',
+            'job_id': str(job['_id']),
+            'status_url': f"{request.path}/{job['_id']}",
+            'job': job_to_dict(job)
+        }), 202
+    
+    except TrainingJobBusy as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'job_id': str(e.job_id) if e.job_id else None
+        }), 409
     except Exception as e:
         return jsonify({
             'success': False,
-            'error': f"Lỗi khi huấn luyện mô hình: {str(e)}"
+            'error': f"Lỗi khi tạo job huấn luyện mô hình: {str(e)}"
         }), 500
 
+@recommendation_api.route('/major-recommendation/train', methods=['GET'])
+@require_admin_token
+def list_training_jobs():
+    """Danh sách các job huấn luyện gần nhất"""
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+        jobs = training_jobs.list_jobs('major_recommendation', limit=limit)
+        return jsonify({'success': True, 'jobs': [job_to_dict(job) for job in jobs]})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f"Lỗi khi lấy danh sách job huấn luyện: {str(e)}"}), 500
+
+@recommendation_api.route('/major-recommendation/train/<job_id>', methods=['GET'])
+@require_admin_token
+def get_training_job(job_id):
+    """Trạng thái của job huấn luyện (queued, running, succeeded, failed, cancelled)"""
+    try:
+        job = training_jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': f"Không tìm thấy job huấn luyện {job_id}"}), 404
+        return jsonify({'success': True, 'job': job_to_dict(job)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': f"Lỗi khi lấy trạng thái job huấn luyện: {str(e)}"}), 500
+
+@recommendation_api.route('/major-recommendation/train/<job_id>/progress', methods=['GET'])
+@require_admin_token
+def get_training_progress(job_id):
+    """Tiến độ của job huấn luyện: epoch, batch, loss hiện tại và kết quả từng epoch"""
+    try:
+        job = training_jobs.get(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': f"Không tìm thấy job huấn luyện {job_id}"}), 404
+        
+        job = job_to_dict(job, include_history=True)
+        return jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'stage': job['stage'],
+            'progress': job['progress'],
+            'history': job['history']
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': f"Lỗi khi lấy tiến độ job huấn luyện: {str(e)}"}), 500
+
+@recommendation_api.route('/major-recommendation/train/<job_id>/cancel', methods=['POST'])
+@require_admin_token
+def cancel_training_job(job_id):
+    """Hủy job huấn luyện đang chạy (409 nếu job đã kết thúc hoặc đang lưu mô hình)"""
+    try:
+        job, cancelled = training_jobs.cancel(job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': f"Không tìm thấy job huấn luyện {job_id}"}), 404
+        if not cancelled:
+            return jsonify({
+                'success': False,
+                'error': f"Không thể hủy job huấn luyện ở trạng thái {job['status']} ({job.get('stage')})",
+                'job': job_to_dict(job)
+            }), 409
+        
+        return jsonify({
+            'success': True,
+            'message': 'Đã yêu cầu hủy job huấn luyện',
+            'job': job_to_dict(job)
+        }), 202
+    except Exception as e:
+        return jsonify({'success': False, 'error': f"Lỗi khi hủy job huấn luyện: {str(e)}"}), 500
+
 # Thêm endpoint mới nếu cần
 # @recommendation_api.route('/endpoint', methods=['GET', 'POST'])
 # def new_endpoint():
@@ -17,26 +17,10 @@ print(f"Python API Environment Variables:")
 print(f"- API_PORT: {os.environ.get('API_PORT')}")
 print(f"- PYTHON_API_PORT: {os.environ.get('PYTHON_API_PORT')}")
 
-# Kiểm tra và khởi tạo mô hình nếu cần
-try:
-    from ai_models.dudoanxacxuat.initialize_model import initialize_model
-    model_initialized = initialize_model()
-    print(f"Khởi tạo mô hình dự đoán xác suất thành công: {model_initialized}")
-except Exception as e:
-    print(f"Lỗi khi khởi tạo mô hình dự đoán xác suất: {e}")
-    model_initialized = False
-
-# Kiểm tra và khởi tạo mô hình gợi ý ngành học nếu cần
-try:
-    from ai_models.goiynganhhoc.initialize_model import initialize_model
-    initialize_model()
-    print("Đã kiểm tra và khởi tạo mô hình gợi ý ngành học")
-except Exception as e:
-    print(f"Lỗi khi khởi tạo mô hình gợi ý ngành học: {e}")
-
 # Import API modules
 try:
     from ai_models.dudoanxacxuat.api_integration import admission_prediction_blueprint
+    from ai_models.dudoanxacxuat.model_registry import admission_model_registry
     ADMISSION_PREDICTION_AVAILABLE = True
     print("API dự đoán xác suất đậu đại học đã được tải thành công")
 except ImportError as e:
@@ -45,13 +29,33 @@ except ImportError as e:
 
 # Import module gợi ý ngành học mới
 try:
-    from ai_models.goiynganhhoc.major_recommendation_api import major_recommendation_blueprint
+    from ai_models.goiynganhhoc.major_recommendation_api import major_recommendation_blueprint, preload_model as preload_major_model
+    from ai_models.goiynganhhoc.model_cache import major_model_cache
     MAJOR_RECOMMENDATION_AVAILABLE = True
     print("API gợi ý ngành học đã được tải thành công")
 except ImportError as e:
     print(f"CẢNH BÁO: Không thể import module gợi ý ngành học: {e}")
     MAJOR_RECOMMENDATION_AVAILABLE = False
 
+# Import API huấn luyện lại mô hình gợi ý ngành học (lỗi ở đây không làm tắt /api/recommendation)
+try:
+    from api.recommendation_api import recommendation_api
+    TRAINING_API_AVAILABLE = True
+except ImportError as e:
+    print(f"CẢNH BÁO: Không thể import API huấn luyện mô hình gợi ý ngành học: {e}")
+    TRAINING_API_AVAILABLE = False
+
+# Ảnh chụp dữ liệu tham chiếu dùng chung (majors, universities, interests, subject_combinations)
+from utils.reference_data import reference_data
+from utils.db_utils import db_client
+from utils.write_behind import write_behind_status
+from utils.batching import batching_status
+from utils.response_cache import response_cache_status
+from utils.training_jobs import training_jobs_status
+from utils.warmup import warmup
+from utils.auth import require_admin_token
+from config.config import STARTUP_WARMUP_MODE, ENSURE_INDEXES_ON_STARTUP
+
 # Tạo Flask app
 app = Flask(__name__)
 CORS(app)
@@ -59,17 +63,52 @@ CORS(app)
 # Health check endpoint cho Cloud Run
 @app.route('/health')
 def health():
-    return jsonify({
+    response = {
         "status": "ok",
-        "message": "Service is healthy"
-    })
+        "message": "Service is healthy",
+        "models": {}
+    }
+    
+    # Thông tin phiên bản và thời gian tải của mô hình (không kích hoạt việc tải)
+    if ADMISSION_PREDICTION_AVAILABLE:
+        response["models"]["admission_probability"] = admission_model_registry.status()
+    if MAJOR_RECOMMENDATION_AVAILABLE:
+        response["models"]["major_recommendation"] = major_model_cache.status()
+    
+    response["referenceData"] = reference_data.status()
+    response["mongo"] = db_client.pool_stats()
+    response["writeBehind"] = write_behind_status()
+    response["batching"] = batching_status()
+    response["responseCache"] = response_cache_status()
+    response["trainingJobs"] = training_jobs_status()
+    response["warmup"] = warmup.status()
+    
+    return jsonify(response)
+
+# Readiness: 200 khi mô hình và dữ liệu tham chiếu đã được tải xong ở luồng khởi động
+@app.route('/ready')
+def ready():
+    is_ready = warmup.is_ready()
+    return jsonify({"ready": is_ready, "warmup": warmup.status()}), 200 if is_ready else 503
+
+# Tải lại dữ liệu tham chiếu sau khi cập nhật majors, universities, interests hoặc subject_combinations:
+# tải lại ngay ở worker nhận request, các worker khác tải lại khi kiểm tra data_versions
+# (REFERENCE_DATA_VERSION_CHECK_SECONDS). Yêu cầu header X-Admin-Token
+@app.route('/reference-data/reload', methods=['POST'])
+@require_admin_token
+def reload_reference_data():
+    try:
+        reference_data.notify_changed()
+        return jsonify({"success": True, "referenceData": reference_data.status()})
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Lỗi khi tải lại dữ liệu tham chiếu: {str(e)}"}), 500
 
 # Đăng ký blueprint API
 @app.route('/')
 def index():
     return jsonify({
         "message": "Python API Server đang hoạt động",
-        "model_initialized": model_initialized,
+        "model_initialized": warmup.step_succeeded('admission_model'),
         "endpoints": [
             {
                 "path": "/api/data/admission/predict-ai",
@@ -110,6 +149,47 @@ else:
             "message": "API gợi ý ngành học không khả dụng"
         }), 503
 
+# Đăng ký API gợi ý ngành học cũ và huấn luyện lại mô hình bằng job chạy nền: /major-recommendation/train
+# (các route huấn luyện yêu cầu header X-Admin-Token, xem ADMIN_TOKEN)
+if TRAINING_API_AVAILABLE:
+    app.register_blueprint(recommendation_api)
+
+# Các bước khởi động nặng chạy sau khi app đã sẵn sàng nhận request (xem /ready)
+def warmup_admission_model():
+    """Kiểm tra và tải trước mô hình dự đoán xác suất để request đầu tiên không phải chờ"""
+    from ai_models.dudoanxacxuat.initialize_model import initialize_model
+    if not initialize_model():
+        raise RuntimeError("Mô hình dự đoán xác suất chưa tồn tại")
+    admission_model_registry.get()
+
+def warmup_major_model():
+    """Khởi tạo mô hình gợi ý ngành học nếu cần (import TensorFlow), tải trước và theo dõi phiên bản mới"""
+    from ai_models.goiynganhhoc.initialize_model import initialize_model
+    initialize_model()
+    preload_major_model()
+
+def warmup_reference_data():
+    """Tải trước dữ liệu tham chiếu và bật làm mới định kỳ (kể cả khi lần tải đầu lỗi)"""
+    try:
+        reference_data.snapshot()
+    finally:
+        reference_data.start_auto_refresh()
+
+def warmup_indexes():
+    """Tạo index cho các collection thường xuyên truy vấn (bật bằng ENSURE_INDEXES_ON_STARTUP)"""
+    from utils.db_indexes import ensure_indexes_and_verify
+    if not ensure_indexes_and_verify():
+        print("CẢNH BÁO: Thiếu index hoặc có truy vấn phải quét toàn bộ collection (COLLSCAN), xem log [index]/[explain] ở trên")
+
+warmup.add_step('reference_data', warmup_reference_data)
+if ADMISSION_PREDICTION_AVAILABLE:
+    warmup.add_step('admission_model', warmup_admission_model)
+if MAJOR_RECOMMENDATION_AVAILABLE:
+    warmup.add_step('major_model', warmup_major_model)
+if ENSURE_INDEXES_ON_STARTUP:
+    warmup.add_step('indexes', warmup_indexes, required=False)
+warmup.start(background=STARTUP_WARMUP_MODE != 'sync')
+
 if __name__ == '__main__':
     # Sửa phần lấy port để tương thích với Cloud Run
     port = int(os.environ.get('PORT', os.environ.get('PYTHON_API_PORT', 8080)))
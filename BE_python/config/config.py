@@ -1,18 +1,126 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load biến môi trường từ file .env (nếu có)
 load_dotenv()
 
-# Cấu hình MongoDB
-MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
-MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'tuyen_sinh_thong_minh')
+# Cấu hình MongoDB (chấp nhận cả tên biến cũ MONGODB_URI và DB_NAME)
+MONGO_URI = os.getenv('MONGO_URI') or os.getenv('MONGODB_URI') or 'mongodb://localhost:27017'
+MONGO_DB_NAME = os.getenv('MONGO_DB_NAME') or os.getenv('DB_NAME') or 'tuyen_sinh_thong_minh'
+
+# Cấu hình pool kết nối MongoDB dùng chung cho toàn bộ worker
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 60000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 30000))
+# Read preference: primary, primaryPreferred, secondary, secondaryPreferred, nearest
+MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+
+# Tạo index và kiểm tra kế hoạch truy vấn (explain) khi khởi động API (xem scripts/ensure_indexes.py)
+ENSURE_INDEXES_ON_STARTUP = os.getenv('ENSURE_INDEXES_ON_STARTUP', 'False').lower() == 'true'
+
+# Chạy các bước khởi động nặng (tải mô hình, dữ liệu tham chiếu): 'background' (server nhận request ngay,
+# xem /ready) hoặc 'sync' (chạy xong trước khi import app hoàn tất)
+STARTUP_WARMUP_MODE = os.getenv('STARTUP_WARMUP_MODE', 'background').lower()
+
+# Thử lại các bước khởi động bắt buộc bị lỗi (ví dụ MongoDB tạm thời không kết nối được) ở luồng nền:
+# chờ WARMUP_RETRY_SECONDS rồi tăng gấp đôi sau mỗi lần lỗi, tối đa WARMUP_RETRY_MAX_SECONDS (0 để tắt)
+WARMUP_RETRY_SECONDS = float(os.getenv('WARMUP_RETRY_SECONDS', 5))
+WARMUP_RETRY_MAX_SECONDS = float(os.getenv('WARMUP_RETRY_MAX_SECONDS', 300))
 
 # Cấu hình API
 API_HOST = os.getenv('API_HOST', '0.0.0.0')
 API_PORT = int(os.getenv('API_PORT', 5000))
 DEBUG_MODE = os.getenv('DEBUG_MODE', 'True').lower() == 'true'
 
+# Ghi nền (write-behind) cho prediction_logs và student_data: gom document và ghi bằng insert_many
+WRITE_BEHIND_ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'True').lower() == 'true'
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv('WRITE_BEHIND_MAX_QUEUE', 10000))
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 200))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv('WRITE_BEHIND_FLUSH_SECONDS', 1.0))
+# Thời gian tối đa request chờ khi hàng đợi đầy trước khi bỏ document (giây)
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.getenv('WRITE_BEHIND_ENQUEUE_TIMEOUT', 0.05))
+
+# Engine suy luận cho mô hình dự đoán xác suất: 'numpy' (không cần TensorFlow), 'tflite' hoặc 'keras'
+ADMISSION_INFERENCE_BACKEND = os.getenv('ADMISSION_INFERENCE_BACKEND', 'numpy').lower()
+
+# Chế độ phục vụ mô hình gợi ý ngành học: 'fused' (gộp các đầu ra thành một ma trận), 'tflite' hoặc 'keras'
+MAJOR_MODEL_SERVING_MODE = os.getenv('MAJOR_MODEL_SERVING_MODE', 'fused').lower()
+
+# Gom các request dự đoán đồng thời thành batch (utils/batching.py): kích thước batch tối đa
+# và thời gian chờ tối đa để gom thêm request (ms)
+INFERENCE_BATCHING_ENABLED = os.getenv('INFERENCE_BATCHING_ENABLED', 'True').lower() == 'true'
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 32))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 2))
+# Engine có thời gian mỗi lần predict nhỏ hơn ngưỡng này (ms, ví dụ numpy/fused) được gọi trực tiếp, không gom batch
+INFERENCE_BATCHING_MIN_PREDICT_MS = float(os.getenv('INFERENCE_BATCHING_MIN_PREDICT_MS', 1.0))
+
+# Số luồng của mỗi interpreter TFLite (engine 'tflite', file .tflite xuất bằng scripts/export_tflite.py)
+TFLITE_NUM_THREADS = int(os.getenv('TFLITE_NUM_THREADS', 1))
+
+# Chu kỳ kiểm tra phiên bản mô hình gợi ý ngành học mới trong thư mục model (giây), 0 để tắt
+MAJOR_MODEL_WATCH_SECONDS = int(os.getenv('MAJOR_MODEL_WATCH_SECONDS', 60))
+
+# Chu kỳ kiểm tra phiên bản dữ liệu benchmark_scores để xây dựng lại chỉ mục tên ngành (giây)
+MAJOR_INDEX_CHECK_SECONDS = int(os.getenv('MAJOR_INDEX_CHECK_SECONDS', 60))
+
+# Chu kỳ kiểm tra phiên bản dữ liệu benchmark_scores để làm mới cache điểm chuẩn theo trường (giây)
+BENCHMARK_CACHE_CHECK_SECONDS = int(os.getenv('BENCHMARK_CACHE_CHECK_SECONDS', 60))
+
+# Chu kỳ đọc lại phiên bản dữ liệu (data_versions) trên đường xử lý request (giây)
+DATA_VERSION_CHECK_SECONDS = int(os.getenv('DATA_VERSION_CHECK_SECONDS', 30))
+
+# Cache kết quả dự đoán cho các request giống nhau (utils/response_cache.py): LRU + TTL trong bộ nhớ,
+# có thể thêm backend dùng chung giữa các worker: 'none' hoặc 'sqlite' (file cục bộ, thay cho cache dùng chung)
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True').lower() == 'true'
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 10000))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', 300))
+RESPONSE_CACHE_SHARED_BACKEND = os.getenv('RESPONSE_CACHE_SHARED_BACKEND', 'none').lower()
+RESPONSE_CACHE_SQLITE_PATH = os.getenv(
+    'RESPONSE_CACHE_SQLITE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'cache', 'response_cache.sqlite3')
+)
+
+# Dữ liệu huấn luyện lưu theo chunk (utils/training_store.py): số dòng mỗi document chunk
+# (giữ mỗi document dưới giới hạn 16MB của MongoDB) và số mẫu tối đa khi cần tải dữ liệu vào bộ nhớ
+# (tập kiểm tra khi đánh giá; lấy mẫu ngẫu nhiên đều khi đọc luồng dữ liệu)
+TRAINING_CHUNK_SIZE = int(os.getenv('TRAINING_CHUNK_SIZE', 5000))
+TRAINING_MAX_SAMPLES = int(os.getenv('TRAINING_MAX_SAMPLES', 10000))
+
+# Luồng dữ liệu tf.data khi huấn luyện (ai_models/training_pipeline.py): số dòng của bộ đệm xáo trộn
+# và nơi cache dữ liệu đã tiền xử lý sau epoch đầu tiên ('file': file tạm trong TRAINING_CACHE_DIR,
+# xóa khi huấn luyện xong; 'memory': trong bộ nhớ; 'none': đọc lại nguồn dữ liệu mỗi epoch)
+TRAINING_SHUFFLE_BUFFER = int(os.getenv('TRAINING_SHUFFLE_BUFFER', 10000))
+TRAINING_DATASET_CACHE = os.getenv('TRAINING_DATASET_CACHE', 'file').lower()
+TRAINING_CACHE_DIR = os.getenv('TRAINING_CACHE_DIR', tempfile.gettempdir())
+
+# Job huấn luyện chạy ở process riêng (utils/training_jobs.py, POST /major-recommendation/train):
+# số CPU/luồng TensorFlow của process huấn luyện (0: không giới hạn), mức nice (ưu tiên thấp hơn các worker phục vụ),
+# chu kỳ ghi heartbeat và kiểm tra yêu cầu hủy (giây), thời gian chờ process tự dừng sau khi hủy trước khi
+# buộc kết thúc (giây) và thời gian không có heartbeat để coi job đã dừng (giây)
+TRAINING_JOB_CPU_THREADS = int(os.getenv('TRAINING_JOB_CPU_THREADS', 2))
+TRAINING_JOB_NICE = int(os.getenv('TRAINING_JOB_NICE', 10))
+TRAINING_JOB_POLL_SECONDS = float(os.getenv('TRAINING_JOB_POLL_SECONDS', 2))
+TRAINING_JOB_CANCEL_GRACE_SECONDS = float(os.getenv('TRAINING_JOB_CANCEL_GRACE_SECONDS', 30))
+TRAINING_JOB_STALE_SECONDS = int(os.getenv('TRAINING_JOB_STALE_SECONDS', 300))
+
+# Token cho các API quản trị (huấn luyện /major-recommendation/train, /reference-data/reload),
+# gửi qua header X-Admin-Token. Để trống thì các API này bị tắt (service chạy --allow-unauthenticated trên Cloud Run)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+# Chu kỳ đọc lại mapping đang active trong model_mappings (giây)
+MODEL_MAPPINGS_REFRESH_SECONDS = int(os.getenv('MODEL_MAPPINGS_REFRESH_SECONDS', 300))
+
+# Chu kỳ làm mới dữ liệu tham chiếu (majors, universities, interests, subject_combinations), 0 để tắt
+REFERENCE_DATA_REFRESH_SECONDS = int(os.getenv('REFERENCE_DATA_REFRESH_SECONDS', 3600))
+
+# Chu kỳ kiểm tra phiên bản dữ liệu tham chiếu (data_versions) để mọi worker tải lại khi dữ liệu thay đổi (giây), 0 để tắt
+REFERENCE_DATA_VERSION_CHECK_SECONDS = int(os.getenv('REFERENCE_DATA_VERSION_CHECK_SECONDS', 30))
+
 # Đường dẫn đến thư mục lưu trữ mô hình
 MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ai_models')
 
@@ -27,7 +135,11 @@ COLLECTIONS = {
     'student_data': 'student_data',
     'model_configs': 'model_configs',
     'training_data': 'training_data',
+    'training_chunks': 'training_chunks',
+    'training_jobs': 'training_jobs',
+    'training_job_locks': 'training_job_locks',
     'benchmark_scores': 'benchmark_scores',
     'prediction_logs': 'prediction_logs',
-    'model_mappings': 'model_mappings'
+    'model_mappings': 'model_mappings',
+    'data_versions': 'data_versions'
 } 
\ No newline at end of file
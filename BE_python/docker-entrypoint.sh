@@ -13,4 +13,6 @@ if [ ! -d "ai_models/admission_probability" ]; then
 fi
 
 # Chạy ứng dụng Flask với gunicorn
-exec gunicorn --bind 0.0.0.0:5000 --workers 4 "app:create_app()" 
\ No newline at end of file
+export PORT="${PORT:-5000}"
+export GUNICORN_WORKERS="${GUNICORN_WORKERS:-4}"
+exec gunicorn --config gunicorn.conf.py app:app 
\ No newline at end of file
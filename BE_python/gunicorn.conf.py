@@ -0,0 +1,59 @@
+# Cấu hình gunicorn cho Python API
+# - Mặc định mỗi worker tự import app và tải mô hình ở luồng nền: /health trả lời ngay khi worker bind xong,
+#   /ready trả về 200 khi worker đã tải xong (xem utils/warmup.py)
+# - GUNICORN_PRELOAD=true: tải mô hình và dữ liệu tham chiếu một lần trong master, các worker dùng chung
+#   (copy-on-write, ít bộ nhớ hơn khi nhiều worker) nhưng không worker nào nhận request, kể cả /health,
+#   cho đến khi master tải xong. So sánh hai chế độ: python scripts/benchmark_startup.py --gunicorn
+# - post_fork: tạo lại kết nối MongoDB, luồng nền và mô hình TensorFlow trong từng worker
+import os
+import gc
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from utils.fork_safety import get_rss_mb, prepare_for_fork, reinitialize_after_fork
+
+_config_loaded_at = time.perf_counter()
+
+bind = f":{os.getenv('PORT', '8080')}"
+workers = int(os.getenv('GUNICORN_WORKERS', os.getenv('WEB_CONCURRENCY', 2)))
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 0))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true'
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+
+def when_ready(server):
+    if preload_app:
+        # Chờ luồng khởi động của app tải xong mô hình để các worker dùng chung bộ nhớ
+        # (fork khi luồng khởi động đang chạy không an toàn: khóa import/TensorFlow có thể đang bị giữ)
+        from utils.warmup import warmup
+        warmup.wait()
+    server.log.info(
+        f"Master sẵn sàng sau {(time.perf_counter() - _config_loaded_at) * 1000:.0f}ms "
+        f"(preload={preload_app}, workers={workers}, threads={threads}), RSS {get_rss_mb():.1f}MB"
+    )
+    if preload_app:
+        prepare_for_fork()
+        # Đưa các object đã tải vào thế hệ cố định để GC không ghi vào các trang bộ nhớ dùng chung
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    worker.boot_started_at = time.perf_counter()
+    reinit_ms = reinitialize_after_fork()
+    server.log.info(f"Worker {worker.pid}: đã khởi tạo lại tài nguyên sau fork trong {reinit_ms:.0f}ms")
+
+
+def post_worker_init(worker):
+    boot_ms = (time.perf_counter() - getattr(worker, 'boot_started_at', _config_loaded_at)) * 1000
+    worker.log.info(f"Worker {worker.pid} sẵn sàng sau {boot_ms:.0f}ms, RSS {get_rss_mb():.1f}MB")
+
+
+def worker_exit(server, worker):
+    # Ghi nốt prediction_logs/student_data còn trong hàng đợi của worker
+    write_behind_module = sys.modules.get('utils.write_behind')
+    if write_behind_module is not None:
+        write_behind_module.flush_all()
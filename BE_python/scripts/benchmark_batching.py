@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Script đo thông lượng dự đoán khi nhiều luồng cùng gửi request một dòng (giống gunicorn --threads),
+so sánh gọi predict trực tiếp với bộ gom batch (utils/batching.py)
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+
+# Thêm thư mục cha vào sys.path để import các module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.batching import MicroBatcher
+
+def load_model(model_name, backend):
+    """Tải mô hình từ đĩa bằng engine chỉ định, trả về (model, hàm predict theo batch, số đặc trưng)"""
+    if model_name == 'admission':
+        from ai_models.dudoanxacxuat.model_registry import AdmissionModelRegistry, MODEL_DIR, MODEL_FILENAME
+        model, _ = AdmissionModelRegistry(backend=backend or 'numpy')._load_model(os.path.join(MODEL_DIR, MODEL_FILENAME))
+        return model, lambda m, X: m.predict(X, verbose=0), len(np.load(os.path.join(MODEL_DIR, 'scaler_mean.npy')))
+
+    from ai_models.goiynganhhoc.model_cache import MajorModelCache, MODEL_DIR, find_latest_model_file
+    model, _ = MajorModelCache(serving_mode=backend or 'fused')._load_model(find_latest_model_file(MODEL_DIR))
+    return model, lambda m, X: m.predict_combined(X), len(np.load(os.path.join(MODEL_DIR, 'scaler_mean.npy')))
+
+def run(batcher, model, rows, threads):
+    """Mỗi luồng gửi lần lượt các dòng của mình, trả về (thông lượng, độ trễ từng request)"""
+    latencies = [[] for _ in range(threads)]
+
+    def worker(i):
+        for row in rows[i::threads]:
+            start = time.perf_counter()
+            batcher.predict(model, row)
+            latencies[i].append((time.perf_counter() - start) * 1000)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return len(rows) / elapsed, np.concatenate([np.asarray(values) for values in latencies])
+
+def main():
+    parser = argparse.ArgumentParser(description='Đo thông lượng dự đoán có và không gom batch')
+    parser.add_argument('--model', choices=['admission', 'major'], default='major', help='Mô hình cần đo')
+    parser.add_argument('--backend', help='Engine suy luận (mặc định: numpy/fused)')
+    parser.add_argument('--threads', type=int, default=8, help='Số luồng gửi request đồng thời')
+    parser.add_argument('--requests', type=int, default=4000, help='Tổng số request')
+    parser.add_argument('--max-batch-size', type=int, default=32, help='Kích thước batch tối đa')
+    parser.add_argument('--max-wait-ms', type=float, default=2, help='Thời gian chờ gom batch tối đa (ms)')
+    parser.add_argument('--min-predict-ms', type=float, default=1.0,
+                        help='Engine nhanh hơn ngưỡng này được gọi trực tiếp (0 để luôn gom batch)')
+
+    args = parser.parse_args()
+
+    model, predict_fn, input_dim = load_model(args.model, args.backend)
+    rows = np.random.default_rng(0).normal(size=(args.requests, input_dim))
+
+    print(f"{args.model}: {args.requests} request, {args.threads} luồng")
+    for label, enabled in (('trực tiếp', False), ('gom batch', True)):
+        batcher = MicroBatcher(f'{args.model}-benchmark', predict_fn, max_batch_size=args.max_batch_size,
+                               max_wait_ms=args.max_wait_ms, min_predict_ms=args.min_predict_ms, enabled=enabled)
+        batcher.predict(model, rows[0])
+        throughput, latencies = run(batcher, model, rows, args.threads)
+        stats = batcher.stats()
+        print(f"{label:<10} {throughput:>9.0f} request/s, p50 {np.percentile(latencies, 50):.3f}ms, "
+              f"p99 {np.percentile(latencies, 99):.3f}ms, batch trung bình {stats['avgBatchSize']}, "
+              f"lớn nhất {stats['maxObservedBatchSize']}, gọi trực tiếp {stats['direct']}, "
+              f"mỗi lần predict {stats['predictCostMs']}ms")
+
+if __name__ == '__main__':
+    main()
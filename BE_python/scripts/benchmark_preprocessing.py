@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Script đo thời gian tiền xử lý dữ liệu huấn luyện mô hình gợi ý ngành học:
+so sánh phiên bản theo cột (DataPreprocessor.preprocess_records) với phiên bản duyệt từng bản ghi
+(preprocess_records_loop bên dưới) trên dữ liệu tổng hợp, và kiểm tra hai kết quả giống hệt từng byte
+
+Dữ liệu tham chiếu (sở thích, tổ hợp môn, ngành) lấy tên từ mappings.json của mô hình hiện tại,
+không cần kết nối MongoDB. Thoát với mã 1 nếu kết quả khác nhau
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+from utils.reference_data import ReferenceDataSnapshot
+from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
+
+MAPPINGS_FILE = os.path.join(BASE_DIR, 'ai_models', 'goiynganhhoc', 'model', 'mappings.json')
+SUBJECTS = ['Toan', 'NguVan', 'VatLy', 'HoaHoc', 'SinhHoc', 'LichSu', 'DiaLy', 'GDCD', 'NgoaiNgu']
+
+def build_snapshot(rng):
+    """Ảnh chụp dữ liệu tham chiếu tổng hợp, mỗi ngành có vài sở thích liên quan"""
+    with open(MAPPINGS_FILE, 'r', encoding='utf-8') as f:
+        mappings = json.load(f)
+
+    interest_names = list(mappings['interest_to_id'])
+    majors = [
+        {'name': name, 'interests': [{'name': interest} for interest in rng.choice(interest_names, 3, replace=False)]}
+        for name in mappings['id_to_major'].values()
+    ]
+
+    documents = {
+        'interests': [{'name': name} for name in interest_names],
+        'subject_combinations': [{'code': code} for code in mappings['subject_comb_to_id']],
+        'majors': majors
+    }
+    return ReferenceDataSnapshot(documents, loaded_at=None, load_time_ms=0)
+
+def generate_records(n_records, snapshot, rng):
+    """Bản ghi tổng hợp theo định dạng của file dữ liệu huấn luyện (pd.read_csv(...).to_dict('records'))"""
+    interest_names = [interest['name'] for interest in snapshot.all('interests')] + ['Sở thích lạ']
+    group_codes = [comb['code'] for comb in snapshot.all('subject_combinations')] + ['Z99']
+    major_names = [major['name'] for major in snapshot.all('majors')] + ['ngành không tồn tại']
+
+    records = []
+    for i in range(n_records):
+        record = {'StudentID': f'S{i:06d}'}
+        for subject in SUBJECTS:
+            roll = rng.random()
+            record[subject] = float('nan') if roll < 0.3 else "" if roll < 0.32 else round(float(rng.uniform(0, 10)), 2)
+
+        roll = rng.random()
+        chosen = list(rng.choice(interest_names, rng.integers(1, 4), replace=False))
+        if roll < 0.05:
+            record['Interests'] = float('nan')
+        elif roll < 0.08:
+            record['Interests'] = [{'name': name} if j % 2 else name for j, name in enumerate(chosen)]
+        else:
+            record['Interests'] = (', ' if roll < 0.2 else ',').join(chosen)
+
+        record['Tohopthi'] = ['TN', 'XH', float('nan')][rng.integers(0, 3)]
+
+        for j in range(1, 4):
+            name = str(rng.choice(major_names))
+            record[f'Major_{j}'] = f' {name.upper()} ' if rng.random() < 0.1 else name
+            record[f'Score_{j}'] = 0.0 if rng.random() < 0.05 else round(float(rng.uniform(0, 1)), 3)
+            roll = rng.random()
+            record[f'Subject_Group_{j}'] = "" if roll < 0.05 else float('nan') if roll < 0.1 else str(rng.choice(group_codes))
+
+        if rng.random() < 0.02:
+            # Một số bản ghi thiếu hẳn cột
+            del record['Tohopthi'], record['Subject_Group_3'], record[SUBJECTS[i % len(SUBJECTS)]]
+        records.append(record)
+    return records
+
+def preprocess_records_loop(preprocessor, records):
+    """
+    Phiên bản tham chiếu của preprocess_records: duyệt từng bản ghi
+    (dùng để kiểm tra phiên bản theo cột cho kết quả giống hệt)
+
+    Args:
+        records: Danh sách dict (mỗi dict là một dòng của file dữ liệu huấn luyện)
+
+    Returns:
+        X, y: Mảng numpy của đặc trưng đầu vào và nhãn đầu ra
+    """
+    # Khởi tạo mảng
+    X = []
+    y = []
+
+    # Debug: Kiểm tra số lượng sở thích
+    print(f"DEBUG: Số lượng sở thích trong mô hình: {len(preprocessor.interest_to_id)}")
+    print(f"DEBUG: Một số sở thích đầu tiên: {list(preprocessor.interest_to_id.keys())[:5]}")
+
+    for record in records:
+        # Xử lý điểm số
+        scores = np.zeros(9)
+        for i, subject in enumerate(preprocessor.subjects):
+            if subject in record and record[subject] != "":
+                scores[i] = float(record[subject]) / 10.0  # Chuẩn hóa về [0,1]
+
+        # Xử lý khối thi (TN hoặc XH)
+        tohopthi = np.zeros(2)  # TN, XH
+        if 'Tohopthi' in record:
+            if record['Tohopthi'] == 'TN':
+                tohopthi[0] = 1.0
+            elif record['Tohopthi'] == 'XH':
+                tohopthi[1] = 1.0
+
+        # Xử lý sở thích - CẢI TIẾN: Kiểm tra nhiều định dạng có thể có
+        interests = np.zeros(len(preprocessor.interest_to_id))
+        if 'Interests' in record:
+            if isinstance(record['Interests'], str):
+                # Xử lý trường hợp Interests là chuỗi
+                student_interests = record['Interests'].split(',')
+                for interest in student_interests:
+                    interest = interest.strip()
+                    if interest in preprocessor.interest_to_id:
+                        interests[preprocessor.interest_to_id[interest]] = 1.0
+                    else:
+                        print(f"DEBUG: Không tìm thấy sở thích '{interest}' trong mapping")
+            elif isinstance(record['Interests'], list):
+                # Xử lý trường hợp Interests là danh sách
+                for interest in record['Interests']:
+                    if isinstance(interest, str) and interest in preprocessor.interest_to_id:
+                        interests[preprocessor.interest_to_id[interest]] = 1.0
+                    elif isinstance(interest, dict) and 'name' in interest and interest['name'] in preprocessor.interest_to_id:
+                        interests[preprocessor.interest_to_id[interest['name']]] = 1.0
+
+        # DEBUG: Kiểm tra nếu vector sở thích toàn 0
+        if np.sum(interests) == 0:
+            print(f"DEBUG: Record có vector sở thích toàn 0: {record.get('Interests', 'Không có')}")
+            # Nếu không có sở thích, thử áp dụng các sở thích từ ngành đã chọn
+            if 'Major_1' in record and record['Major_1']:
+                major_name = record['Major_1'].lower().strip()
+                # Tìm các sở thích liên quan đến ngành này từ dữ liệu majors
+                for major in preprocessor.majors:
+                    if major['name'].lower() == major_name and 'interests' in major:
+                        for interest_obj in major['interests']:
+                            if 'name' in interest_obj and interest_obj['name'] in preprocessor.interest_to_id:
+                                interests[preprocessor.interest_to_id[interest_obj['name']]] = 1.0
+
+        # Xử lý tổ hợp môn
+        subject_groups = np.zeros(len(preprocessor.subject_comb_to_id))
+
+        # Xử lý tổ hợp môn từ định dạng mới
+        for i in range(1, 4):  # Kiểm tra tất cả 3 lựa chọn ngành tiềm năng
+            subject_group_col = f'Subject_Group_{i}'
+            if subject_group_col in record and record[subject_group_col] != "":
+                group = record[subject_group_col]
+                if group in preprocessor.subject_comb_to_id:
+                    subject_groups[preprocessor.subject_comb_to_id[group]] = 1.0
+
+        # Gộp đặc trưng
+        features = np.concatenate([
+            scores,
+            tohopthi,
+            interests,
+            subject_groups
+        ])
+
+        X.append(features)
+
+        # Xử lý mục tiêu - ngành học ưu tiên và điểm số
+        major_scores = np.zeros(len(preprocessor.major_to_id))
+
+        # Xử lý từ định dạng mới (Major_1, Score_1, Major_2, Score_2, Major_3, Score_3)
+        for i in range(1, 4):
+            major_col = f'Major_{i}'
+            score_col = f'Score_{i}'
+            if major_col in record and score_col in record and record[major_col] and record[score_col]:
+                major = record[major_col].lower().strip()
+                if major in preprocessor.major_to_id:
+                    major_scores[preprocessor.major_to_id[major]] = float(record[score_col])
+                else:
+                    print(f"DEBUG: Không tìm thấy ngành '{major}' trong mapping")
+
+        y.append(major_scores)
+
+    return np.array(X), np.array(y)
+
+def measure(func, records, repeat):
+    """Thời gian trung vị (ms) của func(records), bỏ qua thông báo DEBUG và lần chạy khởi động (import pandas)"""
+    times = []
+    for i in range(repeat + 1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func(records)
+            if i > 0:
+                times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times)), result
+
+def main():
+    parser = argparse.ArgumentParser(description='So sánh tiền xử lý dữ liệu huấn luyện theo cột và theo từng bản ghi')
+    parser.add_argument('--records', type=int, default=100000, help='Số bản ghi tổng hợp')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần đo mỗi phiên bản')
+    parser.add_argument('--seed', type=int, default=0, help='Seed sinh dữ liệu')
+
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    snapshot = build_snapshot(rng)
+    with contextlib.redirect_stdout(io.StringIO()):
+        preprocessor = DataPreprocessor(snapshot=snapshot)
+    records = generate_records(args.records, snapshot, rng)
+
+    columnar_ms, (X, y) = measure(preprocessor.preprocess_records, records, args.repeat)
+    loop_ms, (X_loop, y_loop) = measure(lambda batch: preprocess_records_loop(preprocessor, batch), records, args.repeat)
+
+    identical = (
+        X.shape == X_loop.shape and y.shape == y_loop.shape and X.dtype == X_loop.dtype and y.dtype == y_loop.dtype
+        and X.tobytes() == X_loop.tobytes() and y.tobytes() == y_loop.tobytes()
+    )
+
+    print(f"{args.records} bản ghi, X {X.shape}, y {y.shape}")
+    print(f"theo từng bản ghi: {loop_ms:>10.1f}ms")
+    print(f"theo cột:          {columnar_ms:>10.1f}ms  (nhanh hơn {loop_ms / columnar_ms:.1f} lần)")
+    print(f"kết quả giống hệt: {'có' if identical else 'không'}")
+
+    if not identical:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Script đo thời gian khởi động nguội (cold start) của Python API
+
+Mỗi lần chạy dùng một process mới và đo:
+- Thời gian import app (thời điểm server có thể bind port và trả lời /health)
+- Thời gian trả lời /health ngay sau khi import
+- Thời gian đến khi /ready trả về 200 và thời gian từng bước khởi động
+- Các thư viện nặng (tensorflow, pandas, sklearn) đã bị import trước khi server nhận request
+
+Thoát với mã 1 nếu trung vị thời gian import vượt ngân sách (--budget-ms) hoặc
+TensorFlow bị import trên đường khởi động
+
+Với --gunicorn: chạy gunicorn thật (gunicorn.conf.py) lần lượt với GUNICORN_PRELOAD=false và true,
+đo thời gian đến khi /health trả về 200, đến khi khởi động xong (/ready) và tổng bộ nhớ PSS
+của master và các worker
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('tensorflow', 'pandas', 'sklearn')
+
+
+def measure_once(ready_timeout):
+    """Chạy trong process con: import app, gọi /health rồi chờ /ready"""
+    sys.path.insert(0, BASE_DIR)
+    os.chdir(BASE_DIR)
+
+    start = time.perf_counter()
+    from app import app
+    import_ms = (time.perf_counter() - start) * 1000
+    heavy_at_import = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    client = app.test_client()
+    health_start = time.perf_counter()
+    health_status = client.get('/health').status_code
+    health_ms = (time.perf_counter() - health_start) * 1000
+
+    from utils.warmup import warmup
+    warmup.wait(ready_timeout)
+    ready_response = client.get('/ready')
+    ready_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        'importMs': round(import_ms, 1),
+        'healthMs': round(health_ms, 1),
+        'healthStatus': health_status,
+        'readyMs': round(ready_ms, 1),
+        'readyStatus': ready_response.status_code,
+        'heavyModulesAtImport': heavy_at_import,
+        'warmup': ready_response.get_json()['warmup']
+    }
+
+
+def run_child(ready_timeout):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', '--ready-timeout', str(ready_timeout)],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    # Kết quả là dòng cuối cùng (các dòng trước là log của app)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def http_get(port, path):
+    """GET http://127.0.0.1:port/path, trả về (mã trạng thái, JSON) hoặc (None, None) nếu chưa kết nối được"""
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}{path}', timeout=2) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or 'null')
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        return None, None
+
+
+def process_tree_pss_mb(pid):
+    """Tổng PSS (MB) của process và các process con trực tiếp (trang dùng chung chia đều), None nếu không có /proc"""
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids = [pid] + [int(child) for child in f.read().split()]
+        total_kb = 0
+        for item in pids:
+            with open(f'/proc/{item}/smaps_rollup') as f:
+                total_kb += next(int(line.split()[1]) for line in f if line.startswith('Pss:'))
+        return round(total_kb / 1024, 1)
+    except (OSError, StopIteration, ValueError):
+        return None
+
+
+def measure_gunicorn(preload, workers, port, ready_timeout):
+    """Chạy gunicorn với GUNICORN_PRELOAD bật/tắt, đo đến khi /health trả về 200 và đến khi khởi động xong"""
+    env = dict(
+        os.environ, PYTHONDONTWRITEBYTECODE='1', PORT=str(port),
+        GUNICORN_PRELOAD='true' if preload else 'false', GUNICORN_WORKERS=str(workers)
+    )
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'app:app'],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    result = {'healthMs': None, 'warmupMs': None, 'readyStatus': None, 'warmupState': None, 'pssMb': None}
+
+    try:
+        while time.perf_counter() - start < ready_timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"gunicorn đã thoát với mã {process.returncode}")
+
+            if result['healthMs'] is None and http_get(port, '/health')[0] == 200:
+                result['healthMs'] = round((time.perf_counter() - start) * 1000, 1)
+
+            if result['healthMs'] is not None:
+                # Không preload: /ready do worker nhận request trả lời, tức worker đầu tiên khởi động xong
+                status, body = http_get(port, '/ready')
+                state = (body or {}).get('warmup', {}).get('state')
+                if state in ('ready', 'failed'):
+                    result.update({
+                        'warmupMs': round((time.perf_counter() - start) * 1000, 1),
+                        'readyStatus': status,
+                        'warmupState': state,
+                        'pssMb': process_tree_pss_mb(process.pid)
+                    })
+                    break
+            time.sleep(0.05)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    return result
+
+
+def compare_gunicorn_modes(runs, workers, port, ready_timeout):
+    """So sánh GUNICORN_PRELOAD=false và true, mỗi chế độ chạy runs lần"""
+    for preload in (False, True):
+        results = []
+        for i in range(runs):
+            result = measure_gunicorn(preload, workers, port, ready_timeout)
+            results.append(result)
+            print(f"preload={preload} lần {i + 1}: /health 200 sau {result['healthMs']}ms, "
+                  f"khởi động {result['warmupState']} (/ready {result['readyStatus']}) sau {result['warmupMs']}ms, "
+                  f"PSS {result['pssMb']}MB")
+
+        def median(key):
+            values = [result[key] for result in results if result[key] is not None]
+            return f"{statistics.median(values):.0f}" if values else '-'
+
+        print(f"=> preload={preload}, {workers} worker: trung vị /health {median('healthMs')}ms, "
+              f"khởi động xong {median('warmupMs')}ms, PSS {median('pssMb')}MB\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Đo thời gian khởi động nguội của Python API')
+    parser.add_argument('--runs', type=int, default=3, help='Số lần đo (mỗi lần một process mới)')
+    parser.add_argument('--budget-ms', type=float, default=2000, help='Ngân sách thời gian import app (ms)')
+    parser.add_argument('--ready-timeout', type=float, default=120, help='Thời gian chờ /ready tối đa (giây)')
+    parser.add_argument('--gunicorn', action='store_true', help='So sánh gunicorn với GUNICORN_PRELOAD=false và true')
+    parser.add_argument('--workers', type=int, default=2, help='Số worker gunicorn (với --gunicorn)')
+    parser.add_argument('--port', type=int, default=18080, help='Cổng gunicorn (với --gunicorn)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.gunicorn:
+        compare_gunicorn_modes(args.runs, args.workers, args.port, args.ready_timeout)
+        return
+
+    if args.child:
+        print(json.dumps(measure_once(args.ready_timeout), ensure_ascii=False))
+        return
+
+    results = []
+    for i in range(args.runs):
+        result = run_child(args.ready_timeout)
+        results.append(result)
+        steps = ', '.join(f"{name} {step['status']} {step['durationMs']}ms"
+                          for name, step in result['warmup']['steps'].items())
+        print(f"Lần {i + 1}: import {result['importMs']}ms, /health {result['healthStatus']} "
+              f"({result['healthMs']}ms), /ready {result['readyStatus']} sau {result['readyMs']}ms [{steps}]")
+
+    import_median = statistics.median(result['importMs'] for result in results)
+    ready_median = statistics.median(result['readyMs'] for result in results)
+    heavy = sorted({name for result in results for name in result['heavyModulesAtImport']})
+
+    print(f"\nTrung vị: import app {import_median:.0f}ms (ngân sách {args.budget_ms:.0f}ms), /ready {ready_median:.0f}ms")
+    print(f"Thư viện nặng bị import khi khởi động: {', '.join(heavy) or 'không có'}")
+
+    ok = import_median <= args.budget_ms and 'tensorflow' not in heavy
+    if not ok:
+        print("Vượt ngân sách thời gian khởi động")
+        sys.exit(1)
+
+    print("Thời gian khởi động nằm trong ngân sách")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Script so sánh các engine suy luận (keras, numpy/fused, tflite) của mô hình dự đoán xác suất
+và mô hình gợi ý ngành học trên các file test_data_*.csv
+
+Mỗi engine chạy trong một process riêng để đo:
+- Sai số tuyệt đối lớn nhất so với Keras
+- Thời gian tải mô hình và bộ nhớ (RSS) tăng thêm sau khi tải
+- Thời gian dự đoán cả batch và độ trễ dự đoán từng mẫu (p50, p99)
+
+Thoát với mã 1 nếu có engine sai lệch so với Keras vượt quá --atol
+Cần chạy scripts/export_tflite.py trước để có file .tflite
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+from utils.fork_safety import get_rss_mb
+
+BACKENDS = {
+    'admission': ('keras', 'numpy', 'tflite'),
+    'major': ('keras', 'fused', 'tflite')
+}
+TEST_FILES = {
+    'admission': [os.path.join(BASE_DIR, 'ai_models', 'dudoanxacxuat', f'test_data_{n}.csv') for n in (2000, 6000)],
+    'major': [os.path.join(BASE_DIR, 'ai_models', 'goiynganhhoc', f'test_data_{n}.csv') for n in (2000, 6000)]
+}
+SINGLE_ROW_SAMPLES = 200
+
+def build_admission_features(test_file):
+    import pandas as pd
+    from ai_models.dudoanxacxuat.model_registry import MODEL_DIR
+
+    with open(os.path.join(MODEL_DIR, 'features.txt'), 'r', encoding='utf-8') as f:
+        features = f.read().splitlines()
+
+    df = pd.read_csv(test_file)
+    if 'Chênh lệch điểm' not in df.columns:
+        df['Chênh lệch điểm'] = df['Điểm học sinh'] - df['Điểm chuẩn dự kiến']
+
+    scaler_mean = np.load(os.path.join(MODEL_DIR, 'scaler_mean.npy'))
+    scaler_scale = np.load(os.path.join(MODEL_DIR, 'scaler_scale.npy'))
+    return (df[features].values - scaler_mean) / scaler_scale
+
+def build_major_features(test_file):
+    import pandas as pd
+    from ai_models.goiynganhhoc.model_cache import MODEL_DIR
+    from ai_models.goiynganhhoc.fused_head import csv_row_to_student_data
+    from ai_models.goiynganhhoc.data_preprocessing import DataPreprocessor
+
+    with open(os.path.join(MODEL_DIR, 'mappings.json'), 'r', encoding='utf-8') as f:
+        mappings = json.load(f)
+
+    df = pd.read_csv(test_file, encoding='utf-8-sig')
+    scores_order = mappings.get('scores_order', [])
+    X = np.array([
+        DataPreprocessor.preprocess_with_mappings(csv_row_to_student_data(row, scores_order), mappings)
+        for _, row in df.iterrows()
+    ])
+
+    scaler_mean = np.load(os.path.join(MODEL_DIR, 'scaler_mean.npy'))
+    scaler_scale = np.load(os.path.join(MODEL_DIR, 'scaler_scale.npy'))
+    return (X - scaler_mean) / scaler_scale
+
+def measure_backend(model_name, backend, input_path, output_path):
+    """Chạy trong process con: tải mô hình bằng engine chỉ định, dự đoán và đo thời gian"""
+    X = np.load(input_path)
+    rss_before = get_rss_mb()
+
+    start = time.perf_counter()
+    if model_name == 'admission':
+        from ai_models.dudoanxacxuat.model_registry import AdmissionModelRegistry, MODEL_DIR, MODEL_FILENAME
+        model, used_backend = AdmissionModelRegistry(backend=backend)._load_model(os.path.join(MODEL_DIR, MODEL_FILENAME))
+        predict = lambda batch: np.asarray(model.predict(batch, verbose=0)).reshape(len(batch), -1)
+    else:
+        from ai_models.goiynganhhoc.model_cache import MajorModelCache, MODEL_DIR, find_latest_model_file
+        model, used_backend = MajorModelCache(serving_mode=backend)._load_model(find_latest_model_file(MODEL_DIR))
+        predict = lambda batch: np.asarray(model.predict_combined(batch))
+    predict(X[:1])
+    load_ms = (time.perf_counter() - start) * 1000
+
+    batch_times = []
+    for _ in range(5):
+        start = time.perf_counter()
+        predictions = predict(X)
+        batch_times.append((time.perf_counter() - start) * 1000)
+
+    single_times = []
+    for row in X[:SINGLE_ROW_SAMPLES]:
+        start = time.perf_counter()
+        predict(row.reshape(1, -1))
+        single_times.append((time.perf_counter() - start) * 1000)
+
+    np.save(output_path, predictions)
+    if used_backend == 'tflite':
+        # RSS và thời gian tải phụ thuộc runtime (tflite_runtime nhỏ hơn nhiều so với tensorflow)
+        used_backend = f"tflite/{model.runtime}"
+    return {
+        'backend': used_backend,
+        'loadMs': round(load_ms, 1),
+        'rssMb': round(get_rss_mb() - rss_before, 1),
+        'batchMs': round(float(np.median(batch_times)), 2),
+        'singleP50Ms': round(float(np.percentile(single_times, 50)), 3),
+        'singleP99Ms': round(float(np.percentile(single_times, 99)), 3)
+    }
+
+def run_backend(model_name, backend, input_path, output_path):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', model_name, backend, input_path, output_path],
+        cwd=BASE_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    # Kết quả là dòng cuối cùng (các dòng trước là log khi tải mô hình)
+    return json.loads(output.strip().splitlines()[-1])
+
+def compare(model_name, test_file, atol, work_dir):
+    X = build_admission_features(test_file) if model_name == 'admission' else build_major_features(test_file)
+    input_path = os.path.join(work_dir, f'{model_name}_X.npy')
+    np.save(input_path, X)
+
+    print(f"\n{model_name} - {os.path.basename(test_file)} ({len(X)} mẫu, {X.shape[1]} đặc trưng)")
+    print(f"{'engine':<10}{'dùng':<22}{'sai số':>10}{'tải (ms)':>10}{'RSS (MB)':>10}{'batch (ms)':>12}{'p50 (ms)':>10}{'p99 (ms)':>10}")
+
+    reference = None
+    ok = True
+    for backend in BACKENDS[model_name]:
+        output_path = os.path.join(work_dir, f'{model_name}_{backend}.npy')
+        result = run_backend(model_name, backend, input_path, output_path)
+        predictions = np.load(output_path)
+        if reference is None:
+            reference = predictions
+        max_error = float(np.max(np.abs(predictions - reference)))
+        ok = ok and max_error <= atol
+
+        print(f"{backend:<10}{result['backend']:<22}{max_error:>10.1e}{result['loadMs']:>10.0f}{result['rssMb']:>10.1f}"
+              f"{result['batchMs']:>12.2f}{result['singleP50Ms']:>10.3f}{result['singleP99Ms']:>10.3f}")
+
+    return ok
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        print(json.dumps(measure_backend(*sys.argv[2:6])))
+        return
+
+    parser = argparse.ArgumentParser(description='So sánh các engine suy luận với Keras')
+    parser.add_argument('--model', choices=['admission', 'major', 'all'], default='all', help='Mô hình cần so sánh')
+    parser.add_argument('--atol', type=float, default=1e-5, help='Sai số tuyệt đối cho phép so với Keras')
+
+    args = parser.parse_args()
+    model_names = ['admission', 'major'] if args.model == 'all' else [args.model]
+
+    ok = True
+    with tempfile.TemporaryDirectory() as work_dir:
+        for model_name in model_names:
+            for test_file in TEST_FILES[model_name]:
+                if os.path.exists(test_file):
+                    ok = compare(model_name, test_file, args.atol, work_dir) and ok
+
+    if not ok:
+        print(f"\nCó engine sai lệch so với Keras vượt quá {args.atol:.0e}")
+        sys.exit(1)
+
+    print("\nTất cả engine khớp với Keras")
+
+if __name__ == '__main__':
+    main()
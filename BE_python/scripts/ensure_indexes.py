@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Script tạo index cho các collection thường xuyên truy vấn và kiểm tra kế hoạch truy vấn bằng explain()
+
+Thoát với mã 1 nếu có index tạo lỗi, index đã có nhưng khác tùy chọn, hoặc có truy vấn tiêu biểu phải quét toàn bộ collection (COLLSCAN)
+"""
+import os
+import sys
+import argparse
+
+# Thêm thư mục cha vào sys.path để import các module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db_indexes import ensure_indexes, verify_query_plans, ensure_indexes_and_verify
+
+def main():
+    parser = argparse.ArgumentParser(description='Tạo index và kiểm tra kế hoạch truy vấn MongoDB')
+    parser.add_argument('--verify-only', action='store_true', help='Chỉ kiểm tra kế hoạch truy vấn, không tạo index')
+    parser.add_argument('--skip-verify', action='store_true', help='Chỉ tạo index, không kiểm tra kế hoạch truy vấn')
+
+    args = parser.parse_args()
+
+    if args.verify_only:
+        results = verify_query_plans()
+        for result in results:
+            status = 'LỖI COLLSCAN' if result['collscan'] else 'OK'
+            print(f"[explain] {status} - {result['name']} ({result['collection']}): {' > '.join(result['stages'])}")
+        ok = not any(result['collscan'] for result in results)
+    elif args.skip_verify:
+        results = ensure_indexes()
+        for result in results:
+            print(f"[index] {result['collection']} {result['index']}: {result['status']}")
+            if result['error']:
+                print(f"[index]   LỖI: {result['error']}")
+        ok = all(result['status'] not in ('failed', 'mismatch') for result in results)
+    else:
+        ok = ensure_indexes_and_verify()
+
+    if not ok:
+        print("Kiểm tra index thất bại")
+        sys.exit(1)
+
+    print("Tất cả index đã sẵn sàng")
+
+if __name__ == '__main__':
+    main()
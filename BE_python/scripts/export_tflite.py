@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Script xuất mô hình dự đoán xác suất và mô hình gợi ý ngành học từ .h5 sang TFLite
+
+File .tflite được ghi cạnh file .h5 cùng tên (scaler_mean.npy, scaler_scale.npy dùng chung trong
+cùng thư mục) và được dùng khi ADMISSION_INFERENCE_BACKEND=tflite / MAJOR_MODEL_SERVING_MODE=tflite.
+Cần TensorFlow đầy đủ để xuất, khi phục vụ chỉ cần tflite-runtime (xem requirements-serving.txt).
+"""
+import os
+import sys
+import argparse
+
+# Thêm thư mục cha vào sys.path để import các module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_models.tflite_inference import export_keras_model, tflite_path_for, TFLiteModel
+from ai_models.dudoanxacxuat.model_registry import MODEL_DIR as ADMISSION_MODEL_DIR, MODEL_FILENAME as ADMISSION_MODEL_FILENAME
+from ai_models.goiynganhhoc.model_cache import MODEL_DIR as MAJOR_MODEL_DIR, find_latest_model_file
+
+def export_model(model_path, float16=False):
+    """Xuất một file .h5 và kiểm tra nhanh file .tflite vừa tạo"""
+    import numpy as np
+    import tensorflow as tf
+
+    keras_model = tf.keras.models.load_model(model_path, compile=False)
+    output_path = tflite_path_for(model_path)
+    size = export_keras_model(keras_model, output_path, float16=float16, source_path=model_path)
+
+    # Kiểm tra nhanh trên dữ liệu ngẫu nhiên
+    tflite_model = TFLiteModel(output_path)
+    X = np.random.default_rng(0).normal(size=(64, tflite_model.input_dim)).astype(np.float32)
+    keras_preds = keras_model.predict(X, verbose=0)
+    if isinstance(keras_preds, list):
+        keras_preds = np.concatenate([pred.reshape(len(X), -1) for pred in keras_preds], axis=1)
+    max_error = float(np.max(np.abs(keras_preds - tflite_model.predict(X))))
+
+    print(f"Đã xuất {output_path} ({size / 1024:.1f} KB, {tflite_model.output_dim} đầu ra), "
+          f"sai số lớn nhất so với Keras: {max_error:.2e}")
+    return output_path
+
+def main():
+    parser = argparse.ArgumentParser(description='Xuất mô hình .h5 sang TFLite')
+    parser.add_argument('--admission', action='store_true', help='Chỉ xuất mô hình dự đoán xác suất')
+    parser.add_argument('--major', action='store_true', help='Chỉ xuất mô hình gợi ý ngành học')
+    parser.add_argument('--major-model', help='File .h5 của mô hình gợi ý ngành học (mặc định: file mới nhất)')
+    parser.add_argument('--float16', action='store_true', help='Lưu trọng số dạng float16 (file nhỏ hơn, sai số lớn hơn)')
+
+    args = parser.parse_args()
+    export_all = not args.admission and not args.major
+
+    if args.admission or export_all:
+        model_path = os.path.join(ADMISSION_MODEL_DIR, ADMISSION_MODEL_FILENAME)
+        if not os.path.exists(model_path):
+            print(f"Không tìm thấy mô hình dự đoán xác suất tại {model_path}")
+            sys.exit(1)
+        export_model(model_path, float16=args.float16)
+
+    if args.major or export_all:
+        model_path = args.major_model or find_latest_model_file(MAJOR_MODEL_DIR)
+        if model_path is None or not os.path.exists(model_path):
+            print(f"Không tìm thấy mô hình gợi ý ngành học trong {MAJOR_MODEL_DIR}")
+            sys.exit(1)
+        export_model(model_path, float16=args.float16)
+
+if __name__ == '__main__':
+    main()
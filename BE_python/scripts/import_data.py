@@ -13,6 +13,9 @@ import argparse
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.db_utils import db_client
+from utils.data_versions import bump_data_version
+from utils.training_store import TrainingDataWriter
+from config.config import TRAINING_CHUNK_SIZE
 
 def import_subjects(file_path):
     """Nhập dữ liệu môn học từ CSV"""
@@ -34,6 +37,7 @@ def import_subjects(file_path):
         
         # Thêm dữ liệu mới
         result = db_client.insert_many('subjects', records)
+        bump_data_version('subjects')
         print(f"Đã thêm {len(result.inserted_ids)} bản ghi vào collection subjects")
         
         return True
@@ -65,6 +69,7 @@ def import_subject_combinations(file_path):
         
         # Thêm dữ liệu mới
         result = db_client.insert_many('subject_combinations', records)
+        bump_data_version('subject_combinations')
         print(f"Đã thêm {len(result.inserted_ids)} bản ghi vào collection subject_combinations")
         
         return True
@@ -92,6 +97,7 @@ def import_interests(file_path):
         
         # Thêm dữ liệu mới
         result = db_client.insert_many('interests', records)
+        bump_data_version('interests')
         print(f"Đã thêm {len(result.inserted_ids)} bản ghi vào collection interests")
         
         return True
@@ -127,6 +133,7 @@ def import_universities(file_path):
         
         # Thêm dữ liệu mới
         result = db_client.insert_many('universities', records)
+        bump_data_version('universities')
         print(f"Đã thêm {len(result.inserted_ids)} bản ghi vào collection universities")
         
         return True
@@ -201,6 +208,7 @@ def import_majors(file_path, market_trend_file=None):
         
         # Thêm dữ liệu mới
         result = db_client.insert_many('majors', records)
+        bump_data_version('majors')
         print(f"Đã thêm {len(result.inserted_ids)} bản ghi vào collection majors")
         
         return True
@@ -306,6 +314,7 @@ def import_admission_criteria(file_path):
         
         # Thêm dữ liệu mới
         result = db_client.insert_many('admission_criteria', records)
+        bump_data_version('admission_criteria')
         print(f"Đã thêm {len(result.inserted_ids)} bản ghi vào collection admission_criteria")
         
         return True
@@ -313,34 +322,16 @@ def import_admission_criteria(file_path):
         print(f"Lỗi khi nhập dữ liệu tiêu chí tuyển sinh: {e}")
         return False
 
-def import_training_data(file_path, model_type):
-    """Nhập dữ liệu huấn luyện từ CSV"""
+def import_training_data(file_path, model_type, chunk_size=TRAINING_CHUNK_SIZE):
+    """Nhập dữ liệu huấn luyện từ CSV, đọc và ghi theo từng chunk (utils/training_store.py)"""
     try:
-        # Đọc CSV
-        df = pd.read_csv(file_path)
-        print(f"Đọc được {len(df)} bản ghi từ {file_path}")
-        
-        # Chuyển DataFrame thành danh sách dict
-        records = df.to_dict('records')
-        
-        # Tạo document để import
-        document = {
-            'modelType': model_type,
-            'dataSource': 'synthetic',
-            'dataVersion': '1.0',
-            'records': records,
-            'metadata': {
-                'totalRecords': len(records),
-                'createdAt': datetime.now(),
-                'updatedAt': datetime.now()
-            }
-        }
-        
-        # Xóa dữ liệu cũ nếu có
-        db_client.delete_many('training_data', {'modelType': model_type})
-        
-        # Thêm dữ liệu mới
-        result = db_client.insert_one('training_data', document)
+        # Đọc CSV theo từng chunk, không giữ toàn bộ file trong bộ nhớ; bộ dữ liệu cũ
+        # của cùng loại mô hình chỉ bị thay khi đã ghi xong toàn bộ chunk
+        with TrainingDataWriter(model_type, data_source='synthetic', data_version='1.0', chunk_size=chunk_size) as writer:
+            for df in pd.read_csv(file_path, chunksize=chunk_size):
+                writer.write(df.to_dict('records'))
+
+        print(f"Đọc được {writer.total_records} bản ghi từ {file_path} ({writer.chunk_count} chunk)")
         print(f"Đã thêm dữ liệu huấn luyện cho mô hình {model_type}")
         
         return True
@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Script tìm siêu tham số cho mô hình dự đoán xác suất (epochs, batch_size, learning_rate, optimizer,
+các tầng ẩn, dropout) thay cho việc sửa tay train_model.py rồi chạy lại
+
+- Dữ liệu được đọc, tiền xử lý và chuẩn hóa một lần (cùng cách chia train/validation với train_model.py),
+  các mảng đặt trong shared memory để mọi process huấn luyện dùng chung, không sao chép qua pickle
+- Mỗi cấu hình được huấn luyện trong một process của pool, mỗi process giới hạn số luồng TensorFlow
+- Bảng xếp hạng theo MAE trên tập validation kèm độ trễ dự đoán một dòng bằng engine phục vụ,
+  ghi vào ai_models/dudoanxacxuat/sweeps/<thời gian>/leaderboard.csv và leaderboard.json
+- Cấu hình đứng đầu được đưa vào thư mục models/ của mô hình (--no-promote để chỉ xếp hạng),
+  siêu tham số lưu vào models/hyperparameters.json để train_model.py dùng cho các lần huấn luyện sau
+
+Không gian tìm kiếm là file JSON {tên siêu tham số: [các giá trị]}, siêu tham số không có trong file
+giữ giá trị mặc định (DEFAULT_HYPERPARAMETERS của train_model.py), ví dụ:
+    {"learning_rate": [0.01, 0.05], "optimizer": ["sgd", "adam"], "hidden_units": [[16, 8], [32, 16]]}
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import itertools
+import traceback
+import numpy as np
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context, shared_memory
+
+# Thêm thư mục cha vào sys.path để import các module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import ADMISSION_INFERENCE_BACKEND, TRAINING_JOB_NICE
+from utils.training_jobs import limit_cpu
+from ai_models.training_pipeline import ChunkedTrainingSet
+from ai_models.tflite_inference import export_keras_model, tflite_path_for
+from ai_models.dudoanxacxuat.model_registry import AdmissionModelRegistry, MODEL_DIR, MODEL_FILENAME
+from ai_models.dudoanxacxuat.train_model import (
+    DEFAULT_HYPERPARAMETERS, FEATURES, load_training_source, train_model, save_model, save_hyperparameters
+)
+
+SWEEP_DIR = os.path.join(os.path.dirname(MODEL_DIR), 'sweeps')
+
+# Không gian tìm kiếm mặc định khi không truyền --space
+DEFAULT_SEARCH_SPACE = {
+    'learning_rate': [0.01, 0.03, 0.1],
+    'optimizer': ['sgd', 'adam'],
+    'batch_size': [32, 64, 128],
+    'hidden_units': [[16, 8], [32, 16], [64, 32]],
+    'dropout': [0.2, 0.5]
+}
+
+LEADERBOARD_COLUMNS = [
+    'rank', 'trial', 'status', 'val_mae', 'val_mse', 'latency_p50_ms', 'latency_p95_ms', 'engine',
+    'epochs_run', 'best_epoch', 'train_seconds'
+]
+
+# Trong mỗi process của pool: các block shared memory (giữ tham chiếu để buffer không bị giải phóng)
+# và các mảng numpy trỏ vào chúng
+_worker_blocks = []
+_worker_arrays = {}
+
+def load_search_space(path):
+    """Đọc không gian tìm kiếm từ file JSON, None: dùng DEFAULT_SEARCH_SPACE"""
+    if path is None:
+        return DEFAULT_SEARCH_SPACE
+
+    with open(path, 'r', encoding='utf-8') as f:
+        space = json.load(f)
+
+    for key, values in space.items():
+        if key not in DEFAULT_HYPERPARAMETERS:
+            raise ValueError(f"Siêu tham số không hợp lệ: {key} (chỉ hỗ trợ {', '.join(DEFAULT_HYPERPARAMETERS)})")
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"Giá trị của {key} phải là danh sách không rỗng")
+    return space
+
+def expand_search_space(space, max_trials=None, seed=42):
+    """
+    Các cấu hình cần huấn luyện: toàn bộ lưới tổ hợp, hoặc max_trials cấu hình chọn ngẫu nhiên
+    trong lưới nếu lưới lớn hơn
+    """
+    keys = sorted(space)
+    configs = [
+        {**DEFAULT_HYPERPARAMETERS, **dict(zip(keys, values))}
+        for values in itertools.product(*(space[key] for key in keys))
+    ]
+    if max_trials and len(configs) > max_trials:
+        configs = random.Random(seed).sample(configs, max_trials)
+    return configs
+
+def load_arrays(max_samples=None):
+    """
+    Đọc và chuẩn hóa dữ liệu một lần (scaler tính trên tập train như train_model.py)
+
+    Returns:
+        arrays: {'X_train', 'y_train', 'X_val', 'y_val'} kiểu float32, scaler, số dòng train + validation;
+        None nếu không có dữ liệu
+    """
+    source = load_training_source()
+    if source is None:
+        return None
+
+    with ChunkedTrainingSet(source, validation_split=0.2, seed=42, cache='none') as data:
+        stats = data.scan()
+        X_train, y_train = data.sample(validation=False, max_rows=max_samples)
+        X_val, y_val = data.sample(validation=True, max_rows=max_samples)
+
+    arrays = {
+        'X_train': data.scaler.transform(X_train).astype(np.float32),
+        'y_train': y_train.reshape(-1).astype(np.float32),
+        'X_val': data.scaler.transform(X_val).astype(np.float32),
+        'y_val': y_val.reshape(-1).astype(np.float32)
+    }
+    return arrays, data.scaler, stats['train_rows'] + stats['validation_rows']
+
+def share_arrays(arrays):
+    """Chép các mảng vào shared memory, trả về (các block, mô tả {tên: (tên block, shape, dtype)})"""
+    blocks, specs = [], {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+def init_worker(specs, threads, niceness):
+    """Khởi tạo process của pool: giới hạn CPU và gắn các mảng trong shared memory (chỉ đọc)"""
+    limit_cpu(threads, niceness, pin=False)
+
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+        array.flags.writeable = False
+        _worker_blocks.append(block)
+        _worker_arrays[name] = array
+
+def run_trial(trial_id, hyperparameters, trial_dir, seed):
+    """Huấn luyện một cấu hình trong process của pool, lưu mô hình vào trial_dir"""
+    import tensorflow as tf
+
+    tf.keras.utils.set_random_seed(seed)
+    os.makedirs(trial_dir, exist_ok=True)
+    X_train, y_train = _worker_arrays['X_train'], _worker_arrays['y_train']
+    X_val, y_val = _worker_arrays['X_val'], _worker_arrays['y_val']
+
+    start = time.perf_counter()
+    model, history = train_model(
+        X_train, y_train, X_val, y_val, hyperparameters,
+        checkpoint_path=os.path.join(trial_dir, 'best_model.h5'),
+        verbose=0
+    )
+    train_seconds = time.perf_counter() - start
+
+    y_pred = model.predict(X_val, batch_size=4096, verbose=0).reshape(-1)
+    model_path = os.path.join(trial_dir, MODEL_FILENAME)
+    model.save(model_path)
+
+    val_loss = history.history['val_loss']
+    return {
+        'trial': trial_id,
+        'status': 'ok',
+        'hyperparameters': hyperparameters,
+        'val_mae': float(np.mean(np.abs(y_val - y_pred))),
+        'val_mse': float(np.mean((y_val - y_pred) ** 2)),
+        'epochs_run': len(val_loss),
+        'best_epoch': int(np.nanargmin(val_loss)) + 1 if not np.all(np.isnan(val_loss)) else None,
+        'train_seconds': round(train_seconds, 2),
+        'model_path': model_path
+    }
+
+def run_sweep(configs, specs, output_dir, workers, threads, niceness, seed):
+    """Huấn luyện các cấu hình song song, cấu hình lỗi được ghi lại với status 'failed'"""
+    results = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=get_context('spawn'),  # TensorFlow không an toàn khi fork
+        initializer=init_worker,
+        initargs=(specs, threads, niceness)
+    ) as executor:
+        futures = {
+            executor.submit(run_trial, i, params, os.path.join(output_dir, f'trial_{i:03d}'), seed + i): (i, params)
+            for i, params in enumerate(configs)
+        }
+        for future in as_completed(futures):
+            trial_id, params = futures[future]
+            try:
+                result = future.result()
+                print(f"[{len(results) + 1}/{len(configs)}] trial {trial_id}: MAE {result['val_mae']:.5f}, "
+                      f"{result['epochs_run']} epoch, {result['train_seconds']:.1f}s - {params}")
+            except Exception as e:
+                traceback.print_exc()
+                result = {'trial': trial_id, 'status': 'failed', 'hyperparameters': params, 'error': str(e)}
+                print(f"[{len(results) + 1}/{len(configs)}] trial {trial_id} lỗi: {e}")
+            results.append(result)
+    return results
+
+def measure_latency(model_path, X, backend, runs=200):
+    """Độ trễ dự đoán một dòng (ms) bằng engine phục vụ, trả về (engine, p50, p95)"""
+    if backend == 'tflite':
+        import tensorflow as tf
+        export_keras_model(tf.keras.models.load_model(model_path, compile=False), tflite_path_for(model_path),
+                           source_path=model_path)
+
+    model, engine = AdmissionModelRegistry(backend=backend)._load_model(model_path)
+    rows = X[np.arange(runs) % len(X)]
+    for row in rows[:10]:
+        model.predict(row[None, :], verbose=0)
+
+    latencies = []
+    for row in rows:
+        start = time.perf_counter()
+        model.predict(row[None, :], verbose=0)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return engine, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 95))
+
+def rank_trials(results, max_latency_ms=None):
+    """
+    Xếp hạng theo MAE validation tăng dần (cùng MAE: độ trễ p95 thấp hơn đứng trước). Cấu hình lỗi,
+    MAE không hữu hạn hoặc p95 vượt max_latency_ms không được xếp hạng
+    """
+    def eligible(result):
+        return (
+            result['status'] == 'ok' and np.isfinite(result['val_mae'])
+            and (max_latency_ms is None or result['latency_p95_ms'] <= max_latency_ms)
+        )
+
+    ranked = sorted((r for r in results if eligible(r)), key=lambda r: (r['val_mae'], r['latency_p95_ms']))
+    others = sorted((r for r in results if not eligible(r)), key=lambda r: r['trial'])
+    for rank, result in enumerate(ranked, 1):
+        result['rank'] = rank
+    for result in others:
+        result['rank'] = None
+    return ranked + others
+
+def write_leaderboard(results, output_dir):
+    """Ghi bảng xếp hạng ra leaderboard.json (đầy đủ) và leaderboard.csv (mỗi siêu tham số một cột)"""
+    with open(os.path.join(output_dir, 'leaderboard.json'), 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+    with open(os.path.join(output_dir, 'leaderboard.csv'), 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=LEADERBOARD_COLUMNS + list(DEFAULT_HYPERPARAMETERS) + ['error'])
+        writer.writeheader()
+        for result in results:
+            row = {key: result.get(key) for key in LEADERBOARD_COLUMNS + ['error']}
+            for key, value in result['hyperparameters'].items():
+                row[key] = '-'.join(str(units) for units in value) if isinstance(value, list) else value
+            writer.writerow(row)
+
+def print_leaderboard(results, top=10):
+    print(f"\n{'Hạng':>4} {'Trial':>5} {'MAE':>9} {'p50 ms':>8} {'p95 ms':>8} {'Epoch':>5}  Siêu tham số")
+    for result in results[:top]:
+        if result['status'] != 'ok':
+            print(f"{'-':>4} {result['trial']:>5} {'lỗi':>9}  {result.get('error')}")
+            continue
+        rank = result['rank'] if result['rank'] is not None else '-'
+        print(f"{rank:>4} {result['trial']:>5} {result['val_mae']:>9.5f} {result['latency_p50_ms']:>8.3f} "
+              f"{result['latency_p95_ms']:>8.3f} {result['epochs_run']:>5}  {result['hyperparameters']}")
+
+def promote(result, scaler, training_samples):
+    """Đưa mô hình của trial vào models/: mô hình, scaler, đặc trưng, siêu tham số và model_configs"""
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(result['model_path'])
+    save_hyperparameters(result['hyperparameters'])
+    save_model(model, scaler, FEATURES, {'training_samples': training_samples, 'mae': result['val_mae']},
+               result['hyperparameters'])
+
+    # Engine TFLite chỉ dùng file .tflite xuất từ đúng phiên bản .h5 đang phục vụ
+    if ADMISSION_INFERENCE_BACKEND == 'tflite':
+        model_path = os.path.join(MODEL_DIR, MODEL_FILENAME)
+        export_keras_model(model, tflite_path_for(model_path), source_path=model_path)
+
+    print(f"Đã đưa trial {result['trial']} vào {MODEL_DIR}, cần khởi động lại các worker đang phục vụ để dùng mô hình mới")
+
+def main():
+    parser = argparse.ArgumentParser(description='Tìm siêu tham số cho mô hình dự đoán xác suất')
+    parser.add_argument('--space', help='File JSON không gian tìm kiếm (mặc định: DEFAULT_SEARCH_SPACE)')
+    parser.add_argument('--max-trials', type=int, default=20, help='Số cấu hình tối đa, chọn ngẫu nhiên nếu lưới lớn hơn (0: cả lưới)')
+    parser.add_argument('--threads', type=int, default=1, help='Số luồng TensorFlow của mỗi process')
+    parser.add_argument('--workers', type=int, help='Số process huấn luyện song song (mặc định: số CPU / --threads)')
+    parser.add_argument('--nice', type=int, default=TRAINING_JOB_NICE, help='Độ ưu tiên (nice) của các process huấn luyện')
+    parser.add_argument('--max-samples', type=int, help='Số dòng tối đa của tập train và tập validation (mặc định: tất cả)')
+    parser.add_argument('--backend', default=ADMISSION_INFERENCE_BACKEND, choices=['numpy', 'tflite', 'keras'],
+                        help='Engine đo độ trễ dự đoán')
+    parser.add_argument('--latency-runs', type=int, default=200, help='Số lần dự đoán một dòng khi đo độ trễ')
+    parser.add_argument('--max-latency-ms', type=float, help='Chỉ xếp hạng cấu hình có độ trễ p95 không quá giá trị này')
+    parser.add_argument('--output-dir', help='Thư mục kết quả (mặc định: sweeps/<thời gian>)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed chọn cấu hình và khởi tạo trọng số')
+    parser.add_argument('--no-promote', action='store_true', help='Không đưa cấu hình tốt nhất vào models/')
+    args = parser.parse_args()
+
+    configs = expand_search_space(load_search_space(args.space), args.max_trials, args.seed)
+    output_dir = args.output_dir or os.path.join(SWEEP_DIR, datetime.now().strftime('%Y%m%d_%H%M%S'))
+    os.makedirs(output_dir, exist_ok=True)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // max(args.threads, 1))
+
+    loaded = load_arrays(args.max_samples)
+    if loaded is None:
+        print("Lỗi: Không có dữ liệu huấn luyện, cần chạy training_data_creator.py trước")
+        return 1
+    arrays, scaler, training_samples = loaded
+    print(f"Dữ liệu: {len(arrays['X_train'])} mẫu huấn luyện, {len(arrays['X_val'])} mẫu validation")
+    print(f"Huấn luyện {len(configs)} cấu hình với {workers} process x {args.threads} luồng, kết quả tại {output_dir}")
+
+    blocks, specs = share_arrays(arrays)
+    try:
+        start = time.perf_counter()
+        results = run_sweep(configs, specs, output_dir, workers, args.threads, args.nice, args.seed)
+        print(f"Hoàn thành {len(results)} cấu hình trong {time.perf_counter() - start:.1f}s")
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    # Đo độ trễ lần lượt từng mô hình sau khi huấn luyện xong để các process huấn luyện không làm nhiễu kết quả
+    for result in results:
+        if result['status'] == 'ok':
+            engine, p50, p95 = measure_latency(result['model_path'], arrays['X_val'], args.backend, args.latency_runs)
+            result.update({'engine': engine, 'latency_p50_ms': round(p50, 4), 'latency_p95_ms': round(p95, 4)})
+
+    results = rank_trials(results, args.max_latency_ms)
+    write_leaderboard(results, output_dir)
+    print_leaderboard(results)
+    print(f"\nĐã ghi bảng xếp hạng vào {os.path.join(output_dir, 'leaderboard.csv')}")
+
+    best = results[0] if results and results[0]['rank'] == 1 else None
+    if best is None:
+        print("Không có cấu hình nào đạt yêu cầu, giữ nguyên mô hình hiện tại")
+        return 1
+    if not args.no_promote:
+        promote(best, scaler, training_samples)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
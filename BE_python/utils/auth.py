@@ -0,0 +1,28 @@
+import os
+import sys
+import hmac
+from functools import wraps
+from flask import request, jsonify
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import ADMIN_TOKEN
+
+
+def require_admin_token(view):
+    """
+    Chỉ cho phép request có header X-Admin-Token khớp ADMIN_TOKEN (dùng cho các API quản trị),
+    trả về 503 nếu chưa cấu hình token (API bị tắt), 401 nếu token sai
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({
+                'success': False,
+                'error': 'API quản trị chưa được bật (chưa cấu hình ADMIN_TOKEN)'
+            }), 503
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+            return jsonify({'success': False, 'error': 'Không có quyền truy cập API quản trị'}), 401
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,202 @@
+import os
+import sys
+import time
+import queue
+import statistics
+import threading
+from collections import deque
+import numpy as np
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import (
+    INFERENCE_BATCHING_ENABLED, INFERENCE_MAX_BATCH_SIZE, INFERENCE_MAX_WAIT_MS, INFERENCE_BATCHING_MIN_PREDICT_MS
+)
+
+# Số lần gọi predict_fn gần nhất dùng để ước lượng thời gian mỗi lần predict (trung vị,
+# không bị ảnh hưởng bởi các lần bị chậm do tranh chấp GIL)
+COST_WINDOW = 32
+
+
+class _PendingPrediction:
+    __slots__ = ('model', 'row', 'done', 'result', 'error')
+
+    def __init__(self, model, row):
+        self.model = model
+        self.row = row
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Gom các request dự đoán một dòng đến cùng lúc thành một batch để chạy một lần lan truyền tiến
+    - Luồng điều phối lấy request đầu tiên cùng các request đang chờ, gom thêm request đến trong
+      tối đa min(max_wait_ms, thời gian một lần predict) hoặc đến khi đủ max_batch_size,
+      sau đó gọi predict_fn(model, X) một lần và trả kết quả từng dòng
+    - Thời gian mỗi lần predict được đo liên tục: engine rẻ hơn min_predict_ms (numpy, fused, tflite)
+      được gọi trực tiếp vì chi phí chuyển luồng lớn hơn lợi ích gom batch
+    - Request được nhóm theo mô hình: khi mô hình được thay (tải phiên bản mới), request dùng
+      phiên bản cũ vẫn được dự đoán bằng đúng phiên bản đó
+    """
+
+    def __init__(self, name, predict_fn, max_batch_size=INFERENCE_MAX_BATCH_SIZE, max_wait_ms=INFERENCE_MAX_WAIT_MS,
+                 min_predict_ms=INFERENCE_BATCHING_MIN_PREDICT_MS, enabled=INFERENCE_BATCHING_ENABLED):
+        self.name = name
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.min_predict = min_predict_ms / 1000
+        self.enabled = enabled and max_batch_size > 1
+
+        # Thời gian mỗi lần predict (giây, trung vị) của mô hình đang dùng
+        self._cost = None
+        self._cost_model_id = None
+        self._durations = deque(maxlen=COST_WINDOW)
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def predict(self, model, row):
+        """
+        Dự đoán cho một dòng đặc trưng đã chuẩn hóa
+
+        Args:
+            model: Mô hình (handle.model) dùng để dự đoán
+            row: Vector đặc trưng 1 chiều
+
+        Returns:
+            Vector đầu ra 1 chiều của dòng đó
+        """
+        row = np.asarray(row).reshape(-1)
+        if not self.enabled or self._is_cheap(model):
+            return self._predict_direct(model, row)
+
+        pending = _PendingPrediction(model, row)
+        self._ensure_worker().put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _is_cheap(self, model):
+        cost = self._cost
+        return cost is not None and cost < self.min_predict and self._cost_model_id == id(model)
+
+    def _predict_direct(self, model, row):
+        start = time.perf_counter()
+        output = np.asarray(self.predict_fn(model, row.reshape(1, -1)))[0]
+        self._record_batch(1, model, time.perf_counter() - start, direct=True)
+        return output
+
+    def reset(self):
+        """Bỏ hàng đợi và luồng điều phối hiện tại (gọi trong process con sau fork)"""
+        with self._lock:
+            self._queue = None
+            self._pid = None
+            self._thread = None
+        self._cost = None
+        self._cost_model_id = None
+        self._durations.clear()
+        self._reset_stats()
+
+    def stats(self):
+        """Thống kê cho health check"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['avgBatchSize'] = round(stats['requests'] / stats['batches'], 2) if stats['batches'] else None
+        stats.update({
+            'enabled': self.enabled,
+            'predictCostMs': round(self._cost * 1000, 3) if self._cost is not None else None,
+            'maxBatchSize': self.max_batch_size,
+            'maxWaitMs': self.max_wait * 1000
+        })
+        return stats
+
+    def _ensure_worker(self):
+        if self._queue is not None and self._pid == os.getpid():
+            return self._queue
+
+        with self._lock:
+            if self._queue is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,), name=f"batcher-{self.name}", daemon=True
+                )
+                self._thread.start()
+            return self._queue
+
+    def _run(self, pending_queue):
+        while True:
+            batch = [pending_queue.get()]
+
+            # Lấy ngay các request đang chờ, sau đó chờ thêm tối đa max_wait
+            # (không chờ lâu hơn thời gian của chính một lần predict)
+            wait = self.max_wait if self._cost is None else min(self.max_wait, self._cost)
+            deadline = time.monotonic() + wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(pending_queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    pass
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            groups = {}
+            for pending in batch:
+                groups.setdefault(id(pending.model), []).append(pending)
+            for group in groups.values():
+                self._predict_group(group)
+
+    def _predict_group(self, group):
+        start = time.perf_counter()
+        try:
+            outputs = np.asarray(self.predict_fn(group[0].model, np.stack([pending.row for pending in group])))
+            for pending, output in zip(group, outputs):
+                pending.result = output
+        except Exception as e:
+            for pending in group:
+                pending.error = e
+        finally:
+            self._record_batch(len(group), group[0].model, time.perf_counter() - start)
+            for pending in group:
+                pending.done.set()
+
+    def _record_batch(self, size, model, duration, direct=False):
+        with self._stats_lock:
+            if self._cost_model_id != id(model):
+                self._durations.clear()
+                self._cost_model_id = id(model)
+            self._durations.append(duration)
+            self._cost = statistics.median(self._durations)
+            self._stats['requests'] += size
+            self._stats['batches'] += 1
+            self._stats['direct'] += int(direct)
+            self._stats['maxObservedBatchSize'] = max(self._stats['maxObservedBatchSize'], size)
+
+    def _reset_stats(self):
+        with self._stats_lock:
+            self._stats = {'requests': 0, 'batches': 0, 'direct': 0, 'maxObservedBatchSize': 0}
+
+
+# Bộ gom batch cho hai mô hình, dùng chung cho toàn bộ luồng của worker
+admission_batcher = MicroBatcher('admission_probability', lambda model, X: model.predict(X, verbose=0))
+major_batcher = MicroBatcher('major_recommendation', lambda model, X: model.predict_combined(X))
+
+BATCHERS = (admission_batcher, major_batcher)
+
+
+def batching_status():
+    return {batcher.name: batcher.stats() for batcher in BATCHERS}
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import threading
+from datetime import datetime
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import DATA_VERSION_CHECK_SECONDS
+from utils.db_utils import db_client
+
+# Collection lưu phiên bản dữ liệu: mỗi document {_id: tên collection, version, updatedAt}
+DATA_VERSIONS_COLLECTION = 'data_versions'
+
+
+def bump_data_version(collection_name):
+    """
+    Tăng phiên bản dữ liệu của một collection sau khi nhập hoặc sửa dữ liệu
+
+    Returns:
+        Phiên bản mới
+    """
+    collection = db_client.get_collection(DATA_VERSIONS_COLLECTION)
+    collection.update_one(
+        {'_id': collection_name},
+        {'$inc': {'version': 1}, '$set': {'updatedAt': datetime.now()}},
+        upsert=True
+    )
+    return get_data_version(collection_name)
+
+
+def get_data_version(collection_name):
+    """
+    Lấy phiên bản dữ liệu của một collection
+
+    Phiên bản gồm số lần cập nhật đã ghi nhận và số document ước tính, nên việc thêm/xóa
+    dữ liệu mà không tăng phiên bản (ví dụ nhập trực tiếp bằng mongoimport) vẫn được phát hiện
+
+    Returns:
+        Chuỗi phiên bản dạng "<version>.<count>"
+    """
+    record = db_client.get_collection(DATA_VERSIONS_COLLECTION).find_one({'_id': collection_name})
+    version = record.get('version', 0) if record else 0
+    count = db_client.get_collection(collection_name).estimated_document_count()
+    return f"{version}.{count}"
+
+
+class DataVersionCache:
+    """
+    Phiên bản dữ liệu của các collection, đọc lại từ MongoDB tối đa mỗi check_interval giây
+    (dùng trên đường xử lý request, không truy vấn DB mỗi lần)
+    """
+
+    def __init__(self, check_interval=DATA_VERSION_CHECK_SECONDS):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._versions = {}
+
+    def get(self, collection_name):
+        """
+        Phiên bản dữ liệu hiện tại của collection
+
+        Returns:
+            Chuỗi phiên bản, hoặc phiên bản đọc được lần trước (None nếu chưa đọc được lần nào) khi DB lỗi
+        """
+        now = time.monotonic()
+        cached = self._versions.get(collection_name)
+        if cached is not None and now - cached[1] < self.check_interval:
+            return cached[0]
+
+        with self._lock:
+            cached = self._versions.get(collection_name)
+            if cached is not None and now - cached[1] < self.check_interval:
+                return cached[0]
+            try:
+                version = get_data_version(collection_name)
+            except Exception as e:
+                print(f"Không thể đọc phiên bản dữ liệu {collection_name}: {e}")
+                version = cached[0] if cached is not None else None
+            self._versions[collection_name] = (version, now)
+            return version
+
+    def status(self):
+        return {collection_name: version for collection_name, (version, _) in self._versions.items()}
+
+
+# Cache phiên bản dữ liệu dùng chung cho toàn bộ worker
+data_version_cache = DataVersionCache()
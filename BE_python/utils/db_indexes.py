@@ -0,0 +1,201 @@
+import os
+import sys
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from utils.db_utils import db_client
+
+# Các index cần có cho những truy vấn thường xuyên (tên collection theo COLLECTIONS trong config)
+# Index của benchmark_scores trùng với index unique khai báo trong backend/models/BenchmarkScore.js
+# Index của student_data chỉ unique trên các document chứa dự đoán xác suất (mỗi học sinh một document,
+# xem save_prediction_to_mongodb); document gợi ý ngành của /major-recommendation không bị ràng buộc
+STUDENT_PREDICTIONS_FILTER = {'admissionPredictions': {'$exists': True}}
+INDEX_SPECS = [
+    {'collection': 'benchmark_scores',
+     'keys': [('university_code', ASCENDING), ('major', ASCENDING), ('subject_combination', ASCENDING), ('year', ASCENDING)],
+     'options': {'unique': True}},
+    {'collection': 'benchmark_scores',
+     'keys': [('major', ASCENDING), ('year', ASCENDING)]},
+    {'collection': 'admission_criteria',
+     'keys': [('universityCode', ASCENDING), ('majorName', ASCENDING)]},
+    {'collection': 'admission_criteria',
+     'keys': [('majorName', ASCENDING), ('universityName', ASCENDING)]},
+    {'collection': 'majors',
+     'keys': [('nameNormalized', ASCENDING)]},
+    {'collection': 'universities',
+     'keys': [('code', ASCENDING)]},
+    {'collection': 'student_data',
+     'keys': [('userId', ASCENDING)],
+     'options': {'unique': True, 'partialFilterExpression': STUDENT_PREDICTIONS_FILTER}},
+    {'collection': 'student_data',
+     'keys': [('anonymousId', ASCENDING)],
+     'options': {'unique': True, 'partialFilterExpression': STUDENT_PREDICTIONS_FILTER}},
+    {'collection': 'model_mappings',
+     'keys': [('model_name', ASCENDING), ('active', ASCENDING)]},
+    {'collection': 'training_data',
+     'keys': [('modelType', ASCENDING)]},
+    {'collection': 'training_chunks',
+     'keys': [('datasetId', ASCENDING), ('chunk', ASCENDING)],
+     'options': {'unique': True}},
+    {'collection': 'training_jobs',
+     'keys': [('modelType', ASCENDING), ('createdAt', DESCENDING)]},
+]
+
+# Dạng truy vấn tiêu biểu của từng đường dẫn nóng, dùng để kiểm tra kế hoạch thực thi bằng explain()
+QUERY_SHAPES = [
+    {'name': 'benchmark theo danh sách mã trường (benchmark_resolver)',
+     'collection': 'benchmark_scores', 'filter': {'university_code': {'$in': ['BKA', 'NTT']}}},
+    {'name': 'benchmark theo danh sách ngành và năm (gợi ý trường)',
+     'collection': 'benchmark_scores', 'filter': {'major': {'$in': ['Công nghệ thông tin']}, 'year': 2024}},
+    {'name': 'chỉ tiêu theo mã trường và tên ngành',
+     'collection': 'admission_criteria',
+     'filter': {'universityCode': 'BKA', 'majorName': {'$regex': 'công nghệ thông tin', '$options': 'i'}}},
+    {'name': 'chỉ tiêu theo danh sách ngành, sắp xếp theo tên trường',
+     'collection': 'admission_criteria', 'filter': {'majorName': {'$in': ['Công nghệ thông tin']}},
+     'sort': [('universityName', ASCENDING)]},
+    {'name': 'ngành theo tên chuẩn hóa',
+     'collection': 'majors', 'filter': {'nameNormalized': 'công nghệ thông tin'}},
+    {'name': 'trường theo mã',
+     'collection': 'universities', 'filter': {'code': 'BKA'}},
+    {'name': 'dự đoán của học sinh theo userId',
+     'collection': 'student_data',
+     'filter': {'userId': ObjectId('000000000000000000000000'), **STUDENT_PREDICTIONS_FILTER}},
+    {'name': 'dự đoán của học sinh theo anonymousId',
+     'collection': 'student_data', 'filter': {'anonymousId': 'anon_20250101000000', **STUDENT_PREDICTIONS_FILTER}},
+    {'name': 'log dự đoán theo _id (phản hồi)',
+     'collection': 'prediction_logs', 'filter': {'_id': ObjectId('000000000000000000000000')}},
+    {'name': 'mapping đang active của mô hình',
+     'collection': 'model_mappings', 'filter': {'model_name': 'major_recommendation', 'active': True}},
+    {'name': 'bộ dữ liệu huấn luyện theo loại mô hình',
+     'collection': 'training_data', 'filter': {'modelType': 'major_recommendation'}},
+    {'name': 'chunk dữ liệu huấn luyện theo thứ tự',
+     'collection': 'training_chunks', 'filter': {'datasetId': ObjectId('000000000000000000000000')},
+     'sort': [('chunk', ASCENDING)]},
+    {'name': 'job huấn luyện mới nhất theo loại mô hình',
+     'collection': 'training_jobs', 'filter': {'modelType': 'major_recommendation'},
+     'sort': [('createdAt', DESCENDING)]},
+]
+
+
+def ensure_indexes(specs=INDEX_SPECS):
+    """
+    Tạo các index đã khai báo (idempotent: index đã tồn tại với cùng khóa và tùy chọn sẽ được bỏ qua)
+
+    Index đã tồn tại với cùng khóa nhưng khác tùy chọn (unique, sparse, partialFilterExpression)
+    không được tạo lại hay xóa đi mà báo 'mismatch' để xử lý thủ công
+
+    Returns:
+        Danh sách kết quả {'collection', 'index', 'status', 'error'} với status là
+        'created', 'exists', 'mismatch' hoặc 'failed'
+    """
+    results = []
+    for spec in specs:
+        collection = db_client.get_collection(spec['collection'])
+        keys = spec['keys']
+        options = spec.get('options', {})
+        existing = {}
+        for name, info in collection.index_information().items():
+            existing.setdefault(tuple(info['key']), []).append((name, info))
+
+        result = {'collection': spec['collection'], 'index': _describe_keys(keys), 'status': None, 'error': None}
+        if tuple(keys) in existing:
+            wanted = _compared_options(options)
+            matches = existing[tuple(keys)]
+            if any(_compared_options(info) == wanted for _, info in matches):
+                result['status'] = 'exists'
+            else:
+                name, info = matches[0]
+                result['status'] = 'mismatch'
+                result['error'] = (f"Index {name} đã tồn tại với tùy chọn {_compared_options(info)}, "
+                                   f"khác với khai báo {wanted}")
+        else:
+            try:
+                collection.create_index(keys, **options)
+                result['status'] = 'created'
+            except OperationFailure as e:
+                # Ví dụ: dữ liệu trùng lặp khi tạo index unique, hoặc xung đột tên/tùy chọn
+                result['status'] = 'failed'
+                result['error'] = str(e)
+        results.append(result)
+
+    return results
+
+
+def verify_query_plans(shapes=QUERY_SHAPES):
+    """
+    Chạy explain() cho từng dạng truy vấn tiêu biểu và tìm các kế hoạch quét toàn bộ collection
+
+    Returns:
+        Danh sách kết quả {'name', 'collection', 'stages', 'collscan'}
+    """
+    results = []
+    for shape in shapes:
+        cursor = db_client.get_collection(shape['collection']).find(shape['filter'])
+        if shape.get('sort'):
+            cursor = cursor.sort(shape['sort'])
+
+        plan = cursor.explain().get('queryPlanner', {}).get('winningPlan', {})
+        stages = _collect_stages(plan)
+        results.append({
+            'name': shape['name'],
+            'collection': shape['collection'],
+            'stages': stages,
+            'collscan': 'COLLSCAN' in stages
+        })
+
+    return results
+
+
+def ensure_indexes_and_verify():
+    """
+    Tạo index rồi kiểm tra kế hoạch truy vấn, in kết quả
+
+    Returns:
+        True nếu không có index nào tạo lỗi và không có truy vấn nào dùng COLLSCAN
+    """
+    ok = True
+    for result in ensure_indexes():
+        print(f"[index] {result['collection']} {result['index']}: {result['status']}")
+        if result['status'] in ('failed', 'mismatch'):
+            print(f"[index]   LỖI: {result['error']}")
+            ok = False
+
+    for result in verify_query_plans():
+        stages = ' > '.join(result['stages']) or '?'
+        if result['collscan']:
+            ok = False
+            print(f"[explain] LỖI COLLSCAN - {result['name']} ({result['collection']}): {stages}")
+        else:
+            print(f"[explain] {result['name']} ({result['collection']}): {stages}")
+
+    return ok
+
+
+def _compared_options(options):
+    """Các tùy chọn ảnh hưởng đến ngữ nghĩa của index, dùng để so sánh khai báo với index đã có"""
+    return {
+        'unique': bool(options.get('unique', False)),
+        'sparse': bool(options.get('sparse', False)),
+        'partialFilterExpression': options.get('partialFilterExpression')
+    }
+
+
+def _describe_keys(keys):
+    return ', '.join(f"{field}:{direction}" for field, direction in keys)
+
+
+def _collect_stages(plan):
+    """Danh sách stage trong kế hoạch (duyệt theo chiều sâu, hỗ trợ cả định dạng queryPlan của SBE)"""
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for key in ('queryPlan', 'inputStage'):
+            if key in plan:
+                stages.extend(_collect_stages(plan[key]))
+        for child in plan.get('inputStages', []):
+            stages.extend(_collect_stages(child))
+    return stages
@@ -1,22 +1,173 @@
 import pymongo
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
 import os
 import sys
+import threading
 
 # Thêm đường dẫn gốc vào sys.path để có thể import
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
-from config.config import MONGO_URI, MONGO_DB_NAME, COLLECTIONS
+from config.config import (
+    MONGO_URI, MONGO_DB_NAME, COLLECTIONS,
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS, MONGO_READ_PREFERENCE
+)
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Đếm số kết nối trong pool để theo dõi mức sử dụng (hiển thị ở /health)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self.created = 0
+            self.closed = 0
+            self.checked_out = 0
+            self.checked_in = 0
+            self.checkout_failures = 0
+            self.in_use = 0
+            self.max_in_use = 0
+            self.pool_cleared = 0
+    
+    def snapshot(self):
+        with self._lock:
+            return {
+                'open': self.created - self.closed,
+                'inUse': self.in_use,
+                'maxInUse': self.max_in_use,
+                'created': self.created,
+                'closed': self.closed,
+                'checkedOut': self.checked_out,
+                'checkoutFailures': self.checkout_failures,
+                'poolCleared': self.pool_cleared
+            }
+    
+    def pool_created(self, event):
+        pass
+    
+    def pool_ready(self, event):
+        pass
+    
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_cleared += 1
+    
+    def pool_closed(self, event):
+        pass
+    
+    def connection_created(self, event):
+        with self._lock:
+            self.created += 1
+    
+    def connection_ready(self, event):
+        pass
+    
+    def connection_closed(self, event):
+        with self._lock:
+            self.closed += 1
+    
+    def connection_check_out_started(self, event):
+        pass
+    
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+    
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+    
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_in += 1
+            self.in_use -= 1
 
 class MongoDBClient:
+    """
+    MongoClient dùng chung cho toàn bộ module
+    - Chỉ tạo kết nối ở lần truy cập đầu tiên (không kết nối khi import)
+    - Tự tạo client mới khi phát hiện đang chạy trong process con sau fork (MongoClient không fork-safe)
+    """
     _instance = None
+    _instance_lock = threading.Lock()
     
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(MongoDBClient, cls).__new__(cls)
-            cls._instance.client = MongoClient(MONGO_URI)
-            cls._instance.db = cls._instance.client[MONGO_DB_NAME]
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super(MongoDBClient, cls).__new__(cls)
+                    instance._client = None
+                    instance._pid = None
+                    instance._lock = threading.Lock()
+                    instance.pool_metrics = PoolMetricsListener()
+                    cls._instance = instance
         return cls._instance
     
+    @property
+    def client(self):
+        client = self._client
+        if client is not None and self._pid == os.getpid():
+            return client
+        
+        with self._lock:
+            if self._client is None or self._pid != os.getpid():
+                if self._client is not None:
+                    print(f"Phát hiện process mới (pid {os.getpid()}), tạo lại kết nối MongoDB")
+                    self.pool_metrics.reset()
+                self._client = self._create_client()
+                self._pid = os.getpid()
+            return self._client
+    
+    @property
+    def db(self):
+        return self.client[MONGO_DB_NAME]
+    
+    def reset(self):
+        """
+        Bỏ client hiện tại để lần truy cập sau tạo client mới (gọi trong process con sau fork).
+        Không đóng client cũ vì các socket của nó thuộc về process cha
+        """
+        with self._lock:
+            self._client = None
+            self._pid = None
+        self.pool_metrics.reset()
+    
+    def close(self):
+        """Đóng client (khi tắt ứng dụng)"""
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                self._client.close()
+            self._client = None
+            self._pid = None
+    
+    def pool_stats(self):
+        """Thông tin pool kết nối cho health check (không kích hoạt việc kết nối)"""
+        stats = {
+            'connected': self._client is not None and self._pid == os.getpid(),
+            'pid': os.getpid(),
+            'maxPoolSize': MONGO_MAX_POOL_SIZE,
+            'readPreference': MONGO_READ_PREFERENCE
+        }
+        stats.update(self.pool_metrics.snapshot())
+        return stats
+    
+    def _create_client(self):
+        return MongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            readPreference=MONGO_READ_PREFERENCE,
+            event_listeners=[self.pool_metrics]
+        )
+    
     def get_collection(self, collection_name):
         """Lấy collection theo tên đã định nghĩa trong config"""
         if collection_name not in COLLECTIONS:
@@ -79,27 +230,29 @@ class MongoDBClient:
         return collection.delete_many(query)
     
     def fetch_and_normalize_interests(self):
-        """Lấy và chuẩn hóa dữ liệu sở thích"""
-        interests = self.fetch_data('interests')
+        """Lấy và chuẩn hóa dữ liệu sở thích (từ ảnh chụp dữ liệu tham chiếu)"""
+        from utils.reference_data import reference_data
+        interests = reference_data.snapshot().all('interests')
         return {interest['name']: interest['_id'] for interest in interests}
     
     def fetch_and_normalize_subject_combinations(self):
-        """Lấy và chuẩn hóa dữ liệu tổ hợp môn"""
-        subject_combinations = self.fetch_data('subject_combinations')
+        """Lấy và chuẩn hóa dữ liệu tổ hợp môn (từ ảnh chụp dữ liệu tham chiếu)"""
+        from utils.reference_data import reference_data
+        subject_combinations = reference_data.snapshot().all('subject_combinations')
         return {combination['code']: {
             'id': combination['_id'],
             'subjects': combination['subjects']
         } for combination in subject_combinations}
     
     def fetch_university_by_code(self, university_code):
-        """Lấy thông tin trường theo mã"""
-        collection = self.get_collection('universities')
-        return collection.find_one({'code': university_code})
+        """Lấy thông tin trường theo mã (từ ảnh chụp dữ liệu tham chiếu)"""
+        from utils.reference_data import reference_data
+        return reference_data.snapshot().get_by_code('universities', university_code)
     
     def fetch_major_by_code(self, major_code):
-        """Lấy thông tin ngành theo mã"""
-        collection = self.get_collection('majors')
-        return collection.find_one({'code': major_code})
+        """Lấy thông tin ngành theo mã (từ ảnh chụp dữ liệu tham chiếu)"""
+        from utils.reference_data import reference_data
+        return reference_data.snapshot().get_by_code('majors', major_code)
     
     def check_collection_exists(self, collection_name):
         """Kiểm tra collection có tồn tại không"""
@@ -113,5 +266,18 @@ class MongoDBClient:
         collection = self.get_collection(collection_name)
         return collection.count_documents(query or {})
 
+class LazyDatabase:
+    """
+    Đại diện cho database dùng chung, mỗi lần truy cập đều lấy từ client hiện tại của process
+    (dùng thay cho biến db = client[...] ở cấp module)
+    """
+    
+    def __getattr__(self, name):
+        return getattr(db_client.db, name)
+    
+    def __getitem__(self, name):
+        return db_client.db[name]
+
 # Singleton instance
-db_client = MongoDBClient() 
\ No newline at end of file
+db_client = MongoDBClient()
+db = LazyDatabase() 
\ No newline at end of file
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+def get_rss_mb():
+    """Bộ nhớ thường trú (RSS) hiện tại của process, đơn vị MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    # Không có /proc (ví dụ macOS): dùng RSS lớn nhất thay thế
+    import resource
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss / (1024 * 1024) if sys.platform == 'darwin' else max_rss / 1024
+
+
+def prepare_for_fork():
+    """
+    Gọi trong process master (gunicorn --preload) trước khi tạo worker:
+    dừng các luồng nền và đóng kết nối MongoDB của master, mô hình và ảnh chụp dữ liệu
+    đã tải được giữ lại để các worker dùng chung (copy-on-write)
+    """
+    reference_module = sys.modules.get('utils.reference_data')
+    if reference_module is not None:
+        reference_module.reference_data.stop_auto_refresh()
+
+    model_cache_module = sys.modules.get('ai_models.goiynganhhoc.model_cache')
+    if model_cache_module is not None:
+        model_cache_module.major_model_cache.stop_watching()
+
+    from utils.db_utils import db_client
+    db_client.close()
+
+
+def reinitialize_after_fork():
+    """
+    Gọi trong worker ngay sau khi fork:
+    - Tạo lại MongoClient, hàng đợi ghi nền và bộ gom batch (không dùng chung giữa các process)
+    - Khởi động lại các luồng làm mới định kỳ (luồng không tồn tại sau fork)
+    - Tải lại mô hình chạy bằng TensorFlow (runtime TensorFlow không fork-safe),
+      mô hình NumPy được dùng chung với master
+
+    Returns:
+        Thời gian thực hiện (ms)
+    """
+    start = time.perf_counter()
+
+    from utils.db_utils import db_client
+    db_client.reset()
+
+    write_behind_module = sys.modules.get('utils.write_behind')
+    if write_behind_module is not None:
+        for writer in write_behind_module.WRITERS:
+            writer.reset()
+
+    batching_module = sys.modules.get('utils.batching')
+    if batching_module is not None:
+        for batcher in batching_module.BATCHERS:
+            batcher.reset()
+
+    reference_module = sys.modules.get('utils.reference_data')
+    if reference_module is not None:
+        reference_module.reference_data.stop_auto_refresh()
+        reference_module.reference_data.start_auto_refresh()
+
+    registry_module = sys.modules.get('ai_models.dudoanxacxuat.model_registry')
+    if registry_module is not None:
+        registry = registry_module.admission_model_registry
+        if registry.is_loaded() and registry.backend == 'keras':
+            registry.reload()
+
+    model_cache_module = sys.modules.get('ai_models.goiynganhhoc.model_cache')
+    if model_cache_module is not None:
+        cache = model_cache_module.major_model_cache
+        if cache.is_loaded() and cache.get().serving_mode == 'keras':
+            cache.reload()
+        cache.stop_watching()
+        if cache.is_loaded():
+            cache.start_watching()
+
+    return (time.perf_counter() - start) * 1000
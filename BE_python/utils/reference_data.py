@@ -0,0 +1,262 @@
+import os
+import re
+import sys
+import time
+import threading
+from datetime import datetime
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import REFERENCE_DATA_REFRESH_SECONDS, REFERENCE_DATA_VERSION_CHECK_SECONDS
+from utils.db_utils import db_client
+from utils.data_versions import bump_data_version, get_data_version
+
+# Các collection dữ liệu tham chiếu (ít thay đổi, được đọc ở hầu hết các request)
+REFERENCE_COLLECTIONS = ('majors', 'universities', 'interests', 'subject_combinations')
+
+# Trường dùng làm mã và tên cho từng collection
+CODE_FIELDS = {
+    'majors': 'code',
+    'universities': 'code',
+    'interests': None,
+    'subject_combinations': 'code'
+}
+NAME_FIELDS = {
+    'majors': ('nameNormalized', 'name'),
+    'universities': ('name',),
+    'interests': ('name',),
+    'subject_combinations': ('name',)
+}
+
+
+def normalize_name(value):
+    """Chuẩn hóa tên để tra cứu: chữ thường, bỏ khoảng trắng thừa"""
+    if not isinstance(value, str):
+        return None
+    return ' '.join(value.lower().split())
+
+
+class ReferenceDataSnapshot:
+    """
+    Ảnh chụp (chỉ đọc) của các collection tham chiếu, có chỉ mục theo id, mã và tên chuẩn hóa
+
+    Các document được chia sẻ giữa các luồng, nơi gọi không được sửa đổi chúng
+    """
+
+    def __init__(self, documents, loaded_at, load_time_ms, versions=None, started_at=None):
+        self.documents = documents
+        self.loaded_at = loaded_at
+        self.load_time_ms = load_time_ms
+        # Phiên bản dữ liệu (data_versions) đọc ngay trước khi tải và thời điểm bắt đầu tải (monotonic)
+        self.versions = versions
+        self.started_at = started_at
+
+        self._by_id = {}
+        self._by_code = {}
+        self._by_code_upper = {}
+        self._by_name = {}
+
+        for collection_name, docs in documents.items():
+            by_id = self._by_id[collection_name] = {}
+            by_code = self._by_code[collection_name] = {}
+            by_code_upper = self._by_code_upper[collection_name] = {}
+            by_name = self._by_name[collection_name] = {}
+
+            code_field = CODE_FIELDS.get(collection_name)
+            name_fields = NAME_FIELDS.get(collection_name, ('name',))
+
+            # Giữ document đầu tiên (theo thứ tự tự nhiên) cho mỗi khóa, giống find_one
+            for doc in docs:
+                if '_id' in doc:
+                    by_id.setdefault(str(doc['_id']), doc)
+
+                code = doc.get(code_field) if code_field else None
+                if isinstance(code, str):
+                    by_code.setdefault(code, doc)
+                    by_code_upper.setdefault(code.upper(), doc)
+
+                for field in name_fields:
+                    name = normalize_name(doc.get(field))
+                    if name:
+                        by_name.setdefault(name, doc)
+
+    def all(self, collection_name):
+        """Danh sách document của collection (theo thứ tự tự nhiên)"""
+        return list(self.documents.get(collection_name, []))
+
+    def count(self, collection_name):
+        return len(self.documents.get(collection_name, []))
+
+    def get_by_id(self, collection_name, doc_id):
+        return self._by_id.get(collection_name, {}).get(str(doc_id))
+
+    def get_by_code(self, collection_name, code, case_sensitive=True):
+        """Tra cứu theo mã (tương đương find_one({'code': code}))"""
+        if not isinstance(code, str):
+            return None
+        if case_sensitive:
+            return self._by_code.get(collection_name, {}).get(code)
+        return self._by_code_upper.get(collection_name, {}).get(code.upper())
+
+    def get_by_name(self, collection_name, name):
+        """Tra cứu theo tên đã chuẩn hóa (chữ thường, bỏ khoảng trắng thừa)"""
+        return self._by_name.get(collection_name, {}).get(normalize_name(name))
+
+    def find_first(self, collection_name, field, pattern):
+        """
+        Tìm document đầu tiên có trường khớp với regex không phân biệt hoa thường
+        (tương đương find_one({field: {'$regex': pattern, '$options': 'i'}}))
+        """
+        regex = re.compile(pattern, re.IGNORECASE)
+        for doc in self.documents.get(collection_name, []):
+            value = doc.get(field)
+            if isinstance(value, str) and regex.search(value):
+                return doc
+        return None
+
+
+class ReferenceDataStore:
+    """
+    Quản lý ảnh chụp dữ liệu tham chiếu của một worker
+    - Tải một lần khi cần, tải lại khi phiên bản dữ liệu (data_versions) thay đổi, định kỳ, hoặc khi gọi reload()
+    - Mỗi worker giữ ảnh chụp riêng; các worker khác nhận thay đổi qua việc kiểm tra data_versions
+      (scripts/import_data.py và notify_changed() tăng phiên bản)
+    - Ảnh chụp mới được tạo đầy đủ rồi mới thay thế (atomic), các request đang chạy vẫn dùng ảnh cũ
+    """
+
+    def __init__(self, collections=REFERENCE_COLLECTIONS, refresh_interval=REFERENCE_DATA_REFRESH_SECONDS,
+                 version_check_interval=REFERENCE_DATA_VERSION_CHECK_SECONDS):
+        self.collections = tuple(collections)
+        self.refresh_interval = refresh_interval
+        self.version_check_interval = version_check_interval
+        self._lock = threading.Lock()
+        # Chỉ một lần tải lại chạy tại một thời điểm trong worker
+        self._reload_lock = threading.Lock()
+        self._snapshot = None
+        self._timer = None
+        self._last_error = None
+
+    def snapshot(self):
+        """Lấy ảnh chụp hiện tại, tải từ MongoDB nếu chưa có"""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._load()
+            return self._snapshot
+
+    def reload(self):
+        """
+        Tải lại dữ liệu tham chiếu từ MongoDB và thay thế ảnh chụp hiện tại (chỉ trong worker này)
+
+        Các lời gọi đồng thời được gộp: nếu một lần tải bắt đầu sau lời gọi này đã xong trong lúc chờ,
+        dùng luôn kết quả đó thay vì đọc lại cả bốn collection
+        """
+        requested_at = time.monotonic()
+        with self._reload_lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.started_at is not None and snapshot.started_at >= requested_at:
+                return snapshot
+
+            snapshot = self._load()
+            with self._lock:
+                self._snapshot = snapshot
+            return snapshot
+
+    def notify_changed(self):
+        """
+        Tăng phiên bản dữ liệu của các collection tham chiếu để mọi worker tải lại ở lần kiểm tra
+        data_versions tiếp theo, sau đó tải lại ngay trong worker này
+        """
+        for name in self.collections:
+            bump_data_version(name)
+        return self.reload()
+
+    def start_auto_refresh(self):
+        """
+        Bắt đầu kiểm tra phiên bản dữ liệu và làm mới định kỳ
+        (bỏ qua nếu cả hai chu kỳ <= 0 hoặc đã chạy)
+        """
+        if self._tick_interval() <= 0 or self._timer is not None:
+            return
+        self._schedule_refresh()
+
+    def stop_auto_refresh(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def status(self):
+        """Thông tin trạng thái cho health check (không kích hoạt việc tải)"""
+        snapshot = self._snapshot
+        status = {
+            'loaded': snapshot is not None,
+            'refreshIntervalSeconds': self.refresh_interval,
+            'versionCheckIntervalSeconds': self.version_check_interval
+        }
+        if snapshot is not None:
+            status.update({
+                'loadedAt': snapshot.loaded_at.isoformat(),
+                'loadTimeMs': round(snapshot.load_time_ms, 2),
+                'counts': {name: snapshot.count(name) for name in self.collections},
+                'versions': snapshot.versions
+            })
+        if self._last_error:
+            status['lastError'] = self._last_error
+        return status
+
+    def _tick_interval(self):
+        intervals = [interval for interval in (self.version_check_interval, self.refresh_interval) if interval > 0]
+        return min(intervals) if intervals else 0
+
+    def _schedule_refresh(self):
+        self._timer = threading.Timer(self._tick_interval(), self._refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _needs_reload(self):
+        """Chưa có ảnh chụp, phiên bản dữ liệu đã thay đổi hoặc đã quá refresh_interval"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return True
+        if self.refresh_interval > 0 and time.monotonic() - snapshot.started_at >= self.refresh_interval:
+            return True
+        if self.version_check_interval > 0:
+            return self._read_versions() != snapshot.versions
+        return False
+
+    def _refresh(self):
+        try:
+            if self._needs_reload():
+                self.reload()
+        except Exception as e:
+            # Giữ ảnh chụp cũ nếu không tải được dữ liệu mới
+            print(f"Lỗi khi làm mới dữ liệu tham chiếu: {e}")
+        finally:
+            self._schedule_refresh()
+
+    def _read_versions(self):
+        return {name: get_data_version(name) for name in self.collections}
+
+    def _load(self):
+        started_at = time.monotonic()
+        start = time.perf_counter()
+        try:
+            # Đọc phiên bản trước khi tải: thay đổi xảy ra trong lúc tải sẽ được phát hiện ở lần kiểm tra sau
+            versions = self._read_versions()
+            documents = {name: db_client.fetch_data(name) for name in self.collections}
+        except Exception as e:
+            self._last_error = str(e)
+            raise
+
+        load_time_ms = (time.perf_counter() - start) * 1000
+        self._last_error = None
+        counts = ', '.join(f"{name}={len(docs)}" for name, docs in documents.items())
+        print(f"Đã tải dữ liệu tham chiếu ({counts}) trong {load_time_ms:.0f}ms")
+        return ReferenceDataSnapshot(documents, datetime.now(), load_time_ms, versions=versions, started_at=started_at)
+
+
+# Store dùng chung cho các luồng trong worker
+reference_data = ReferenceDataStore()
@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECONDS,
+    RESPONSE_CACHE_SHARED_BACKEND, RESPONSE_CACHE_SQLITE_PATH
+)
+
+
+class LocalLRUBackend:
+    """LRU + TTL trong bộ nhớ của process (mỗi worker một bản)"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    Backend dùng chung giữa các worker trên cùng máy bằng một file SQLite
+    (thay thế cục bộ cho cache dùng chung như Redis/Memcached, cùng giao diện get/set/clear/size)
+    - Mỗi luồng của mỗi process dùng một kết nối riêng
+    - Bản ghi hết hạn bị bỏ qua khi đọc và được xóa định kỳ khi ghi
+    - Giá trị lưu dạng JSON (kết quả trả về qua jsonify), không dùng pickle: nội dung file không
+      được tin cậy như code; thư mục và file chỉ user của service được đọc/ghi
+    """
+
+    name = 'sqlite'
+
+    # Xóa các bản ghi hết hạn sau mỗi số lần ghi này
+    PURGE_EVERY = 500
+
+    def __init__(self, path=RESPONSE_CACHE_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._pid = None
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)'
+            )
+        os.chmod(path, 0o600)
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM response_cache WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value, ensure_ascii=False, separators=(',', ':')), now + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                connection.execute('DELETE FROM response_cache WHERE expires_at <= ?', (now,))
+
+    def clear(self):
+        with self._connection() as connection:
+            connection.execute('DELETE FROM response_cache')
+
+    def size(self):
+        return self._connection().execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+    def _connection(self):
+        if self._pid != os.getpid():
+            # Không dùng lại kết nối của process cha sau fork
+            self._local = threading.local()
+            self._pid = os.getpid()
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+
+SHARED_BACKENDS = {
+    'sqlite': SQLiteBackend
+}
+
+
+def canonical_key(payload, version):
+    """
+    Khóa cache của một request: mã băm của request đã chuẩn hóa (khóa sắp xếp, JSON gọn)
+    kèm phiên bản mô hình/dữ liệu, nên khi phiên bản thay đổi các kết quả cũ tự động không còn được dùng
+    """
+    serialized = json.dumps([payload, version], sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha1(serialized.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache kết quả dự đoán theo request đã chuẩn hóa
+    - Tầng 1: LRU + TTL trong bộ nhớ của worker
+    - Tầng 2 (tùy chọn): backend dùng chung giữa các worker, kết quả tìm thấy được chép lên tầng 1
+    - Giá trị trong cache chỉ được đọc, không được sửa đổi sau khi lấy ra
+    """
+
+    def __init__(self, name, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL_SECONDS,
+                 shared_backend=None, enabled=RESPONSE_CACHE_ENABLED):
+        self.name = name
+        self.ttl = ttl
+        self.enabled = enabled and ttl > 0
+        self.local = LocalLRUBackend(max_entries)
+        self.shared = shared_backend
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'sharedHits': 0, 'misses': 0, 'sets': 0, 'errors': 0}
+
+    def get(self, key):
+        """Lấy kết quả đã cache, None nếu không có hoặc đã hết hạn"""
+        if not self.enabled:
+            return None
+
+        value = self.local.get(key)
+        if value is not None:
+            self._count('hits')
+            return value
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception as e:
+                self._count('errors')
+                print(f"Lỗi khi đọc cache dùng chung {self.shared.name}: {e}")
+            if value is not None:
+                self.local.set(key, value, self.ttl)
+                self._count('sharedHits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        if not self.enabled:
+            return
+
+        self.local.set(key, value, self.ttl)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, self.ttl)
+            except Exception as e:
+                self._count('errors')
+                print(f"Lỗi khi ghi cache dùng chung {self.shared.name}: {e}")
+        self._count('sets')
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        """Thống kê cho health check"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['sharedHits'] + stats['misses']
+        stats.update({
+            'enabled': self.enabled,
+            'hitRate': round((stats['hits'] + stats['sharedHits']) / lookups, 4) if lookups else None,
+            'size': self.local.size(),
+            'maxEntries': self.local.max_entries,
+            'ttlSeconds': self.ttl,
+            'sharedBackend': self.shared.name if self.shared is not None else None
+        })
+        return stats
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+
+def create_shared_backend(name=RESPONSE_CACHE_SHARED_BACKEND):
+    """Tạo backend dùng chung theo cấu hình (None nếu tắt hoặc không khởi tạo được)"""
+    if name in ('', 'none'):
+        return None
+    if name not in SHARED_BACKENDS:
+        print(f"Backend cache dùng chung không hợp lệ: {name} (chỉ hỗ trợ {', '.join(SHARED_BACKENDS)}), chỉ dùng cache trong bộ nhớ")
+        return None
+    try:
+        return SHARED_BACKENDS[name]()
+    except Exception as e:
+        print(f"Không thể khởi tạo cache dùng chung {name}: {e}, chỉ dùng cache trong bộ nhớ")
+        return None
+
+
+# Cache kết quả dự đoán xác suất dùng chung cho toàn bộ luồng của worker
+admission_response_cache = ResponseCache('admission_prediction', shared_backend=create_shared_backend())
+
+RESPONSE_CACHES = (admission_response_cache,)
+
+
+def response_cache_status():
+    return {cache.name: cache.stats() for cache in RESPONSE_CACHES}
@@ -0,0 +1,443 @@
+import os
+import sys
+import time
+import socket
+import argparse
+import importlib
+import threading
+import traceback
+import subprocess
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+BASE_DIR = os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, BASE_DIR)
+from config.config import (
+    TRAINING_JOB_CPU_THREADS, TRAINING_JOB_NICE, TRAINING_JOB_POLL_SECONDS,
+    TRAINING_JOB_CANCEL_GRACE_SECONDS, TRAINING_JOB_STALE_SECONDS
+)
+from utils.db_utils import db_client
+
+# Mỗi job là một document trong training_jobs; training_job_locks giữ job đang chạy của từng loại mô hình
+# ({_id: loại mô hình, jobId, heartbeatAt}), jobId = None khi không có job nào
+JOB_COLLECTION = 'training_jobs'
+LOCK_COLLECTION = 'training_job_locks'
+ACTIVE_STATUSES = ('queued', 'running')
+# Các giai đoạn không được hủy: đang ghi file mô hình, dừng giữa chừng sẽ để lại file hỏng
+UNCANCELLABLE_STAGES = ('saving', 'exporting')
+
+# Hàm huấn luyện của từng loại mô hình ('module:hàm'), chạy trong process huấn luyện:
+# nhận TrainingJobContext, trả về dictionary kết quả
+TRAINING_TARGETS = {
+    'major_recommendation': 'ai_models.goiynganhhoc.train_model:train_job'
+}
+
+
+class TrainingCancelled(Exception):
+    """Job bị hủy theo yêu cầu (ném ra trong process huấn luyện)"""
+
+
+class TrainingJobBusy(Exception):
+    """Đã có job huấn luyện khác đang chạy cho cùng loại mô hình"""
+
+    def __init__(self, job_id):
+        super().__init__(f"Đang có job huấn luyện khác chạy: {job_id}")
+        self.job_id = job_id
+
+
+class TrainingJobManager:
+    """
+    Chạy huấn luyện mô hình ở process riêng, ngoài luồng xử lý request của gunicorn
+    - Trạng thái, tiến độ và yêu cầu hủy lưu trong MongoDB nên worker nào cũng đọc và hủy được
+    - Mỗi loại mô hình chỉ có một job chạy tại một thời điểm, khóa hết hạn khi không có heartbeat
+      trong TRAINING_JOB_STALE_SECONDS (worker và process huấn luyện đều đã dừng)
+    - Process huấn luyện bị giới hạn CPU: số luồng TensorFlow, tập CPU được dùng và mức nice
+    - Luồng theo dõi trong worker tạo job ghi heartbeat, buộc dừng process nếu không tự dừng sau
+      TRAINING_JOB_CANCEL_GRACE_SECONDS kể từ khi bị hủy, và gọi on_success khi huấn luyện xong
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes = {}
+
+    def submit(self, model_type, on_success=None):
+        """
+        Tạo job và chạy process huấn luyện
+
+        Args:
+            model_type: Loại mô hình (khóa của TRAINING_TARGETS)
+            on_success: Hàm job -> None gọi trong worker này khi huấn luyện thành công (ví dụ tải mô hình mới)
+
+        Returns:
+            Document của job
+
+        Raises:
+            TrainingJobBusy: Nếu đang có job khác chạy cho loại mô hình này
+        """
+        if model_type not in TRAINING_TARGETS:
+            raise ValueError(f"Không hỗ trợ huấn luyện nền cho mô hình {model_type}")
+
+        job_id = ObjectId()
+        now = datetime.now()
+        self._acquire(model_type, job_id, now)
+
+        job = {
+            '_id': job_id,
+            'modelType': model_type,
+            'status': 'queued',
+            'stage': None,
+            'progress': {},
+            'history': [],
+            'cancelRequested': False,
+            'host': socket.gethostname(),
+            'workerPid': os.getpid(),
+            'createdAt': now,
+            'updatedAt': now,
+            'heartbeatAt': now
+        }
+        try:
+            db_client.insert_one(JOB_COLLECTION, job)
+            process = subprocess.Popen(
+                [sys.executable, '-m', 'utils.training_jobs', str(job_id)],
+                cwd=BASE_DIR,
+                env=_job_environment()
+            )
+        except Exception as e:
+            _finish(job_id, model_type, 'failed', error=f"Không thể khởi động process huấn luyện: {e}")
+            raise
+
+        db_client.update_one(JOB_COLLECTION, {'_id': job_id}, {'$set': {'pid': process.pid}})
+        with self._lock:
+            self._processes[str(job_id)] = process
+
+        threading.Thread(
+            target=self._monitor, args=(job_id, model_type, process, on_success),
+            name=f"training-job-{job_id}", daemon=True
+        ).start()
+        print(f"Đã tạo job huấn luyện {job_id} cho mô hình {model_type} (process {process.pid})")
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Document của job (None nếu không tồn tại), job không còn heartbeat được đánh dấu thất bại"""
+        job_id = _parse_job_id(job_id)
+        if job_id is None:
+            return None
+
+        job = db_client.get_collection(JOB_COLLECTION).find_one({'_id': job_id})
+        if job is not None and job['status'] in ACTIVE_STATUSES and _is_stale(job.get('heartbeatAt')):
+            _finish(job_id, job['modelType'], 'failed', error="Process huấn luyện đã dừng (không còn heartbeat)")
+            job = db_client.get_collection(JOB_COLLECTION).find_one({'_id': job_id})
+        return job
+
+    def list_jobs(self, model_type, limit=20):
+        """Các job mới nhất của một loại mô hình (không kèm lịch sử từng epoch)"""
+        return db_client.fetch_data(
+            JOB_COLLECTION,
+            query={'modelType': model_type},
+            projection={'history': 0},
+            sort=[('createdAt', DESCENDING)],
+            limit=limit
+        )
+
+    def cancel(self, job_id):
+        """
+        Yêu cầu hủy job, process huấn luyện dừng ở batch tiếp theo
+
+        Returns:
+            (job, cancelled): document của job (None nếu không tồn tại) và True nếu yêu cầu hủy được ghi nhận
+            (False nếu job đã kết thúc hoặc đang lưu mô hình)
+        """
+        job_id = _parse_job_id(job_id)
+        if job_id is None:
+            return None, False
+
+        job = db_client.get_collection(JOB_COLLECTION).find_one_and_update(
+            {'_id': job_id, 'status': {'$in': list(ACTIVE_STATUSES)}, 'stage': {'$nin': list(UNCANCELLABLE_STAGES)}},
+            {'$set': {'cancelRequested': True, 'updatedAt': datetime.now()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if job is None:
+            return self.get(job_id), False
+
+        print(f"Đã yêu cầu hủy job huấn luyện {job_id}")
+        return job, True
+
+    def status(self):
+        """Các job do worker này tạo và đang chạy (cho health check, không truy vấn MongoDB)"""
+        with self._lock:
+            return {'activeJobs': [job_id for job_id, process in self._processes.items() if process.poll() is None]}
+
+    def _monitor(self, job_id, model_type, process, on_success):
+        cancel_deadline = None
+        try:
+            while True:
+                try:
+                    process.wait(timeout=TRAINING_JOB_POLL_SECONDS)
+                    break
+                except subprocess.TimeoutExpired:
+                    pass
+
+                try:
+                    _heartbeat(job_id, model_type)
+                    job = db_client.get_collection(JOB_COLLECTION).find_one(
+                        {'_id': job_id}, {'cancelRequested': 1, 'stage': 1}
+                    )
+                    if job is None or not job.get('cancelRequested'):
+                        continue
+                    if cancel_deadline is None:
+                        cancel_deadline = time.monotonic() + TRAINING_JOB_CANCEL_GRACE_SECONDS
+                    elif time.monotonic() > cancel_deadline and job.get('stage') not in UNCANCELLABLE_STAGES:
+                        print(f"Job huấn luyện {job_id} không dừng sau {TRAINING_JOB_CANCEL_GRACE_SECONDS:.0f}s, buộc kết thúc process")
+                        process.terminate()
+                        cancel_deadline = float('inf')
+                except Exception as e:
+                    print(f"Lỗi khi theo dõi job huấn luyện {job_id}: {e}")
+
+            # Process dừng mà chưa ghi trạng thái cuối (bị kết thúc hoặc lỗi không bắt được)
+            job = db_client.get_collection(JOB_COLLECTION).find_one({'_id': job_id}, {'cancelRequested': 1})
+            if job is not None and job.get('cancelRequested'):
+                _finish(job_id, model_type, 'cancelled')
+            else:
+                _finish(job_id, model_type, 'failed', error=f"Process huấn luyện kết thúc với mã {process.returncode}")
+
+            job = db_client.get_collection(JOB_COLLECTION).find_one({'_id': job_id})
+            print(f"Job huấn luyện {job_id} kết thúc: {job['status']}")
+            if job['status'] == 'succeeded' and on_success is not None:
+                try:
+                    on_success(job)
+                    db_client.update_one(JOB_COLLECTION, {'_id': job_id}, {'$set': {'activatedAt': datetime.now()}})
+                except Exception as e:
+                    print(f"Lỗi khi đưa mô hình của job {job_id} vào phục vụ: {e}")
+                    db_client.update_one(JOB_COLLECTION, {'_id': job_id}, {'$set': {'activationError': str(e)}})
+        except Exception as e:
+            print(f"Lỗi khi theo dõi job huấn luyện {job_id}: {e}")
+        finally:
+            _release(job_id, model_type)
+            with self._lock:
+                self._processes.pop(str(job_id), None)
+
+    def _acquire(self, model_type, job_id, now):
+        locks = db_client.get_collection(LOCK_COLLECTION)
+        try:
+            # upsert: lần đầu tạo khóa; khóa đang được giữ làm upsert trùng _id và ném DuplicateKeyError
+            previous = locks.find_one_and_update(
+                {'_id': model_type, '$or': [{'jobId': None}, {'heartbeatAt': {'$lt': now - timedelta(seconds=TRAINING_JOB_STALE_SECONDS)}}]},
+                {'$set': {'jobId': job_id, 'heartbeatAt': now}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            lock = locks.find_one({'_id': model_type}) or {}
+            raise TrainingJobBusy(lock.get('jobId'))
+
+        if previous is not None and previous.get('jobId') is not None:
+            print(f"Job huấn luyện {previous['jobId']} không còn heartbeat, đánh dấu thất bại")
+            _finish(previous['jobId'], None, 'failed', error="Process huấn luyện đã dừng (không còn heartbeat)")
+
+
+class TrainingJobContext:
+    """
+    Dùng trong process huấn luyện: cập nhật giai đoạn, tiến độ (epoch, loss) của job và kiểm tra yêu cầu hủy
+    (đọc MongoDB tối đa mỗi TRAINING_JOB_POLL_SECONDS giây trong khi huấn luyện)
+    """
+
+    def __init__(self, job_id, model_type, poll_seconds=TRAINING_JOB_POLL_SECONDS):
+        self.job_id = job_id
+        self.model_type = model_type
+        self.poll_seconds = poll_seconds
+        self._last_poll = 0.0
+
+    def set_stage(self, stage):
+        """Chuyển giai đoạn (ví dụ 'loading_data', 'training', 'saving'), dừng nếu đã bị hủy"""
+        if stage not in UNCANCELLABLE_STAGES:
+            self.check_cancelled()
+        self.update({'$set': {'stage': stage}})
+        print(f"[job {self.job_id}] {stage}")
+
+    def report_batch(self, epoch, epochs, batch, logs=None):
+        """Tiến độ trong một epoch, ghi và kiểm tra yêu cầu hủy tối đa mỗi poll_seconds giây"""
+        if time.monotonic() - self._last_poll < self.poll_seconds:
+            return
+        progress = {'progress.epoch': epoch, 'progress.epochs': epochs, 'progress.batch': batch}
+        if logs and 'loss' in logs:
+            progress['progress.loss'] = float(logs['loss'])
+        self.update({'$set': progress})
+        self.check_cancelled()
+
+    def report_epoch(self, epoch, epochs, logs=None):
+        """Kết quả một epoch: ghi vào progress và history, sau đó kiểm tra yêu cầu hủy"""
+        metrics = {name: float(value) for name, value in (logs or {}).items()}
+        self.update({
+            '$set': {'progress': {'epoch': epoch, 'epochs': epochs, **metrics}},
+            '$push': {'history': {'epoch': epoch, **metrics}}
+        })
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        """
+        Raises:
+            TrainingCancelled: Nếu job đã bị yêu cầu hủy
+        """
+        self._last_poll = time.monotonic()
+        job = db_client.get_collection(JOB_COLLECTION).find_one({'_id': self.job_id}, {'cancelRequested': 1})
+        if job is not None and job.get('cancelRequested'):
+            raise TrainingCancelled(f"Job huấn luyện {self.job_id} đã bị hủy")
+
+    def update(self, update):
+        """Cập nhật document của job (kèm heartbeat của job và khóa)"""
+        now = datetime.now()
+        update.setdefault('$set', {}).update({'updatedAt': now, 'heartbeatAt': now})
+        db_client.update_one(JOB_COLLECTION, {'_id': self.job_id}, update)
+        # Process huấn luyện cũng giữ khóa, kể cả khi worker tạo job đã dừng
+        db_client.update_one(LOCK_COLLECTION, {'_id': self.model_type, 'jobId': self.job_id}, {'$set': {'heartbeatAt': now}})
+        self._last_poll = time.monotonic()
+
+
+def limit_cpu(threads=TRAINING_JOB_CPU_THREADS, niceness=TRAINING_JOB_NICE, pin=True):
+    """
+    Giới hạn CPU của process hiện tại (gọi trước khi TensorFlow chạy phép tính nào):
+    giảm độ ưu tiên so với các worker phục vụ, chỉ dùng threads CPU cuối cùng
+    (cả các luồng của tf.data) và threads luồng cho phép tính TensorFlow
+
+    Args:
+        pin: Gắn process vào threads CPU cuối cùng, tắt khi nhiều process cùng giới hạn
+             (ví dụ các worker của sweep_admission_model.py) để không dồn vào cùng các CPU
+    """
+    if niceness > 0 and hasattr(os, 'nice'):
+        os.nice(niceness)
+
+    if threads <= 0:
+        return
+
+    if pin and hasattr(os, 'sched_setaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) > threads:
+            os.sched_setaffinity(0, cpus[-threads:])
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(min(threads, 2))
+
+
+def run_job(job_id):
+    """
+    Chạy job trong process huấn luyện (python -m utils.training_jobs <job_id>)
+
+    Returns:
+        Mã thoát của process
+    """
+    job = db_client.get_collection(JOB_COLLECTION).find_one({'_id': job_id})
+    if job is None:
+        print(f"Không tìm thấy job huấn luyện {job_id}")
+        return 1
+
+    model_type = job['modelType']
+    context = TrainingJobContext(job_id, model_type)
+    try:
+        limit_cpu()
+        now = datetime.now()
+        context.update({'$set': {'status': 'running', 'startedAt': now, 'pid': os.getpid()}})
+        context.set_stage('loading_data')
+
+        module_name, function_name = TRAINING_TARGETS[model_type].split(':')
+        result = getattr(importlib.import_module(module_name), function_name)(context)
+    except TrainingCancelled:
+        print(f"Job huấn luyện {job_id} đã bị hủy")
+        _finish(job_id, model_type, 'cancelled')
+        return 0
+    except Exception as e:
+        traceback.print_exc()
+        _finish(job_id, model_type, 'failed', error=str(e))
+        return 1
+
+    _finish(job_id, model_type, 'succeeded', result=result)
+    return 0
+
+
+def _finish(job_id, model_type, status, error=None, result=None):
+    """Ghi trạng thái cuối (chỉ khi job chưa kết thúc) và trả khóa"""
+    fields = {'status': status, 'finishedAt': datetime.now(), 'updatedAt': datetime.now()}
+    if error is not None:
+        fields['error'] = error
+    if result is not None:
+        fields['result'] = result
+    db_client.update_one(JOB_COLLECTION, {'_id': job_id, 'status': {'$in': list(ACTIVE_STATUSES)}}, {'$set': fields})
+    if model_type is not None:
+        _release(job_id, model_type)
+
+
+def _heartbeat(job_id, model_type):
+    now = datetime.now()
+    db_client.update_one(JOB_COLLECTION, {'_id': job_id, 'status': {'$in': list(ACTIVE_STATUSES)}}, {'$set': {'heartbeatAt': now}})
+    db_client.update_one(LOCK_COLLECTION, {'_id': model_type, 'jobId': job_id}, {'$set': {'heartbeatAt': now}})
+
+
+def _release(job_id, model_type):
+    db_client.update_one(LOCK_COLLECTION, {'_id': model_type, 'jobId': job_id}, {'$set': {'jobId': None}})
+
+
+def _is_stale(heartbeat_at):
+    return heartbeat_at is None or heartbeat_at < datetime.now() - timedelta(seconds=TRAINING_JOB_STALE_SECONDS)
+
+
+def _parse_job_id(job_id):
+    if isinstance(job_id, ObjectId):
+        return job_id
+    try:
+        return ObjectId(job_id)
+    except (InvalidId, TypeError):
+        return None
+
+
+def _job_environment():
+    """Biến môi trường của process huấn luyện: giới hạn số luồng của các thư viện tính toán"""
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    if TRAINING_JOB_CPU_THREADS > 0:
+        threads = str(TRAINING_JOB_CPU_THREADS)
+        env.update(OMP_NUM_THREADS=threads, OPENBLAS_NUM_THREADS=threads, MKL_NUM_THREADS=threads)
+    return env
+
+
+def job_to_dict(job, include_history=False):
+    """Chuyển document của job sang JSON trả về cho client"""
+    result = {
+        'job_id': str(job['_id']),
+        'model_type': job.get('modelType'),
+        'status': job.get('status'),
+        'stage': job.get('stage'),
+        'progress': job.get('progress', {}),
+        'cancel_requested': job.get('cancelRequested', False)
+    }
+    for field, key in (('createdAt', 'created_at'), ('startedAt', 'started_at'), ('finishedAt', 'finished_at'),
+                       ('activatedAt', 'activated_at')):
+        if job.get(field) is not None:
+            result[key] = job[field].isoformat()
+    for field, key in (('result', 'result'), ('error', 'error'), ('activationError', 'activation_error')):
+        if job.get(field) is not None:
+            result[key] = job[field]
+    if include_history:
+        result['history'] = job.get('history', [])
+    return result
+
+
+# Quản lý job dùng chung cho toàn bộ luồng của worker
+training_jobs = TrainingJobManager()
+
+
+def training_jobs_status():
+    return training_jobs.status()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chạy một job huấn luyện đã tạo bằng TrainingJobManager.submit')
+    parser.add_argument('job_id', help='_id của job trong training_jobs')
+
+    args = parser.parse_args()
+    sys.exit(run_job(ObjectId(args.job_id)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+import os
+import sys
+from datetime import datetime
+from itertools import chain
+import numpy as np
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import TRAINING_CHUNK_SIZE, TRAINING_MAX_SAMPLES
+from utils.db_utils import db_client
+from utils.data_versions import bump_data_version
+
+# Bộ dữ liệu huấn luyện gồm một manifest trong training_data (mỗi loại mô hình một bộ đang dùng)
+# và các document chunk trong training_chunks: {datasetId, modelType, chunk, start, count, records}
+MANIFEST_COLLECTION = 'training_data'
+CHUNK_COLLECTION = 'training_chunks'
+
+
+class TrainingDataWriter:
+    """
+    Ghi một bộ dữ liệu huấn luyện mới thành các document chunk (mỗi chunk tối đa chunk_size dòng)
+
+    Bộ dữ liệu chỉ được dùng sau commit(): manifest mới được thêm vào rồi bộ dữ liệu cũ của cùng
+    loại mô hình mới bị xóa, nên nhập lỗi giữa chừng không làm mất dữ liệu đang dùng.
+    Dùng với with: commit khi thành công, xóa các chunk đã ghi khi có lỗi
+    """
+
+    def __init__(self, model_type, data_source='synthetic', data_version='1.0', chunk_size=TRAINING_CHUNK_SIZE):
+        self.model_type = model_type
+        self.data_source = data_source
+        self.data_version = data_version
+        self.chunk_size = chunk_size
+        self.dataset_id = ObjectId()
+        self.total_records = 0
+        self.chunk_count = 0
+        self._columns = {}
+        self._buffer = []
+
+    def write(self, records):
+        """Thêm các bản ghi (dict), ghi ra MongoDB mỗi khi đủ một chunk"""
+        self._buffer.extend(records)
+        while len(self._buffer) >= self.chunk_size:
+            self._flush(self._buffer[:self.chunk_size])
+            self._buffer = self._buffer[self.chunk_size:]
+
+    def commit(self):
+        """Ghi phần còn lại, kích hoạt bộ dữ liệu mới và xóa bộ dữ liệu cũ, trả về manifest"""
+        if self._buffer:
+            self._flush(self._buffer)
+            self._buffer = []
+
+        now = datetime.now()
+        manifest = {
+            'modelType': self.model_type,
+            'dataSource': self.data_source,
+            'dataVersion': self.data_version,
+            'storage': 'chunked',
+            'datasetId': self.dataset_id,
+            'chunkSize': self.chunk_size,
+            'chunkCount': self.chunk_count,
+            'columns': list(self._columns),
+            'metadata': {
+                'totalRecords': self.total_records,
+                'createdAt': now,
+                'updatedAt': now
+            }
+        }
+        db_client.insert_one(MANIFEST_COLLECTION, manifest)
+
+        # Xóa các bộ dữ liệu cũ (kể cả document cũ chứa toàn bộ records) của cùng loại mô hình
+        old_manifests = db_client.fetch_data(
+            MANIFEST_COLLECTION,
+            query={'modelType': self.model_type, '_id': {'$ne': manifest['_id']}},
+            projection={'datasetId': 1}
+        )
+        if old_manifests:
+            old_dataset_ids = [doc['datasetId'] for doc in old_manifests if 'datasetId' in doc]
+            if old_dataset_ids:
+                db_client.delete_many(CHUNK_COLLECTION, {'datasetId': {'$in': old_dataset_ids}})
+            db_client.delete_many(MANIFEST_COLLECTION, {'_id': {'$in': [doc['_id'] for doc in old_manifests]}})
+
+        bump_data_version(MANIFEST_COLLECTION)
+        return manifest
+
+    def abort(self):
+        """Xóa các chunk đã ghi của bộ dữ liệu chưa commit"""
+        self._buffer = []
+        db_client.delete_many(CHUNK_COLLECTION, {'datasetId': self.dataset_id})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+    def _flush(self, records):
+        db_client.insert_one(CHUNK_COLLECTION, {
+            'datasetId': self.dataset_id,
+            'modelType': self.model_type,
+            'chunk': self.chunk_count,
+            'start': self.total_records,
+            'count': len(records),
+            'records': records
+        })
+        self._columns.update(dict.fromkeys(chain.from_iterable(records)))
+        self.chunk_count += 1
+        self.total_records += len(records)
+
+
+def get_training_manifest(model_type):
+    """
+    Manifest của bộ dữ liệu huấn luyện mới nhất của một loại mô hình (không kèm records),
+    None nếu chưa có. Document định dạng cũ (toàn bộ records trong một document) không có 'storage'
+    """
+    manifests = db_client.fetch_data(
+        MANIFEST_COLLECTION,
+        query={'modelType': model_type},
+        projection={'records': 0},
+        sort=[('metadata.createdAt', DESCENDING)],
+        limit=1
+    )
+    return manifests[0] if manifests else None
+
+
+def count_training_records(model_type):
+    manifest = get_training_manifest(model_type)
+    return manifest.get('metadata', {}).get('totalRecords', 0) if manifest else 0
+
+
+def iter_training_chunks(model_type, shuffle=False, seed=None, manifest=None):
+    """
+    Đọc lần lượt từng chunk của bộ dữ liệu huấn luyện, mỗi lúc chỉ giữ một chunk trong bộ nhớ
+
+    Args:
+        model_type: Loại mô hình ('major_recommendation', 'admission_probability')
+        shuffle: Đọc các chunk theo thứ tự ngẫu nhiên
+        seed: Seed cho thứ tự ngẫu nhiên
+        manifest: Manifest đã lấy bằng get_training_manifest (mặc định lấy mới)
+
+    Yields:
+        (start, records): vị trí dòng đầu tiên của chunk trong bộ dữ liệu và danh sách bản ghi
+    """
+    manifest = manifest or get_training_manifest(model_type)
+    if manifest is None:
+        raise ValueError(f"Không tìm thấy dữ liệu huấn luyện cho mô hình {model_type} trong MongoDB")
+
+    if manifest.get('storage') != 'chunked':
+        # Định dạng cũ: toàn bộ bản ghi nằm trong một document, chia thành các đoạn để xử lý giống chunk
+        document = db_client.get_collection(MANIFEST_COLLECTION).find_one({'_id': manifest['_id']}, {'records': 1})
+        records = (document or {}).get('records', [])
+        starts = np.arange(0, len(records), TRAINING_CHUNK_SIZE)
+        if shuffle:
+            starts = np.random.default_rng(seed).permutation(starts)
+        for start in starts.tolist():
+            yield start, records[start:start + TRAINING_CHUNK_SIZE]
+        return
+
+    chunks = db_client.get_collection(CHUNK_COLLECTION)
+    projection = {'start': 1, 'records': 1}
+    if shuffle:
+        documents = (
+            chunks.find_one({'datasetId': manifest['datasetId'], 'chunk': chunk}, projection)
+            for chunk in np.random.default_rng(seed).permutation(manifest['chunkCount']).tolist()
+        )
+    else:
+        # batch_size(1): driver chỉ lấy trước một chunk mỗi lần
+        documents = chunks.find({'datasetId': manifest['datasetId']}, projection).sort('chunk', ASCENDING).batch_size(1)
+
+    read_chunks = 0
+    for document in documents:
+        if document is None:
+            break
+        read_chunks += 1
+        yield document['start'], document['records']
+
+    if read_chunks != manifest['chunkCount']:
+        raise ValueError(
+            f"Bộ dữ liệu huấn luyện {manifest['datasetId']} đã bị thay thế trong khi đọc "
+            f"({read_chunks}/{manifest['chunkCount']} chunk)"
+        )
+
+
+def iter_training_frames(model_type, columns=None, **kwargs):
+    """
+    Đọc bộ dữ liệu huấn luyện thành các DataFrame, mỗi DataFrame là một chunk
+    (index là vị trí dòng trong bộ dữ liệu). Tham số khác giống iter_training_chunks
+    """
+    import pandas as pd
+
+    for start, records in iter_training_chunks(model_type, **kwargs):
+        yield pd.DataFrame(records, columns=columns, index=pd.RangeIndex(start, start + len(records)))
+
+
+def iter_training_batches(model_type, transform, batch_size, shuffle=False, seed=None, manifest=None):
+    """
+    Luồng batch NumPy kích thước cố định (batch cuối có thể nhỏ hơn) từ bộ dữ liệu huấn luyện,
+    bộ nhớ dùng tối đa khoảng một chunk cộng một batch
+
+    Args:
+        model_type: Loại mô hình
+        transform: Hàm (records, row_ids) -> tuple mảng numpy cùng số dòng, ví dụ (X, y);
+                   row_ids là vị trí các bản ghi trong bộ dữ liệu, transform có thể lọc bớt dòng
+        batch_size: Số dòng mỗi batch
+        shuffle: Xáo trộn thứ tự chunk và thứ tự dòng trong mỗi chunk
+        seed: Seed cho việc xáo trộn
+        manifest: Manifest đã lấy bằng get_training_manifest (mặc định lấy mới)
+
+    Yields:
+        Tuple mảng numpy, mỗi mảng có batch_size dòng
+    """
+    rng = np.random.default_rng(seed)
+    pending = []
+    pending_rows = 0
+
+    for start, records in iter_training_chunks(model_type, shuffle=shuffle, seed=seed, manifest=manifest):
+        arrays = tuple(transform(records, np.arange(start, start + len(records))))
+        if shuffle:
+            order = rng.permutation(len(arrays[0]))
+            arrays = tuple(array[order] for array in arrays)
+        pending.append(arrays)
+        pending_rows += len(arrays[0])
+
+        if pending_rows >= batch_size:
+            merged = _concat(pending)
+            full_rows = pending_rows - pending_rows % batch_size
+            for i in range(0, full_rows, batch_size):
+                yield tuple(array[i:i + batch_size] for array in merged)
+            pending = [tuple(array[full_rows:] for array in merged)]
+            pending_rows -= full_rows
+
+    if pending_rows:
+        yield _concat(pending)
+
+
+def sample_batches(batches, max_rows=TRAINING_MAX_SAMPLES, seed=42):
+    """
+    Lấy mẫu ngẫu nhiên đều (không lặp) tối đa max_rows dòng từ một luồng batch, chỉ giữ trong bộ nhớ
+    tối đa max_rows dòng cộng một batch. Luồng có không quá max_rows dòng được giữ nguyên,
+    các dòng được chọn giữ theo thứ tự trong luồng
+
+    Args:
+        batches: Luồng tuple mảng numpy cùng số dòng, hoặc luồng DataFrame
+        max_rows: Số dòng tối đa (None: giữ tất cả)
+        seed: Seed cho việc chọn mẫu
+
+    Returns:
+        Tuple mảng numpy hoặc DataFrame đã gộp, None nếu luồng rỗng
+    """
+    rng = np.random.default_rng(seed)
+    kept = []
+    keys = np.empty(0)
+
+    for batch in batches:
+        kept.append(batch)
+        if max_rows is None:
+            continue
+        keys = np.concatenate([keys, rng.random(_length(batch))])
+        if len(keys) > max_rows:
+            # Giữ max_rows dòng có khóa ngẫu nhiên nhỏ nhất (tương đương chọn ngẫu nhiên đều)
+            selected = np.sort(np.argpartition(keys, max_rows)[:max_rows])
+            kept = [_take(_concat(kept), selected)]
+            keys = keys[selected]
+
+    return _concat(kept) if kept else None
+
+
+def _length(batch):
+    return len(batch) if hasattr(batch, 'iloc') else len(batch[0])
+
+
+def _concat(batches):
+    if len(batches) == 1:
+        return batches[0]
+    if hasattr(batches[0], 'iloc'):
+        import pandas as pd
+        return pd.concat(batches)
+    return tuple(np.concatenate(arrays) for arrays in zip(*batches))
+
+
+def _take(batch, rows):
+    if hasattr(batch, 'iloc'):
+        return batch.iloc[rows]
+    return tuple(array[rows] for array in batch)
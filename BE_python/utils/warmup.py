@@ -0,0 +1,150 @@
+import os
+import sys
+import time
+import threading
+import traceback
+from datetime import datetime
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import WARMUP_RETRY_SECONDS, WARMUP_RETRY_MAX_SECONDS
+
+
+class WarmupRunner:
+    """
+    Chạy các bước khởi động nặng (import TensorFlow, tải mô hình, tải dữ liệu tham chiếu)
+    ở luồng nền để server có thể nhận request /health ngay khi import xong app
+    - Các bước chạy tuần tự theo thứ tự đăng ký; bước lỗi không chặn các bước sau
+    - Bước bắt buộc bị lỗi được thử lại ở luồng nền với thời gian chờ tăng dần (backoff)
+    - Service sẵn sàng (/ready) khi mọi bước bắt buộc (required=True) đã chạy thành công
+    """
+
+    def __init__(self, retry_interval=WARMUP_RETRY_SECONDS, max_retry_interval=WARMUP_RETRY_MAX_SECONDS):
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self._lock = threading.Lock()
+        self._steps = []
+        self._results = {}
+        self._thread = None
+        self._pid = None
+        self._started_at = None
+        self._finished_at = None
+        self._done = threading.Event()
+        self._retry_thread = None
+
+    def add_step(self, name, func, required=True):
+        """Đăng ký một bước khởi động (phải gọi trước start())"""
+        self._steps.append({'name': name, 'func': func, 'required': required})
+        self._results[name] = {'status': 'pending', 'required': required, 'durationMs': None, 'error': None,
+                               'attempts': 0}
+
+    def start(self, background=True):
+        """
+        Chạy các bước đã đăng ký
+
+        Args:
+            background: True để chạy ở luồng nền, False để chạy ngay trong luồng gọi
+        """
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._started_at = time.perf_counter()
+            if background:
+                self._thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+                self._thread.start()
+                return
+        self._run()
+
+    def wait(self, timeout=None):
+        """Chờ các bước khởi động hoàn tất, trả về True nếu đã xong trong thời gian timeout"""
+        return self._done.wait(timeout)
+
+    def is_done(self):
+        return self._done.is_set()
+
+    def is_ready(self):
+        """Đã xong và mọi bước bắt buộc đều thành công"""
+        return self._done.is_set() and all(
+            result['status'] == 'ok' for result in self._results.values() if result['required']
+        )
+
+    def step_succeeded(self, name):
+        return self._results.get(name, {}).get('status') == 'ok'
+
+    def status(self):
+        """Trạng thái khởi động cho /health và /ready"""
+        if self._started_at is None:
+            state = 'pending'
+        elif not self._done.is_set():
+            state = 'running'
+        else:
+            state = 'ready' if self.is_ready() else ('retrying' if self._is_retrying() else 'failed')
+
+        elapsed = None
+        if self._started_at is not None:
+            end = self._finished_at if self._finished_at is not None else time.perf_counter()
+            elapsed = round((end - self._started_at) * 1000, 1)
+
+        return {
+            'state': state,
+            'elapsedMs': elapsed,
+            'steps': {name: dict(result) for name, result in self._results.items()}
+        }
+
+    def _run(self):
+        for step in self._steps:
+            self._run_step(step)
+
+        self._finished_at = time.perf_counter()
+        summary = ', '.join(f"{name} {result['status']} ({result['durationMs']:.0f}ms)"
+                            for name, result in self._results.items())
+        print(f"Khởi động hoàn tất lúc {datetime.now().isoformat(timespec='seconds')} "
+              f"sau {(self._finished_at - self._started_at) * 1000:.0f}ms: {summary}")
+
+        if self._failed_required_steps() and self.retry_interval > 0:
+            self._retry_thread = threading.Thread(target=self._retry_failed, name='warmup-retry', daemon=True)
+            self._retry_thread.start()
+        self._done.set()
+
+    def _run_step(self, step):
+        result = self._results[step['name']]
+        result['status'] = 'running'
+        result['attempts'] += 1
+        start = time.perf_counter()
+        try:
+            step['func']()
+            result['status'] = 'ok'
+            result['error'] = None
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = str(e)
+            print(f"Lỗi ở bước khởi động {step['name']} (lần {result['attempts']}): {e}")
+            traceback.print_exc()
+        finally:
+            result['durationMs'] = round((time.perf_counter() - start) * 1000, 1)
+
+    def _failed_required_steps(self):
+        return [step for step in self._steps
+                if step['required'] and self._results[step['name']]['status'] == 'failed']
+
+    def _is_retrying(self):
+        return self._retry_thread is not None and self._retry_thread.is_alive()
+
+    def _retry_failed(self):
+        """Thử lại các bước bắt buộc bị lỗi cho đến khi thành công (chờ tăng gấp đôi sau mỗi lần)"""
+        delay = self.retry_interval
+        while True:
+            failed = self._failed_required_steps()
+            if not failed:
+                print("Các bước khởi động đã thành công sau khi thử lại, service sẵn sàng")
+                return
+            print(f"Thử lại bước khởi động {', '.join(step['name'] for step in failed)} sau {delay:.0f}s")
+            time.sleep(delay)
+            for step in failed:
+                self._run_step(step)
+            delay = min(delay * 2, self.max_retry_interval)
+
+
+# Các bước khởi động của API (được đăng ký trong app.py)
+warmup = WarmupRunner()
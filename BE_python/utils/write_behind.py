@@ -0,0 +1,234 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+# Thêm đường dẫn gốc vào sys.path để có thể import
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from config.config import (
+    WRITE_BEHIND_ENABLED, WRITE_BEHIND_MAX_QUEUE, WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_FLUSH_SECONDS, WRITE_BEHIND_ENQUEUE_TIMEOUT
+)
+from utils.db_utils import db_client
+
+
+class WriteBehindBuffer:
+    """
+    Hàng đợi có giới hạn để ghi document ở luồng nền, ngoài đường xử lý của request
+    - _id được tạo ngay tại client (ObjectId) nên có thể trả về cho frontend trước khi ghi
+    - Luồng nền gom document và ghi bằng insert_many(ordered=False) khi đủ batch_size
+      hoặc sau flush_interval giây kể từ document đầu tiên của batch
+    - Khi hàng đợi đầy, request chờ tối đa enqueue_timeout giây (backpressure), sau đó document bị bỏ
+    """
+
+    def __init__(self, collection_name, max_queue=WRITE_BEHIND_MAX_QUEUE, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval=WRITE_BEHIND_FLUSH_SECONDS, enqueue_timeout=WRITE_BEHIND_ENQUEUE_TIMEOUT,
+                 enabled=WRITE_BEHIND_ENABLED):
+        self.collection_name = collection_name
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._queue = None
+        self._pid = None
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def submit(self, document):
+        """
+        Đưa document vào hàng đợi ghi (ghi trực tiếp nếu write-behind bị tắt)
+
+        Returns:
+            _id của document (ObjectId)
+        """
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+
+        if not self.enabled:
+            db_client.get_collection(self.collection_name).insert_one(document)
+            self._count('written')
+            return document['_id']
+
+        document_queue = self._ensure_worker()
+        try:
+            document_queue.put_nowait(document)
+        except queue.Full:
+            self._count('backpressure')
+            try:
+                document_queue.put(document, timeout=self.enqueue_timeout)
+            except queue.Full:
+                dropped = self._count('dropped')
+                if dropped % 100 == 1:
+                    print(f"Hàng đợi ghi {self.collection_name} đầy, đã bỏ {dropped} document")
+                return document['_id']
+
+        self._count('enqueued')
+        return document['_id']
+
+    def flush(self, timeout=5.0):
+        """
+        Ghi ngay các document đang chờ (ở luồng gọi) và chờ batch đang ghi ở luồng nền hoàn tất
+
+        Returns:
+            True nếu hàng đợi đã được ghi hết trong thời gian timeout
+        """
+        document_queue = self._queue
+        if document_queue is None or self._pid != os.getpid():
+            return True
+
+        batch = []
+        while True:
+            try:
+                batch.append(document_queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+            for _ in batch:
+                document_queue.task_done()
+
+        deadline = time.monotonic() + timeout
+        with document_queue.all_tasks_done:
+            while document_queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                document_queue.all_tasks_done.wait(remaining)
+        return True
+
+    def reset(self):
+        """
+        Bỏ hàng đợi và luồng hiện tại (gọi trong process con sau fork:
+        document kế thừa từ process cha sẽ do process cha ghi)
+        """
+        with self._lock:
+            self._queue = None
+            self._pid = None
+            self._thread = None
+        self._reset_stats()
+
+    def stats(self):
+        """Thống kê cho health check"""
+        document_queue = self._queue
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({
+            'enabled': self.enabled,
+            'queueSize': document_queue.qsize() if document_queue is not None and self._pid == os.getpid() else 0,
+            'maxQueue': self.max_queue,
+            'batchSize': self.batch_size,
+            'flushIntervalSeconds': self.flush_interval
+        })
+        return stats
+
+    def _ensure_worker(self):
+        if self._queue is not None and self._pid == os.getpid():
+            return self._queue
+
+        with self._lock:
+            if self._queue is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, args=(self._queue,),
+                    name=f"write-behind-{self.collection_name}", daemon=True
+                )
+                self._thread.start()
+            return self._queue
+
+    def _run(self, document_queue):
+        while True:
+            try:
+                batch = [document_queue.get(timeout=1.0)]
+            except queue.Empty:
+                continue
+
+            # Gom thêm document cho đến khi đủ batch hoặc hết thời gian chờ
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(document_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    document_queue.task_done()
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        try:
+            db_client.get_collection(self.collection_name).insert_many(batch, ordered=False)
+            self._count('written', len(batch))
+        except BulkWriteError as e:
+            # ordered=False: các document không lỗi vẫn được ghi
+            failed = len(e.details.get('writeErrors', []))
+            self._count('written', len(batch) - failed)
+            self._count('failed', failed)
+            self._set_last_error(f"{failed} document lỗi khi ghi batch")
+        except Exception as e:
+            self._count('failed', len(batch))
+            self._set_last_error(str(e))
+            print(f"Lỗi khi ghi {len(batch)} document vào {self.collection_name}: {e}")
+        finally:
+            with self._stats_lock:
+                self._stats['batches'] += 1
+                self._stats['lastFlushMs'] = round((time.perf_counter() - start) * 1000, 2)
+
+    def _count(self, key, value=1):
+        with self._stats_lock:
+            self._stats[key] += value
+            return self._stats[key]
+
+    def _set_last_error(self, message):
+        with self._stats_lock:
+            self._stats['lastError'] = message
+
+    def _reset_stats(self):
+        with self._stats_lock:
+            self._stats = {
+                'enqueued': 0,
+                'written': 0,
+                'failed': 0,
+                'dropped': 0,
+                'backpressure': 0,
+                'batches': 0,
+                'lastFlushMs': None,
+                'lastError': None
+            }
+
+
+# Hàng đợi ghi dùng chung cho toàn bộ worker
+prediction_log_writer = WriteBehindBuffer('prediction_logs')
+student_data_writer = WriteBehindBuffer('student_data')
+
+WRITERS = (prediction_log_writer, student_data_writer)
+
+
+def flush_all(timeout=5.0):
+    """Ghi hết các hàng đợi (khi tắt ứng dụng)"""
+    for writer in WRITERS:
+        try:
+            writer.flush(timeout)
+        except Exception as e:
+            print(f"Lỗi khi ghi hàng đợi {writer.collection_name}: {e}")
+
+
+def write_behind_status():
+    return {writer.collection_name: writer.stats() for writer in WRITERS}
+
+
+atexit.register(flush_all)
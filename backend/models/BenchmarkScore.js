@@ -60,6 +60,23 @@ benchmarkScoreSchema.index(
   { unique: true }
 );
 
+// Tăng phiên bản dữ liệu để Python API biết cần xây dựng lại chỉ mục tên ngành
+const bumpDataVersion = async function() {
+  try {
+    await mongoose.connection.collection('data_versions').updateOne(
+      { _id: 'benchmark_scores' },
+      { $inc: { version: 1 }, $set: { updatedAt: new Date() } },
+      { upsert: true }
+    );
+  } catch (error) {
+    console.error('Error bumping benchmark_scores data version:', error);
+  }
+};
+
+benchmarkScoreSchema.post('save', bumpDataVersion);
+benchmarkScoreSchema.post('findOneAndUpdate', bumpDataVersion);
+benchmarkScoreSchema.post('findOneAndDelete', bumpDataVersion);
+
 const BenchmarkScore = mongoose.model('BenchmarkScore', benchmarkScoreSchema,'benchmark_scores');
 
 module.exports = BenchmarkScore; 
\ No newline at end of file